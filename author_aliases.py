@@ -4,7 +4,7 @@ This is primarily intended as a library module for other scripts, but there's
 a perfunctory standalone functionality that may be of use.
 """
 
-from collections import namedtuple
+from collections import namedtuple, defaultdict
 import logging
 import pdb
 import re
@@ -13,9 +13,16 @@ import sys
 from sqlalchemy.sql import text
 
 from common import get_connection
+from isfdb_lib.alias_graph import get_alias_graph
+from isfdb_lib.derived_tables import has_derived_tables
 
 AuthorIdAndName = namedtuple('AuthorIdAndName', 'id, name')
 
+# Equivalents of the rows from the queries in get_author_aliases() and
+# _get_author_alias_tuples(), for when they come from the alias graph
+_AliasNamesRow = namedtuple('_AliasNamesRow', 'name1, legal1, name2, legal2, name3, legal3')
+_AliasIdsRow = namedtuple('_AliasIdsRow', 'id1, author1, id2, author2, id3, author3')
+
 def unlegalize(txt):
     """
     Given a name of the form "Bloggs, Joe", return "Joe Bloggs"
@@ -52,30 +59,34 @@ def get_author_aliases(conn, author, search_for_additional_pseudonyms=True):
     at the risk of missing out on all pseudonyms.
     """
 
-    if isinstance(author, int):
-        fltr = 'a1.author_id = :author'
-    else:
-        fltr = 'a1.author_canonical = :author OR a1.author_legalname = :author'
-
     primary_name = None
 
-    # This would be much nicer if I had a newer MySQL/Maria with CTEs...
-    # The two lots of joins are because we don't know if we have been given
-    # a real name or an alias, so we try going "in both directions".
-    query = text("""SELECT -- a1.author_id id1,
-                    a1.author_canonical name1, a1.author_legalname legal1,
-                    -- p.pseudonym, a2.author_id id2,
-                    a2.author_canonical name2, a2.author_legalname legal2,
-                    a3.author_canonical name3, a3.author_legalname legal3
-
-  FROM authors a1
-  left outer join pseudonyms p1 on p1.author_id = a1.author_id
-  left outer join authors a2 on p1.pseudonym = a2.author_id
-  left outer join pseudonyms p2 on p2.pseudonym = a1.author_id
-  left outer join authors a3 on p2.author_id = a3.author_id
-    where %s;""" % (fltr))
-    params = {'author': author}
-    results = conn.execute(query, params).fetchall()
+    graph = get_alias_graph(conn)
+    if graph:
+        results = _get_author_alias_name_rows_from_graph(graph, author)
+    else:
+        if isinstance(author, int):
+            fltr = 'a1.author_id = :author'
+        else:
+            fltr = 'a1.author_canonical = :author OR a1.author_legalname = :author'
+
+        # This would be much nicer if I had a newer MySQL/Maria with CTEs...
+        # The two lots of joins are because we don't know if we have been given
+        # a real name or an alias, so we try going "in both directions".
+        query = text("""SELECT -- a1.author_id id1,
+                        a1.author_canonical name1, a1.author_legalname legal1,
+                        -- p.pseudonym, a2.author_id id2,
+                        a2.author_canonical name2, a2.author_legalname legal2,
+                        a3.author_canonical name3, a3.author_legalname legal3
+
+      FROM authors a1
+      left outer join pseudonyms p1 on p1.author_id = a1.author_id
+      left outer join authors a2 on p1.pseudonym = a2.author_id
+      left outer join pseudonyms p2 on p2.pseudonym = a1.author_id
+      left outer join authors a3 on p2.author_id = a3.author_id
+        where %s;""" % (fltr))
+        params = {'author': author}
+        results = conn.execute(query, params).fetchall()
     ret = set()
     for row in results:
         if row.name3:
@@ -85,11 +96,11 @@ def get_author_aliases(conn, author, search_for_additional_pseudonyms=True):
             else:
                 primary_name = row.name3
         for col in ('name1', 'name2', 'name3'):
-            if row._mapping[col]:
-                ret.add(row._mapping[col])
+            if getattr(row, col):
+                ret.add(getattr(row, col))
         for col in ('legal1', 'legal2', 'legal3'):
-            if row._mapping[col]:
-                legal = unlegalize(row._mapping[col])
+            if getattr(row, col):
+                legal = unlegalize(getattr(row, col))
                 if legal:
                     ret.add(legal)
 
@@ -109,6 +120,17 @@ def get_author_aliases(conn, author, search_for_additional_pseudonyms=True):
     else:
         return order_aliases_by_name_resemblance(author, ret)
 
+def _get_author_alias_name_rows_from_graph(graph, author):
+    if isinstance(author, int):
+        author_ids = [author]
+    else:
+        author_ids = graph.author_ids_for_name(author)
+    return [_AliasNamesRow(graph.names.get(id1), graph.legal_names.get(id1),
+                           graph.names.get(id2), graph.legal_names.get(id2),
+                           graph.names.get(id3), graph.legal_names.get(id3))
+            for id1, id2, id3 in graph.join_rows(author_ids)]
+
+
 def order_aliases_by_name_resemblance(author, aliases):
     # The following functions and sorting are an attempt to return the most
     # relevant names first - this is to minimize the risk of having authors
@@ -133,6 +155,12 @@ def get_gestalt_ids(conn, ids_to_check, more_than=2):
     Given a list/iterable/whatever of IDs, return a list of any that are
     pseudonyms used by more than the specified value.
     """
+    graph = get_alias_graph(conn)
+    if graph:
+        # The query's GROUP BY means it returns them in ID order
+        return [z for z in sorted(set(ids_to_check))
+                if graph.pseudonym_use_counts[z] > more_than]
+
     query = text("""SELECT pseudonym FROM
     (
       SELECT pseudonym, COUNT(1) num_uses
@@ -152,21 +180,28 @@ def _get_author_alias_tuples(conn, author, ignore_gestalt_threshold=None,
     Helper function for _get_author_alias_ids, basically for supporting the
     secondary lookup if a pseudonym was supplied.
     """
-    # This would be much nicer if I had a newer MySQL/Maria with CTEs...
-    # The two lots of joins are because we don't know if we have been given
-    # a real name or an alias, so we try going "in both directions".
-    query = text("""SELECT a1.author_id id1, a1.author_canonical author1,
-          a2.author_id id2, a2.author_canonical author2,
-          a3.author_id id3, a3.author_canonical author3
-  FROM authors a1
-  left outer join pseudonyms p1 on p1.author_id = a1.author_id
-  left outer join authors a2 on p1.pseudonym = a2.author_id
-  left outer join pseudonyms p2 on p2.pseudonym = a1.author_id
-  left outer join authors a3 on p2.author_id = a3.author_id
-  where a1.author_canonical = :author
-     or a1.author_legalname = :author;""")
-    params = {'author': author}
-    results = conn.execute(query, params).fetchall()
+    graph = get_alias_graph(conn)
+    if graph:
+        results = [_AliasIdsRow(id1, graph.names.get(id1),
+                                id2, graph.names.get(id2),
+                                id3, graph.names.get(id3))
+                   for id1, id2, id3 in graph.join_rows(graph.author_ids_for_name(author))]
+    else:
+        # This would be much nicer if I had a newer MySQL/Maria with CTEs...
+        # The two lots of joins are because we don't know if we have been given
+        # a real name or an alias, so we try going "in both directions".
+        query = text("""SELECT a1.author_id id1, a1.author_canonical author1,
+              a2.author_id id2, a2.author_canonical author2,
+              a3.author_id id3, a3.author_canonical author3
+      FROM authors a1
+      left outer join pseudonyms p1 on p1.author_id = a1.author_id
+      left outer join authors a2 on p1.pseudonym = a2.author_id
+      left outer join pseudonyms p2 on p2.pseudonym = a1.author_id
+      left outer join authors a3 on p2.author_id = a3.author_id
+      where a1.author_canonical = :author
+         or a1.author_legalname = :author;""")
+        params = {'author': author}
+        results = conn.execute(query, params).fetchall()
 
     # Uggh, horrible copypasting from above
     def name_words(name):
@@ -286,6 +321,10 @@ def get_real_author_id_and_name(conn, pseudonym_id):
     return a list of the "real" author_ids, or None if this is the "real" ID.
 
     """
+    graph = get_alias_graph(conn)
+    if graph:
+        return [AuthorIdAndName(*z) for z in graph.real_authors(pseudonym_id)] or None
+
     query = text("""SELECT p.author_id, a.author_canonical name
     FROM pseudonyms p
     LEFT OUTER JOIN authors a ON (a.author_id = p.author_id)
@@ -299,11 +338,68 @@ def get_real_author_id_and_name(conn, pseudonym_id):
         return None
 
 
+def get_real_author_ids_and_names(conn, pseudonym_ids):
+    """
+    Bulk version of get_real_author_id_and_name: given an iterable of numeric
+    pseudonym_ids, return a dict mapping each pseudonym_id to a list of the
+    "real" AuthorIdAndName tuples.  IDs which are "real" (i.e. not pseudonyms)
+    are not present in the returned dict.
+    """
+    ids = list({z for z in pseudonym_ids if z})
+    if not ids:
+        return {}
+    graph = get_alias_graph(conn)
+    if graph:
+        ret = {}
+        for pseudonym_id in ids:
+            real_authors = graph.real_authors(pseudonym_id)
+            if real_authors:
+                ret[pseudonym_id] = [AuthorIdAndName(*z) for z in real_authors]
+        return ret
+
+    query = text("""SELECT p.pseudonym, p.author_id, a.author_canonical name
+    FROM pseudonyms p
+    LEFT OUTER JOIN authors a ON (a.author_id = p.author_id)
+    WHERE p.pseudonym IN :pseudonym_ids
+    ORDER BY p.pseudonym, p.author_id;""") # ORDER BY as per get_real_author_id_and_name
+    results = conn.execute(query, {'pseudonym_ids': ids})
+    ret = defaultdict(list)
+    for row in results:
+        ret[row.pseudonym].append(AuthorIdAndName(row.author_id, row.name))
+    return dict(ret)
+
+
+def get_real_author_ids_and_names_for_titles(conn, title_ids):
+    """
+    Same return value as get_real_author_ids_and_names(), but for all the
+    credited authors of the given title_ids.  If the title_real_authors
+    derived table is available, this is a single indexed lookup, otherwise
+    it's None and the caller should fall back to get_real_author_ids_and_names()
+    """
+    ids = list({z for z in title_ids if z})
+    if not ids or not has_derived_tables(conn):
+        return None
+    query = text("""SELECT DISTINCT author_id, real_author_id, real_author_name name
+    FROM title_real_authors
+    WHERE title_id IN :title_ids
+      AND real_author_id != author_id
+    ORDER BY author_id, real_author_id;""") # ORDER BY as per get_real_author_id_and_name
+    results = conn.execute(query, {'title_ids': ids})
+    ret = defaultdict(list)
+    for row in results:
+        ret[row.author_id].append(AuthorIdAndName(row.real_author_id, row.name))
+    return dict(ret)
+
+
 def get_real_author_id_and_name_from_name(conn, pseudonym):
     """
     Same as get_real_author_id_and_name, but takes a name string rather than a
     numeric ID
     """
+    graph = get_alias_graph(conn)
+    if graph:
+        return _get_real_author_id_and_name_from_name_via_graph(graph, pseudonym)
+
     # r_details = details about the real/canonical entry
     # p_pdetails = details about the real/canonical entry
     query = text("""SELECT r_details.author_id, r_details.author_canonical name
@@ -334,6 +430,22 @@ def get_real_author_id_and_name_from_name(conn, pseudonym):
             return None
 
 
+def _get_real_author_id_and_name_from_name_via_graph(graph, pseudonym):
+    pseudonym_ids = graph.author_ids_for_name(pseudonym, include_legal_names=False)
+    real_ids = []
+    for pseudonym_id in pseudonym_ids:
+        real_ids.extend(z[0] for z in graph.real_authors(pseudonym_id))
+    if real_ids:
+        # As per the query, a missing real author record gives a NULL ID,
+        # which MySQL sorts first
+        ret = [AuthorIdAndName(graph.existing_id(z), graph.names.get(z)) for z in real_ids]
+        return sorted(ret, key=lambda z: (z.id is not None, z.id or 0))
+    elif pseudonym_ids:
+        return [AuthorIdAndName(pseudonym_ids[0], graph.names[pseudonym_ids[0]])]
+    else:
+        return None
+
+
 def get_author_name(conn, author_id):
     """
     Return the author name for the given author_id
@@ -14,6 +14,8 @@ import sys
 from sqlalchemy.sql import text
 
 from common import (get_connection, parse_args, AmbiguousArgumentsError)
+from isfdb_lib.analysis_context import resolve_context
+from isfdb_lib.temp_id_tables import id_list_filter
 from author_aliases import (get_author_alias_ids, get_author_aliases,
                             get_real_author_id)
 from award_related import extract_authors_from_author_field
@@ -42,10 +44,11 @@ def get_urls(conn, author_ids, include_priority_values=False):
     # I'm not sure where ISFDB gets the "display label" for links from, I'm
     # guessing it's maybe hardcoded as some links don't have it e.g. a couple
     # for http://www.isfdb.org/cgi-bin/ea.cgi?20
-    query = text("""SELECT author_id, url
-    FROM webpages wp
-    WHERE wp.author_id IN :author_ids;""")
-    rows = conn.execute(query, {'author_ids':author_ids})
+    with id_list_filter(conn, 'wp.author_id', 'author_ids', author_ids) as (fltr, params):
+        query = text("""SELECT author_id, url
+        FROM webpages wp
+        WHERE %s;""" % (fltr))
+        rows = conn.execute(query, params).fetchall()
 
     # print(author_ids)
     aid_priority = {}
@@ -141,8 +144,13 @@ def get_author_gender_from_id_and_then_name(conn, author_id, name):
         # If we get here, then human-names has failed as well
         return GenderAndSource(None, None)
 
-gagfiatn_cache = {}
-def get_author_gender_from_ids_and_then_name_cached(conn, author_ids, name):
+def get_author_gender_from_ids_and_then_name_cached(conn, author_ids, name,
+                                                    context=None):
+    """
+    Cached version of get_author_gender_from_id_and_then_name(), using the
+    author_gender_from_ids_and_then_name cache of context (or the default
+    AnalysisContext)
+    """
     raw_key_bits = []
     for thing in (author_ids, name):
         if isinstance(thing, (list, tuple, set)):
@@ -150,12 +158,9 @@ def get_author_gender_from_ids_and_then_name_cached(conn, author_ids, name):
         else:
             raw_key_bits.append(thing)
     cache_key = tuple(raw_key_bits)
-    try:
-        return gagfiatn_cache[cache_key]
-    except KeyError:
-        x = get_author_gender_from_id_and_then_name(conn, author_ids, name)
-        gagfiatn_cache[cache_key] = x
-        return x
+    cache = resolve_context(context).cache('author_gender_from_ids_and_then_name')
+    return cache.get_or_set(
+        cache_key, lambda: get_author_gender_from_id_and_then_name(conn, author_ids, name))
 
 
 def gender_response_from_name(name, original_name):
@@ -231,16 +236,14 @@ def get_author_gender(conn, author_names):
         return GenderAndSource(None, msg)
 
 
-gag_cache = {}
-
-def get_author_gender_cached(conn, author_names):
-    cache_key = tuple(author_names)
-    try:
-        return gag_cache[cache_key]
-    except KeyError:
-        x = get_author_gender(conn, author_names)
-        gag_cache[cache_key] = x
-        return x
+def get_author_gender_cached(conn, author_names, context=None):
+    """
+    Cached version of get_author_gender(), using the author_gender cache of
+    context (or the default AnalysisContext)
+    """
+    cache = resolve_context(context).cache('author_gender')
+    return cache.get_or_set(tuple(author_names),
+                            lambda: get_author_gender(conn, author_names))
 
 
 if __name__ == '__main__':
@@ -14,8 +14,8 @@ Known bugs/issues:
 """
 
 from collections import defaultdict, Counter, namedtuple
+from contextlib import ExitStack
 from datetime import date
-from functools import reduce, lru_cache
 from itertools import chain
 import logging
 import pdb
@@ -25,12 +25,11 @@ import sys
 from sqlalchemy.sql import text
 
 from common import (get_connection, create_parser, parse_args,
-                    AmbiguousArgumentsError)
+                    AmbiguousArgumentsError, stream_results)
 from isfdb_utils import (convert_dateish_to_date, merge_similar_titles)
+from isfdb_lib.temp_id_tables import id_list_filter
 from author_aliases import (get_author_alias_ids,
                             get_real_author_id_and_name_from_name)
-from deduplicate import (DuplicatedOrMergedRecordError,
-                         make_list_excluding_duplicates)
 from publisher_variants import REVERSE_PUBLISHER_VARIANTS
 from author_bio import (get_author_bio, name_with_dates)
 
@@ -66,9 +65,6 @@ def safe_max(values, values_to_exclude=None):
 
 
 
-class DuplicateBookError(DuplicatedOrMergedRecordError):
-    pass
-
 # This probably needs more work - there's a difference between unknown (0000)
 # and never published (8888)
 FALLBACK_YEAR = 8888
@@ -86,91 +82,71 @@ class BookByAuthor(object):
     Originally a data class for all the books (and maybe other titles/pubs?) by an
     author with some useful helper properties, but increasingly large amounts
     of logic have been added.
-    """
-    # _tid_to_bba maps title_ids to BookByAuthor, and is used to merge duplicates
-    # (as determined by common title_id)
-    _tid_to_bba = {}
 
-    @classmethod
-    def reset_duplicate_cache(cls):
-        """
-        If you are processing multiple bibliographies, possibly for the same
-        or related author (e.g. variant, maybe co-author too), you need to clear
-        out the cache, otherwise later queries for bibliographies will return
-        zero or reduced rows.
-        """
-        cls._tid_to_bba = {}
+    An instance is created from the first get_raw_bibliography() row for a
+    title (or its variants), and the rest of that title's rows are added with
+    add_row() - see group_bibliography_rows().  __slots__ are used as a big
+    bibliography can have a lot of these.
+    """
+    __slots__ = ['title_id', 'parent_id', 'title_title', 'title_ttype',
+                 'copyright_date', '_copyright_dates',
+                 'pub_id', 'pub_title', 'publication_date', '_publication_dates',
+                 'isbns', 'pub_ctype', 'publishers', '_repackagings', '_titles',
+                 'pub_stuff', 'all_pub_stuff']
 
-    def __init__(self, row,
-                 allow_duplicates=False):
-        # Q: I don't see that allow_duplicates is ever used?
+    def __init__(self, row):
         self.title_id = row.title_id
         self.parent_id = row.title_parent
         self.title_title = row.title_title # Use the .title property over this (not sure what this means?)
         self.title_ttype = row.title_ttype
-
         self.copyright_date = convert_dateish_to_date(row.t_copyright)
-        self._copyright_dates = [self.copyright_date]
-
         self.pub_id = row.pub_id
         self.pub_title = row.pub_title
         self.publication_date = convert_dateish_to_date(row.p_publication_date)
-        self._publication_dates = [self.publication_date]
-        self.isbns = [row.pub_isbn]
         self.pub_ctype = row.pub_ctype # e.g. This could be COLLECTION/ANTHOLOGY for title=NOVEL
 
+        self._copyright_dates = []
+        self._publication_dates = []
+        self.isbns = []
+        self.publishers = set()
+        self._repackagings = set()
+        self._titles = Counter()
+        self.all_pub_stuff = []
+        self.add_row(row)
+        self.pub_stuff = self.all_pub_stuff[0]
+
+    def add_row(self, row):
+        """
+        Add the details of another row for the same title root
+        """
+        copyright_date = convert_dateish_to_date(row.t_copyright)
+        publication_date = convert_dateish_to_date(row.p_publication_date)
         pn = row.publisher_name
         sanitised_publisher = REVERSE_PUBLISHER_VARIANTS.get(pn, pn)
-        self.publishers = {sanitised_publisher}
 
         # Q: should this count twice if title and pub_title are the same?
         # A: It doesn't seem to make that much difference in the end, but it's
-        #    confusing for debugging, so now use a set comprehension to remove
-        #    dupes.
-        if self.title_ttype != self.pub_ctype:
-            logging.debug(f'REPACK {self.title_title} {self.title_ttype} '
-                          f'{self.pub_title} {row.pub_ctype}')
-            self._repackagings = {Repackaging(self.pub_title, self.pub_ctype,
-                                              self.publication_date)}
-            valid_titles = {self.title_title}
+        #    confusing for debugging, so now only count each distinct title once
+        #    per row.
+        if row.title_ttype != row.pub_ctype:
+            logging.debug('REPACK %s %s %s %s', row.title_title, row.title_ttype,
+                          row.pub_title, row.pub_ctype)
+            self._repackagings.add(Repackaging(row.pub_title, row.pub_ctype,
+                                               publication_date))
+            self._titles[row.title_title] += 1
         else:
-            logging.debug(f'= {self.title_title}, {self.title_id}, {self.title_ttype}, '
-                          f'{self.pub_title}, {row.pub_ctype}')
-            self._repackagings = set()
-            valid_titles = {z for z in [self.title_title, self.pub_title] if z}
-
-        self._titles = Counter(valid_titles)
-
-        self.pub_stuff = PubStuff(self.pub_id, self.publication_date,
-                                  row.pub_ptype, row.pub_price, sanitised_publisher)
-        self.all_pub_stuff = [self.pub_stuff]
-
-
-        key = self.parent_id or self.title_id
-        # self._title_id_to_titles[key].update([self.title, self.pub_title])
-        # self._publication_dict[key].update([self.copyright_date, self.publication_date])
-
-        try:
-            other = self._tid_to_bba[key]
-            other.merge_in_fields(self)
-            raise DuplicateBookError('%s (id=%d) already known as %s (id=%d)' %
-                                     (self.title, self.title_id,
-                                      other.title, other.title_id))
-
-        except KeyError:
-            self._tid_to_bba[key] = self
-
-
-    def merge_in_fields(self, other):
-        self._titles.update(other._titles)
-        self._copyright_dates.extend(other._copyright_dates)
-        self._publication_dates.extend(other._publication_dates)
-        self.isbns.extend(other.isbns)
-        self.publishers.update(other.publishers)
-        self.all_pub_stuff.extend(other.all_pub_stuff)
-        if other._repackagings: # only log if something actually being added
-            logging.debug(f'Repacking {other._repackagings} into {self.title_title}/{self.title_id}')
-        self._repackagings.update(other._repackagings)
+            logging.debug('= %s, %s, %s, %s, %s', row.title_title, row.title_id,
+                          row.title_ttype, row.pub_title, row.pub_ctype)
+            for valid_title in dict.fromkeys(z for z in (row.title_title, row.pub_title) if z):
+                self._titles[valid_title] += 1
+
+        self._copyright_dates.append(copyright_date)
+        self._publication_dates.append(publication_date)
+        self.isbns.append(row.pub_isbn)
+        self.publishers.add(sanitised_publisher)
+        self.all_pub_stuff.append(PubStuff(row.pub_id, publication_date,
+                                           row.pub_ptype, row.pub_price,
+                                           sanitised_publisher))
 
     @property
     def earliest_copyright_date(self):
@@ -248,12 +224,10 @@ class BookByAuthor(object):
         return ret
 
     @property
-    @lru_cache()
     def title(self):
         return self.prioritized_titles[0]
 
     @property
-    @lru_cache()
     def year(self):
         dt = safe_min([self.earliest_copyright_date, self.earliest_publication_date])
         if not dt:
@@ -326,6 +300,27 @@ class BookByAuthor(object):
 class BadFiltersError(Exception):
     pass
 
+
+def _id_filters(conn, stack, filters, value_map):
+    """
+    Return the WHERE clause for the author_ids and/or title_ids in filters,
+    adding the relevant params to value_map.  Long lists of IDs go via
+    temporary tables, which are dropped when the ExitStack stack is closed.
+    """
+    filter_bits = []
+    for param_name, column in (('author_ids', 'author_id'),
+                               ('title_ids', 't.title_id')):
+        if param_name in filters:
+            fltr, params = stack.enter_context(
+                id_list_filter(conn, column, param_name, filters[param_name]))
+            filter_bits.append(fltr)
+            value_map.update(params)
+
+    if not filter_bits:
+        raise BadFiltersError('No known filters passed')
+    return ' AND '.join(filter_bits)
+
+
 def get_raw_title_ids(conn, filters):
     """
     Return a set of title_ids that match the provided filters.
@@ -346,24 +341,15 @@ def get_raw_title_ids(conn, filters):
     # Much of this is copypasted from get_raw_bibliography - TODO tidy up
 
     value_map = {'title_languages': VALID_LANGUAGE_IDS}
-    value_map.update(filters)
 
-    filter_bits = []
-    if 'author_ids' in filters:
-        filter_bits.append('author_id in :author_ids')
-    if 'title_ids' in filters:
-        filter_bits.append('t.title_id in :title_ids')
-
-    if not filter_bits:
-        raise BadFiltersError('No known filters passed')
-    filter_string = ' AND '.join(filter_bits)
-
-    query = text("""SELECT t.title_id, t.title_parent
-    FROM canonical_author ca
-    LEFT OUTER JOIN titles t ON ca.title_id = t.title_id
-    WHERE %s
-      AND title_language IN :title_languages; """ % (filter_string))
-    rows = conn.execute(query, value_map)
+    with ExitStack() as stack:
+        filter_string = _id_filters(conn, stack, filters, value_map)
+        query = text("""SELECT t.title_id, t.title_parent
+        FROM canonical_author ca
+        LEFT OUTER JOIN titles t ON ca.title_id = t.title_id
+        WHERE %s
+          AND title_language IN :title_languages; """ % (filter_string))
+        rows = conn.execute(query, value_map).fetchall()
     interim = [(z.title_id, z.title_parent) for z in rows]
     title_ids = set(chain(*interim))
     try:
@@ -375,6 +361,50 @@ def get_raw_title_ids(conn, filters):
 
 
 
+def _bibliography_params(title_types):
+    """
+    Return the params (other than the ID filters) for _bibliography_query()
+    """
+    # logging.debug(f'title_types={title_types}')
+    if not title_types:
+        title_types = DEFAULT_TITLE_TYPES
+
+    pub_types = set()
+    for tt in title_types:
+        if tt == 'SHORTFICTION':
+            # OMNIBUS also?
+            pub_types.update(['COLLECTION', 'CHAPBOOK', 'ANTHOLOGY', 'MAGAZINE'])
+        else:
+            # Assume user knew what they were doing
+            pub_types.update([tt])
+
+    return {#'author_ids':author_ids,
+            'title_types': title_types,
+            'pub_types': list(pub_types), # Doesn't seem to like set?
+            'title_languages': VALID_LANGUAGE_IDS}
+
+
+def _bibliography_query(filter_string):
+    return text("""SELECT t.title_id, t.title_parent, t.title_title,
+              CAST(t.title_copyright AS CHAR) t_copyright,
+              t.series_id, t.title_seriesnum, t.title_seriesnum_2,
+              t.title_ttype,
+              p.pub_id, p.pub_title, CAST(p.pub_year as CHAR) p_publication_date,
+              p.pub_isbn, p.pub_price, p.pub_ptype, p.pub_ctype,
+              p.publisher_id, pl.publisher_name,
+              ca.author_id
+        FROM canonical_author ca
+        LEFT OUTER JOIN titles t ON ca.title_id = t.title_id
+        LEFT OUTER JOIN pub_content pc ON t.title_id = pc.title_id
+        LEFT OUTER JOIN pubs p ON pc.pub_id = p.pub_id
+        LEFT OUTER JOIN publishers pl ON p.publisher_id = pl.publisher_id
+        WHERE %s
+          AND t.title_ttype IN :title_types
+          AND p.pub_ctype IN :pub_types
+          AND title_language IN :title_languages
+        ORDER BY t.title_id, p.pub_year; """ % (filter_string))
+
+
 def get_raw_bibliography(conn, filters, title_types=DEFAULT_TITLE_TYPES):
     """
     Return a bunch of rows of all the publications matching the filters map
@@ -400,57 +430,32 @@ def get_raw_bibliography(conn, filters, title_types=DEFAULT_TITLE_TYPES):
     # Q: Why do we need to check both title_ttype and pub_ctype?  Isn't the
     #    first enough?
 
-    # logging.debug(f'title_types={title_types}')
-    if not title_types:
-        title_types = DEFAULT_TITLE_TYPES
-
-    pub_types = set()
-    for tt in title_types:
-        if tt == 'SHORTFICTION':
-            # OMNIBUS also?
-            pub_types.update(['COLLECTION', 'CHAPBOOK', 'ANTHOLOGY', 'MAGAZINE'])
-        else:
-            # Assume user knew what they were doing
-            pub_types.update([tt])
-
-    value_map = {#'author_ids':author_ids,
-                 'title_types': title_types,
-                 'pub_types': list(pub_types), # Doesn't seem to like set?
-                 'title_languages': VALID_LANGUAGE_IDS}
+    value_map = _bibliography_params(title_types)
+    with ExitStack() as stack:
+        filter_string = _id_filters(conn, stack, filters, value_map)
+        query = _bibliography_query(filter_string)
+        # Fetch everything now, as any temporary tables go when the stack closes
+        rows = conn.execute(query, value_map).fetchall()
+    return rows
 
-    value_map.update(filters)
 
-    filter_bits = []
-    if 'author_ids' in filters:
-        filter_bits.append('author_id in :author_ids')
-    if 'title_ids' in filters:
-        filter_bits.append('t.title_id in :title_ids')
 
-    if not filter_bits:
-        raise BadFiltersError('No known filters passed')
-    filter_string = ' AND '.join(filter_bits)
-
-    query = text("""SELECT t.title_id, t.title_parent, t.title_title,
-          CAST(t.title_copyright AS CHAR) t_copyright,
-          t.series_id, t.title_seriesnum, t.title_seriesnum_2,
-          t.title_ttype,
-          p.pub_id, p.pub_title, CAST(p.pub_year as CHAR) p_publication_date,
-          p.pub_isbn, p.pub_price, p.pub_ptype, p.pub_ctype,
-          p.publisher_id, pl.publisher_name,
-          ca.author_id
-    FROM canonical_author ca
-    LEFT OUTER JOIN titles t ON ca.title_id = t.title_id
-    LEFT OUTER JOIN pub_content pc ON t.title_id = pc.title_id
-    LEFT OUTER JOIN pubs p ON pc.pub_id = p.pub_id
-    LEFT OUTER JOIN publishers pl ON p.publisher_id = pl.publisher_id
-    WHERE %s
-      AND t.title_ttype IN :title_types
-      AND p.pub_ctype IN :pub_types
-      AND title_language IN :title_languages
-    ORDER BY t.title_id, p.pub_year; """ % (filter_string))
-    rows = conn.execute(query, value_map)
-    # print(len(rows)) # This only works if you do a .fetchall() above
-    return rows
+def group_bibliography_rows(rows):
+    """
+    Given an iterable of rows as per get_raw_bibliography(), return a list of
+    BookByAuthor, one per title root (i.e. a title and its variants), in order
+    of the root's first appearance.  This is a single pass over the rows, so
+    they can be streamed.
+    """
+    books = {}
+    for row in rows:
+        root_id = row.title_parent or row.title_id
+        book = books.get(root_id)
+        if book is None:
+            books[root_id] = BookByAuthor(row)
+        else:
+            book.add_row(row)
+    return list(books.values())
 
 
 
@@ -474,23 +479,7 @@ def get_bibliography(conn, filters,
 
     # rows = get_raw_bibliography(conn, author_ids, title_types)
     rows = get_raw_bibliography(conn, filters, title_types)
-
-    BookByAuthor.reset_duplicate_cache()
-
-    def make_bba(stuff, allow_duplicates):
-        """
-        Curried wrapper to BookByAuthor class.
-        """
-        bba =  BookByAuthor(stuff,
-                            allow_duplicates=allow_duplicates)
-        # if bba.year is None or bba.year == FALLBACK_YEAR:
-        #    logging.warning('Year is None or %s for %s (possibly unpublished?' %
-        #                    (FALLBACK_YEAR, bba))
-        return bba
-
-    books = make_list_excluding_duplicates(
-        rows, make_bba,
-        allow_duplicates=False, duplication_exception=DuplicateBookError)
+    books = group_bibliography_rows(rows)
 
     if not books:
         # Hack for 1975 Campbell New Writer winner P. J. Plauger, who seems to only
@@ -502,6 +491,59 @@ def get_bibliography(conn, filters,
     return sorted(books, key=lambda z: z.year)
 
 
+def get_bibliographies(conn, author_id_groups,
+                       title_types=DEFAULT_TITLE_TYPES):
+    """
+    Bulk equivalent of calling
+
+      get_bibliography(conn, {'author_ids': author_ids}, title_types)
+
+    for each of the lists of author IDs (typically an author and their
+    aliases) that are the values of the author_id_groups dict.  Returns a dict
+    with the same keys, mapping to sorted bibliographies.
+
+    Rather than a query per author, this is one query for all the IDs, whose
+    rows are streamed and handed out to the group(s) that each author_id
+    belongs to, and merged on their title root (parent or own title_id) as
+    they arrive.  The rows are in the same order as get_raw_bibliography()'s,
+    so each group sees exactly the rows it would have got from its own query,
+    in the same order.
+    """
+    groups_for_author_id = defaultdict(list)
+    for key, author_ids in author_id_groups.items():
+        for author_id in set(author_ids):
+            groups_for_author_id[author_id].append(key)
+
+    # Maps each key to a dict of title root to BookByAuthor, as per
+    # group_bibliography_rows()
+    books = {key: {} for key in author_id_groups}
+    if not groups_for_author_id:
+        return {key: [] for key in author_id_groups}
+
+    value_map = _bibliography_params(title_types)
+    with ExitStack() as stack:
+        filter_string = _id_filters(conn, stack,
+                                    {'author_ids': sorted(groups_for_author_id)},
+                                    value_map)
+        for row in stream_results(conn, _bibliography_query(filter_string), value_map):
+            root_id = row.title_parent or row.title_id
+            for key in groups_for_author_id[row.author_id]:
+                book = books[key].get(root_id)
+                if book is None:
+                    books[key][root_id] = BookByAuthor(row)
+                else:
+                    book.add_row(row)
+
+    ret = {}
+    for key, roots in books.items():
+        if not roots:
+            logging.warning('No books found for author IDs %s' % (author_id_groups[key]))
+        # The sort is stable, so ties are in order of first appearance, as
+        # per get_bibliography()
+        ret[key] = sorted(roots.values(), key=lambda z: z.year)
+    return ret
+
+
 def output_publisher_stats(publisher_counts, output_function=print,
                            min_percent=5, max_publishers=10):
     output_function(f'\n= This author has been published by the following =')
@@ -535,11 +577,12 @@ WHERE award_type_id = 31 AND award_cat_id = 413 AND award_level = 1;""")
     # Assumption: the award IDs are the parent titles
     # Hardcoding language 17 (English) is yet another hack
     # print(ret)
-    query2 = text("""SELECT t.title_id
-    FROM titles t
-    WHERE t.title_parent in :title_ids
-    AND t.title_language = 17;""")
-    more_rows = conn.execute(query2, {'title_ids': ret})
+    with id_list_filter(conn, 't.title_parent', 'title_ids', ret) as (fltr, params):
+        query2 = text("""SELECT t.title_id
+        FROM titles t
+        WHERE %s
+        AND t.title_language = 17;""" % (fltr))
+        more_rows = conn.execute(query2, params).fetchall()
     more_ids = list(z.title_id for z in more_rows)
     # print(more_ids)
     merged = set(ret + more_ids)
@@ -6,12 +6,15 @@ import sys
 
 from sqlalchemy.sql import text
 
-from common import get_connection, parse_args, get_filters_and_params_from_args
+from common import (get_connection, parse_args, get_filters_and_params_from_args,
+                    create_parser)
 
-from title_related import get_definitive_authors
+from title_related import get_definitive_authors_for_books
 from author_gender import get_author_gender_from_ids_and_then_name_cached
 from isfdb_utils import safe_year_from_date, convert_dateish_to_date
 from gender_analysis import year_data_as_cells
+from isfdb_lib.year_slicing import (args_for_year_chunks, merge_counters,
+                                    run_in_workers)
 
 class Book(object):
     def __init__(self, title_id, author=''):
@@ -93,12 +96,18 @@ def normalize_gender_source(src):
     else:
         return src
 
-def generate_gender_stats(conn, books, period='year', output_function=print):
-
+def _gender_stats(conn, books, period, line_function, context):
+    """
+    Return a (prefix/period/gender/source counts, gender counts, number of
+    books) tuple, calling line_function(book_number, text) for each author of
+    each book.
+    """
     gender_counts = Counter()
     pgs_counts = Counter() # prefix/period/gender/source
-    for i, row in enumerate(books, 1):
-        authors = get_definitive_authors(conn, Book(row.title_id))
+    books = list(books)
+    all_authors = get_definitive_authors_for_books(conn,
+                                                   [Book(z.title_id) for z in books])
+    for i, (row, authors) in enumerate(zip(books, all_authors), 1):
         for j, author in enumerate(authors, 1):
             if not author.id:
                 # There are a few (six as of Oct 2019) orphaned canonical_author
@@ -114,10 +123,10 @@ def generate_gender_stats(conn, books, period='year', output_function=print):
                      j, author, dt)
             gender, source = get_author_gender_from_ids_and_then_name_cached(conn,
                                                                              author.id,
-                                                                             author.name)
+                                                                             author.name,
+                                                                             context)
             gender_counts[gender] += 1
-            output_function('%4d. %s : %s (source:%s)' % (i, gender, label,
-                                                source))
+            line_function(i, '%s : %s (source:%s)' % (gender, label, source))
             sanitised_source = normalize_gender_source(source)
             if period == 'year':
                 if gender:
@@ -127,18 +136,62 @@ def generate_gender_stats(conn, books, period='year', output_function=print):
             else:
                 raise Exception('Dunno how to handle prefix/period "%s"' % (period))
             pgs_counts[k] += 1
+    return pgs_counts, gender_counts, len(books)
 
 
-
+def generate_gender_stats(conn, books, period='year', output_function=print,
+                          context=None):
+    pgs_counts, gender_counts, _ = _gender_stats(
+        conn, books, period,
+        lambda i, txt: output_function('%4d. %s' % (i, txt)),
+        context)
     output_function(gender_counts)
     return pgs_counts
 
 
 
+def _gender_stats_for_years(conn, args, period):
+    """
+    Worker process part of generate_gender_stats_by_year_chunks(), which
+    returns the output lines (as (book_number, text) tuples) rather than
+    outputting them
+    """
+    lines = []
+    rows = get_title_ids_for_year(conn, args)
+    pgs_counts, gender_counts, book_count = _gender_stats(
+        conn, rows, period, lambda i, txt: lines.append((i, txt)), None)
+    return pgs_counts, gender_counts, book_count, lines
+
+
+def generate_gender_stats_by_year_chunks(args, conn=None, period='year',
+                                         output_function=print, workers=None,
+                                         chunk_years=None):
+    """
+    Equivalent of generate_gender_stats(conn, get_title_ids_for_year(conn, args)),
+    but with the args.year range split into chunks that are run in worker
+    processes, as per isfdb_lib/year_slicing.py.  The output for each chunk
+    is output in year order once they are all done, numbered as if it had
+    been one run, followed by the overall gender totals.
+    """
+    chunk_args = [(z, period) for z in args_for_year_chunks(args, chunk_years, workers)]
+    results = run_in_workers(_gender_stats_for_years, chunk_args, conn=conn,
+                             workers=workers)
+    books_so_far = 0
+    for _, _, book_count, lines in results:
+        for i, txt in lines:
+            output_function('%4d. %s' % (books_so_far + i, txt))
+        books_so_far += book_count
+    output_function(merge_counters(z[1] for z in results))
+    return merge_counters(z[0] for z in results)
+
+
 if __name__ == '__main__':
-    args = parse_args(sys.argv[1:],
-                      description='Report on gender balance for published novels',
-                      supported_args='gy')
+    parser = create_parser(description='Report on gender balance for published novels',
+                           supported_args='gy')
+    parser.add_argument('-j', dest='workers', type=int, default=1,
+                        help='Number of worker processes to split the years '
+                        'between (0 = one per CPU)')
+    args = parse_args(sys.argv[1:], parser=parser)
     # pdb.set_trace()
 
     conn = get_connection()
@@ -153,8 +206,12 @@ if __name__ == '__main__':
 
 
     # rows = get_title_ids_for_year(conn, year, max_year, tags=['science fiction'])
-    rows = get_title_ids_for_year(conn, args)
-    stats = generate_gender_stats(conn, rows)
+    if args.workers == 1:
+        rows = get_title_ids_for_year(conn, args)
+        stats = generate_gender_stats(conn, rows)
+    else:
+        stats = generate_gender_stats_by_year_chunks(args, conn,
+                                                     workers=args.workers or None)
 
     # for k, c in sorted(stats.items()):
     #     print(k, c)
@@ -23,20 +23,18 @@ from common import (get_connection, parse_args, get_filters_and_params_from_args
 
 from publisher_books import (get_publisher_books, PublisherBooks,
                              get_original_novels)
-from bibliography import get_bibliography
+from bibliography import get_bibliographies
 from author_aliases import get_real_author_id_and_name, get_author_alias_ids
 from publisher_variants import PUBLISHER_VARIANTS
+from isfdb_lib.analysis_context import resolve_context
+from isfdb_lib.derived_tables import has_derived_tables, ORDINAL_TITLE_TYPES
+from isfdb_lib.temp_id_tables import id_list_filter
+from isfdb_lib.year_slicing import run_in_workers, split_years
 
 
 AUTHORS_TO_IGNORE = {'uncredited'}
 
 
-# Maps author_id to list of something.  A global variable so that once we've
-# looked up an author's bibliography, we can re-use that data if they come up
-# again
-bibliographies = {}
-
-
 # I'm sure I have tuples for this already, although maybe in another repo?
 # ... although I've now added book, so this isn't the same as the other
 # namedtuples
@@ -71,14 +69,108 @@ def is_same_book(bk1, bk2):
     return bk1_ids.intersection(bk2_ids)
 
 
+def fetch_bibliographies(conn, author_details, title_types=VALID_BOOK_TYPES,
+                         context=None):
+    """
+    Given a list of AuthorAndTitleStuff, return a list of the same length of
+    the bibliography of each one's author, adding any that aren't already
+    known to the bibliographies cache of the AnalysisContext, so that once
+    we've looked up an author's bibliography, we can re-use that data if they
+    come up again.
+
+    This used to call get_bibliography() for each author in turn; now all the
+    unknown bibliographies are fetched with one get_bibliographies() call, but
+    the results are the same as for doing them one by one, including an
+    author getting the bibliography of an earlier author whose alias they are.
+
+    Note that each author's aliases are still looked up one at a time, via
+    get_author_alias_ids(), which is two or three queries per author unless
+    the alias graph is enabled (ISFDB_ALIAS_GRAPH, see
+    isfdb_lib/alias_graph.py), in which case it's just dict lookups.  So for
+    reports on lots of authors, most of the win from fetching the
+    bibliographies in bulk depends on that being set.
+    """
+    bibliographies = resolve_context(context).cache('bibliographies')
+    # The cache is keyed on the title types as well as the author_id, as the
+    # context may be shared by reports on different types
+    types_key = tuple(sorted(z.upper() for z in title_types))
+
+    # Maps author_id to either an already known bibliography, or the key in
+    # author_id_groups that will have it
+    lookup = {}
+    author_id_groups = {}
+    sources = []
+    for details in author_details:
+        author_id = details.author_id
+        source = lookup.get(author_id)
+        if source is None:
+            source = bibliographies.get((types_key, author_id))
+        if source is None:
+            author_ids = [author_id]
+            # Not sure why I originally chose get_real_author_id_and_name(), it seems
+            # to only pick up parent authors, and we only need IDs here.
+            # Had to filter out gestalt pseudonyms (the 2 argument) - this probably needs
+            # revisiting/pondering...
+            # other_author_stuff = get_real_author_id_and_name(self.conn, author_id)
+            other_author_stuff = get_author_alias_ids(conn, details.author, 2)
+            if other_author_stuff:
+                # author_ids.extend([z.id for z in other_author_stuff])
+                author_ids.extend(other_author_stuff)
+            author_id_groups[author_id] = author_ids
+            source = author_id
+            for aid in author_ids:
+                lookup[aid] = author_id
+        sources.append(source)
+
+    new_bibliographies = get_bibliographies(conn, author_id_groups,
+                                            title_types=title_types)
+    for key, author_ids in author_id_groups.items():
+        for aid in author_ids:
+            bibliographies.set((types_key, aid), new_bibliographies[key])
+
+    return [z if isinstance(z, list) else new_bibliographies[z] for z in sources]
+
+
+
+def get_nth_novels_from_derived_tables(conn, title_ids):
+    """
+    Return a dict mapping (title_id, credited author_id) to which of that
+    author's novels the title is - 1 being their debut - for the titles in
+    title_ids, going by the author_title_ordinals derived table.  This is
+    equivalent to looking for the title in the bibliography that
+    fetch_bibliographies() gets, but without having to build it.
+
+    Only call this if has_derived_tables() is True.
+    """
+    # The ordinals are keyed on the credited author, and already take their
+    # aliases into account.  DISTINCT as title_real_authors has a row per
+    # real author.
+    with id_list_filter(conn, 'tra.title_id', 'title_ids', title_ids) as (fltr, params):
+        query = text("""SELECT DISTINCT tra.title_id, tra.author_id, o.ordinal
+          FROM title_real_authors tra
+          INNER JOIN title_root tr ON tr.title_id = tra.title_id
+          INNER JOIN author_title_ordinals o ON o.root_title_id = tr.root_title_id
+            AND o.author_id = tra.author_id
+          WHERE %s;""" % (fltr))
+        rows = conn.execute(query, params).fetchall()
+    return {(row.title_id, row.author_id): row.ordinal for row in rows}
+
+
+
 class DebutStats(PublisherBooks):
     def __init__(self, books, conn, original_books_only=True,
-                 title_types=VALID_BOOK_TYPES):
+                 title_types=VALID_BOOK_TYPES, context=None):
         super().__init__(books, conn, original_books_only)
         self.title_types = title_types
+        self.context = context
         self.bookstring = '/'.join([z.lower() for z in self.title_types])
         self._process()
 
+    def __getstate__(self):
+        state = super().__getstate__()
+        state['context'] = None
+        return state
+
     def _process(self):
         self.all_details = []
         # Dict mapping author name to book details; this is to avoid counting
@@ -92,43 +184,49 @@ class DebutStats(PublisherBooks):
                 details = AuthorAndTitleStuff(author_id, author_name,
                                               bk.title_id, bk.title, bk)
                 self.all_details.append(details)
-                author_ids = [author_id]
-                # Not sure why I originally chose get_real_author_id_and_name(), it seems
-                # to only pick up parent authors, and we only need IDs here.
-                # Had to filter out gestalt pseudonyms (the 2 argument) - this probably needs
-                # revisiting/pondering...
-                # other_author_stuff = get_real_author_id_and_name(self.conn, author_id)
-                other_author_stuff = get_author_alias_ids(self.conn, author_name, 2)
-                if other_author_stuff:
-                    # author_ids.extend([z.id for z in other_author_stuff])
-                    author_ids.extend(other_author_stuff)
-                try:
-                    bib = bibliographies[author_id]
-                except KeyError:
-                    filters = {'author_ids': author_ids}
-                    bib = get_bibliography(self.conn,
-                                           filters,
-                                           # author_name, # what was this needed for?
-                                           title_types=self.title_types)
-                    for aid in author_ids:
-                        bibliographies[aid] = bib
-                if len(bib) == 0:
-                    # This will come up if a novel has never been published standalone,
-                    # but only serialized or in an anthology
-                    # e.g. http://www.isfdb.org/cgi-bin/title.cgi?973501
-                    logging.warning('No bibliography found for author %s (%d)' %
-                                    (author_name, author_id))
-                    # pdb.set_trace()
-                    continue
 
-                # Check the title IDs and the title parent IDs to be (hopefully)
-                # sure of finding a match
-                debut_novel = bib[0]
-                if is_same_book(debut_novel, bk):
-                    if author_name not in self.debut_details:
-                        self.debut_details[author_name] = details
-                    # print('debut_ids=%s; bk_ids=%s' % (debut_ids, bk_ids))
-                    # print(bk.copyright_date, bk.best_copyright_date)
+        # If available, the derived table of everyone's nth novels saves
+        # having to get each author's bibliography
+        self.nth_novels = None
+        self.author_bibliographies = None
+        if set(z.upper() for z in self.title_types) == set(ORDINAL_TITLE_TYPES) and \
+           has_derived_tables(self.conn):
+            self.nth_novels = get_nth_novels_from_derived_tables(
+                self.conn, set(z.title_id for z in self.all_details))
+            for details in self.all_details:
+                nth = self.nth_novels.get((details.title_id, details.author_id))
+                if nth is None:
+                    logging.warning('No bibliography found for author %s (%d)' %
+                                    (details.author, details.author_id))
+                elif nth == 1 and details.author not in self.debut_details:
+                    self.debut_details[details.author] = details
+            return
+
+        # Kept so that nth_book_details doesn't depend on the bibliographies
+        # still being in the cache
+        self.author_bibliographies = fetch_bibliographies(self.conn, self.all_details,
+                                                          self.title_types,
+                                                          self.context)
+
+        for details, bib in zip(self.all_details, self.author_bibliographies):
+            author_id, author_name, bk = details.author_id, details.author, details.book
+            if len(bib) == 0:
+                # This will come up if a novel has never been published standalone,
+                # but only serialized or in an anthology
+                # e.g. http://www.isfdb.org/cgi-bin/title.cgi?973501
+                logging.warning('No bibliography found for author %s (%d)' %
+                                (author_name, author_id))
+                # pdb.set_trace()
+                continue
+
+            # Check the title IDs and the title parent IDs to be (hopefully)
+            # sure of finding a match
+            debut_novel = bib[0]
+            if is_same_book(debut_novel, bk):
+                if author_name not in self.debut_details:
+                    self.debut_details[author_name] = details
+                # print('debut_ids=%s; bk_ids=%s' % (debut_ids, bk_ids))
+                # print(bk.copyright_date, bk.best_copyright_date)
 
         for i, bk in enumerate(self.all_details, 1):
             # print(i,bk)
@@ -162,10 +260,22 @@ class DebutStats(PublisherBooks):
         code in this module uses 0.  (The other code doesn't display any number
         to the user, whereas the expectation is that these values will be shown
         or used in some other calculation such as average nth book.
+
+        This uses the author_title_ordinals derived table if _process() did,
+        otherwise it looks through the author's bibliography for the book.
         """
         ret = []
-        for bk_stuff in self.all_details:
-            bib = bibliographies[bk_stuff.author_id]
+        if self.nth_novels is not None:
+            for bk_stuff in self.all_details:
+                nth = self.nth_novels.get((bk_stuff.title_id, bk_stuff.author_id))
+                if nth is None:
+                    logging.warning(f'Failed to find {bk_stuff.book.title} in bibliography '
+                                    f'for {bk_stuff.author} ({bk_stuff.author_id})')
+                else:
+                    ret.append((nth, bk_stuff))
+            return ret
+
+        for bk_stuff, bib in zip(self.all_details, self.author_bibliographies):
             for i, bib_book in enumerate(bib, 1):
                 if is_same_book(bk_stuff.book, bib_book):
                     ret.append((i, bk_stuff))
@@ -281,11 +391,73 @@ def split_books_by_year(books):
     return sorted(year_to_books.items())
 
 
-def debut_report(conn, args, output_function=print):
+def _debut_report_for_year(conn, year, all_published_books, args, work_types,
+                           output_function=print, context=None):
+    """
+    Output the report for one year of debut_report(), and return its DebutStats
+    """
+    new_novels = get_original_novels(all_published_books, valid_pub_types=work_types)
+    non_backlist_novels = get_original_novels(all_published_books,
+                                              valid_pub_types=work_types,
+                                              year_difference_threshold=5)
+    num_backlist_novels = len(all_published_books) - len(non_backlist_novels)
+    ds = DebutStats(new_novels, conn, original_books_only=False,
+                    title_types=work_types, context=context)
+    output_function('Of %d %ss published in %d, %d (%d%%) were brand new %ss and %d classic %ss' %
+                    (len(all_published_books),
+                     ds.bookstring,
+                     year,
+                     len(new_novels), 100 * len(new_novels) / len(all_published_books),
+                     ds.bookstring,
+                     num_backlist_novels, ds.bookstring
+                    ))
+
+    if ds.book_author_count:
+        mean, weighted_mean, median, weighted_median= ds.average_nth_book
+        output_function('%s. %s (mean %dth/%dth book, median %dth/%dth book)' %
+                        (year, ds, mean, weighted_mean, median, weighted_median))
+        try:
+            if args.show_nth_detail:
+                ds.output_nth_detail(output_function)
+            if args.show_pub_detail:
+                ds.output_pub_detail(output_function)
+        except AttributeError: # Why might this blow up?
+            pass
+    if args.verbose:
+        for nth, bk in ds.nth_book_details:
+            pretty_nth = pretty_ordinal(nth)
+            output_function(f'{pretty_nth} novel by {bk.author} : {bk.title}')
+    return ds
+
+
+def _debut_report_for_years(conn, yearly_results, args, work_types):
+    """
+    Worker process version of the debut_report() loop, which returns a list of
+    (year, DebutStats, list-of-output-lines) rather than outputting anything
+    """
+    ret = []
+    for year, all_published_books in yearly_results:
+        lines = []
+        ds = _debut_report_for_year(conn, year, all_published_books, args,
+                                    work_types, lines.append)
+        ret.append((year, ds, lines))
+    return ret
+
+
+def debut_report(conn, args, output_function=print, context=None, workers=1):
     """
     Besides outputting a textual report, returns a sorted list of
     (year, DebutStats1.  Only years that had books published will be in the
     returned value, but this may include years where there were no debut novels.)
+
+    context is the AnalysisContext whose caches to use, by default the shared
+    one.
+
+    If workers is more than 1 (or None, meaning one per CPU), the years are
+    split into chunks which are processed in that many worker processes - see
+    isfdb_lib/year_slicing.py.  The output and returned values are the same,
+    but context is only used for the books query, as the workers have their
+    own.
     """
 
     work_types = args.work_types or VALID_BOOK_TYPES
@@ -297,39 +469,31 @@ def debut_report(conn, args, output_function=print):
                                   book_types=work_types)
 
     yearly_results = split_books_by_year(results)
-    for year, all_published_books in sorted(yearly_results):
-        new_novels = get_original_novels(all_published_books, valid_pub_types=work_types)
-        non_backlist_novels = get_original_novels(all_published_books,
-                                                  valid_pub_types=work_types,
-                                                  year_difference_threshold=5)
-        num_backlist_novels = len(all_published_books) - len(non_backlist_novels)
-        ds = DebutStats(new_novels, conn, original_books_only=False,
-                        title_types=work_types)
-        output_function('Of %d %ss published in %d, %d (%d%%) were brand new %ss and %d classic %ss' %
-                        (len(all_published_books),
-                         ds.bookstring,
-                         year,
-                         len(new_novels), 100 * len(new_novels) / len(all_published_books),
-                         ds.bookstring,
-                         num_backlist_novels, ds.bookstring
-                        ))
-
-        if ds.book_author_count:
-            mean, weighted_mean, median, weighted_median= ds.average_nth_book
-            output_function('%s. %s (mean %dth/%dth book, median %dth/%dth book)' %
-                            (year, ds, mean, weighted_mean, median, weighted_median))
-            try:
-                if args.show_nth_detail:
-                    ds.output_nth_detail(output_function)
-                if args.show_pub_detail:
-                    ds.output_pub_detail(output_function)
-            except AttributeError: # Why might this blow up?
-                pass
-        ret.append((year, ds))
-        if args.verbose:
-            for nth, bk in ds.nth_book_details:
-                pretty_nth = pretty_ordinal(nth)
-                output_function(f'{pretty_nth} novel by {bk.author} : {bk.title}')
+    if workers == 1 or len(yearly_results) <= 1:
+        for year, all_published_books in yearly_results:
+            ds = _debut_report_for_year(conn, year, all_published_books, args,
+                                        work_types, output_function, context)
+            ret.append((year, ds))
+        return ret
+
+    # The books query has already been done, so it's the years of books that
+    # get split up, rather than args.year
+    year_chunks = split_years(yearly_results[0][0], yearly_results[-1][0],
+                              workers=workers)
+    chunk_args = []
+    for from_year, to_year in year_chunks:
+        chunk = [z for z in yearly_results if from_year <= z[0] <= to_year]
+        if chunk:
+            chunk_args.append((chunk, args, work_types))
+    for chunk_results in run_in_workers(_debut_report_for_years, chunk_args,
+                                        conn=conn, workers=workers):
+        for year, ds, lines in chunk_results:
+            for line in lines:
+                output_function(line)
+            # Reattach what couldn't be sent back from the worker
+            ds.conn = conn
+            ds.context = context
+            ret.append((year, ds))
     return ret
 
 
@@ -341,7 +505,10 @@ if __name__ == '__main__':
                         help='Enable detailed output re. debut/nth novel')
     parser.add_argument('-D', dest='show_pub_detail', action='store_true',
                         help='Enable detailed output re. titles and publications')
+    parser.add_argument('-j', dest='workers', type=int, default=1,
+                        help='Number of worker processes to split the years '
+                        'between (0 = one per CPU)')
     args = parse_args(sys.argv[1:], parser=parser)
 
     conn = get_connection()
-    debut_report(conn, args)
+    debut_report(conn, args, workers=args.workers or None)
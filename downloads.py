@@ -7,7 +7,7 @@ Download and persist to filesystem content at URLs.  Includes functionality for:
 * etc
 """
 
-from datetime import datetime
+from datetime import datetime, timedelta
 from enum import Enum
 import logging
 import os
@@ -19,6 +19,8 @@ import time
 import requests
 from urllib.parse import urlparse
 
+from isfdb_lib.analysis_context import resolve_context
+
 
 class OverwriteBehaviour(Enum):
     OVERWRITE = 0
@@ -28,7 +30,8 @@ class OverwriteBehaviour(Enum):
 DOWNLOAD_DIR = os.path.join(os.path.dirname(__file__), 'download_cache')
 
 THROTTLE_SECONDS = 5
-throttled_domains = {} # maps sanitised domain/hostname to time of last download
+# The time of the last download from each sanitised domain/hostname is kept in
+# the throttled_domains cache of the AnalysisContext
 
 
 class UnableToSaveError(Exception):
@@ -71,7 +74,31 @@ def rename_with_timestamp_suffix(full_path, dont_die_if_doesnt_exist=True):
     ts = time.strftime('%Y%m%d%H%M%S', extant_ctime)
     os.rename(full_path, full_path + '_' + ts)
 
-def download_file_as(url, full_path, overwrite):
+def wait_for_throttle(domain, context=None):
+    """
+    Sleep until THROTTLE_SECONDS after the last download from domain.  The
+    slot is reserved before sleeping, so that other threads wanting the same
+    domain queue up behind this one, rather than all going at once.
+    """
+    throttled_domains = resolve_context(context).cache('throttled_domains')
+    with throttled_domains.lock:
+        now = datetime.now()
+        previous = throttled_domains.get(domain)
+        if previous is None:
+            # Domain hasn't been previously downloaded from, so no need to
+            # throttle or do anything
+            start = now
+        else:
+            start = max(now, previous + timedelta(seconds=THROTTLE_SECONDS))
+        throttled_domains.set(domain, start)
+    pause_for = (start - now).total_seconds()
+    if pause_for > 0:
+        logging.debug('Throttling request to %s for %.2f seconds' %
+                      (domain, pause_for))
+        time.sleep(pause_for)
+
+
+def download_file_as(url, full_path, overwrite, context=None):
     """
     Download file to a specific location - this is primarily intended for
     "internal use" by download_file(), but might be useful for downloads outside
@@ -87,23 +114,14 @@ def download_file_as(url, full_path, overwrite):
                                    (full_path), extant_file=full_path)
 
     if THROTTLE_SECONDS > 0: # Q: Will things work OK without this doing check?
-        now = datetime.now()
-        try:
-            previous = throttled_domains[domain]
-            difference = (now - previous).total_seconds()
-            if difference < THROTTLE_SECONDS:
-                pause_for = THROTTLE_SECONDS - difference
-                logging.debug('Throttling request to %s for %.2f seconds' %
-                              (domain, pause_for))
-                time.sleep(pause_for)
-
-        except KeyError:
-            # Domain hasn't been previously downloaded from, so no need to
-            # throttle or do anything
-            pass
+        wait_for_throttle(domain, context)
 
     req = requests.get(url)
-    throttled_domains[domain] = datetime.now()
+    throttled_domains = resolve_context(context).cache('throttled_domains')
+    with throttled_domains.lock:
+        # Don't go backwards if another thread has reserved a later slot
+        now = datetime.now()
+        throttled_domains.set(domain, max(now, throttled_domains.get(domain) or now))
     if req.ok:
         # logging.error("Status code = %s" % (req.status_code))
 
@@ -129,20 +147,22 @@ def download_file_as(url, full_path, overwrite):
                                                                  url))
 
 
-def download_file(url, overwrite=OverwriteBehaviour.RENAME_OLD_WITH_TIMESTAMP_SUFFIX):
+def download_file(url, overwrite=OverwriteBehaviour.RENAME_OLD_WITH_TIMESTAMP_SUFFIX,
+                  context=None):
     subdir, filename = sanitised_filename_for_url(url)
     full_dir = os.path.join(DOWNLOAD_DIR, subdir)
     if not os.path.exists(full_dir):
         os.mkdir(full_dir)
     full_path = os.path.join(full_dir, filename)
 
-    return download_file_as(url, full_path, overwrite)
+    return download_file_as(url, full_path, overwrite, context)
 
-def download_file_only_if_necessary(url):
+def download_file_only_if_necessary(url, context=None):
     # TODO: optionally redownload and overwrite files over a user-specified age?
     #       Maybe that should be in download_file()?
     try:
-        fn = download_file(url, overwrite=OverwriteBehaviour.NEVER_OVERWRITE)
+        fn = download_file(url, overwrite=OverwriteBehaviour.NEVER_OVERWRITE,
+                           context=context)
     except CannotOverwriteError as err:
         logging.debug('Already downloaded %s as %s' % (url, err.extant_file))
         fn = err.extant_file
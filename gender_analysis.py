@@ -13,7 +13,7 @@ from author_gender import (get_author_gender_cached,
                            get_author_gender_from_ids_and_then_name_cached,
                            UnableToDeriveGenderError)
 from award_related import extract_authors_from_author_field
-from title_related import get_authors_for_title, get_definitive_authors
+from title_related import get_authors_for_title, get_definitive_authors_for_books
 
 GenderStats = namedtuple('GenderStats',
                          'by_gender, by_gender_and_source, '
@@ -23,7 +23,7 @@ GenderType = namedtuple('GenderType', 'heading, key')
 
 
 def analyse_authors_by_gender(conn, books, output_function=print,
-                              prefix_property='year'):
+                              prefix_property='year', context=None):
     """
     Given a list of objects that have an author or title_id property,
     return some aggregated stats about them,
@@ -42,8 +42,10 @@ def analyse_authors_by_gender(conn, books, output_function=print,
     year_gender_source_appearance_counts = Counter()
     author_gender = {}
     ignored = [] # TODO: Remove as we don't use it that I can see now?
-    for book in books:
-        author_bits = get_definitive_authors(conn, book)
+    books = list(books)
+    # Resolve all the authors up front, rather than doing several queries per book
+    all_author_bits = get_definitive_authors_for_books(conn, books)
+    for book, author_bits in zip(books, all_author_bits):
         # print(author_bits)
 
         # Use those <<<<<<<<<<<<<<<<<<<< THIS COMMENT MAKES NO SENSE IN THIS CONTEXT?!?!?
@@ -58,7 +60,8 @@ def analyse_authors_by_gender(conn, books, output_function=print,
                 # Try the author_id...
                 try:
                     g_s = get_author_gender_from_ids_and_then_name_cached(conn, author.id,
-                                                                          author.name)
+                                                                          author.name,
+                                                                          context)
                 except UnableToDeriveGenderError as err:
                     # ...and if that fails, fall back to the name
                     pass # rely on "not g_s" to trigger the code a bit further down
@@ -87,7 +90,7 @@ def analyse_authors_by_gender(conn, books, output_function=print,
                     else:
                         name = author
                     # g_s = get_author_gender(conn, [name])
-                    g_s = get_author_gender_cached(conn, [name])
+                    g_s = get_author_gender_cached(conn, [name], context)
 
                 gender = g_s.gender or 'unknown'
                 output_function('%s : %s : %s : %s' % (getattr(book, prefix_property),
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+An optional in-memory copy of the authors and pseudonyms tables, so that the
+author_aliases.py functions can be answered from dicts, rather than by one or
+two queries each - which adds up when something like debut_novel_stats.py or
+bulk_author_gender.py calls them for thousands of authors.
+
+It is off by default, as loading it takes a few seconds and a few hundred MB,
+which is a waste for scripts that only look up a handful of authors.  Turn it
+on with the ISFDB_ALIAS_GRAPH environment variable, or enable_alias_graph().
+It's then loaded the first time that get_alias_graph() is called for each
+database, and kept until that database's dump version (as per
+common.get_dump_version()) changes - e.g. a long-running server that has a new
+dump loaded underneath it.  As that takes a couple of queries, it is only
+checked every DUMP_VERSION_CHECK_INTERVAL seconds.
+
+The aim is to give exactly the same results as the SQL in author_aliases.py,
+which is why join_rows() reproduces the rows of the LEFT OUTER JOINs there,
+duplicates and all.  The one approximation is name matching: the ISFDB tables
+use a case insensitive collation that ignores trailing spaces, which is what
+the name index does, but that collation also treats some accented letters as
+equal, which this doesn't.
+"""
+
+from collections import Counter, defaultdict
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy.sql import text
+
+from isfdb_lib.common import get_dump_version
+
+
+DUMP_VERSION_CHECK_INTERVAL = 60
+
+_enabled = None
+# Maps each database URL to a (dump version, time it was checked, AliasGraph)
+# tuple
+_graphs = {}
+_graphs_lock = threading.Lock()
+
+
+def _name_key(name):
+    return name.lower().rstrip(' ')
+
+
+class AliasGraph(object):
+    """
+    authors is an iterable of (author_id, author_canonical, author_legalname)
+    and pseudonyms an iterable of (pseudonym, author_id) i.e. rows from the
+    respective tables.
+    """
+    def __init__(self, authors, pseudonyms):
+        self.names = {}
+        self.legal_names = {}
+        self._ids_by_name = defaultdict(list)
+        self._ids_by_canonical_name = defaultdict(list)
+        for author_id, canonical, legal in authors:
+            self.names[author_id] = canonical
+            self.legal_names[author_id] = legal
+            if canonical is not None:
+                self._ids_by_name[_name_key(canonical)].append(author_id)
+                self._ids_by_canonical_name[_name_key(canonical)].append(author_id)
+            if legal is not None and \
+               (canonical is None or _name_key(legal) != _name_key(canonical)):
+                self._ids_by_name[_name_key(legal)].append(author_id)
+
+        # Adjacency lists in both directions, keeping any duplicate rows, as
+        # the SQL joins would
+        self.pseudonyms_of = defaultdict(list)
+        self.real_authors_of = defaultdict(list)
+        for pseudonym, author_id in pseudonyms:
+            self.pseudonyms_of[author_id].append(pseudonym)
+            self.real_authors_of[pseudonym].append(author_id)
+        for adjacency in (self.pseudonyms_of, self.real_authors_of):
+            for ids in adjacency.values():
+                ids.sort()
+        # i.e. how many people use each pseudonym, for get_gestalt_ids()
+        self.pseudonym_use_counts = Counter({k: len(v) for k, v in
+                                             self.real_authors_of.items()})
+
+    @classmethod
+    def load(cls, conn):
+        authors = conn.execute(text("""SELECT author_id, author_canonical, author_legalname
+          FROM authors;"""))
+        pseudonyms = conn.execute(text('SELECT pseudonym, author_id FROM pseudonyms;'))
+        return cls(((z.author_id, z.author_canonical, z.author_legalname) for z in authors),
+                   ((z.pseudonym, z.author_id) for z in pseudonyms))
+
+    def author_ids_for_name(self, name, include_legal_names=True):
+        """
+        Return a sorted list of the author_ids whose canonical name - or legal
+        name, if include_legal_names - matches name
+        """
+        if name is None:
+            return []
+        lookup = self._ids_by_name if include_legal_names else self._ids_by_canonical_name
+        return sorted(lookup.get(_name_key(name), []))
+
+    def existing_id(self, author_id):
+        # An ID in pseudonyms that has no authors row comes back from the
+        # LEFT OUTER JOIN to authors as NULL
+        return author_id if author_id in self.names else None
+
+    def join_rows(self, author_ids):
+        """
+        Return a list of (id1, id2, id3) tuples equivalent to
+
+          FROM authors a1
+          left outer join pseudonyms p1 on p1.author_id = a1.author_id
+          left outer join authors a2 on p1.pseudonym = a2.author_id
+          left outer join pseudonyms p2 on p2.pseudonym = a1.author_id
+          left outer join authors a3 on p2.author_id = a3.author_id
+
+        for a1 in author_ids
+        """
+        ret = []
+        for id1 in author_ids:
+            if id1 not in self.names:
+                continue
+            for pseudonym in self.pseudonyms_of.get(id1) or [None]:
+                for real in self.real_authors_of.get(id1) or [None]:
+                    ret.append((id1, self.existing_id(pseudonym), self.existing_id(real)))
+        return ret
+
+    def real_authors(self, pseudonym_id):
+        """
+        Return a list of (author_id, name) tuples for the real authors behind
+        pseudonym_id, sorted by author_id, as get_real_author_id_and_name()'s
+        query does.  name is None if the real author's record is missing.
+        """
+        return [(z, self.names.get(z)) for z in self.real_authors_of.get(pseudonym_id, [])]
+
+
+def enable_alias_graph(enabled=True):
+    """
+    Override the ISFDB_ALIAS_GRAPH environment variable
+    """
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled():
+    if _enabled is not None:
+        return _enabled
+    return bool(os.environ.get('ISFDB_ALIAS_GRAPH'))
+
+
+def get_alias_graph(conn):
+    """
+    Return the AliasGraph for the connection's database, loading it if need
+    be, or None if the graph isn't enabled.
+    """
+    if not is_enabled():
+        return None
+    key = conn.engine.url.render_as_string(hide_password=True)
+    with _graphs_lock:
+        dump_version, checked_at, graph = _graphs.get(key, (None, 0, None))
+        now = time.time()
+        if graph is not None and now - checked_at >= DUMP_VERSION_CHECK_INTERVAL:
+            current_version = get_dump_version(conn)
+            if current_version != dump_version:
+                logging.info('Dump version changed from %s to %s, reloading alias graph' %
+                             (dump_version, current_version))
+                graph = None
+            else:
+                _graphs[key] = (dump_version, now, graph)
+        if graph is None:
+            # Drop any old graph before loading the new one, rather than
+            # briefly having both in memory
+            _graphs.pop(key, None)
+            dump_version = get_dump_version(conn)
+            graph = AliasGraph.load(conn)
+            _graphs[key] = (dump_version, time.time(), graph)
+            logging.info('Loaded alias graph of %d authors in %.3f seconds' %
+                         (len(graph.names), time.time() - now))
+    return graph
+
+
+def forget_alias_graphs():
+    with _graphs_lock:
+        _graphs.clear()
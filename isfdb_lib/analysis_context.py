@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+The caches that various modules keep whilst a report is run - author genders,
+bibliographies, when each website was last downloaded from, etc - used to be
+module level dicts that grew for the life of the process, and which weren't
+safe to use from more than one thread.  They now live in an AnalysisContext,
+which has a bounded, thread-safe LRU cache for each of them, and keeps
+hit/miss counts so that it's possible to see whether they are earning their
+keep.
+
+Functions that use these caches take an optional context argument; if it
+isn't passed, the process-wide default context (get_default_context()) is
+used, which is the same behaviour as before, other than the size limits.
+Pass a separate AnalysisContext per job if you want to keep jobs in the same
+process (e.g. a long-lived worker) from sharing - or evicting - each other's
+cached data, or want per-job stats:
+
+    context = AnalysisContext()
+    debut_report(conn, args, context=context)
+    for stats in context.stats():
+        print(stats)
+
+Note that a value that isn't cached yet can be worked out by two threads at
+the same time, as the lock isn't held whilst doing so (it typically involves
+database queries or downloads); the second one to finish wins.
+"""
+
+from collections import namedtuple, OrderedDict
+import threading
+
+
+DEFAULT_CACHE_SIZES = {
+    # author_gender.get_author_gender_cached()
+    'author_gender': 20000,
+    # author_gender.get_author_gender_from_ids_and_then_name_cached()
+    'author_gender_from_ids_and_then_name': 20000,
+    # debut_novel_stats.fetch_bibliographies() - these can be big
+    'bibliographies': 5000,
+    # downloads.download_file_as() throttling
+    'throttled_domains': 1000
+}
+
+CacheStats = namedtuple('CacheStats', 'name, hits, misses, size, max_size')
+
+_MISSING = object()
+
+
+class LRUCache(object):
+    """
+    A dict-like cache of at most max_size items, discarding the least
+    recently used ones when it gets full.  lock can be used by callers that
+    need to do several operations atomically.
+    """
+    def __init__(self, name, max_size):
+        self.name = name
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+        self._items = OrderedDict()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self._items[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def get_or_set(self, key, function):
+        """
+        Return the cached value for key, or if there isn't one, call function
+        (with no arguments) to get it, and cache that
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = function()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self._items.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def stats(self):
+        with self.lock:
+            return CacheStats(self.name, self.hits, self.misses, len(self._items),
+                              self.max_size)
+
+
+class AnalysisContext(object):
+    """
+    Owner of the caches listed in DEFAULT_CACHE_SIZES.  cache_sizes is an
+    optional dict to override some or all of those sizes.
+    """
+    def __init__(self, cache_sizes=None):
+        sizes = dict(DEFAULT_CACHE_SIZES)
+        if cache_sizes:
+            sizes.update(cache_sizes)
+        self.caches = {name: LRUCache(name, size) for name, size in sizes.items()}
+
+    def cache(self, name):
+        return self.caches[name]
+
+    def stats(self):
+        """
+        Return a list of CacheStats, one per cache, sorted by name
+        """
+        return [self.caches[z].stats for z in sorted(self.caches)]
+
+    def clear(self):
+        for cache in self.caches.values():
+            cache.clear()
+
+
+_default_context = AnalysisContext()
+
+
+def get_default_context():
+    return _default_context
+
+
+def resolve_context(context):
+    """
+    Return context, or the default context if that is None - for use by
+    functions with an optional context argument
+    """
+    return _default_context if context is None else context
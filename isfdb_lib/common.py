@@ -8,15 +8,19 @@ More specialized library functions should go elsewhere.
 """
 
 from argparse import ArgumentParser
+from contextlib import contextmanager
 import logging
 import os
 import pdb
 import sys
+import threading
 
 from sqlalchemy import create_engine
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.sql import text
 
 from isfdb_lib.expansions import EXPANSION_MAPPINGS
+from isfdb_lib import sql_stats as sql_stats_module
 
 class AmbiguousArgumentsError(Exception):
     pass
@@ -31,7 +35,27 @@ class AmbiguousArgumentsError(Exception):
 FORCE_UTF8 = True
 
 
-def get_connection(connection_string=None, force_utf8=FORCE_UTF8):
+# Connection pool settings for get_engine()/get_connection().  These only take
+# effect when the engine for a particular connection string is first created.
+# pool_recycle is in seconds, and is to avoid MariaDB's wait_timeout killing
+# connections that have been sat idle in the pool in long-running processes.
+# Plenty of code (including the tests) opens connections and never closes them,
+# so by default there is no limit on the number of connections, only on how
+# many are kept in the pool once returned; servers that want to cap how many
+# they open can pass max_overflow.
+DEFAULT_POOL_SIZE = 5
+DEFAULT_MAX_OVERFLOW = -1
+DEFAULT_POOL_PRE_PING = True
+DEFAULT_POOL_RECYCLE = 3600
+
+# Maps (final) connection string to Engine, so that all the modules in a process
+# share the same engine and connection pool, rather than each paying the cost of
+# engine setup and connection handshakes.
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def _build_connection_string(connection_string=None, force_utf8=FORCE_UTF8):
     # https://docs.sqlalchemy.org/en/latest/core/engines.html#database-urls
     # https://docs.sqlalchemy.org/en/latest/core/engines.html#mysql
     if not connection_string:
@@ -41,11 +65,168 @@ def get_connection(connection_string=None, force_utf8=FORCE_UTF8):
         # Passing encoding='utf8' to create_engine() doesn't make any difference
         # (Passing 'utf8mb4' gives "LookupError: unknown encoding: utf8mb4")
         connection_string += "?charset=utf8mb4"
-    engine = create_engine(connection_string)
+    return connection_string
+
+
+def get_engine(connection_string=None, force_utf8=FORCE_UTF8,
+               pool_size=DEFAULT_POOL_SIZE, max_overflow=DEFAULT_MAX_OVERFLOW,
+               pool_pre_ping=DEFAULT_POOL_PRE_PING,
+               pool_recycle=DEFAULT_POOL_RECYCLE):
+    """
+    Return the (per-process) shared Engine for the connection string, creating
+    it if this is the first time it has been asked for.
+
+    Note that the pool arguments are ignored if the engine already exists.
+    """
+    full_connection_string = _build_connection_string(connection_string, force_utf8)
+    with _engines_lock:
+        engine = _engines.get(full_connection_string)
+        if engine is None:
+            engine = create_engine(full_connection_string,
+                                   pool_size=pool_size,
+                                   max_overflow=max_overflow,
+                                   pool_pre_ping=pool_pre_ping,
+                                   pool_recycle=pool_recycle)
+            _engines[full_connection_string] = engine
+    return engine
+
+
+def dispose_engines(close=True):
+    """
+    Close all pooled connections and forget about the engines, e.g. before a
+    fork(), as pooled connections mustn't be shared between processes.  In the
+    child process, use reset_engines_after_fork() instead.
+    """
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose(close=close)
+        _engines.clear()
+
+
+def reset_engines_after_fork():
+    """
+    Forget about the engines inherited from the parent process, without closing
+    their connections, for use in an os.register_at_fork(after_in_child=...)
+    hook or a multiprocessing initializer.  Unlike dispose_engines(), this
+    doesn't take _engines_lock, which another of the parent's threads might
+    have been holding when it forked, and so would never be released here.
+    """
+    global _engines_lock
+    _engines_lock = threading.Lock()
+    for engine in list(_engines.values()):
+        engine.dispose(close=False)
+    _engines.clear()
+
+
+def get_connection(connection_string=None, force_utf8=FORCE_UTF8,
+                   query_cache=None, sql_stats=None, **pool_kwargs):
+    """
+    Return a connection from the shared engine/pool for the connection string,
+    which defaults to the one in the ISFDB_CONNECTION_DETAILS environment
+    variable.  pool_kwargs are passed to get_engine().
+
+    If query_cache is True - or None and the ISFDB_QUERY_CACHE_DIR environment
+    variable is set - the connection is wrapped so that SELECT results are
+    cached on disk; see query_cache.py
+
+    Similarly, sql_stats (or the ISFDB_SQL_STATS environment variable) turns on
+    the per-query timings etc in sql_stats.py
+
+    Callers that are finished with the connection should close() it to return
+    it to the pool, or else use connection() instead.
+    """
+    engine = get_engine(connection_string, force_utf8, **pool_kwargs)
+    if sql_stats is None:
+        sql_stats = bool(os.environ.get('ISFDB_SQL_STATS')) or \
+                    sql_stats_module.is_enabled()
+    if sql_stats:
+        sql_stats_module.instrument_engine(engine)
     conn = engine.connect()
+    if query_cache is None:
+        query_cache = bool(os.environ.get('ISFDB_QUERY_CACHE_DIR'))
+    if query_cache:
+        # Imported here, as query_cache.py imports this module
+        from isfdb_lib.query_cache import CachingConnection
+        conn = CachingConnection(conn)
     return conn
 
 
+@contextmanager
+def connection(connection_string=None, force_utf8=FORCE_UTF8, query_cache=None,
+               sql_stats=None, **pool_kwargs):
+    """
+    Context manager version of get_connection(), which returns the connection
+    to the pool on exit e.g.
+
+        with connection() as conn:
+            results = conn.execute(query, params).fetchall()
+    """
+    conn = get_connection(connection_string, force_utf8, query_cache, sql_stats,
+                          **pool_kwargs)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def get_dump_version(conn, allow_unknown=True):
+    """
+    Return a string that identifies which ISFDB dump the database was loaded
+    from, for use when deciding whether cached data derived from it is stale.
+
+    The ISFDB tables don't record the dump date, so this uses the schema version
+    and the highest submission ID, the latter of which goes up with every edit.
+    The ISFDB_DUMP_VERSION environment variable overrides this, for databases
+    without those tables, or if you want to force caches to be (in)valid.
+
+    If either of those can't be read, the string says so, which means that
+    every such database gets the same version; pass allow_unknown=False to get
+    None instead in that case.
+    """
+    override = os.environ.get('ISFDB_DUMP_VERSION')
+    if override:
+        return override
+    bits = []
+    known = True
+    for label, query in (('schema', 'SELECT MAX(metadata_schemaversion) FROM metadata;'),
+                         ('sub', 'SELECT MAX(sub_id) FROM submissions;')):
+        try:
+            val = conn.execute(text(query)).scalar()
+        except DBAPIError as err:
+            logging.warning('Unable to get %s for dump version: %s' % (label, err))
+            val = None
+        if val is None:
+            known = False
+        bits.append('%s%s' % (label, val))
+    if not known and not allow_unknown:
+        return None
+    return '-'.join(bits)
+
+
+# Rows fetched from the server at a time by stream_results()
+STREAM_BATCH_SIZE = 1000
+
+
+def stream_results(conn, query, params=None, batch_size=STREAM_BATCH_SIZE):
+    """
+    Generator yielding the rows of a text() query one at a time, using a
+    server-side cursor, so that memory use doesn't depend on the size of the
+    result set.
+
+    IMPORTANT: MySQL doesn't allow anything else to be run on the connection
+    until all the rows have been read (or the generator closed), so any
+    further queries whilst iterating need a different connection.  Also, the
+    query cache is bypassed, as the point of it is not to hold the whole
+    result set.
+    """
+    results = conn.execute(query.execution_options(yield_per=batch_size), params)
+    try:
+        for row in results:
+            yield row
+    finally:
+        results.close()
+
+
 def create_parser(description, supported_args):
     """
     Return an ArgumentParser with support for arguments specified by supported_args.
@@ -64,7 +245,8 @@ def create_parser(description, supported_args):
     * y : year(s) (e.g. "2001", "1970-2020")
 
     For many arguments, two argument variants are supported:
-    * -x foo : case insensitive pattern match
+    * -x foo : case insensitive pattern match (-x ^foo to only match at the start,
+      which is a lot quicker as it can use an index)
     * -X "Exact Match" : exact match, but can be passed multiple times for an OR check
     Notable exceptions: k/country,  l/limit, v/verbose and y/year,
 
@@ -147,6 +329,11 @@ def create_parser(description, supported_args):
 
     parser.add_argument('-v', action='store_true', dest='verbose',
                         help='Log verbosely')
+    parser.add_argument('--profile', nargs='?', dest='profile', const=True,
+                        metavar='PSTATS_FILE',
+                        help='Profile the Python and SQL, writing the pstats to '
+                        'PSTATS_FILE (default <script>.pstats) - use --profile=foo '
+                        'rather than --profile foo')
     return parser
 
 
@@ -157,6 +344,12 @@ def parse_args(cli_args, description='No description provided',
     if not parser:
         parser = create_parser(description, supported_args)
     args = parser.parse_args(cli_args)
+    if getattr(args, 'profile', None):
+        # Imported here, as profiling isn't something we normally want
+        from isfdb_lib.profiling import start_profiling
+        with _engines_lock:
+            engines = list(_engines.values())
+        start_profiling(None if args.profile is True else args.profile, engines)
     return args
 
 # TODO: The callers that rely on this should be updated to pass a dict with
@@ -188,6 +381,38 @@ def _generate_prefixed_column_name(column_name, name_mapping):
     return full_name
 
 
+# Pattern args starting with this are matched against the start of the value
+# only e.g. "-a ^Le" for authors whose names begin with Le
+PREFIX_ANCHOR = '^'
+
+
+def _start_of_year(year):
+    """
+    Return a date string that sorts before (or equal to) any DATE in the year,
+    including the partial ones like 1968-00-00 that ISFDB is full of, so
+    "col >= start of year N AND col < start of year N+1" gives the same rows
+    as "YEAR(col) = N".
+    """
+    return '%04d-00-00' % (year)
+
+
+def _pattern_filter(col, prm, val, params):
+    """
+    Return the SQL for a case insensitive pattern match, and add its
+    parameter to params.  Substring matches can't use an index whatever we do
+    (and FULLTEXT's word matching isn't the same thing), but prefix matches
+    can, provided the column isn't wrapped in LOWER().  As the ISFDB tables
+    use case insensitive collations, the bare LIKE matches (at least) the same
+    rows as the LOWER() one, which is kept so the results are the same
+    regardless.
+    """
+    if val.startswith(PREFIX_ANCHOR):
+        params[prm] = '%s%%' % (val[len(PREFIX_ANCHOR):].lower())
+        return '%s LIKE :%s AND LOWER(%s) LIKE :%s' % (col, prm, col, prm)
+    params[prm] = '%%%s%%' % (val.lower())
+    return 'LOWER(%s) LIKE :%s' % (col, prm)
+
+
 def get_filters_and_params_from_args(filter_args, column_name_mappings=None):
     # This theoretically is generic, but the tablename_foo column names
     # make it less so.  (TODO (maybe): have extra prefix arg?)
@@ -240,8 +465,7 @@ def get_filters_and_params_from_args(filter_args, column_name_mappings=None):
         if variants in ('pe', 'pex'): # pattern and exact match, optionally expand
             if val is not None:
                 # pattern variant
-                params[prm] = '%%%s%%' % (val.lower())
-                filters.append('LOWER(%s) LIKE :%s' % (col, prm))
+                filters.append(_pattern_filter(col, prm, val, params))
                 continue
 
             try:
@@ -288,19 +512,33 @@ def get_filters_and_params_from_args(filter_args, column_name_mappings=None):
             # e.g. '-n NOVEL -n CHAPBOOK' will match NOVEL *or* CHAPBOOK
             if val is None or len(val) == 0:
                 continue
-            params[prm] = [z.lower() for z in val]
-            filters.append('LOWER(%s) IN :%s' % (col, prm))
+            # The only 'g' column is title_ttype, an ENUM of uppercase values,
+            # so uppercasing the args gives the same results as LOWER()ing the
+            # column, but without stopping an index on it being used
+            params[prm] = [z.upper() for z in val]
+            filters.append('%s IN :%s' % (col, prm))
         elif variants == 'y': # year
             if val is None:
                 continue
+            # Rather than YEAR(col), which means every row has to be looked at,
+            # compare against the start of the years, which can use an index.
+            # The from_year/to_year/year params are no longer used in the SQL,
+            # but are kept in case anything looks at them.
             if '-' in val:
                 from_year, to_year = val.split('-')
                 params['from_year'] = (int(from_year)  if from_year else -1000)
                 params['to_year'] = (int(to_year) if to_year else 2999)
-                filters.append('YEAR(%s) BETWEEN :from_year AND :to_year' % (col))
+                if from_year:
+                    params['from_date'] = _start_of_year(params['from_year'])
+                    filters.append('%s >= :from_date' % (col))
+                # Even without a lower bound, this excludes NULLs, as YEAR() did
+                params['to_date'] = _start_of_year(params['to_year'] + 1)
+                filters.append('%s < :to_date' % (col))
             else:
                 params[prm] = int(val)
-                filters.append('YEAR(%s) = :%s' % (col, prm))
+                params['from_date'] = _start_of_year(params[prm])
+                params['to_date'] = _start_of_year(params[prm] + 1)
+                filters.append('%s >= :from_date AND %s < :to_date' % (col, col))
         elif variants == 't': # pass through to params, but do nothing with fltr
             params[prm] = val
 
@@ -0,0 +1,532 @@
+#!/usr/bin/env python3
+"""
+Memory-efficient replacements for the sets and dicts of ID strings used by
+ids_in_memory.py.
+
+Rather than millions of Python str objects, IDs are packed into 64-bit ints
+held in a sorted array('Q'), and looked up by binary search.  The packing is
+lossless w.r.t. the original string, so that membership tests and the IDs
+reported back to callers are exactly the same as they'd be with a plain set:
+
+* 13 digit strings (ISBN-13s) are stored as their integer value
+* 9 digits followed by a digit or X (ISBN-10s) are stored as
+  (first 9 digits * 11) + check digit, where X is 10
+* Any other 10 character string of digits and upper case letters (ASINs)
+  is stored as a base-36 integer
+
+The top byte of the int records which of these applies.  Anything that doesn't
+fit one of those patterns (which in practice is a tiny number of bogus values)
+is kept in an ordinary set/dict.
+
+The Fixer mappings additionally hold their values in parallel arrays, with
+status and priority being dictionary-encoded into one byte each.
+
+If numpy is installed, encode_ids_bulk() and CompactIdSet.find_keys() allow
+whole batches of IDs to be packed and looked up with vectorized operations.
+
+save_compact_ids() and load_compact_ids() write/read all three structures to a
+single binary cache file.  Loading just memory-maps the arrays, so is more or
+less instant, and multiple processes using the same file share the same
+physical memory via the page cache.
+"""
+
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping, Set
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+KIND_SHIFT = 56
+VALUE_MASK = (1 << KIND_SHIFT) - 1
+
+KIND_ISBN13 = 1
+KIND_ISBN10 = 2
+KIND_ALNUM10 = 3
+
+BASE36_DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+# Used in the parallel arrays to indicate there isn't a value
+NO_ID = 0
+
+
+def encode_id(val):
+    """
+    Return the packed integer form of an ID string, or None if it can't be
+    packed.
+    """
+    if not isinstance(val, str) or not val.isascii():
+        return None
+    length = len(val)
+    if length == 13 and val.isdigit():
+        return (KIND_ISBN13 << KIND_SHIFT) | int(val)
+    elif length == 10 and val.isalnum():
+        if val[:9].isdigit():
+            last = val[9]
+            if last == 'X':
+                return (KIND_ISBN10 << KIND_SHIFT) | (int(val[:9]) * 11 + 10)
+            elif last.isdigit():
+                return (KIND_ISBN10 << KIND_SHIFT) | (int(val[:9]) * 11 + int(last))
+        if val == val.upper():
+            return (KIND_ALNUM10 << KIND_SHIFT) | int(val, 36)
+    return None
+
+
+def decode_id(key):
+    """
+    Inverse of encode_id()
+    """
+    kind = key >> KIND_SHIFT
+    value = key & VALUE_MASK
+    if kind == KIND_ISBN13:
+        return '%013d' % (value)
+    elif kind == KIND_ISBN10:
+        core, check = divmod(value, 11)
+        return '%09d%s' % (core, 'X' if check == 10 else check)
+    elif kind == KIND_ALNUM10:
+        chars = []
+        for _ in range(10):
+            value, remainder = divmod(value, 36)
+            chars.append(BASE36_DIGITS[remainder])
+        return ''.join(reversed(chars))
+    else:
+        raise ValueError('%d is not a packed ID' % (key))
+
+
+# Number of IDs to process at a time in encode_ids_bulk(), to keep the size of
+# the temporary arrays in check
+BULK_CHUNK_SIZE = 65536
+
+if NUMPY_AVAILABLE:
+    _POW10_13 = 10 ** np.arange(12, -1, -1, dtype=np.int64)
+    _POW10_9 = _POW10_13[4:]
+    _POW36_10 = 36 ** np.arange(9, -1, -1, dtype=np.int64)
+    # Weights used for the ISBN-10 check digit...
+    _ISBN10_WEIGHTS = np.arange(1, 10, dtype=np.int64)
+    # ...and for the ISBN-13 check digit of 978 + first 9 digits of an ISBN-10;
+    # the 978 prefix contributes 9*1 + 7*3 + 8*1
+    _ISBN13_WEIGHTS = np.array([3, 1, 3, 1, 3, 1, 3, 1, 3], dtype=np.int64)
+    _ISBN13_PREFIX_SUM = 38
+
+
+def encode_ids_bulk(vals):
+    """
+    Vectorized version of encode_id(), that also works out the packed forms of
+    the ISBN-10 and ISBN-13 variants, as per isbn_functions.isbn10and13().
+    Returns a tuple of numpy uint64 arrays, each the same length as vals:
+
+    * keys - equivalent to encode_id(val)
+    * isbn10_keys - equivalent to encode_id(toISBN10(val))
+    * isbn13_keys - equivalent to encode_id(toISBN13(val))
+
+    with NO_ID wherever encode_id() would have returned None.  Requires numpy.
+    """
+    num_vals = len(vals)
+    ret = tuple(np.zeros(num_vals, dtype=np.uint64) for _ in range(3))
+    for start in range(0, num_vals, BULK_CHUNK_SIZE):
+        chunk = vals[start:start + BULK_CHUNK_SIZE]
+        for arr, chunk_arr in zip(ret, _encode_ids_chunk(chunk)):
+            arr[start:start + len(chunk)] = chunk_arr
+    return ret
+
+
+def _encode_ids_chunk(vals):
+    num_vals = len(vals)
+    lengths = np.fromiter(map(len, vals), dtype=np.int64, count=num_vals)
+    # Any strings longer than 13 characters are truncated here, but the
+    # length checks below mean that doesn't matter
+    codepoints = np.array(vals, dtype='<U13').view(np.uint32).reshape(
+        num_vals, 13).astype(np.int64)
+    is_digit = (codepoints >= 48) & (codepoints <= 57)
+    is_upper = (codepoints >= 65) & (codepoints <= 90)
+    digits = np.where(is_digit, codepoints - 48, 0)
+    core9 = digits[:, :9] @ _POW10_9
+
+    length13 = lengths == 13
+    length10 = lengths == 10
+    first9_digits = is_digit[:, :9].all(axis=1)
+    last_is_x = codepoints[:, 9] == ord('X')
+
+    isbn13 = length13 & is_digit.all(axis=1)
+    isbn10 = length10 & first9_digits & (is_digit[:, 9] | last_is_x)
+    alnum10 = length10 & ~isbn10 & (is_digit | is_upper)[:, :10].all(axis=1)
+
+    keys = np.zeros(num_vals, dtype=np.int64)
+    keys = np.where(isbn13, (KIND_ISBN13 << KIND_SHIFT) | (digits @ _POW10_13), keys)
+    keys = np.where(isbn10, (KIND_ISBN10 << KIND_SHIFT) |
+                    (core9 * 11 + np.where(last_is_x, 10, digits[:, 9])), keys)
+    base36 = np.where(is_digit, codepoints - 48, codepoints - 55)[:, :10] @ _POW36_10
+    keys = np.where(alnum10, (KIND_ALNUM10 << KIND_SHIFT) | base36, keys)
+
+    # toISBN10() only converts 978 prefixed 13 character strings, and only looks
+    # at the 9 characters after the prefix
+    convertible_to_10 = length13 & (codepoints[:, 0] == ord('9')) & \
+                        (codepoints[:, 1] == ord('7')) & \
+                        (codepoints[:, 2] == ord('8')) & \
+                        is_digit[:, 3:12].all(axis=1)
+    digits_3_to_12 = digits[:, 3:12]
+    isbn10_keys = np.where(convertible_to_10,
+                           (KIND_ISBN10 << KIND_SHIFT) |
+                           (digits_3_to_12 @ _POW10_9 * 11 +
+                            (digits_3_to_12 @ _ISBN10_WEIGHTS) % 11),
+                           keys)
+
+    # Similarly toISBN13() converts any 10 character string where the first 9
+    # characters are digits
+    convertible_to_13 = length10 & first9_digits
+    check13 = (10 - (_ISBN13_PREFIX_SUM + digits[:, :9] @ _ISBN13_WEIGHTS) % 10) % 10
+    isbn13_keys = np.where(convertible_to_13,
+                           (KIND_ISBN13 << KIND_SHIFT) |
+                           ((978 * 10 ** 9 + core9) * 10 + check13),
+                           keys)
+
+    return (keys.astype(np.uint64), isbn10_keys.astype(np.uint64),
+            isbn13_keys.astype(np.uint64))
+
+
+class CompactIdSet(Set):
+    """
+    Read-only set of ID strings.
+    """
+    def __init__(self, ids=()):
+        keys = set()
+        others = set()
+        for val in ids:
+            key = encode_id(val)
+            if key is None:
+                others.add(val)
+            else:
+                keys.add(key)
+        self.keys = array('Q', sorted(keys))
+        self.others = frozenset(others)
+
+    @classmethod
+    def from_parts(cls, keys, others):
+        """
+        Alternate constructor for when keys - which can be anything that
+        behaves like a sorted array('Q'), such as a memoryview onto a mmap -
+        have already been worked out.
+        """
+        obj = cls.__new__(cls)
+        obj.keys = keys
+        obj.others = frozenset(others)
+        return obj
+
+    def key_index(self, key):
+        """
+        Return the position of the packed key in self.keys, or -1
+        """
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return i
+        return -1
+
+    def index(self, val):
+        """
+        Return the position of the ID in self.keys (which is what any parallel
+        arrays are indexed by), or -1 if it isn't present or is one of the
+        unpackable values.
+        """
+        key = encode_id(val)
+        if key is None:
+            return -1
+        return self.key_index(key)
+
+    def __contains__(self, val):
+        key = encode_id(val)
+        if key is None:
+            return val in self.others
+        return self.key_index(key) >= 0
+
+    def find_keys(self, keys):
+        """
+        Vectorized version of key_index(): given a numpy uint64 array of
+        packed keys, return an int64 array of their positions in self.keys,
+        with -1 for those that aren't present.  (Requires numpy.)
+        """
+        stored = np.frombuffer(self.keys, dtype=np.uint64)
+        if len(stored) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(stored, keys), len(stored) - 1)
+        return np.where(stored[positions] == keys, positions, -1)
+
+    def __len__(self):
+        return len(self.keys) + len(self.others)
+
+    def __iter__(self):
+        for key in self.keys:
+            yield decode_id(key)
+        yield from self.others
+
+    def nbytes(self):
+        """
+        Approximate memory usage, comparable with sys.getsizeof() on a set
+        """
+        return self.keys.itemsize * len(self.keys) + sys.getsizeof(self.others)
+
+
+class _CodedColumn(object):
+    """
+    Dictionary-encoded column of values, one byte per row, for columns that
+    only have a handful of distinct values.
+    """
+    def __init__(self, codes=None, values=None):
+        self.codes = array('B') if codes is None else codes
+        self.values = values or []
+        self._value_to_code = {(type(z), z): i for i, z in enumerate(self.values)}
+
+    def append(self, val):
+        code = self._value_to_code.get((type(val), val))
+        if code is None:
+            code = len(self.values)
+            if code > 255:
+                raise ValueError('Too many distinct values for a coded column')
+            self.values.append(val)
+            self._value_to_code[(type(val), val)] = code
+        self.codes.append(code)
+
+    def __getitem__(self, i):
+        return self.values[self.codes[i]]
+
+    def nbytes(self):
+        return len(self.codes)
+
+
+def _encode_optional_id(val, i, exceptions):
+    """
+    Helper for the parallel ID arrays: return the packed form of val, or
+    NO_ID, in the latter case recording any (non-None) val in exceptions[i]
+    """
+    key = encode_id(val) if val is not None else None
+    if key is None:
+        if val is not None:
+            exceptions[i] = val
+        return NO_ID
+    return key
+
+
+def _decode_optional_id(key, i, exceptions):
+    if key != NO_ID:
+        return decode_id(key)
+    return exceptions.get(i)
+
+
+class _CompactIdMap(Mapping):
+    """
+    Read-only mapping from ID strings to values, where the values for the
+    packable keys are held in arrays parallel to self.ids.keys, and the values
+    for the rest are held in an ordinary dict.  Subclasses need to implement
+    _append_value() and _value_at().
+    """
+    def __init__(self, mapping):
+        self.ids = CompactIdSet(mapping.keys())
+        self.others = {z: mapping[z] for z in self.ids.others}
+        for i, key in enumerate(self.ids.keys):
+            self._append_value(i, mapping[decode_id(key)])
+
+    @classmethod
+    def from_parts(cls, ids, others, **columns):
+        """
+        Alternate constructor, where ids is a CompactIdSet, others is the dict
+        for the unpackable IDs, and columns are the subclass-specific
+        attributes.
+        """
+        obj = cls.__new__(cls)
+        obj.ids = ids
+        obj.others = others
+        for k, v in columns.items():
+            setattr(obj, k, v)
+        return obj
+
+    def __getitem__(self, val):
+        i = self.ids.index(val)
+        if i >= 0:
+            return self._value_at(i)
+        return self.others[val]
+
+    def __contains__(self, val):
+        return val in self.ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+
+class FixerIsbnMap(_CompactIdMap):
+    """
+    Compact version of the isbn_mappings dict returned by
+    ids_in_memory.load_fixer_ids(), i.e. ISBN to (status, priority, asin)
+    """
+    def __init__(self, mapping):
+        self.statuses = _CodedColumn()
+        self.priorities = _CodedColumn()
+        self.asins = array('Q')
+        self.asin_exceptions = {}
+        super().__init__(mapping)
+
+    def _append_value(self, i, value):
+        status, priority, asin = value
+        self.statuses.append(status)
+        self.priorities.append(priority)
+        self.asins.append(_encode_optional_id(asin, i, self.asin_exceptions))
+
+    def _value_at(self, i):
+        return (self.statuses[i], self.priorities[i],
+                _decode_optional_id(self.asins[i], i, self.asin_exceptions))
+
+    def nbytes(self):
+        return self.ids.nbytes() + self.statuses.nbytes() + \
+            self.priorities.nbytes() + self.asins.itemsize * len(self.asins)
+
+
+class FixerAsinMap(_CompactIdMap):
+    """
+    Compact version of the asin_mappings dict returned by
+    ids_in_memory.load_fixer_ids(), i.e. ASIN to ISBN (or None)
+    """
+    def __init__(self, mapping):
+        self.isbns = array('Q')
+        self.isbn_exceptions = {}
+        super().__init__(mapping)
+
+    def _append_value(self, i, value):
+        self.isbns.append(_encode_optional_id(value, i, self.isbn_exceptions))
+
+    def _value_at(self, i):
+        return _decode_optional_id(self.isbns[i], i, self.isbn_exceptions)
+
+    def nbytes(self):
+        return self.ids.nbytes() + self.isbns.itemsize * len(self.isbns)
+
+
+CACHE_FORMAT_VERSION = 1
+CACHE_MAGIC = b'ISFDBIDS'
+# Magic, then the length of the JSON header
+CACHE_PREAMBLE = struct.Struct('<8sQ')
+CACHE_ALIGNMENT = 8
+
+
+class StaleCacheError(Exception):
+    pass
+
+
+def _cache_arrays_and_header(all_ids, isbn_map, asin_map):
+    arrays = {
+        'all_keys': all_ids.keys,
+        'isbn_keys': isbn_map.ids.keys,
+        'isbn_statuses': isbn_map.statuses.codes,
+        'isbn_priorities': isbn_map.priorities.codes,
+        'isbn_asins': isbn_map.asins,
+        'asin_keys': asin_map.ids.keys,
+        'asin_isbns': asin_map.isbns
+    }
+    header = {
+        'all_others': list(all_ids.others),
+        'isbn_others': {k: list(v) for k, v in isbn_map.others.items()},
+        'isbn_status_values': isbn_map.statuses.values,
+        'isbn_priority_values': isbn_map.priorities.values,
+        'isbn_asin_exceptions': isbn_map.asin_exceptions,
+        'asin_others': asin_map.others,
+        'asin_isbn_exceptions': asin_map.isbn_exceptions
+    }
+    return arrays, header
+
+
+def save_compact_ids(filename, fingerprint, all_ids, isbn_map, asin_map):
+    """
+    Save a CompactIdSet, FixerIsbnMap and FixerAsinMap to a cache file, tagged
+    with fingerprint (some string that changes whenever the underlying data
+    does).  The file is written to a temporary name and then renamed, so
+    concurrent readers never see a partially written file.
+    """
+    arrays, header = _cache_arrays_and_header(all_ids, isbn_map, asin_map)
+    header['format_version'] = CACHE_FORMAT_VERSION
+    header['fingerprint'] = fingerprint
+    header['byteorder'] = sys.byteorder
+
+    # Work out where each array will go, relative to the end of the header
+    sections = {}
+    offset = 0
+    for name, arr in arrays.items():
+        nbytes = arr.itemsize * len(arr)
+        sections[name] = [offset, nbytes, arr.typecode if hasattr(arr, 'typecode')
+                          else arr.format]
+        offset += nbytes + (-nbytes % CACHE_ALIGNMENT)
+    header['sections'] = sections
+    header_bytes = json.dumps(header).encode('utf-8')
+    header_bytes += b' ' * (-(CACHE_PREAMBLE.size + len(header_bytes)) % CACHE_ALIGNMENT)
+
+    cache_dir = os.path.dirname(os.path.abspath(filename))
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_filename = tempfile.mkstemp(dir=cache_dir)
+    try:
+        with os.fdopen(fd, 'wb') as outputstream:
+            outputstream.write(CACHE_PREAMBLE.pack(CACHE_MAGIC, len(header_bytes)))
+            outputstream.write(header_bytes)
+            for name, arr in arrays.items():
+                data = bytes(arr)
+                outputstream.write(data)
+                outputstream.write(b'\0' * (-len(data) % CACHE_ALIGNMENT))
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        os.remove(tmp_filename)
+        raise
+
+
+def load_compact_ids(filename, fingerprint=None):
+    """
+    Return a (CompactIdSet, FixerIsbnMap, FixerAsinMap) tuple from a file
+    created by save_compact_ids(), with the arrays being read-only views onto
+    a memory-map of the file.  Raises StaleCacheError if the file is for a
+    different format version or (if specified) fingerprint.
+    """
+    with open(filename, 'rb') as inputstream:
+        mm = mmap.mmap(inputstream.fileno(), 0, access=mmap.ACCESS_READ)
+    buf = memoryview(mm)
+    magic, header_length = CACHE_PREAMBLE.unpack_from(buf)
+    if magic != CACHE_MAGIC:
+        raise StaleCacheError('%s is not an ID cache file' % (filename))
+    data_start = CACHE_PREAMBLE.size + header_length
+    header = json.loads(bytes(buf[CACHE_PREAMBLE.size:data_start]))
+    if header.get('format_version') != CACHE_FORMAT_VERSION or \
+       header.get('byteorder') != sys.byteorder:
+        raise StaleCacheError('%s is an incompatible version' % (filename))
+    if fingerprint is not None and header.get('fingerprint') != fingerprint:
+        raise StaleCacheError('%s is for %s, not %s' %
+                              (filename, header.get('fingerprint'), fingerprint))
+
+    arrays = {}
+    for name, (offset, nbytes, typecode) in header['sections'].items():
+        start = data_start + offset
+        arrays[name] = buf[start:start + nbytes].cast(typecode)
+
+    def int_keys(dct):
+        # JSON turns the int keys of the exceptions dicts into strings
+        return {int(k): v for k, v in dct.items()}
+
+    all_ids = CompactIdSet.from_parts(arrays['all_keys'], header['all_others'])
+    isbn_map = FixerIsbnMap.from_parts(
+        CompactIdSet.from_parts(arrays['isbn_keys'], header['isbn_others'].keys()),
+        {k: tuple(v) for k, v in header['isbn_others'].items()},
+        statuses=_CodedColumn(arrays['isbn_statuses'], header['isbn_status_values']),
+        priorities=_CodedColumn(arrays['isbn_priorities'], header['isbn_priority_values']),
+        asins=arrays['isbn_asins'],
+        asin_exceptions=int_keys(header['isbn_asin_exceptions']))
+    asin_map = FixerAsinMap.from_parts(
+        CompactIdSet.from_parts(arrays['asin_keys'], header['asin_others'].keys()),
+        header['asin_others'],
+        isbns=arrays['asin_isbns'],
+        isbn_exceptions=int_keys(header['asin_isbn_exceptions']))
+    return all_ids, isbn_map, asin_map
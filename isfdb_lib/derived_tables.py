@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+Precomputed ("derived") tables of things that lots of queries otherwise
+work out over and over again, built once after a dump has been imported:
+
+title_root
+  title_id => root_title_id, i.e. the same as the ubiquitous
+  CASE WHEN title_parent != 0 THEN title_parent ELSE title_id END, plus the
+  root's language and copyright date (as CHAR, as there are plenty of
+  partial/zero dates).
+title_real_authors
+  (title_id, credited author_id) => real author_id(s) and name(s), i.e.
+  canonical_author with the pseudonyms resolved.  Credited authors who aren't
+  pseudonyms map to themselves.
+title_first_pub
+  title_id => the earliest pub (with a known date) containing that title
+title_first_pub_by_country
+  (title_id, country) => the earliest pub from that country, going by
+  country_related.derive_country_from_price(), which is why this is built
+  in Python rather than with INSERT ... SELECT.
+author_title_ordinals
+  (credited author_id, root_title_id) => which novel it is in the
+  bibliography that debut_novel_stats.fetch_bibliographies() gets for that
+  author, 1 being their debut.  That is a bibliography.get_bibliography() of
+  the author plus the IDs that author_aliases.get_author_alias_ids() returns
+  for them, ignoring gestalts - so a pseudonym gets its real author(s)' books
+  as well as its own, and a gestalt gets all of its members' books.  Also
+  built in Python, by title_ordinal_rows().  The differences from the
+  bibliography route are that aliases are found by ID rather than by name,
+  and that fetch_bibliographies() can hand a later author the bibliography
+  of an earlier one whose alias they are, which depends on the order of the
+  books; the table doesn't try to reproduce that.
+
+A derived_tables_metadata table records the dump version (as per
+common.get_dump_version()) that they were built from.  has_derived_tables()
+only returns True if that matches the current database, so after a new dump
+is loaded the library silently goes back to the slower queries until the
+tables are rebuilt.  Setting the ISFDB_IGNORE_DERIVED_TABLES environment
+variable also forces the slower queries, which is useful for comparing
+results.
+
+tools/setup_testing_database.sh builds these (via tools/build_derived_tables.py)
+after loading the dump.  The SQL is MariaDB/MySQL specific.
+"""
+
+from collections import Counter, defaultdict, OrderedDict
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql import text
+
+from isfdb_lib.common import get_dump_version
+
+
+METADATA_TABLE = 'derived_tables_metadata'
+
+# Dates that extract_earliest_pub() in title_publications.py treats as unknown
+UNKNOWN_PUB_DATES = ('0000-00-00', '8888-00-00')
+
+INSERT_BATCH_SIZE = 5000
+
+DDL = OrderedDict([
+    ('title_root', """CREATE TABLE title_root (
+  title_id INT NOT NULL,
+  root_title_id INT NOT NULL,
+  root_language INT DEFAULT NULL,
+  root_copyright_dateish CHAR(10) DEFAULT NULL,
+  PRIMARY KEY (title_id),
+  KEY root_title_id (root_title_id)
+);"""),
+    ('title_real_authors', """CREATE TABLE title_real_authors (
+  title_id INT NOT NULL,
+  author_id INT NOT NULL,
+  real_author_id INT NOT NULL,
+  real_author_name MEDIUMTEXT,
+  PRIMARY KEY (title_id, author_id, real_author_id),
+  KEY real_author_id (real_author_id, title_id)
+);"""),
+    ('title_first_pub', """CREATE TABLE title_first_pub (
+  title_id INT NOT NULL,
+  pub_id INT NOT NULL,
+  pub_date CHAR(10) NOT NULL,
+  PRIMARY KEY (title_id)
+);"""),
+    ('title_first_pub_by_country', """CREATE TABLE title_first_pub_by_country (
+  title_id INT NOT NULL,
+  country VARCHAR(8) NOT NULL,
+  pub_id INT NOT NULL,
+  pub_date CHAR(10) NOT NULL,
+  PRIMARY KEY (title_id, country)
+);"""),
+    ('author_title_ordinals', """CREATE TABLE author_title_ordinals (
+  author_id INT NOT NULL,
+  root_title_id INT NOT NULL,
+  ordinal INT NOT NULL,
+  title_year INT NOT NULL,
+  PRIMARY KEY (author_id, root_title_id),
+  KEY root_title_id (root_title_id)
+);"""),
+    (METADATA_TABLE, """CREATE TABLE derived_tables_metadata (
+  dump_version VARCHAR(100) NOT NULL,
+  built_at DATETIME NOT NULL
+);""")
+])
+
+DERIVED_TABLE_NAMES = [z for z in DDL if z != METADATA_TABLE]
+
+POPULATE_SQL = {
+    # The parent's language/copyright are NULL if the parent record is missing,
+    # which CountrySpecificBook treats the same as a language mismatch
+    'title_root': """INSERT INTO title_root
+  SELECT t.title_id,
+    CASE WHEN t.title_parent != 0 THEN t.title_parent ELSE t.title_id END,
+    CASE WHEN t.title_parent != 0 THEN p.title_language ELSE t.title_language END,
+    CASE WHEN t.title_parent != 0 THEN CAST(p.title_copyright AS CHAR)
+         ELSE CAST(t.title_copyright AS CHAR) END
+  FROM titles t
+  LEFT OUTER JOIN titles p ON p.title_id = t.title_parent;""",
+    # IGNORE as there are (a handful of) duplicate canonical_author rows
+    'title_real_authors': """INSERT IGNORE INTO title_real_authors
+  SELECT ca.title_id, ca.author_id, COALESCE(p.author_id, ca.author_id),
+    a.author_canonical
+  FROM canonical_author ca
+  LEFT OUTER JOIN pseudonyms p ON p.pseudonym = ca.author_id
+  LEFT OUTER JOIN authors a ON a.author_id = COALESCE(p.author_id, ca.author_id)
+  WHERE ca.title_id IS NOT NULL AND ca.author_id IS NOT NULL;"""
+}
+
+# The ORDER BY matches the tie-breaking in title_publications.get_earliest_pub()
+PUB_DATES_QUERY = """SELECT pc.title_id, p.pub_id, CAST(p.pub_year AS CHAR) pub_date,
+    p.pub_price
+  FROM pub_content pc
+  INNER JOIN pubs p ON p.pub_id = pc.pub_id
+  WHERE pc.title_id IS NOT NULL
+  ORDER BY pc.title_id, p.pub_year, p.pub_id;"""
+
+# The ordinals are only built for novels, in the languages and with the
+# pseudonym handling that debut_novel_stats.py uses
+ORDINAL_TITLE_TYPES = ['NOVEL']
+ORDINAL_LANGUAGE_IDS = [17] # English, as per bibliography.VALID_LANGUAGE_IDS
+# Pseudonyms used by more than this many authors are treated as gestalts
+ORDINAL_GESTALT_THRESHOLD = 2
+# The year bibliography.BookByAuthor uses when there are no known dates
+ORDINAL_FALLBACK_YEAR = 8888
+
+# This is the SELECT of bibliography.get_raw_bibliography() cut down to what
+# the ordering of the books needs, and for every author
+ORDINAL_ROWS_QUERY = """SELECT ca.author_id, t.title_id, t.title_parent,
+    CAST(t.title_copyright AS CHAR) t_copyright,
+    CAST(p.pub_year AS CHAR) p_publication_date
+  FROM canonical_author ca
+  INNER JOIN titles t ON ca.title_id = t.title_id
+  INNER JOIN pub_content pc ON t.title_id = pc.title_id
+  INNER JOIN pubs p ON pc.pub_id = p.pub_id
+  WHERE t.title_ttype IN :title_types
+    AND p.pub_ctype IN :title_types
+    AND t.title_language IN :title_languages
+  ORDER BY t.title_id, p.pub_year;"""
+
+
+_availability = {}
+_availability_lock = threading.Lock()
+
+
+def has_derived_tables(conn):
+    """
+    Return True if the derived tables exist and are up to date for the current
+    dump.  This is only checked once per database per process.
+    """
+    if os.environ.get('ISFDB_IGNORE_DERIVED_TABLES'):
+        return False
+    key = conn.engine.url.render_as_string(hide_password=True)
+    with _availability_lock:
+        if key in _availability:
+            return _availability[key]
+    try:
+        built_version = conn.execute(text('SELECT dump_version FROM %s;' %
+                                          (METADATA_TABLE))).scalar()
+    except DBAPIError:
+        conn.rollback()
+        built_version = None
+    if built_version is None:
+        available = False
+    else:
+        # An unknown dump version could be any dump, so can't match
+        dump_version = get_dump_version(conn, allow_unknown=False)
+        available = built_version == dump_version
+        if not available:
+            logging.warning('Derived tables are for dump %s, not %s - ignoring them' %
+                            (built_version, dump_version or 'unknown'))
+    with _availability_lock:
+        _availability[key] = available
+    return available
+
+
+def forget_availability():
+    """
+    Make has_derived_tables() check again next time
+    """
+    with _availability_lock:
+        _availability.clear()
+
+
+def first_pub_rows(rows, country_function=None):
+    """
+    Given an iterable of (title_id, pub_id, pub_date, pub_price) sorted by
+    title_id then date, return a tuple of two lists:
+    * (title_id, pub_id, pub_date) of the earliest pub of each title
+    * (title_id, country, pub_id, pub_date) of the earliest pub of each title
+      from each country
+    Pubs with unknown dates are ignored.
+    """
+    if country_function is None:
+        # Imported here as country_related loads its data files on import, and
+        # has_derived_tables() gets imported by lots of modules
+        from country_related import derive_country_from_price
+        country_function = derive_country_from_price
+    first_pubs = []
+    first_pubs_by_country = []
+    country_cache = {}
+    current_title_id = None
+    seen_countries = set()
+    for title_id, pub_id, pub_date, pub_price in rows:
+        if not pub_date or pub_date in UNKNOWN_PUB_DATES:
+            continue
+        if title_id != current_title_id:
+            current_title_id = title_id
+            seen_countries = set()
+            first_pubs.append((title_id, pub_id, pub_date))
+        # Caching the country lookups means any warnings about unknown prices
+        # only get logged once
+        try:
+            country = country_cache[pub_price]
+        except KeyError:
+            country = country_cache[pub_price] = country_function(pub_price)
+        if country and country not in seen_countries:
+            seen_countries.add(country)
+            first_pubs_by_country.append((title_id, country, pub_id, pub_date))
+    return first_pubs, first_pubs_by_country
+
+
+def _dateish_year(dateish):
+    # Equivalent to isfdb_utils.convert_dateish_to_date(dateish).year, with
+    # None for the unknown 0000 year
+    if not dateish:
+        return None
+    return int(dateish[:4]) or None
+
+
+def alias_id_groups(author_ids, pseudonyms, more_than=ORDINAL_GESTALT_THRESHOLD):
+    """
+    Given an iterable of author_ids and an iterable of (pseudonym, author_id)
+    rows from the pseudonyms table, return a dict mapping each author_id to
+    the set of IDs whose books go in their bibliography, as per
+    debut_novel_stats.fetch_bibliographies().  That is the author_id, plus
+    what get_author_alias_ids(conn, name, more_than) returns, namely:
+    * their pseudonyms and real author(s)
+    * if they have real authors, the first of them (as per the order of the
+      pseudonyms rows) and that one's pseudonyms and real authors
+    less any pseudonyms used by more than more_than authors.
+    """
+    pseudonyms_of = defaultdict(list)
+    real_authors_of = defaultdict(list)
+    use_counts = Counter()
+    for pseudonym, author_id in pseudonyms:
+        pseudonyms_of[author_id].append(pseudonym)
+        real_authors_of[pseudonym].append(author_id)
+        use_counts[pseudonym] += 1
+
+    ret = {}
+    for author_id in author_ids:
+        ids = {author_id}
+        ids.update(pseudonyms_of.get(author_id, []))
+        real_ids = real_authors_of.get(author_id)
+        if real_ids:
+            primary_id = real_ids[0]
+            ids.update(real_ids)
+            ids.update(pseudonyms_of.get(primary_id, []))
+            ids.update(real_authors_of.get(primary_id, []))
+        ret[author_id] = {z for z in ids if use_counts[z] <= more_than} | {author_id}
+    return ret
+
+
+def title_ordinal_rows(rows, pseudonyms, more_than=ORDINAL_GESTALT_THRESHOLD):
+    """
+    Given an iterable of (author_id, title_id, title_parent, title_dateish,
+    pub_dateish) rows sorted by title_id then pub date, i.e. as per
+    ORDINAL_ROWS_QUERY, and an iterable of (pseudonym, author_id) rows from
+    the pseudonyms table, return a list of (author_id, root_title_id, ordinal,
+    title_year) tuples, for every author credited in the rows, covering the
+    books of everyone in their alias_id_groups().
+
+    The ordering matches bibliography.get_bibliography(), which sorts on the
+    year of the earliest copyright or publication date, with ties in order of
+    first appearance in the rows.
+    """
+    # Maps author_id to an OrderedDict of root_title_id => [first row, year]
+    books = defaultdict(OrderedDict)
+    for row_number, (author_id, title_id, parent_id, title_dateish,
+                     pub_dateish) in enumerate(rows):
+        root_id = parent_id or title_id
+        years = [z for z in (_dateish_year(title_dateish), _dateish_year(pub_dateish)) if z]
+        year = min(years) if years else None
+        book = books[author_id].get(root_id)
+        if book is None:
+            books[author_id][root_id] = [row_number, year]
+        elif year and (not book[1] or year < book[1]):
+            book[1] = year
+
+    ret = []
+    for author_id, group in alias_id_groups(list(books), pseudonyms, more_than).items():
+        roots = {}
+        for aid in group:
+            for root_id, (row_number, year) in books.get(aid, {}).items():
+                book = roots.get(root_id)
+                if book is None:
+                    roots[root_id] = [row_number, year]
+                else:
+                    book[0] = min(book[0], row_number)
+                    if year and (not book[1] or year < book[1]):
+                        book[1] = year
+        ordered = sorted(roots.items(),
+                         key=lambda z: (z[1][1] or ORDINAL_FALLBACK_YEAR, z[1][0]))
+        for ordinal, (root_id, (_, year)) in enumerate(ordered, 1):
+            ret.append((author_id, root_id, ordinal, year or ORDINAL_FALLBACK_YEAR))
+    return ret
+
+
+def _insert_rows(conn, table, columns, rows, batch_size=INSERT_BATCH_SIZE):
+    insert = text('INSERT INTO %s (%s) VALUES (%s);' %
+                  (table, ', '.join(columns), ', '.join(':%s' % z for z in columns)))
+    for start in range(0, len(rows), batch_size):
+        conn.execute(insert, [dict(zip(columns, row))
+                              for row in rows[start:start + batch_size]])
+
+
+def build_derived_tables(conn, output_function=print):
+    """
+    (Re)build all the derived tables.  Raises ValueError if the database's
+    dump version can't be determined, as has_derived_tables() would never
+    use them.
+    """
+    dump_version = get_dump_version(conn, allow_unknown=False)
+    if dump_version is None:
+        raise ValueError('Unable to determine the dump version - set '
+                         'ISFDB_DUMP_VERSION if the database has no metadata '
+                         'or submissions tables')
+    start = time.time()
+    for table, ddl in DDL.items():
+        conn.execute(text('DROP TABLE IF EXISTS %s;' % (table)))
+        conn.execute(text(ddl))
+    conn.commit()
+
+    for table, sql in POPULATE_SQL.items():
+        conn.execute(text(sql))
+        conn.commit()
+        output_function('Built %s after %.3f seconds' % (table, time.time() - start))
+
+    results = conn.execute(text(PUB_DATES_QUERY).execution_options(stream_results=True))
+    first_pubs, first_pubs_by_country = first_pub_rows(tuple(z) for z in results)
+    _insert_rows(conn, 'title_first_pub', ['title_id', 'pub_id', 'pub_date'],
+                 first_pubs)
+    _insert_rows(conn, 'title_first_pub_by_country',
+                 ['title_id', 'country', 'pub_id', 'pub_date'], first_pubs_by_country)
+    conn.commit()
+    output_function('Built title_first_pub and title_first_pub_by_country after '
+                    '%.3f seconds' % (time.time() - start))
+
+    # No ORDER BY, so that the "first" real author of a pseudonym is the same
+    # as for get_author_alias_ids()'s query
+    pseudonyms = conn.execute(text('SELECT pseudonym, author_id FROM pseudonyms;')).fetchall()
+    results = conn.execute(text(ORDINAL_ROWS_QUERY).execution_options(stream_results=True),
+                           {'title_types': ORDINAL_TITLE_TYPES,
+                            'title_languages': ORDINAL_LANGUAGE_IDS})
+    _insert_rows(conn, 'author_title_ordinals',
+                 ['author_id', 'root_title_id', 'ordinal', 'title_year'],
+                 title_ordinal_rows((tuple(z) for z in results), pseudonyms))
+    conn.commit()
+    output_function('Built author_title_ordinals after %.3f seconds' %
+                    (time.time() - start))
+
+    conn.execute(text('INSERT INTO %s VALUES (:dump_version, NOW());' % (METADATA_TABLE)),
+                 {'dump_version': dump_version})
+    conn.commit()
+    forget_availability()
+
+
+def drop_derived_tables(conn):
+    for table in DDL:
+        conn.execute(text('DROP TABLE IF EXISTS %s;' % (table)))
+    conn.commit()
+    forget_availability()
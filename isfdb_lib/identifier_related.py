@@ -54,7 +54,7 @@ def check_isbn(conn, raw_isbn, check_only_this_isbn=False):
     # ISBN13s are often of the form "978-....", so we normalize that out.
     # Note X can be the final character for ISBN-10s:
     # https://en.wikipedia.org/wiki/International_Standard_Book_Number#Check_digits
-    isbn = re.sub('[^\dX]', '', raw_isbn.upper())
+    isbn = re.sub(r'[^\dX]', '', raw_isbn.upper())
     if check_only_this_isbn:
         isbns = [isbn]
     else:
@@ -67,6 +67,45 @@ def check_isbn(conn, raw_isbn, check_only_this_isbn=False):
     return len(results) > 0
 
 
+def check_ids(conn, ids):
+    """
+    Return a dict mapping each of the provided IDs to True or False, depending
+    on whether check_asin() or check_isbn() would return True for it, but
+    using just two queries for the whole lot, rather than two per ID.
+
+    The values the queries return are compared case-insensitively, as the
+    ISFDB tables' collation - and hence check_asin() - is case insensitive.
+    """
+    ids = [z for z in ids if z]
+    if not ids:
+        return {}
+
+    asin_query = text("""SELECT DISTINCT identifier_value v FROM identifiers i
+    LEFT OUTER JOIN identifier_types it ON i.identifier_type_id = it.identifier_type_id
+    WHERE it.identifier_type_name IN ('ASIN', 'Audible-ASIN')
+    AND i.identifier_value IN :asins;""")
+    known_asins = set(z.v.upper() for z in conn.execute(asin_query,
+                                                        {'asins': list(set(ids))}))
+
+    isbn_variants = {}
+    for val in ids:
+        if val.upper() not in known_asins:
+            isbn = re.sub(r'[^\dX]', '', val.upper())
+            isbn_variants[val] = isbn10and13(isbn)
+    all_isbns = set(isbn for variants in isbn_variants.values() for isbn in variants)
+    if all_isbns:
+        isbn_query = text("""SELECT DISTINCT pub_isbn v FROM pubs
+        WHERE pub_isbn IN :isbns;""")
+        known_isbns = set(z.v.upper() for z in conn.execute(isbn_query,
+                                                            {'isbns': list(all_isbns)}))
+    else:
+        known_isbns = set()
+
+    return {val: val.upper() in known_asins or
+            any(z in known_isbns for z in isbn_variants.get(val, []))
+            for val in ids}
+
+
 def _get_authors_and_title_for_identifiers(conn, identifiers,
                                            filters, extra_joins=None,
                                            both_isbn10_and_isbn13=True):
@@ -140,7 +179,7 @@ def get_authors_and_title_for_isbn(conn, raw_isbn, check_only_this_isbn=False,
     Or None for no match, invalid ISBNs, etc
     """
 
-    isbn = re.sub('[^\dX]', '', raw_isbn.upper())
+    isbn = re.sub(r'[^\dX]', '', raw_isbn.upper())
     if check_only_this_isbn:
         isbns = [isbn]
     else:
@@ -170,7 +209,7 @@ def get_authors_and_title_for_asin(conn, raw_asin,
     (some?) physical books.
     """
 
-    asin = re.sub('\W', '', raw_asin.upper())
+    asin = re.sub(r'\W', '', raw_asin.upper())
     return _get_authors_and_title_for_identifiers(
         conn, [asin],
         ['i.identifier_value IN :identifiers',
@@ -26,6 +26,25 @@ Stats as of end March 2020:
 UPDATE#2: Format has changed again per
 http://www.isfdb.org/wiki/index.php/User:Fixer/Queues#Lists_of_ISBNs_and_ASINs_known_to_Fixer
 
+UPDATE#3: By default, initialise() now converts the loaded IDs and Fixer
+mappings into the compact integer-keyed structures in compact_ids.py, which
+behave like the original sets/dicts as far as batch_check_in_memory() is
+concerned, but use a fraction of the memory - which matters when every
+gunicorn worker has its own copy.
+
+UPDATE#4: initialise() also saves the compact structures to a cache file
+(CACHE_FILE, overridable via ISFDB_ID_CACHE_FILE), and on subsequent startups
+memory-maps that rather than hitting the database and parsing the Fixer files,
+which takes startup from seconds to milliseconds.  The cache is tagged with the
+dump version of the database and the sizes/mtimes of the Fixer files, and gets
+rebuilt if any of those change.  As the cache is mapped read-only, multiple
+workers all share the same pages.
+
+UPDATE#5: To support reloading the data in a running server, the three
+structures are now swapped in together via set_data(), and each batch check
+works on a consistent snapshot of them (via current_data()).  reload_data()
+rebuilds the cache file from source, and refresh_from_cache() lets other
+processes pick up a cache file that has been rebuilt under them.
 
 """
 
@@ -35,22 +54,40 @@ import logging
 import os
 import pdb
 import sys
+import threading
 import time
 
 from sqlalchemy.sql import text
 
-from common import get_connection
+from common import get_connection, get_dump_version
 from isbn_functions import isbn10and13
 from isfdb_lib.identifier_related import check_asin, check_isbn
+from isfdb_lib.compact_ids import (CompactIdSet, FixerIsbnMap, FixerAsinMap,
+                                   NUMPY_AVAILABLE, NO_ID, encode_ids_bulk,
+                                   decode_id, save_compact_ids, load_compact_ids,
+                                   StaleCacheError)
+
+if NUMPY_AVAILABLE:
+    import numpy as np
 
 FIXER_DUMP_DIR = os.environ.get('ISFDB_FIXER_DUMP_DIR') or \
                  os.path.join('/', 'mnt', 'data2019', '_isfdb_')
+FIXER_FILES = ['AllISBNs.txt', 'AllASINs.txt']
+
+# An empty string disables the cache
+CACHE_FILE = os.environ.get('ISFDB_ID_CACHE_FILE',
+                            os.path.join(FIXER_DUMP_DIR, 'ids_in_memory.cache'))
 
 
-# These only get populated when initialise() is called
+# These only get populated when initialise() is called.  Use set_data() and
+# current_data() rather than accessing them directly, so that they are always
+# changed/read as a consistent set.
 all_isfdb_ids = {}
 isbn_mappings = {}
 asin_mappings = {}
+_data_lock = threading.Lock()
+# (inode, mtime) of the cache file the current data came from, if any
+_loaded_cache_stat = None
 
 MAX_UNKNOWNS_TO_LOG = 10 # was 3, but this doesn't help debugging
 
@@ -194,13 +231,167 @@ def batch_check_in_memory(list_of_ids, do_fixer_checks=True,
     these will be separately documented.
 
     Doing fixer checks multiplies the time taken for a batch roughly threefold.
+
+    If the data has been compacted and numpy is available, the checks are
+    done in bulk via batch_check_compact(), otherwise one ID at a time.
+    """
+    data = current_data()
+    if not _can_vectorize(data):
+        return _batch_check_one_by_one(list_of_ids, do_fixer_checks,
+                                       check_both_isbn10_and_13, data)
+
+    vals = list(list_of_ids)
+    hits, misses = _batch_check_vectorized(vals, do_fixer_checks,
+                                           check_both_isbn10_and_13, data)
+    for i in misses:
+        hits[i] = _unknown_info(vals[i], do_fixer_checks)
+    return [hits[i] for i in range(len(vals))]
+
+
+def batch_check_compact(list_of_ids, do_fixer_checks=True,
+                        check_both_isbn10_and_13=True):
     """
+    Like batch_check_in_memory(), but only returns the dicts for IDs that
+    are known to ISFDB or (if do_fixer_checks) to Fixer.  Returns a tuple of:
+    * A list of those dicts
+    * A list of the IDs that are known to neither, for which the dicts
+      would have just been {"id": x, "supplied_id": x, "known": False} (plus
+      "asin_known_to_fixer": False for ASINs, if doing Fixer checks)
+    """
+    vals = list(list_of_ids)
+    data = current_data()
+    if _can_vectorize(data):
+        hits, misses = _batch_check_vectorized(vals, do_fixer_checks,
+                                               check_both_isbn10_and_13, data)
+        return ([hits[i] for i in sorted(hits)],
+                [vals[i] for i in misses])
+
+    hits = []
+    misses = []
+    for info in _batch_check_one_by_one(vals, do_fixer_checks,
+                                        check_both_isbn10_and_13, data):
+        if info == _unknown_info(info['id'], do_fixer_checks):
+            misses.append(info['id'])
+        else:
+            hits.append(info)
+    return hits, misses
+
+
+def current_data():
+    """
+    Return a tuple of (all_isfdb_ids, isbn_mappings, asin_mappings) which are
+    guaranteed to have been loaded together.
+    """
+    with _data_lock:
+        return all_isfdb_ids, isbn_mappings, asin_mappings
+
+
+def set_data(ids, isbns, asins, cache_stat=None):
+    """
+    Atomically replace the data used by batch_check_in_memory() etc.  Checks
+    that are already running carry on with the old data.
+    """
+    global all_isfdb_ids, isbn_mappings, asin_mappings, _loaded_cache_stat
+    with _data_lock:
+        all_isfdb_ids, isbn_mappings, asin_mappings = ids, isbns, asins
+        _loaded_cache_stat = cache_stat
+
+
+def _can_vectorize(data):
+    all_ids, isbns, asins = data
+    return NUMPY_AVAILABLE and isinstance(all_ids, CompactIdSet) and \
+        isinstance(isbns, FixerIsbnMap) and isinstance(asins, FixerAsinMap)
+
+
+def _unknown_info(val, do_fixer_checks):
+    info = {'id': val, 'supplied_id': val, 'known': False}
+    if do_fixer_checks and possible_asin_but_not_isbn(val):
+        info['asin_known_to_fixer'] = False
+    return info
+
+
+def _batch_check_vectorized(vals, do_fixer_checks, check_both_isbn10_and_13,
+                            data):
+    """
+    Return a tuple of:
+    * A dict mapping the index (in vals) of IDs known to ISFDB or Fixer to the
+      dict that batch_check_in_memory() would return for them
+    * An array of the indexes of the other IDs
+    """
+    all_ids, isbns, asins = data
+    keys, isbn10_keys, isbn13_keys = encode_ids_bulk(vals)
+    num_vals = len(vals)
+    # Equivalent to "not possible_asin_but_not_isbn(val)"
+    first_chars = np.array([z[:1] for z in vals], dtype='<U1').view(np.uint32)
+    possible_isbns = (first_chars >= 48) & (first_chars <= 57)
+    if check_both_isbn10_and_13:
+        isbn_checks = possible_isbns
+    else:
+        isbn_checks = np.zeros(num_vals, dtype=bool)
+    first_keys = np.where(isbn_checks, isbn10_keys, keys)
+    second_keys = np.where(isbn_checks, isbn13_keys, keys)
+
+    # IDs that can't be packed are (a) very rare and (b) might be in the
+    # "others" that CompactIdSet can't look up in bulk, so do them the slow way
+    one_by_one = (first_keys == NO_ID) | (second_keys == NO_ID)
+
+    first_positions = all_ids.find_keys(first_keys)
+    second_positions = all_ids.find_keys(second_keys)
+    known = ~one_by_one & ((first_positions >= 0) | (second_positions >= 0))
+    matched_keys = np.where(first_positions >= 0, first_keys, second_keys)
+
+    hits = {}
+    for i in np.flatnonzero(known).tolist():
+        val = vals[i]
+        hits[i] = {'id': val, 'supplied_id': val, 'known': True,
+                   'matched_id': decode_id(int(matched_keys[i]))}
+
+    unknown = ~one_by_one & ~known
+    if do_fixer_checks:
+        asin_checks = unknown & ~possible_isbns & \
+            (asins.ids.find_keys(keys) >= 0)
+        isbn_positions = isbns.ids.find_keys(keys)
+        fixer_known = unknown & ((isbn_positions >= 0) | asin_checks)
+        # Only the ASIN-ish IDs get "asin_known_to_fixer", and all of them do;
+        # asin_known_to_fixer=False on its own doesn't count as a hit though
+        for i in np.flatnonzero(fixer_known).tolist():
+            val = vals[i]
+            info = {'id': val, 'supplied_id': val, 'known': False}
+            if possible_asin_but_not_isbn(val):
+                info['asin_known_to_fixer'] = bool(asin_checks[i])
+            pos = isbn_positions[i]
+            if pos >= 0:
+                info['status'] = isbns.statuses[pos]
+                info['priority'] = isbns.priorities[pos]
+            hits[i] = info
+        unknown &= ~fixer_known
+
+    one_by_one_indexes = np.flatnonzero(one_by_one).tolist()
+    if one_by_one_indexes:
+        results = _batch_check_one_by_one([vals[i] for i in one_by_one_indexes],
+                                          do_fixer_checks, check_both_isbn10_and_13,
+                                          data)
+        for i, info in zip(one_by_one_indexes, results):
+            if info == _unknown_info(vals[i], do_fixer_checks):
+                unknown[i] = True
+            else:
+                hits[i] = info
+
+    return hits, np.flatnonzero(unknown).tolist()
 
+
+def _batch_check_one_by_one(list_of_ids, do_fixer_checks=True,
+                            check_both_isbn10_and_13=True, data=None):
+    """
+    The original implementation of batch_check_in_memory(), which works with
+    either plain sets/dicts or their compact equivalents.
+    """
+    all_ids, isbns, asins = data or current_data()
     ret = []
     for val in list_of_ids:
         if check_both_isbn10_and_13 and not possible_asin_but_not_isbn(val):
             both_isbns = isbn10and13(val)
-            matches = [val for val in both_isbns if val in all_isfdb_ids]
+            matches = [val for val in both_isbns if val in all_ids]
             if any(matches): # Remember: [False, False] evaluates to True
                 known = True
                 # First match could be the ISBN variant we didn't supply if
@@ -209,7 +400,7 @@ def batch_check_in_memory(list_of_ids, do_fixer_checks=True,
             else:
                 known = False
         else:
-            known = val in all_isfdb_ids
+            known = val in all_ids
             matched_id = val
         info = {'id': val, 'supplied_id': val, 'known': known}
         if known:
@@ -219,14 +410,14 @@ def batch_check_in_memory(list_of_ids, do_fixer_checks=True,
             if possible_asin_but_not_isbn(val):
                 # Try to convert ASIN to ISBN
                 try:
-                    fixer_isbn = asin_mappings[val]
+                    fixer_isbn = asins[val]
                     info['asin_known_to_fixer'] = True
                     #  if fixer_isbn: TODO...
 
                 except KeyError:
                     info['asin_known_to_fixer'] = False
             try:
-                info['status'], info['priority'], _ = isbn_mappings[val]
+                info['status'], info['priority'], _ = isbns[val]
             except KeyError:
                 pass
         ret.append(info)
@@ -278,10 +469,144 @@ def batch_stats_pedantic(vals, do_fixer_checks, check_both_isbn10_and_13,
                        output_function, label)
 
 
-def initialise(conn):
-    global all_isfdb_ids, isbn_mappings, asin_mappings
-    all_isfdb_ids = load_ids(conn)
-    isbn_mappings, asin_mappings = load_fixer_ids()
+def compact_ids(ids, isbns, asins, output_function=print):
+    """
+    Convert the output of load_ids() and load_fixer_ids() into their compact
+    equivalents.
+    """
+    start = time.time()
+    compact_all = CompactIdSet(ids)
+    compact_isbns = FixerIsbnMap(isbns)
+    compact_asins = FixerAsinMap(asins)
+    output_function('Compacted IDs in %.3f seconds, sizes=%.1fMB/%.1fMB/%.1fMB' %
+                    (time.time() - start,
+                     compact_all.nbytes() / (1024 * 1024),
+                     compact_isbns.nbytes() / (1024 * 1024),
+                     compact_asins.nbytes() / (1024 * 1024)))
+    return compact_all, compact_isbns, compact_asins
+
+
+def get_cache_fingerprint(conn):
+    """
+    Return a string which changes whenever the database dump or the Fixer
+    files do, or None if the dump version is unknown, in which case there's
+    no way of telling whether a cache file is stale.
+    """
+    dump_version = get_dump_version(conn, allow_unknown=False)
+    if dump_version is None:
+        return None
+    bits = [dump_version]
+    for filename in FIXER_FILES:
+        stat = os.stat(os.path.join(FIXER_DUMP_DIR, filename))
+        bits.append('%s:%d:%d' % (filename, stat.st_size, stat.st_mtime_ns))
+    return '|'.join(bits)
+
+
+def _cache_file_stat(cache_file):
+    try:
+        stat = os.stat(cache_file)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns)
+
+
+def load_cached_ids(conn, cache_file=CACHE_FILE, output_function=print,
+                    force_rebuild=False):
+    """
+    Return the compact (all_isfdb_ids, isbn_mappings, asin_mappings) from the
+    cache file if it is up-to-date, otherwise load them from the database and
+    Fixer files, and (try to) save them to the cache file for next time.
+
+    The returned tuple has a 4th element, the (inode, mtime) of the cache file
+    the data corresponds to - see refresh_from_cache().
+    """
+    start = time.time()
+    fingerprint = get_cache_fingerprint(conn)
+    if fingerprint is None:
+        logging.warning('Unknown dump version, so not using ID cache %s' % (cache_file))
+        ret = compact_ids(load_ids(conn, output_function),
+                          *load_fixer_ids(output_function),
+                          output_function=output_function)
+        return ret + (None,)
+    if not force_rebuild:
+        # Stat before loading, so that if the file gets replaced while we're
+        # loading it, refresh_from_cache() will notice
+        cache_stat = _cache_file_stat(cache_file)
+        try:
+            ret = load_compact_ids(cache_file, fingerprint)
+            output_function('Loaded %d IDs from cache %s in %.3f seconds' %
+                            (len(ret[0]), cache_file, time.time() - start))
+            return ret + (cache_stat,)
+        except FileNotFoundError:
+            output_function('No ID cache at %s, will create it' % (cache_file))
+        except StaleCacheError as err:
+            output_function('ID cache is out of date (%s), will recreate it' % (err))
+
+    ret = compact_ids(load_ids(conn, output_function),
+                      *load_fixer_ids(output_function),
+                      output_function=output_function)
+    try:
+        save_compact_ids(cache_file, fingerprint, *ret)
+        cache_stat = _cache_file_stat(cache_file)
+    except OSError as err:
+        logging.warning('Unable to save ID cache to %s: %s' % (cache_file, err))
+        cache_stat = None
+    return ret + (cache_stat,)
+
+
+def initialise(conn, compact=True, cache_file=CACHE_FILE):
+    """
+    Populate the module-level ID sets and mappings.  If cache_file is None,
+    the cache isn't used, and the data is always loaded from source.
+    """
+    if compact and cache_file:
+        set_data(*load_cached_ids(conn, cache_file))
+        return
+    ids = load_ids(conn)
+    isbns, asins = load_fixer_ids()
+    if compact:
+        ids, isbns, asins = compact_ids(ids, isbns, asins)
+    set_data(ids, isbns, asins)
+
+
+def reload_data(conn, cache_file=CACHE_FILE, output_function=print):
+    """
+    Rebuild the data (and cache file, if there is one) from the database and
+    Fixer files, e.g. after a new dump has been loaded, and swap it in.  Any
+    other processes using the same cache file will pick it up the next time
+    they call refresh_from_cache().
+    """
+    if cache_file:
+        set_data(*load_cached_ids(conn, cache_file, output_function,
+                                  force_rebuild=True))
+    else:
+        ids = load_ids(conn, output_function)
+        isbns, asins = load_fixer_ids(output_function)
+        set_data(*compact_ids(ids, isbns, asins, output_function))
+
+
+def refresh_from_cache(cache_file=CACHE_FILE, output_function=print):
+    """
+    If the cache file has been replaced since the current data was loaded from
+    it, swap in the data from the new file.  This doesn't check the file's
+    fingerprint, on the basis that whoever replaced it knew what they were
+    doing.  Returns True if the data was refreshed.
+    """
+    if not cache_file or _loaded_cache_stat is None:
+        return False
+    cache_stat = _cache_file_stat(cache_file)
+    if cache_stat is None or cache_stat == _loaded_cache_stat:
+        return False
+    start = time.time()
+    try:
+        data = load_compact_ids(cache_file)
+    except (OSError, StaleCacheError) as err:
+        logging.warning('Unable to refresh from ID cache %s: %s' % (cache_file, err))
+        return False
+    set_data(*data, cache_stat=cache_stat)
+    output_function('Refreshed %d IDs from cache %s in %.3f seconds' %
+                    (len(data[0]), cache_file, time.time() - start))
+    return True
 
 
 if __name__ == '__main__':
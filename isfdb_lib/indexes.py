@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Secondary indexes that the queries in this repo benefit from, but which the
+stock ISFDB schema doesn't have, plus support for checking query plans.
+
+The ISFDB dumps are built for the ISFDB website's access patterns, whereas a
+lot of the code here goes in "the other direction" e.g. from an author to
+their titles via canonical_author.author_id, or from an ISBN/ASIN to a pub.
+Without these indexes such lookups are full table scans, which is fine for
+one-off queries, but not when they're done thousands of times in a report or
+by id_checker.
+
+tools/setup_testing_database.sh calls create_indexes() (via
+tools/add_indexes.py) after loading a dump.  All the indexes here are named
+with INDEX_NAME_PREFIX, so that they can be told apart from the stock ones,
+and dropped again if need be.
+
+explain_statement() and find_full_scans() are used by tools/explain_queries.py
+to check the query plans of the SQL that sql_stats.py captured.
+"""
+
+from collections import namedtuple, OrderedDict
+import re
+import time
+
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql import text
+
+
+INDEX_NAME_PREFIX = 'isfdb_tools_'
+
+# columns is the SQL column list, including any prefix lengths, which are
+# needed for the (medium)text columns
+IndexSpec = namedtuple('IndexSpec', 'table, name, columns, reason')
+
+SECONDARY_INDEXES = [
+    IndexSpec('canonical_author', 'author_title', 'author_id, title_id',
+              'Author to titles (bibliography, aliases); covering, so the '
+              'titles join does not need the table rows'),
+    IndexSpec('pseudonyms', 'pseudonym', 'pseudonym',
+              'Pseudonym to real author (author_aliases, author_country)'),
+    IndexSpec('identifiers', 'identifier_value', 'identifier_value(20)',
+              'ASIN lookups in identifier_related and id_checker'),
+    IndexSpec('pubs', 'pub_isbn', 'pub_isbn',
+              'ISBN lookups in identifier_related and id_checker'),
+    IndexSpec('webpages', 'author_id', 'author_id',
+              'Author URLs for gender/country derivation (author_gender.get_urls)'),
+    IndexSpec('webpages', 'url', 'url(100)',
+              'Exact and prefix URL matches; note this does not help the '
+              "LIKE '%www.audible%' style queries, which are in KNOWN_FULL_SCANS"),
+]
+
+# Full table scans that are expected, and which there is no index for.
+# Each is a (regex on the normalized template, reason) tuple.
+KNOWN_FULL_SCANS = [
+    (re.compile(r"url LIKE '%", re.IGNORECASE),
+     'Leading wildcard LIKE on webpages.url can never use an index'),
+    (re.compile(r'^SELECT DISTINCT (identifier_value|pub_isbn) v\b', re.IGNORECASE),
+     'ids_in_memory.load_ids() deliberately reads every ID'),
+]
+
+# Scans of tables smaller than this (going by EXPLAIN's estimate) aren't
+# worth worrying about e.g. award_types, languages
+MIN_SCAN_ROWS = 1000
+
+EXPLAINABLE_SQL_REGEX = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+
+FullScan = namedtuple('FullScan', 'table, rows, possible_keys, known_reason')
+
+
+def full_index_name(spec):
+    return INDEX_NAME_PREFIX + spec.name
+
+
+def get_index_details(conn, table):
+    """
+    Return an OrderedDict mapping index names on the table to the list of
+    column names in them, in order.
+    """
+    ret = OrderedDict()
+    for row in conn.execute(text('SHOW INDEX FROM `%s`;' % (table))):
+        ret.setdefault(row.Key_name, []).append(row.Column_name)
+    return ret
+
+
+def _leading_column_names(columns):
+    # Strip the prefix lengths, e.g. 'url(100)' => 'url'
+    return [re.sub(r'\(\d+\)', '', z).strip() for z in columns.split(',')]
+
+
+def _is_already_indexed(spec, existing_indexes):
+    """
+    True if we have already added this index, or if the stock schema has one
+    that starts with the same column(s)
+    """
+    if full_index_name(spec) in existing_indexes:
+        return True
+    wanted = _leading_column_names(spec.columns)
+    return any(columns[:len(wanted)] == wanted
+               for columns in existing_indexes.values())
+
+
+def get_alter_statements(specs, existing_indexes_by_table):
+    """
+    Return a list of ALTER TABLE statements (one per table, as MyISAM rebuilds
+    the whole table for each ALTER) to add any of the specs that aren't
+    already covered by an existing index.
+    """
+    additions = OrderedDict()
+    for spec in specs:
+        if spec.table not in existing_indexes_by_table:
+            # Table doesn't exist in this database
+            continue
+        if _is_already_indexed(spec, existing_indexes_by_table[spec.table]):
+            continue
+        additions.setdefault(spec.table, []).append(
+            'ADD INDEX `%s` (%s)' % (full_index_name(spec), spec.columns))
+    return ['ALTER TABLE `%s` %s;' % (table, ', '.join(bits))
+            for table, bits in additions.items()]
+
+
+def _existing_indexes_by_table(conn, specs):
+    ret = {}
+    for table in OrderedDict.fromkeys(z.table for z in specs):
+        try:
+            ret[table] = get_index_details(conn, table)
+        except DBAPIError:
+            conn.rollback()
+    return ret
+
+
+def create_indexes(conn, specs=SECONDARY_INDEXES, dry_run=False,
+                   output_function=print):
+    """
+    Add any of the indexes that don't already exist.  Returns the list of
+    statements that were (or, if dry_run, would have been) run.
+    """
+    statements = get_alter_statements(specs, _existing_indexes_by_table(conn, specs))
+    if not statements:
+        output_function('All indexes already exist')
+    for statement in statements:
+        output_function(statement)
+        if dry_run:
+            continue
+        start = time.time()
+        conn.execute(text(statement))
+        output_function('... took %.3f seconds' % (time.time() - start))
+    return statements
+
+
+def drop_indexes(conn, specs=SECONDARY_INDEXES, output_function=print):
+    """
+    Remove all the indexes that create_indexes() added
+    """
+    existing = _existing_indexes_by_table(conn, specs)
+    for table, indexes in existing.items():
+        ours = [z for z in indexes if z.startswith(INDEX_NAME_PREFIX)]
+        if ours:
+            statement = 'ALTER TABLE `%s` %s;' % (
+                table, ', '.join('DROP INDEX `%s`' % (z) for z in ours))
+            output_function(statement)
+            conn.execute(text(statement))
+
+
+def is_explainable(statement):
+    return bool(EXPLAINABLE_SQL_REGEX.match(statement))
+
+
+def explain_statement(conn, statement, parameters=None):
+    """
+    Return the EXPLAIN output for an already-compiled statement - i.e. the SQL
+    as sent to the database driver, as recorded by sql_stats - as a list of
+    dicts.
+    """
+    if isinstance(parameters, list):
+        # JSON has turned the tuple into a list
+        parameters = tuple(parameters)
+    results = conn.exec_driver_sql('EXPLAIN ' + statement, parameters or ())
+    return [dict(z._mapping) for z in results]
+
+
+def known_full_scan_reason(template):
+    for regex, reason in KNOWN_FULL_SCANS:
+        if regex.search(template):
+            return reason
+    return None
+
+
+def find_full_scans(template, explain_rows, min_rows=MIN_SCAN_ROWS):
+    """
+    Return a list of FullScans for the tables that the EXPLAIN output says will
+    be read in their entirety
+    """
+    ret = []
+    known_reason = known_full_scan_reason(template)
+    for row in explain_rows:
+        table = row.get('table') or ''
+        if row.get('type') != 'ALL' or table.startswith('<'):
+            # <derived2> etc are temporary tables from subqueries/CTEs
+            continue
+        rows = row.get('rows') or 0
+        if rows < min_rows:
+            continue
+        ret.append(FullScan(table, rows, row.get('possible_keys'), known_reason))
+    return ret
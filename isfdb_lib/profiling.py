@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Support for the --profile option that create_parser() adds to every script.
+
+When it is used, parse_args() calls start_profiling(), which turns on cProfile
+and the SQL instrumentation in sql_stats.py for the rest of the run - which in
+practice is the script's main work, as that's what comes after argument
+parsing.  At exit the profile is written to a pstats file (which can be
+explored with e.g. "python -m pstats foo.pstats" or snakeviz), and a summary
+of the top Python functions and top SQL templates is printed on stderr.
+
+Usage:
+
+    ./some_script.py --profile [other args ...]
+    ./some_script.py --profile=/tmp/foo.pstats [other args ...]
+
+(Note that if you want to specify the filename, you have to use the = form,
+otherwise it'll be confused with any positional arguments.)
+"""
+
+import atexit
+import cProfile
+import os
+import pstats
+import sys
+import time
+
+from isfdb_lib import sql_stats
+
+
+DEFAULT_REPORT_SIZE = 20
+
+_profiler = None
+
+
+def default_profile_filename():
+    script = os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0]
+    return '%s.pstats' % (script)
+
+
+def start_profiling(output_file=None, engines=(),
+                    output_function=lambda txt: print(txt, file=sys.stderr)):
+    """
+    Start profiling, with the results being written/reported at exit.  engines
+    are any already-existing engines whose SQL should be included.  Calling
+    this more than once is harmless.
+    """
+    global _profiler
+    if _profiler:
+        return
+    output_file = output_file or default_profile_filename()
+    sql_stats.enable(engines, report_at_exit=False)
+    sql_stats.get_stats()
+    _profiler = cProfile.Profile()
+    start = time.time()
+    atexit.register(_finish_profiling, _profiler, output_file, start,
+                    output_function)
+    _profiler.enable()
+
+
+def _finish_profiling(profiler, output_file, start, output_function):
+    profiler.disable()
+    duration = time.time() - start
+    profiler.dump_stats(output_file)
+    report(pstats.Stats(profiler), sql_stats.get_stats(), duration,
+           output_function=output_function)
+    output_function('Wrote profile to %s' % (output_file))
+
+
+def _function_label(func_key):
+    filename, line_number, function_name = func_key
+    if filename == '~':
+        # Built-ins e.g. "<method 'execute' of 'MySQLdb.cursors' objects>"
+        return function_name
+    return '%s:%d(%s)' % (os.path.basename(filename), line_number, function_name)
+
+
+def top_functions(stats, sort_key='tottime', limit=DEFAULT_REPORT_SIZE):
+    """
+    Return a list of (label, calls, tottime, cumtime) tuples for the top
+    functions in a pstats.Stats
+    """
+    rows = []
+    for func_key, (_, num_calls, tottime, cumtime, _) in stats.stats.items():
+        rows.append((_function_label(func_key), num_calls, tottime, cumtime))
+    idx = 2 if sort_key == 'tottime' else 3
+    return sorted(rows, key=lambda z: z[idx], reverse=True)[:limit]
+
+
+def report(stats, sql, duration, limit=DEFAULT_REPORT_SIZE, output_function=print):
+    sql_time = sum([z.total_time for z in sql.templates.values()])
+    output_function('Profiled %.3f seconds, of which %.3f (%d%%) were spent in SQL' %
+                    (duration, sql_time,
+                     100 * sql_time / duration if duration else 0))
+    output_function('')
+    output_function('Top Python functions by own time:')
+    output_function('%9s %9s %9s  %s' % ('Calls', 'Own(s)', 'Cumul(s)', 'Function'))
+    for label, num_calls, tottime, cumtime in top_functions(stats, 'tottime', limit):
+        output_function('%9d %9.3f %9.3f  %s' % (num_calls, tottime, cumtime, label))
+    output_function('')
+    output_function('Top SQL by total time:')
+    sql.report(limit=limit, output_function=output_function)
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+An opt-in on-disk cache of query results, for the common case of re-running
+the same report(s) over and over against the same ISFDB dump e.g. whilst
+tweaking the output formatting.
+
+get_connection() wraps the connection in a CachingConnection when the
+ISFDB_QUERY_CACHE_DIR environment variable is set (or if explicitly asked to
+with query_cache=True).  Its execute() checks the cache for any text() SELECT
+statement, keyed on:
+* The SQL with whitespace normalized
+* The bound parameters
+* The database URL and get_dump_version(), so that loading a new dump
+  implicitly invalidates everything.  If the dump version can't be worked
+  out (and ISFDB_DUMP_VERSION isn't set), nothing is cached, as there would
+  be no way of telling when the results went stale.
+
+Results are stored one file per query as zlib-compressed pickles of just the
+column names and row tuples, and are returned as regular SQLAlchemy Result
+objects, so callers can't tell the difference.  The total size is bounded
+(ISFDB_QUERY_CACHE_MAX_MB, default DEFAULT_MAX_MB), with the least recently
+used files - going by mtime, which gets updated on every hit - evicted first.
+
+Anything other than a text() SELECT, or executed via execution_options(), or
+with streaming options on the statement (see common.stream_results()), or
+via .uncached, bypasses the cache.
+"""
+
+from hashlib import sha256
+import logging
+import os
+import pickle
+import re
+import tempfile
+import zlib
+
+from sqlalchemy.engine.result import IteratorResult, SimpleResultMetaData
+from sqlalchemy.sql.elements import TextClause
+
+from isfdb_lib.common import get_dump_version
+from isfdb_lib.temp_id_tables import create_pending_id_tables
+
+
+DEFAULT_QUERY_CACHE_DIR = os.environ.get('ISFDB_QUERY_CACHE_DIR') or \
+                          os.path.join(os.path.expanduser('~'), '.isfdb_query_cache')
+
+DEFAULT_MAX_MB = 1024
+
+CACHE_FILE_SUFFIX = '.rows'
+
+# When the cache gets too big, evict down to this proportion of the maximum,
+# so that we aren't evicting something on every write
+EVICT_TO_FRACTION = 0.9
+
+CACHE_FORMAT_VERSION = 1
+
+CACHEABLE_SQL_REGEX = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+UNCACHEABLE_SQL_REGEX = re.compile(r'\bFOR\s+UPDATE\b|\bINTO\s+@|\bRAND\s*\(|\bNOW\s*\(',
+                                   re.IGNORECASE)
+
+
+def normalize_sql(sql):
+    """
+    Collapse all runs of whitespace, so that cosmetic changes to a query don't
+    stop it hitting the cache.  (This also affects any whitespace inside string
+    literals, but ISFDB queries don't have any where that matters.)
+    """
+    return ' '.join(sql.split())
+
+
+def _is_cacheable(statement, parameters):
+    if not isinstance(statement, TextClause):
+        return False
+    if parameters is not None and not isinstance(parameters, dict):
+        # e.g. executemany
+        return False
+    if statement.get_execution_options().get('yield_per') or \
+       statement.get_execution_options().get('stream_results'):
+        # Caching would mean reading the whole lot into memory
+        return False
+    return bool(CACHEABLE_SQL_REGEX.match(statement.text)) and \
+        not UNCACHEABLE_SQL_REGEX.search(statement.text)
+
+
+class QueryCache(object):
+    def __init__(self, cache_dir=DEFAULT_QUERY_CACHE_DIR, max_mb=None):
+        if max_mb is None:
+            max_mb = float(os.environ.get('ISFDB_QUERY_CACHE_MAX_MB', DEFAULT_MAX_MB))
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        # Only worked out on the first write, and is approximate if other
+        # processes are using the same directory
+        self._total_bytes = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, namespace, sql, parameters):
+        """
+        Return the (hex) key for a query.  namespace should identify the
+        database and dump.
+        """
+        # repr() is fine for the parameter types that actually get used - ints,
+        # strings, lists/tuples of same, dates
+        params_repr = repr(sorted((parameters or {}).items()))
+        txt = '\n'.join([str(CACHE_FORMAT_VERSION), namespace, normalize_sql(sql),
+                         params_repr])
+        return sha256(txt.encode('utf-8')).hexdigest()
+
+    def _filename(self, key):
+        return os.path.join(self.cache_dir, key + CACHE_FILE_SUFFIX)
+
+    def get(self, key):
+        """
+        Return a (column_names, rows) tuple for the key, or None
+        """
+        filename = self._filename(key)
+        try:
+            with open(filename, 'rb') as inputstream:
+                data = inputstream.read()
+            ret = pickle.loads(zlib.decompress(data))
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError) as err:
+            logging.warning('Ignoring bad query cache file %s: %s' % (filename, err))
+            self.misses += 1
+            return None
+        try:
+            # Mark as recently used
+            os.utime(filename)
+        except OSError:
+            pass
+        self.hits += 1
+        return ret
+
+    def put(self, key, column_names, rows):
+        data = zlib.compress(pickle.dumps((list(column_names), rows),
+                                          pickle.HIGHEST_PROTOCOL))
+        # Write via a temporary file, so that other processes never see a
+        # partially written file
+        fd, tmp_filename = tempfile.mkstemp(dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, 'wb') as outputstream:
+                outputstream.write(data)
+            os.replace(tmp_filename, self._filename(key))
+        except OSError as err:
+            logging.warning('Unable to write to query cache: %s' % (err))
+            try:
+                os.remove(tmp_filename)
+            except OSError:
+                pass
+            return
+
+        if self._total_bytes is None:
+            self._total_bytes = self.size()
+        else:
+            self._total_bytes += len(data)
+        if self._total_bytes > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        ret = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(CACHE_FILE_SUFFIX):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                ret.append((stat.st_mtime, stat.st_size, entry.path))
+        return ret
+
+    def size(self):
+        return sum([z[1] for z in self._entries()])
+
+    def evict(self, target_bytes=None):
+        """
+        Remove the least recently used files until the total size is below
+        target_bytes (default: EVICT_TO_FRACTION of the maximum size).
+        """
+        if target_bytes is None:
+            target_bytes = int(self.max_bytes * EVICT_TO_FRACTION)
+        entries = sorted(self._entries())
+        total = sum([z[1] for z in entries])
+        for _, size, path in entries:
+            if total <= target_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._total_bytes = total
+
+    def clear(self):
+        self.evict(target_bytes=0)
+
+
+_default_cache = None
+
+def get_default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = QueryCache()
+    return _default_cache
+
+
+class CachingConnection(object):
+    """
+    Wrapper around a SQLAlchemy Connection, which caches the results of
+    text() SELECT queries.  Everything other than execute() is passed through
+    to the underlying connection, which is also available as .uncached
+    """
+    def __init__(self, conn, cache=None):
+        self.uncached = conn
+        self.cache = cache or get_default_cache()
+        self._namespace = None
+        self._namespace_checked = False
+
+    def __getattr__(self, name):
+        return getattr(self.uncached, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return self.uncached.__exit__(*args)
+
+    @property
+    def namespace(self):
+        """
+        The prefix for this connection's cache keys, or None if the dump
+        version is unknown, in which case nothing is cached
+        """
+        if not self._namespace_checked:
+            dump_version = get_dump_version(self.uncached, allow_unknown=False)
+            if dump_version is None:
+                logging.warning('Unknown dump version, so not caching query results')
+            else:
+                url = self.uncached.engine.url.render_as_string(hide_password=True)
+                self._namespace = '%s|%s' % (url, dump_version)
+            self._namespace_checked = True
+        return self._namespace
+
+    def execute(self, statement, parameters=None, **kwargs):
+        if kwargs or not _is_cacheable(statement, parameters) or self.namespace is None:
+            create_pending_id_tables(self.uncached)
+            return self.uncached.execute(statement, parameters, **kwargs)
+
+        key = self.cache.make_key(self.namespace, statement.text, parameters)
+        cached = self.cache.get(key)
+        if cached is None:
+            create_pending_id_tables(self.uncached)
+            results = self.uncached.execute(statement, parameters)
+            column_names = list(results.keys())
+            rows = [tuple(z) for z in results.fetchall()]
+            self.cache.put(key, column_names, rows)
+        else:
+            column_names, rows = cached
+        return IteratorResult(SimpleResultMetaData(column_names), iter(rows))
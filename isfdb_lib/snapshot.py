@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Export the core ISFDB tables to a compact columnar on-disk snapshot, and load
+such snapshots via mmap, so that heavy analyses can be run repeatedly without
+a database - or at least without waiting on multi-second joins every time.
+
+Snapshot layout (one directory per snapshot):
+
+    manifest.json                   - format version, tables, columns, row counts
+    <table>/<column>.dat            - values as a raw typed array (ints, floats,
+                                      dates) or UTF-8 bytes (strings)
+    <table>/<column>.off            - (strings only) array of len+1 byte offsets
+                                      into the .dat file
+    <table>/<column>.nul            - (only if the column has any NULLs) one byte
+                                      per row, non-zero meaning NULL
+
+Dates are stored as YYYYMMDD integers rather than date objects, as ISFDB has
+lots of partial dates like 2016-00-00 which Python (and SQLAlchemy) can't
+represent.  When read back they are returned as 'YYYY-MM-DD' strings, i.e. the
+same as the CAST(foo AS CHAR) that the queries elsewhere use, so that they
+can be fed into isfdb_utils.convert_dateish_to_date().
+
+Only the standard library (plus SQLAlchemy for the export) is needed.
+
+Usage:
+
+    ./isfdb_lib/snapshot.py -o /path/to/snapshot [table ...]
+"""
+
+from array import array
+from collections import namedtuple
+from datetime import datetime
+import json
+import mmap
+import os
+import pdb
+import sys
+import time
+
+from sqlalchemy import inspect
+from sqlalchemy.sql import text
+from sqlalchemy.types import Integer, Float, Numeric, Date, Boolean
+
+from isfdb_lib.common import get_connection, create_parser, parse_args
+
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+DEFAULT_SNAPSHOT_DIR = os.environ.get('ISFDB_SNAPSHOT_DIR') or \
+                       os.path.join(os.path.expanduser('~'), '.isfdb_snapshot')
+
+DEFAULT_SNAPSHOT_TABLES = ['titles', 'pubs', 'pub_content', 'canonical_author',
+                           'authors', 'pseudonyms', 'awards', 'title_awards',
+                           'series', 'identifiers', 'webpages']
+
+MANIFEST_FILENAME = 'manifest.json'
+
+# Column kinds, and the array typecode used to store each one.  For strings,
+# the typecode is that of the offsets array.
+INT_KIND = 'int'
+FLOAT_KIND = 'float'
+DATE_KIND = 'date'
+STR_KIND = 'str'
+KIND_TYPECODES = {
+    INT_KIND: 'q',
+    FLOAT_KIND: 'd',
+    DATE_KIND: 'i',
+    STR_KIND: 'q'
+}
+
+# How many values to buffer per column before writing them out
+FLUSH_THRESHOLD = 65536
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _column_kind(sqla_type):
+    if isinstance(sqla_type, (Integer, Boolean)):
+        return INT_KIND
+    elif isinstance(sqla_type, (Float, Numeric)):
+        return FLOAT_KIND
+    elif isinstance(sqla_type, Date):
+        return DATE_KIND
+    else:
+        return STR_KIND
+
+
+def _date_to_int(val):
+    # Works for both date objects and 'YYYY-MM-DD' strings
+    txt = str(val)
+    return int(txt[0:4]) * 10000 + int(txt[5:7]) * 100 + int(txt[8:10])
+
+
+def _int_to_date_string(val):
+    return '%04d-%02d-%02d' % (val // 10000, (val // 100) % 100, val % 100)
+
+
+class _ColumnWriter(object):
+    """
+    Incrementally write the values for a single column, so that we never need
+    to hold a whole table in memory.
+    """
+    def __init__(self, path_prefix, kind):
+        self.path_prefix = path_prefix
+        self.kind = kind
+        self.values = array(KIND_TYPECODES[kind])
+        self.nulls = bytearray()
+        self.has_nulls = False
+        if kind == STR_KIND:
+            self.values_stream = open(path_prefix + '.off', 'wb')
+            self.blob_stream = open(path_prefix + '.dat', 'wb')
+            self.offset = 0
+            self.values.append(0)
+        else:
+            self.values_stream = open(path_prefix + '.dat', 'wb')
+
+    def append(self, val):
+        if val is None:
+            self.nulls.append(1)
+            self.has_nulls = True
+        else:
+            self.nulls.append(0)
+
+        if self.kind == STR_KIND:
+            if val is not None:
+                encoded = str(val).encode('utf-8')
+                self.blob_stream.write(encoded)
+                self.offset += len(encoded)
+            self.values.append(self.offset)
+        elif val is None:
+            self.values.append(0)
+        elif self.kind == DATE_KIND:
+            self.values.append(_date_to_int(val))
+        elif self.kind == FLOAT_KIND:
+            self.values.append(float(val))
+        else:
+            self.values.append(int(val))
+
+        if len(self.values) >= FLUSH_THRESHOLD:
+            self._flush()
+
+    def _flush(self):
+        self.values.tofile(self.values_stream)
+        del self.values[:]
+
+    def close(self):
+        self._flush()
+        self.values_stream.close()
+        if self.kind == STR_KIND:
+            self.blob_stream.close()
+        if self.has_nulls:
+            with open(self.path_prefix + '.nul', 'wb') as outputstream:
+                outputstream.write(self.nulls)
+
+
+def export_table(conn, table, output_dir, output_function=print):
+    """
+    Export a single table into output_dir/table/, returning the manifest entry
+    for the table.
+    """
+    start = time.time()
+    table_dir = os.path.join(output_dir, table)
+    os.makedirs(table_dir, exist_ok=True)
+
+    columns = [(z['name'], _column_kind(z['type']))
+               for z in inspect(conn).get_columns(table)]
+    select_bits = []
+    for name, kind in columns:
+        if kind == DATE_KIND:
+            # Avoid partial/zero dates being turned into None by the driver
+            select_bits.append('CAST(%s AS CHAR) %s' % (name, name))
+        else:
+            select_bits.append(name)
+    query = text('SELECT %s FROM %s;' % (', '.join(select_bits), table))
+
+    writers = [_ColumnWriter(os.path.join(table_dir, name), kind)
+               for name, kind in columns]
+    num_rows = 0
+    results = conn.execution_options(stream_results=True).execute(query)
+    for row in results:
+        for writer, val in zip(writers, row):
+            writer.append(val)
+        num_rows += 1
+    for writer in writers:
+        writer.close()
+
+    output_function('Exported %d rows from %s in %.3f seconds' %
+                    (num_rows, table, time.time() - start))
+    return {'num_rows': num_rows,
+            'columns': [{'name': name, 'kind': kind} for name, kind in columns]}
+
+
+def export_snapshot(conn, output_dir=DEFAULT_SNAPSHOT_DIR, tables=None,
+                    output_function=print):
+    """
+    Export the specified tables (default: DEFAULT_SNAPSHOT_TABLES) to a
+    snapshot in output_dir.  The manifest is written last, so a partially
+    written snapshot can't be accidentally loaded.
+    """
+    tables = tables or DEFAULT_SNAPSHOT_TABLES
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_file = os.path.join(output_dir, MANIFEST_FILENAME)
+    if os.path.exists(manifest_file):
+        os.remove(manifest_file)
+
+    manifest = {
+        'format_version': SNAPSHOT_FORMAT_VERSION,
+        'byteorder': sys.byteorder,
+        'created': datetime.now().isoformat(),
+        'tables': {}
+    }
+    for table in tables:
+        manifest['tables'][table] = export_table(conn, table, output_dir,
+                                                 output_function)
+
+    with open(manifest_file, 'w') as outputstream:
+        json.dump(manifest, outputstream, indent=2)
+    return manifest
+
+
+def _map_file(filename):
+    """
+    Return a read-only memoryview of the file, or None if it is empty (which
+    mmap doesn't allow)
+    """
+    with open(filename, 'rb') as inputstream:
+        if os.fstat(inputstream.fileno()).st_size == 0:
+            return None
+        mm = mmap.mmap(inputstream.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mm)
+
+
+class SnapshotColumn(object):
+    """
+    Read-only, list-like access to a single column of a snapshot table.
+
+    For the non-string kinds, the raw typed memoryview is available as
+    .values, for when you want to do something fast like sum() or Counter()
+    over the whole column without creating per-row Python objects.
+    """
+    def __init__(self, table_dir, name, kind, num_rows):
+        self.name = name
+        self.kind = kind
+        self.num_rows = num_rows
+        path_prefix = os.path.join(table_dir, name)
+        typecode = KIND_TYPECODES[kind]
+
+        if kind == STR_KIND:
+            offsets = _map_file(path_prefix + '.off')
+            self.offsets = offsets.cast(typecode)
+            self.blob = _map_file(path_prefix + '.dat') or memoryview(b'')
+            self.values = None
+        else:
+            raw = _map_file(path_prefix + '.dat')
+            self.values = raw.cast(typecode) if raw else array(typecode)
+
+        if os.path.exists(path_prefix + '.nul'):
+            self.nulls = _map_file(path_prefix + '.nul')
+        else:
+            self.nulls = None
+
+    def __len__(self):
+        return self.num_rows
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.num_rows
+        if not 0 <= i < self.num_rows:
+            raise IndexError('%s index %d out of range' % (self.name, i))
+        if self.nulls is not None and self.nulls[i]:
+            return None
+        if self.kind == STR_KIND:
+            return str(self.blob[self.offsets[i]:self.offsets[i+1]], 'utf-8')
+        elif self.kind == DATE_KIND:
+            return _int_to_date_string(self.values[i])
+        else:
+            return self.values[i]
+
+    def __iter__(self):
+        for i in range(self.num_rows):
+            yield self[i]
+
+
+class SnapshotTable(object):
+    def __init__(self, snapshot_dir, name, table_manifest):
+        self.name = name
+        self.num_rows = table_manifest['num_rows']
+        table_dir = os.path.join(snapshot_dir, name)
+        self.columns = {}
+        for col in table_manifest['columns']:
+            self.columns[col['name']] = SnapshotColumn(table_dir, col['name'],
+                                                       col['kind'], self.num_rows)
+        self.Row = namedtuple('%sRow' % (name.title().replace('_', '')),
+                              list(self.columns.keys()))
+
+    def __len__(self):
+        return self.num_rows
+
+    def __getitem__(self, column_name):
+        return self.columns[column_name]
+
+    def rows(self, column_names=None):
+        """
+        Return a generator of namedtuples for each row, optionally only
+        including the specified columns.
+        """
+        if column_names:
+            RowClass = namedtuple(self.Row.__name__, column_names)
+        else:
+            RowClass = self.Row
+            column_names = RowClass._fields
+        cols = [self.columns[z] for z in column_names]
+        for i in range(self.num_rows):
+            yield RowClass(*[c[i] for c in cols])
+
+
+class Snapshot(object):
+    def __init__(self, snapshot_dir, manifest):
+        self.snapshot_dir = snapshot_dir
+        self.manifest = manifest
+        self.created = manifest['created']
+        self.tables = {name: SnapshotTable(snapshot_dir, name, details)
+                       for name, details in manifest['tables'].items()}
+
+    def __getitem__(self, table_name):
+        return self.tables[table_name]
+
+
+def load_snapshot(snapshot_dir=DEFAULT_SNAPSHOT_DIR):
+    """
+    Return a Snapshot object for the snapshot in snapshot_dir.  This only
+    memory-maps the column files, so is very quick; data is read on demand.
+    """
+    manifest_file = os.path.join(snapshot_dir, MANIFEST_FILENAME)
+    try:
+        with open(manifest_file) as inputstream:
+            manifest = json.load(inputstream)
+    except FileNotFoundError:
+        raise SnapshotError('No (complete) snapshot found in %s' % (snapshot_dir))
+    if manifest.get('format_version') != SNAPSHOT_FORMAT_VERSION:
+        raise SnapshotError('Snapshot in %s is format version %s, expected %s' %
+                            (snapshot_dir, manifest.get('format_version'),
+                             SNAPSHOT_FORMAT_VERSION))
+    if manifest.get('byteorder') != sys.byteorder:
+        raise SnapshotError('Snapshot in %s was created on a %s-endian machine' %
+                            (snapshot_dir, manifest.get('byteorder')))
+    return Snapshot(snapshot_dir, manifest)
+
+
+if __name__ == '__main__':
+    parser = create_parser(description='Export core ISFDB tables to a columnar snapshot',
+                           supported_args='v')
+    parser.add_argument('-o', dest='output_dir', nargs='?', default=DEFAULT_SNAPSHOT_DIR,
+                        help='Directory to write the snapshot to (default %s)' %
+                        (DEFAULT_SNAPSHOT_DIR))
+    parser.add_argument('tables', nargs='*',
+                        help='Tables to export (default: %s)' %
+                        (', '.join(DEFAULT_SNAPSHOT_TABLES)))
+    args = parse_args(sys.argv[1:], parser=parser)
+
+    conn = get_connection(query_cache=False)
+    export_snapshot(conn, args.output_dir, args.tables)
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Optional instrumentation of the SQL that a script runs, to see where it is
+spending its time in the database.
+
+get_connection() attaches SQLAlchemy event listeners to its engine if the
+ISFDB_SQL_STATS environment variable is set (or if explicitly asked to with
+sql_stats=True).  For each statement template - i.e. the SQL with whitespace
+normalized, and IN (...) lists and literal numbers collapsed - they record:
+* how many times it was executed
+* total, maximum and 95th percentile time - the latter from a random sample
+  of at most MAX_DURATION_SAMPLES of the executions, so that a long-running
+  process doesn't keep every duration in memory
+* total rows (as per cursor.rowcount, so may be missing for some drivers)
+* the function(s) that called it
+* how many distinct sets of parameters it was run with
+* the first actual statement and parameters, so that it can be EXPLAINed
+  later (see tools/explain_queries.py)
+
+At exit, these are reported as a table on stderr, and as JSON to the file
+named by ISFDB_SQL_STATS_JSON (if set).  Templates run at least
+N_PLUS_ONE_MIN_CALLS times with varying parameters are flagged as likely
+N+1 patterns i.e. a query in a loop that could be done as one bulk query.
+"""
+
+import atexit
+from collections import Counter
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+import weakref
+
+from sqlalchemy import event
+
+
+N_PLUS_ONE_MIN_CALLS = 100
+
+# No point remembering more distinct parameters than this per template
+MAX_DISTINCT_PARAMS_TRACKED = 1000
+
+# How many durations per template are kept for estimating the 95th percentile
+MAX_DURATION_SAMPLES = 1000
+
+DEFAULT_REPORT_SIZE = 20
+
+MAX_TEMPLATE_DISPLAY_LENGTH = 70
+
+# Frames from files in these directories or with these names aren't
+# interesting as "the caller"
+_SQLALCHEMY_DIR = os.path.dirname(os.path.dirname(event.__file__))
+_IGNORED_CALLER_FILENAMES = {'common.py', 'query_cache.py', 'sql_stats.py',
+                             'contextlib.py'}
+
+PLACEHOLDER_LIST_REGEX = re.compile(r'\(\s*(%s|\?|:\w+)(\s*,\s*(%s|\?|:\w+))*\s*\)')
+NUMBER_REGEX = re.compile(r'\b\d+\b')
+
+
+def normalize_template(sql):
+    txt = ' '.join(sql.split())
+    txt = PLACEHOLDER_LIST_REGEX.sub('(...)', txt)
+    return NUMBER_REGEX.sub('N', txt)
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of a non-empty list
+    """
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * pct / 100) - 1)]
+
+
+def _find_caller():
+    frame = sys._getframe(2)
+    while frame:
+        filename = frame.f_code.co_filename
+        if not filename.startswith(_SQLALCHEMY_DIR) and \
+           os.path.basename(filename) not in _IGNORED_CALLER_FILENAMES:
+            return '%s:%s' % (os.path.splitext(os.path.basename(filename))[0],
+                              frame.f_code.co_name)
+        frame = frame.f_back
+    return '?'
+
+
+class TemplateStats(object):
+    def __init__(self, template):
+        self.template = template
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        # A reservoir sample of the durations, see add_duration()
+        self.duration_samples = []
+        self.rows = 0
+        self.callers = Counter()
+        self.distinct_params = set()
+        self.sample_statement = None
+        self.sample_parameters = None
+
+    def add_duration(self, duration, rng=random):
+        self.count += 1
+        self.total_time += duration
+        self.max_time = max(self.max_time, duration)
+        # Reservoir sampling (Vitter's algorithm R), so that every execution
+        # has the same chance of being in the sample
+        if len(self.duration_samples) < MAX_DURATION_SAMPLES:
+            self.duration_samples.append(duration)
+        else:
+            idx = rng.randrange(self.count)
+            if idx < MAX_DURATION_SAMPLES:
+                self.duration_samples[idx] = duration
+
+    @property
+    def p95_time(self):
+        return percentile(self.duration_samples, 95)
+
+    @property
+    def possible_n_plus_one(self):
+        return self.count >= N_PLUS_ONE_MIN_CALLS and len(self.distinct_params) > 1
+
+    def as_dict(self):
+        return {
+            'template': self.template,
+            'count': self.count,
+            'total_time': self.total_time,
+            'max_time': self.max_time,
+            'p95_time': self.p95_time,
+            'rows': self.rows,
+            'callers': dict(self.callers.most_common()),
+            'distinct_params': len(self.distinct_params),
+            'possible_n_plus_one': self.possible_n_plus_one,
+            'sample_statement': self.sample_statement,
+            'sample_parameters': self.sample_parameters
+        }
+
+
+class SqlStats(object):
+    def __init__(self):
+        self.templates = {}
+        self._lock = threading.Lock()
+
+    def record(self, statement, parameters, duration, rowcount, caller):
+        template = normalize_template(statement)
+        with self._lock:
+            stats = self.templates.get(template)
+            if stats is None:
+                stats = self.templates[template] = TemplateStats(template)
+                stats.sample_statement = statement
+                stats.sample_parameters = parameters
+            stats.add_duration(duration)
+            if rowcount is not None and rowcount >= 0:
+                stats.rows += rowcount
+            stats.callers[caller] += 1
+            if len(stats.distinct_params) < MAX_DISTINCT_PARAMS_TRACKED:
+                stats.distinct_params.add(repr(parameters))
+
+    def top_templates(self, limit=None):
+        ret = sorted(self.templates.values(), key=lambda z: z.total_time,
+                     reverse=True)
+        return ret[:limit] if limit else ret
+
+    def as_json(self):
+        return json.dumps({
+            'total_count': sum([z.count for z in self.templates.values()]),
+            'total_time': sum([z.total_time for z in self.templates.values()]),
+            'templates': [z.as_dict() for z in self.top_templates()]
+        }, indent=2, default=str) # default is for any dates etc in the parameters
+
+    def report(self, limit=DEFAULT_REPORT_SIZE, output_function=print):
+        templates = self.top_templates()
+        if not templates:
+            output_function('No SQL was executed')
+            return
+        output_function('%d SQL statements (%d distinct) took %.3f seconds' %
+                        (sum([z.count for z in templates]), len(templates),
+                         sum([z.total_time for z in templates])))
+        output_function('%7s %9s %8s %9s  %-25s %s' %
+                        ('Count', 'Total(s)', 'p95(ms)', 'Rows', 'Main caller', 'SQL'))
+        for stats in templates[:limit]:
+            sql = stats.template
+            if len(sql) > MAX_TEMPLATE_DISPLAY_LENGTH:
+                sql = sql[:MAX_TEMPLATE_DISPLAY_LENGTH - 3] + '...'
+            output_function('%7d %9.3f %8.1f %9d  %-25s %s' %
+                            (stats.count, stats.total_time, stats.p95_time * 1000,
+                             stats.rows, stats.callers.most_common(1)[0][0], sql))
+        for stats in templates:
+            if stats.possible_n_plus_one:
+                output_function('Possible N+1: %s ran %d times from %s' %
+                                (stats.template[:MAX_TEMPLATE_DISPLAY_LENGTH],
+                                 stats.count,
+                                 ', '.join(stats.callers.keys())))
+
+
+_stats = None
+# Maps each instrumented engine to its listeners, so that they can be removed
+_instrumented_engines = weakref.WeakKeyDictionary()
+_instrument_lock = threading.Lock()
+# Set by enable(); get_connection() instruments all engines when this is True
+_enabled = False
+_report_at_exit = True
+
+
+def get_stats():
+    """
+    Return the process-wide SqlStats, creating it - and registering the at
+    exit report - if this is the first time.
+    """
+    global _stats
+    with _instrument_lock:
+        if _stats is None:
+            _stats = SqlStats()
+            atexit.register(report_at_exit)
+    return _stats
+
+
+def enable(engines=(), report_at_exit=True):
+    """
+    Turn on instrumentation for the specified (already existing) engines,
+    and for any that get_connection() uses from now on.  Pass
+    report_at_exit=False if you'll be reporting the stats yourself.
+    """
+    global _enabled, _report_at_exit
+    _enabled = True
+    _report_at_exit = report_at_exit
+    for engine in engines:
+        instrument_engine(engine)
+
+
+def is_enabled():
+    return _enabled
+
+
+_START_TIMES_KEY = 'isfdb_query_start_times'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault(_START_TIMES_KEY, []).append((context, time.perf_counter()))
+
+
+def _pop_start_time(conn, context):
+    """
+    Return (and forget) the start time of the statement with the execution
+    context, or None if there isn't one
+    """
+    start_times = conn.info.get(_START_TIMES_KEY)
+    for idx in range(len(start_times or []) - 1, -1, -1):
+        if start_times[idx][0] is context:
+            return start_times.pop(idx)[1]
+    return None
+
+
+def _make_listeners(stats):
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start_time = _pop_start_time(conn, context)
+        if start_time is not None:
+            stats.record(statement, parameters, time.perf_counter() - start_time,
+                         getattr(cursor, 'rowcount', None), _find_caller())
+
+    def handle_error(exception_context):
+        # The statement failed, so there won't be an after_cursor_execute to
+        # clear up its start time
+        if exception_context.connection is not None:
+            _pop_start_time(exception_context.connection,
+                            exception_context.execution_context)
+
+    return [('before_cursor_execute', _before_cursor_execute),
+            ('after_cursor_execute', after_cursor_execute),
+            ('handle_error', handle_error)]
+
+
+def instrument_engine(engine, stats=None):
+    """
+    Attach the listeners to the engine, if they aren't already.  The
+    statements are recorded in stats, which defaults to the process-wide
+    SqlStats from get_stats().
+    """
+    if stats is None:
+        stats = get_stats()
+    with _instrument_lock:
+        if engine in _instrumented_engines:
+            return
+        listeners = _instrumented_engines[engine] = _make_listeners(stats)
+    for name, listener in listeners:
+        event.listen(engine, name, listener)
+
+
+def is_instrumented(engine):
+    return engine in _instrumented_engines
+
+
+def uninstrument_engine(engine):
+    """
+    Remove the listeners that instrument_engine() attached, if any
+    """
+    with _instrument_lock:
+        listeners = _instrumented_engines.pop(engine, [])
+    for name, listener in listeners:
+        event.remove(engine, name, listener)
+
+
+def report_at_exit():
+    if not _stats or not _report_at_exit:
+        return
+    _stats.report(output_function=lambda txt: print(txt, file=sys.stderr))
+    json_file = os.environ.get('ISFDB_SQL_STATS_JSON')
+    if json_file:
+        with open(json_file, 'w') as outputstream:
+            outputstream.write(_stats.as_json())
+        print('Wrote SQL stats to %s' % (json_file), file=sys.stderr)
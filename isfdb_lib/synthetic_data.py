@@ -0,0 +1,902 @@
+#!/usr/bin/env python3
+"""
+Generate a synthetic - but schema-faithful - ISFDB database, for benchmarking
+(see tools/run_benchmarks.py) and for trying things out without downloading
+and restoring a real multi-GB dump.
+
+The data is entirely made up, but is shaped like the real thing:
+* authors, some with pseudonyms whose books are variant titles of a parent
+  credited to the real author
+* novels (some in series), collections, anthologies and short fiction, with
+  cover art titles by artists cluttering up the pubs as in the real data
+* publications with reprints in later years, ISBN-10s and ISBN-13s (with
+  valid check digits) depending on the year, UK and US prices
+* magazines containing the short fiction
+* translations (variant titles in other languages)
+* identifiers (ASINs, OCLC), author homepages and Audible URLs
+* award types, categories, nominations and winners linked to titles
+* primary verifications, tags and submissions
+
+Dates use ISFDB's partial dates (e.g. 1987-00-00).  No Wikipedia or Twitter
+URLs are generated, so the gender analysis code falls back to names rather
+than trying to download anything.
+
+Everything is driven by a seeded random number generator, so the same scale
+and seed always produce identical data.  At the default scale of 1 there are
+approximately 2000 real authors, 22000 titles and 12000 publications; the
+number of authors - and hence (roughly) everything else - is proportional to
+the scale.
+
+The output can be either:
+* A SQL file in the same format as the ISFDB MySQL backups, so it can be
+  loaded with tools/setup_testing_database.sh (or mysql's SOURCE), and
+  poked at with tools/split_sql_dump.py and tools/search_in_dump.py
+* Loaded directly into the database in ISFDB_CONNECTION_DETAILS (or -c),
+  which must be MariaDB/MySQL as the DDL is.  This will refuse to overwrite
+  a database that wasn't created by this module, unless --force is used.
+
+Usage:
+
+    ./isfdb_lib/synthetic_data.py [-s SCALE] [--seed SEED] -o synthetic.sql
+    ./isfdb_lib/synthetic_data.py [-s SCALE] [--seed SEED] --load [-c CONNECTION_STRING]
+"""
+
+from argparse import ArgumentParser
+from collections import OrderedDict
+import logging
+import random
+import sys
+import time
+
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql import text
+
+from isbn_functions import toISBN10, toISBN13
+from isfdb_lib.common import get_connection
+
+
+DEFAULT_SCALE = 1
+DEFAULT_SEED = 1926 # Amazing Stories
+
+AUTHORS_PER_SCALE = 2000
+
+FIRST_YEAR = 1950
+LAST_YEAR = 2022
+
+# Stored in metadata.metadata_wikiloc, so that we can tell a synthetic
+# database from a real one before we wipe it
+SYNTHETIC_MARKER = 'synthetic-isfdb'
+
+# Rows per extended INSERT in the SQL output, and per executemany() batch when
+# loading directly
+INSERT_BATCH_SIZE = 1000
+
+
+# Only tables that something in this repo queries are included.  The columns
+# and types are as per the real schema; the indexes are just the primary keys
+# and the ones that the real dumps have on the linking tables.
+SCHEMA = OrderedDict([
+    ('metadata', """CREATE TABLE `metadata` (
+  `metadata_schemaversion` varchar(5) DEFAULT NULL,
+  `metadata_counter` int(11) DEFAULT NULL,
+  `metadata_dbstatus` tinyint(1) DEFAULT '1',
+  `metadata_wikiloc` tinytext
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;"""),
+    ('languages', """CREATE TABLE `languages` (
+  `lang_id` int(11) NOT NULL AUTO_INCREMENT,
+  `lang_name` mediumtext,
+  `lang_code` varchar(3) DEFAULT NULL,
+  `latin_script` enum('Yes','No') NOT NULL DEFAULT 'Yes',
+  PRIMARY KEY (`lang_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;"""),
+    ('authors', """CREATE TABLE `authors` (
+  `author_id` int(11) NOT NULL AUTO_INCREMENT,
+  `author_canonical` mediumtext,
+  `author_legalname` mediumtext,
+  `author_birthplace` mediumtext,
+  `author_birthdate` date DEFAULT NULL,
+  `author_deathdate` date DEFAULT NULL,
+  `note_id` int(11) DEFAULT NULL,
+  `author_wikipedia` mediumtext,
+  `author_views` int(11) NOT NULL DEFAULT '0',
+  `author_imdb` mediumtext,
+  `author_marque` int(11) NOT NULL DEFAULT '0',
+  `author_image` mediumtext,
+  `author_annualviews` int(11) NOT NULL DEFAULT '0',
+  `author_lastname` mediumtext,
+  `author_language` int(11) DEFAULT NULL,
+  PRIMARY KEY (`author_id`),
+  KEY `canonical` (`author_canonical`(50))
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;"""),
+    ('pseudonyms', """CREATE TABLE `pseudonyms` (
+  `pseudo_id` int(11) NOT NULL AUTO_INCREMENT,
+  `author_id` int(11) DEFAULT NULL,
+  `pseudonym` int(11) DEFAULT NULL,
+  PRIMARY KEY (`pseudo_id`),
+  KEY `author_id` (`author_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;"""),
+    ('series', """CREATE TABLE `series` (
+  `series_id` int(11) NOT NULL AUTO_INCREMENT,
+  `series_title` mediumtext,
+  `series_parent` int(11) DEFAULT NULL,
+  `series_type` tinyint(4) DEFAULT NULL,
+  `series_parent_position` int(11) DEFAULT NULL,
+  `series_note_id` int(11) DEFAULT NULL,
+  PRIMARY KEY (`series_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;"""),
+    ('titles', """CREATE TABLE `titles` (
+  `title_id` int(11) NOT NULL AUTO_INCREMENT,
+  `title_title` mediumtext,
+  `title_translator` mediumtext,
+  `title_synopsis` int(11) DEFAULT NULL,
+  `note_id` int(11) DEFAULT NULL,
+  `series_id` int(11) DEFAULT NULL,
+  `title_seriesnum` int(11) DEFAULT NULL,
+  `title_copyright` date DEFAULT NULL,
+  `title_storylen` varchar(16) DEFAULT NULL,
+  `title_ttype` enum('ANTHOLOGY','BACKCOVERART','COLLECTION','COVERART','INTERIORART','EDITOR','ESSAY','INTERVIEW','NOVEL','NONFICTION','OMNIBUS','POEM','REVIEW','SERIAL','SHORTFICTION','CHAPBOOK') DEFAULT NULL,
+  `title_wikipedia` mediumtext,
+  `title_views` int(11) NOT NULL DEFAULT '0',
+  `title_parent` int(11) NOT NULL DEFAULT '0',
+  `title_rating` float DEFAULT NULL,
+  `title_annualviews` int(11) NOT NULL DEFAULT '0',
+  `title_ctl` tinyint(1) DEFAULT '0',
+  `title_language` int(11) DEFAULT NULL,
+  `title_seriesnum_2` varchar(128) DEFAULT NULL,
+  `title_non_genre` enum('Yes','No') NOT NULL DEFAULT 'No',
+  `title_graphic` enum('Yes','No') NOT NULL DEFAULT 'No',
+  `title_nvz` enum('Yes','No') NOT NULL DEFAULT 'No',
+  `title_jvn` enum('Yes','No') NOT NULL DEFAULT 'No',
+  `title_content` varchar(254) DEFAULT NULL,
+  PRIMARY KEY (`title_id`),
+  KEY `title` (`title_title`(50)),
+  KEY `title_parent` (`title_parent`),
+  KEY `series_id` (`series_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;"""),
+    ('canonical_author', """CREATE TABLE `canonical_author` (
+  `ca_id` int(11) NOT NULL AUTO_INCREMENT,
+  `title_id` int(11) DEFAULT NULL,
+  `author_id` int(11) DEFAULT NULL,
+  `ca_status` int(11) DEFAULT NULL,
+  PRIMARY KEY (`ca_id`),
+  KEY `titles` (`title_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;"""),
+    ('publishers', """CREATE TABLE `publishers` (
+  `publisher_id` int(11) NOT NULL AUTO_INCREMENT,
+  `publisher_name` mediumtext,
+  `publisher_wikipedia` mediumtext,
+  `note_id` int(11) DEFAULT NULL,
+  PRIMARY KEY (`publisher_id`),
+  KEY `name` (`publisher_name`(50))
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;"""),
+    ('pub_series', """CREATE TABLE `pub_series` (
+  `pub_series_id` int(11) NOT NULL AUTO_INCREMENT,
+  `pub_series_name` mediumtext,
+  `pub_series_wikipedia` mediumtext,
+  `pub_series_note_id` int(11) DEFAULT NULL,
+  PRIMARY KEY (`pub_series_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;"""),
+    ('pubs', """CREATE TABLE `pubs` (
+  `pub_id` int(11) NOT NULL AUTO_INCREMENT,
+  `pub_title` mediumtext,
+  `pub_tag` varchar(45) DEFAULT NULL,
+  `pub_year` date DEFAULT NULL,
+  `publisher_id` int(11) DEFAULT NULL,
+  `pub_pages` varchar(64) DEFAULT NULL,
+  `pub_ptype` varchar(64) DEFAULT NULL,
+  `pub_ctype` enum('ANTHOLOGY','CHAPBOOK','COLLECTION','MAGAZINE','NONFICTION','NOVEL','OMNIBUS','FANZINE') DEFAULT NULL,
+  `pub_isbn` varchar(32) DEFAULT NULL,
+  `pub_frontimage` mediumtext,
+  `pub_price` mediumtext,
+  `note_id` int(11) DEFAULT NULL,
+  `pub_series_id` int(11) DEFAULT NULL,
+  `pub_series_num` mediumtext,
+  `pub_catalog` mediumtext,
+  PRIMARY KEY (`pub_id`),
+  KEY `tag` (`pub_tag`),
+  KEY `publisher_id` (`publisher_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;"""),
+    ('pub_content', """CREATE TABLE `pub_content` (
+  `pubc_id` int(11) NOT NULL AUTO_INCREMENT,
+  `title_id` int(11) DEFAULT NULL,
+  `pub_id` int(11) DEFAULT NULL,
+  `pubc_page` varchar(20) DEFAULT NULL,
+  PRIMARY KEY (`pubc_id`),
+  KEY `titles` (`title_id`),
+  KEY `pubs` (`pub_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;"""),
+    ('identifier_types', """CREATE TABLE `identifier_types` (
+  `identifier_type_id` int(11) NOT NULL AUTO_INCREMENT,
+  `identifier_type_name` varchar(50) DEFAULT NULL,
+  `identifier_type_full_name` varchar(150) DEFAULT NULL,
+  PRIMARY KEY (`identifier_type_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;"""),
+    ('identifiers', """CREATE TABLE `identifiers` (
+  `identifier_id` int(11) NOT NULL AUTO_INCREMENT,
+  `identifier_type_id` int(11) DEFAULT NULL,
+  `identifier_value` mediumtext,
+  `pub_id` int(11) DEFAULT NULL,
+  PRIMARY KEY (`identifier_id`),
+  KEY `pub_id` (`pub_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;"""),
+    ('webpages', """CREATE TABLE `webpages` (
+  `webpage_id` int(11) NOT NULL AUTO_INCREMENT,
+  `author_id` int(11) DEFAULT NULL,
+  `publisher_id` int(11) DEFAULT NULL,
+  `url` mediumtext,
+  `pub_series_id` int(11) DEFAULT NULL,
+  `title_id` int(11) DEFAULT NULL,
+  `award_type_id` int(11) DEFAULT NULL,
+  `series_id` int(11) DEFAULT NULL,
+  `award_cat_id` int(11) DEFAULT NULL,
+  `pub_id` int(11) DEFAULT NULL,
+  PRIMARY KEY (`webpage_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;"""),
+    ('award_types', """CREATE TABLE `award_types` (
+  `award_type_id` int(11) NOT NULL AUTO_INCREMENT,
+  `award_type_code` varchar(5) DEFAULT NULL,
+  `award_type_by` mediumtext,
+  `award_type_for` mediumtext,
+  `award_type_name` mediumtext,
+  `award_type_short_name` mediumtext,
+  `award_type_poll` enum('Yes','No') DEFAULT 'No',
+  `award_type_non_genre` enum('Yes','No') DEFAULT 'No',
+  `award_type_note_id` int(11) DEFAULT NULL,
+  `award_type_wikipedia` mediumtext,
+  PRIMARY KEY (`award_type_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;"""),
+    ('award_cats', """CREATE TABLE `award_cats` (
+  `award_cat_id` int(11) NOT NULL AUTO_INCREMENT,
+  `award_cat_name` mediumtext,
+  `award_cat_type_id` int(11) DEFAULT NULL,
+  `award_cat_order` int(11) DEFAULT NULL,
+  `award_cat_note_id` int(11) DEFAULT NULL,
+  PRIMARY KEY (`award_cat_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;"""),
+    ('awards', """CREATE TABLE `awards` (
+  `award_id` int(11) NOT NULL AUTO_INCREMENT,
+  `award_title` mediumtext,
+  `award_author` mediumtext,
+  `award_year` date DEFAULT NULL,
+  `award_ttype` varchar(2) DEFAULT NULL,
+  `award_atype` mediumtext,
+  `award_level` mediumtext,
+  `award_movie` mediumtext,
+  `award_type_id` int(11) DEFAULT NULL,
+  `award_cat_id` int(11) DEFAULT NULL,
+  `award_note_id` int(11) DEFAULT NULL,
+  PRIMARY KEY (`award_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;"""),
+    ('title_awards', """CREATE TABLE `title_awards` (
+  `taw_id` int(11) NOT NULL AUTO_INCREMENT,
+  `award_id` int(11) DEFAULT NULL,
+  `title_id` int(11) DEFAULT NULL,
+  PRIMARY KEY (`taw_id`),
+  KEY `award_id` (`award_id`),
+  KEY `title_id` (`title_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;"""),
+    ('title_relationships', """CREATE TABLE `title_relationships` (
+  `title_relationship_id` int(11) NOT NULL AUTO_INCREMENT,
+  `title_id` int(11) NOT NULL,
+  `review_id` int(11) DEFAULT NULL,
+  `series_id` int(11) DEFAULT NULL,
+  `translation_id` int(11) DEFAULT NULL,
+  PRIMARY KEY (`title_relationship_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;"""),
+    ('primary_verifications', """CREATE TABLE `primary_verifications` (
+  `verification_id` int(11) NOT NULL AUTO_INCREMENT,
+  `pub_id` int(11) NOT NULL,
+  `user_id` int(11) NOT NULL,
+  `ver_time` datetime NOT NULL,
+  `ver_transient` tinyint(1) DEFAULT NULL,
+  PRIMARY KEY (`verification_id`),
+  KEY `pub_id` (`pub_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;"""),
+    ('tags', """CREATE TABLE `tags` (
+  `tag_id` int(11) NOT NULL AUTO_INCREMENT,
+  `tag_name` tinytext,
+  `tag_status` tinyint(1) NOT NULL DEFAULT '0',
+  PRIMARY KEY (`tag_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;"""),
+    ('tag_mapping', """CREATE TABLE `tag_mapping` (
+  `tagmap_id` int(11) NOT NULL AUTO_INCREMENT,
+  `tag_id` int(11) DEFAULT NULL,
+  `title_id` int(11) DEFAULT NULL,
+  `user_id` int(11) DEFAULT NULL,
+  PRIMARY KEY (`tagmap_id`),
+  KEY `tag_id` (`tag_id`),
+  KEY `title_id` (`title_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;"""),
+    ('submissions', """CREATE TABLE `submissions` (
+  `sub_id` int(11) NOT NULL AUTO_INCREMENT,
+  `sub_state` enum('N','R','I','P') NOT NULL DEFAULT 'N',
+  `sub_type` tinyint(4) DEFAULT NULL,
+  `sub_data` longtext,
+  `sub_time` datetime DEFAULT NULL,
+  `sub_reviewed` datetime DEFAULT NULL,
+  `sub_submitter` int(11) NOT NULL DEFAULT '0',
+  `sub_reviewer` int(11) DEFAULT NULL,
+  `sub_reason` longtext,
+  `sub_holdid` int(11) NOT NULL DEFAULT '0',
+  `affected_record_id` int(11) DEFAULT NULL,
+  PRIMARY KEY (`sub_id`)
+) ENGINE=MyISAM DEFAULT CHARSET=latin1;""")
+])
+
+ENGLISH = 17
+LANGUAGES = [(17, 'English', 'eng', 'Yes'), (22, 'French', 'fre', 'Yes'),
+             (26, 'German', 'ger', 'Yes'), (36, 'Japanese', 'jpn', 'No')]
+TRANSLATION_LANGUAGES = [22, 26, 36]
+
+IDENTIFIER_TYPES = [(1, 'ASIN', 'Amazon Standard Identification Number'),
+                    (2, 'Audible-ASIN', 'Audible ASIN'),
+                    (3, 'BL', 'The British Library'),
+                    (12, 'OCLC/WorldCat', 'Online Computer Library Center')]
+
+# (award_type_id, name, short name, [(award_cat_id, name, title_ttype, storylen)])
+AWARDS = [
+    (23, 'Hugo Award', 'Hugo', [(261, 'Best Novel', 'NOVEL', None),
+                                (262, 'Best Novella', 'SHORTFICTION', 'novella'),
+                                (263, 'Best Short Story', 'SHORTFICTION', 'short story')]),
+    (31, 'Nebula Award', 'Nebula', [(413, 'Best Novel', 'NOVEL', None),
+                                    (414, 'Best Novella', 'SHORTFICTION', 'novella')]),
+    (40, 'Arthur C. Clarke Award', 'Clarke', [(501, 'Best Novel', 'NOVEL', None)]),
+    (41, 'World Fantasy Award', 'WFA', [(520, 'Novel', 'NOVEL', None),
+                                        (521, 'Short Fiction', 'SHORTFICTION', 'short story')])
+]
+FINALISTS_PER_CATEGORY = 6
+FIRST_AWARD_YEAR = 1960
+
+TAGS = ['science fiction', 'fantasy', 'horror', 'space opera', 'time travel',
+        'first contact', 'cyberpunk', 'epic fantasy', 'urban fantasy',
+        'alternate history', 'dystopia', 'generation ship', 'dragons', 'robots']
+
+FEMALE_FIRST_NAMES = ['Anne', 'Margaret', 'Ursula', 'Octavia', 'Lois', 'Connie',
+                      'Nnedi', 'Ann', 'Becky', 'Martha', 'Kate', 'Aliette',
+                      'Catherine', 'Elizabeth', 'Karen', 'Mary', 'Nicola',
+                      'Tricia', 'Judith', 'Sarah', 'Jane', 'Emma', 'Helen',
+                      'Susan', 'Claire', 'Rachel', 'Joanna', 'Vonda', 'Tanith']
+MALE_FIRST_NAMES = ['Isaac', 'Robert', 'Arthur', 'Frederik', 'Iain', 'Peter',
+                    'Alastair', 'Adrian', 'Neal', 'William', 'Greg', 'Ken',
+                    'Christopher', 'Gene', 'Michael', 'John', 'Paul', 'Stephen',
+                    'Richard', 'Gary', 'Dan', 'Brian', 'Ted', 'David', 'James',
+                    'Charles', 'Roger', 'Philip', 'Ian']
+AMBIGUOUS_FIRST_NAMES = ['Alex', 'Jordan', 'Robin', 'Sam', 'Jo', 'Pat', 'Chris',
+                         'Lee', 'Leslie', 'Kim']
+SURNAMES = ['Adams', 'Baxter', 'Banks', 'Bear', 'Brin', 'Butler', 'Cherryh',
+            'Clarke', 'Cadigan', 'Delany', 'Egan', 'Fowler', 'Gibson', 'Griffith',
+            'Hamilton', 'Harrison', 'Jemisin', 'Kress', 'Leckie', 'MacLeod',
+            'McAuley', 'McDonald', 'Moon', 'Niven', 'Okorafor', 'Pohl',
+            'Reynolds', 'Roberts', 'Robinson', 'Russ', 'Scalzi', 'Sheldon',
+            'Silverberg', 'Simmons', 'Stephenson', 'Stross', 'Tepper', 'Tidhar',
+            'Vinge', 'Walton', 'Watts', 'Wells', 'Willis', 'Wolfe', 'Wyndham',
+            'Zelazny']
+BIRTHPLACES = ['London, England, UK', 'Manchester, England, UK',
+               'Edinburgh, Scotland, UK', 'Chicago, Illinois, USA',
+               'Brooklyn, New York, USA', 'Los Angeles, California, USA',
+               'Toronto, Ontario, Canada', 'Sydney, New South Wales, Australia',
+               'Dublin, Ireland', 'Auckland, New Zealand', None]
+
+TITLE_ADJECTIVES = ['Last', 'Hidden', 'Silent', 'Broken', 'Burning', 'Forgotten',
+                    'Infinite', 'Crimson', 'Hollow', 'Drowned', 'Shattered',
+                    'Endless', 'Iron', 'Glass', 'Quantum', 'Dark', 'Distant']
+TITLE_NOUNS = ['Empire', 'Star', 'Sea', 'Crown', 'Machine', 'Garden', 'Gate',
+               'City', 'Sky', 'Engine', 'Kingdom', 'Dragon', 'Moon', 'Station',
+               'Archive', 'Labyrinth', 'Children', 'Ship', 'Wind', 'Tower']
+PUBLISHER_WORDS = ['Nova', 'Orbital', 'Meridian', 'Zenith', 'Nebula', 'Quasar',
+                   'Parallax', 'Corona', 'Aphelion', 'Solstice', 'Eclipse',
+                   'Tachyon', 'Halcyon', 'Vortex', 'Chimera', 'Basilisk']
+PUBLISHER_SUFFIXES = ['Books', 'Press', 'Publishing', 'House', 'Editions']
+
+PUB_TYPES = ['hc', 'tp', 'pb', 'ebook']
+
+
+def _isbns(rng):
+    """
+    Return a random (ISBN-10, ISBN-13) pair, both with valid check digits
+    """
+    isbn13 = toISBN13('%09d0' % (rng.randrange(10 ** 9)))
+    return toISBN10(isbn13), isbn13
+
+
+def _asin(rng):
+    return 'B0' + ''.join(rng.choice('0123456789ABCDEFGHJKLMNPQRSTUVWXYZ')
+                          for _ in range(8))
+
+
+def _dateish(rng, year, precision_probability=0.7):
+    """
+    ISFDB-style partial dates - mostly with months, sometimes days
+    """
+    if rng.random() > precision_probability:
+        return '%d-00-00' % (year)
+    month = rng.randint(1, 12)
+    day = rng.randint(1, 28) if rng.random() < 0.5 else 0
+    return '%d-%02d-%02d' % (year, month, day)
+
+
+def _title_text(rng):
+    pattern = rng.random()
+    if pattern < 0.4:
+        return 'The %s %s' % (rng.choice(TITLE_ADJECTIVES), rng.choice(TITLE_NOUNS))
+    elif pattern < 0.7:
+        return '%s of the %s' % (rng.choice(TITLE_NOUNS), rng.choice(TITLE_NOUNS))
+    elif pattern < 0.9:
+        return '%s %s' % (rng.choice(TITLE_ADJECTIVES), rng.choice(TITLE_NOUNS))
+    else:
+        return '%s %s %s' % (rng.choice(TITLE_ADJECTIVES), rng.choice(TITLE_NOUNS),
+                             rng.choice(['Rising', 'Falling', 'Reborn', 'Awakens']))
+
+
+class _Table(object):
+    """
+    Accumulates the rows for a table, assigning the auto-increment IDs
+    """
+    def __init__(self, columns, first_id=1):
+        self.columns = columns
+        self.rows = []
+        self.next_id = first_id
+
+    def add(self, *values):
+        """
+        Add a row of all but the first (ID) column, returning the assigned ID
+        """
+        new_id = self.next_id
+        self.next_id += 1
+        self.rows.append((new_id,) + values)
+        return new_id
+
+
+class _Generator(object):
+    def __init__(self, scale, seed):
+        self.rng = random.Random(seed)
+        self.scale = scale
+        t = self.tables = OrderedDict()
+        for table in SCHEMA:
+            t[table] = None
+        t['metadata'] = _Table(['metadata_schemaversion', 'metadata_counter',
+                                'metadata_dbstatus', 'metadata_wikiloc'])
+        t['languages'] = _Table(['lang_id', 'lang_name', 'lang_code', 'latin_script'])
+        t['authors'] = _Table(['author_id', 'author_canonical', 'author_legalname',
+                               'author_birthplace', 'author_birthdate',
+                               'author_lastname', 'author_language'])
+        t['pseudonyms'] = _Table(['pseudo_id', 'author_id', 'pseudonym'])
+        t['series'] = _Table(['series_id', 'series_title', 'series_parent'])
+        t['titles'] = _Table(['title_id', 'title_title', 'series_id',
+                              'title_seriesnum', 'title_copyright',
+                              'title_storylen', 'title_ttype', 'title_parent',
+                              'title_language', 'title_non_genre',
+                              'title_graphic', 'title_nvz', 'title_jvn'])
+        t['canonical_author'] = _Table(['ca_id', 'title_id', 'author_id', 'ca_status'])
+        t['publishers'] = _Table(['publisher_id', 'publisher_name'])
+        t['pub_series'] = _Table(['pub_series_id', 'pub_series_name'])
+        t['pubs'] = _Table(['pub_id', 'pub_title', 'pub_tag', 'pub_year',
+                            'publisher_id', 'pub_pages', 'pub_ptype', 'pub_ctype',
+                            'pub_isbn', 'pub_price', 'pub_series_id'])
+        t['pub_content'] = _Table(['pubc_id', 'title_id', 'pub_id', 'pubc_page'])
+        t['identifier_types'] = _Table(['identifier_type_id', 'identifier_type_name',
+                                        'identifier_type_full_name'])
+        t['identifiers'] = _Table(['identifier_id', 'identifier_type_id',
+                                   'identifier_value', 'pub_id'])
+        t['webpages'] = _Table(['webpage_id', 'author_id', 'url', 'pub_id'])
+        t['award_types'] = _Table(['award_type_id', 'award_type_code',
+                                   'award_type_name', 'award_type_short_name'])
+        t['award_cats'] = _Table(['award_cat_id', 'award_cat_name',
+                                  'award_cat_type_id', 'award_cat_order'])
+        t['awards'] = _Table(['award_id', 'award_title', 'award_author', 'award_year',
+                              'award_ttype', 'award_level', 'award_type_id',
+                              'award_cat_id'])
+        t['title_awards'] = _Table(['taw_id', 'award_id', 'title_id'])
+        t['title_relationships'] = _Table(['title_relationship_id', 'title_id',
+                                           'review_id'])
+        t['primary_verifications'] = _Table(['verification_id', 'pub_id', 'user_id',
+                                             'ver_time', 'ver_transient'])
+        t['tags'] = _Table(['tag_id', 'tag_name', 'tag_status'])
+        t['tag_mapping'] = _Table(['tagmap_id', 'tag_id', 'title_id', 'user_id'])
+        t['submissions'] = _Table(['sub_id', 'sub_state', 'sub_type', 'sub_time',
+                                   'sub_submitter', 'affected_record_id'])
+
+        self.author_names = set()
+        # (title_id, year, ttype, storylen, display_author) of English
+        # canonical titles, for the awards to pick from
+        self.award_candidates = []
+        self.short_fiction_by_year = {}
+        self.artist_ids = []
+        self.publisher_ids = []
+        self.publisher_weights = []
+
+    def generate(self):
+        num_authors = max(10, int(AUTHORS_PER_SCALE * self.scale))
+        self.add_static_rows()
+        self.add_publishers(max(5, num_authors // 10))
+        # Artists only exist to clutter up the pubs with cover art titles
+        self.artist_ids = [self.add_author()[0] for _ in range(max(3, num_authors // 20))]
+        for _ in range(num_authors):
+            self.add_author_and_works()
+        self.add_magazines()
+        self.add_awards()
+        self.add_verifications_tags_and_submissions()
+        return OrderedDict((name, (table.columns, table.rows))
+                           for name, table in self.tables.items())
+
+    def add_static_rows(self):
+        t = self.tables
+        t['metadata'].rows.append(('0.05', 0, 1, SYNTHETIC_MARKER))
+        t['languages'].rows.extend(LANGUAGES)
+        t['identifier_types'].rows.extend(IDENTIFIER_TYPES)
+        for tag in TAGS:
+            t['tags'].add(tag, 0)
+        for award_type_id, name, short_name, cats in AWARDS:
+            t['award_types'].rows.append((award_type_id, short_name[:5], name, short_name))
+            for i, (cat_id, cat_name, _, _) in enumerate(cats, 1):
+                t['award_cats'].rows.append((cat_id, cat_name, award_type_id, i))
+
+    def add_publishers(self, num_publishers):
+        rng = self.rng
+        for i in range(num_publishers):
+            name = '%s %s' % (PUBLISHER_WORDS[i % len(PUBLISHER_WORDS)],
+                              PUBLISHER_SUFFIXES[(i // len(PUBLISHER_WORDS)) %
+                                                 len(PUBLISHER_SUFFIXES)])
+            if i >= len(PUBLISHER_WORDS) * len(PUBLISHER_SUFFIXES):
+                name = '%s %d' % (name, i)
+            self.publisher_ids.append(self.tables['publishers'].add(name))
+            # A few big publishers, and a long tail of small ones
+            self.publisher_weights.append(1.0 / (i + 1) + 0.01)
+            if rng.random() < 0.2:
+                self.tables['pub_series'].add('%s Classics' % (name))
+
+    def add_author(self, language=ENGLISH):
+        """
+        Return an (author_id, name) tuple for a new author with a unique name
+        """
+        rng = self.rng
+        first_names = rng.choice([FEMALE_FIRST_NAMES, MALE_FIRST_NAMES,
+                                  FEMALE_FIRST_NAMES, MALE_FIRST_NAMES,
+                                  AMBIGUOUS_FIRST_NAMES])
+        first_name = rng.choice(first_names)
+        surname = rng.choice(SURNAMES)
+        name = '%s %s' % (first_name, surname)
+        while name in self.author_names:
+            name = '%s %s. %s' % (first_name, rng.choice('ABCDEFGHJKLMNPRSTW'), surname)
+            if name in self.author_names:
+                name = '%s %s' % (name, rng.choice(['Jr.', 'III', 'IV']))
+                if name in self.author_names:
+                    name = '%s %d' % (name, self.tables['authors'].next_id)
+        self.author_names.add(name)
+        birth_year = rng.randint(1900, 1995)
+        author_id = self.tables['authors'].add(
+            name, name if rng.random() < 0.3 else None, rng.choice(BIRTHPLACES),
+            _dateish(rng, birth_year), surname, language)
+        return author_id, name
+
+    def add_title(self, title, year, ttype, author_ids, parent=0, language=ENGLISH,
+                  storylen=None, series_id=None, seriesnum=None, non_genre='No'):
+        rng = self.rng
+        title_id = self.tables['titles'].add(
+            title, series_id, seriesnum, _dateish(rng, year), storylen, ttype,
+            parent, language, non_genre, 'No', 'No',
+            'Yes' if rng.random() < 0.05 else 'No')
+        for author_id in author_ids:
+            self.tables['canonical_author'].add(title_id, author_id, 1)
+        return title_id
+
+    def add_pub(self, title, year, ctype, content_title_ids, ptype=None,
+                publisher_id=None):
+        rng = self.rng
+        t = self.tables
+        ptype = ptype or rng.choice(PUB_TYPES)
+        if publisher_id is None:
+            publisher_id = rng.choices(self.publisher_ids, self.publisher_weights)[0]
+        isbn = None
+        if year >= 1970 and ctype != 'MAGAZINE':
+            isbn10, isbn13 = _isbns(rng)
+            isbn = isbn13 if year >= 2007 else isbn10
+        if rng.random() < 0.5:
+            price = '$%d.99' % (rng.randint(2, 30))
+        else:
+            price = '\xa3%d.99' % (rng.randint(2, 20))
+        pub_series_id = None
+        if t['pub_series'].rows and rng.random() < 0.05:
+            pub_series_id = rng.randint(1, len(t['pub_series'].rows))
+        # Tags are the initials of the title plus a unique-ifying number
+        pub_tag = '%s%d' % (''.join(z[0] for z in title.split())[:8].upper(),
+                            t['pubs'].next_id)
+        pub_id = t['pubs'].add(title, pub_tag, _dateish(rng, year, 0.9), publisher_id,
+                               str(rng.randint(150, 700)), ptype, ctype, isbn, price,
+                               pub_series_id)
+        for page, title_id in enumerate(content_title_ids, 1):
+            t['pub_content'].add(title_id, pub_id, str(page) if page > 1 else None)
+        if ctype != 'MAGAZINE' and self.artist_ids and rng.random() < 0.6:
+            cover_id = self.add_title(title, year, 'COVERART', [rng.choice(self.artist_ids)])
+            t['pub_content'].add(cover_id, pub_id, 'fc')
+
+        if ptype == 'ebook' or rng.random() < 0.1:
+            t['identifiers'].add(1, _asin(rng), pub_id)
+        if rng.random() < 0.3:
+            t['identifiers'].add(12, str(rng.randint(10 ** 6, 10 ** 9)), pub_id)
+        if rng.random() < 0.03:
+            t['webpages'].add(None, 'https://www.audible.co.uk/pd/%s' % (_asin(rng)),
+                              pub_id)
+        return pub_id
+
+    def add_author_and_works(self):
+        rng = self.rng
+        t = self.tables
+        author_id, name = self.add_author()
+        pseudonym = None
+        if rng.random() < 0.1:
+            pseudonym_id, pseudonym_name = self.add_author()
+            t['pseudonyms'].add(author_id, pseudonym_id)
+            pseudonym = (pseudonym_id, pseudonym_name)
+        if rng.random() < 0.4:
+            t['webpages'].add(author_id, 'https://www.example.com/authors/%d' %
+                              (author_id), None)
+
+        year = rng.randint(FIRST_YEAR, LAST_YEAR - 2)
+        num_novels = min(40, int(rng.paretovariate(1.1)))
+        series_id = None
+        seriesnum = None
+        short_fiction_ids = []
+        for i in range(num_novels):
+            if year > LAST_YEAR:
+                break
+            title = _title_text(rng)
+            if rng.random() < 0.3:
+                if series_id is None or rng.random() < 0.3:
+                    series_id = t['series'].add('The %s Sequence' % (title.split()[-1]),
+                                                None)
+                    seriesnum = 0
+                seriesnum += 1
+            else:
+                series_id = seriesnum = None
+            ttype = rng.choices(['NOVEL', 'COLLECTION', 'ANTHOLOGY', 'NONFICTION',
+                                 'CHAPBOOK'], [85, 6, 3, 3, 3])[0]
+            if ttype == 'COLLECTION' and short_fiction_ids:
+                content_ids = rng.sample(short_fiction_ids,
+                                         min(len(short_fiction_ids), 10))
+            else:
+                content_ids = []
+            non_genre = 'Yes' if ttype == 'NONFICTION' and rng.random() < 0.5 else 'No'
+            display_author = name
+            title_id = self.add_title(title, year, ttype, [author_id],
+                                      series_id=series_id, seriesnum=seriesnum,
+                                      non_genre=non_genre)
+            pub_title_id = title_id
+            if pseudonym and rng.random() < 0.5:
+                # Published under the pseudonym, so the pubs contain a variant
+                pub_title_id = self.add_title(title, year, ttype, [pseudonym[0]],
+                                              parent=title_id)
+                display_author = pseudonym[1]
+            if content_ids:
+                rng.shuffle(content_ids)
+            # First edition, plus any reprints
+            self.add_pub(title, year, ttype, [pub_title_id] + content_ids,
+                         ptype=rng.choice(['hc', 'tp']))
+            for _ in range(min(6, int(rng.expovariate(0.8)))):
+                reprint_year = min(LAST_YEAR, year + rng.randint(0, 15))
+                self.add_pub(title, reprint_year, ttype, [pub_title_id])
+            if ttype == 'NOVEL':
+                self.award_candidates.append((title_id, year, ttype, None,
+                                              display_author))
+                if rng.random() < 0.05:
+                    language = rng.choice(TRANSLATION_LANGUAGES)
+                    translated_title = '%s [%s]' % (title, language)
+                    translation_year = min(LAST_YEAR, year + rng.randint(1, 10))
+                    variant_id = self.add_title(translated_title, translation_year,
+                                                ttype, [author_id], parent=title_id,
+                                                language=language)
+                    self.add_pub(translated_title, translation_year, ttype, [variant_id])
+
+            # Some short fiction in between the books
+            for _ in range(rng.randint(0, 3)):
+                storylen = rng.choices(['short story', 'novelette', 'novella'],
+                                       [70, 20, 10])[0]
+                sf_year = min(LAST_YEAR, year + rng.randint(0, 2))
+                sf_id = self.add_title(_title_text(rng), sf_year, 'SHORTFICTION',
+                                       [author_id], storylen=storylen)
+                short_fiction_ids.append(sf_id)
+                self.short_fiction_by_year.setdefault(sf_year, []).append(sf_id)
+                self.award_candidates.append((sf_id, sf_year, 'SHORTFICTION',
+                                              storylen, name))
+            year += rng.randint(1, 4)
+
+    def add_magazines(self):
+        """
+        Put all the short fiction into monthly-ish magazine issues
+        """
+        rng = self.rng
+        magazines = ['%s Stories' % (z) for z in ['Astounding', 'Amazing',
+                                                    'Fantastic', 'Weird',
+                                                    'Uncanny', 'Galactic']]
+        editors = {mag: self.add_author()[0] for mag in magazines}
+        for year, story_ids in sorted(self.short_fiction_by_year.items()):
+            story_ids = list(story_ids)
+            rng.shuffle(story_ids)
+            issue = 0
+            while story_ids:
+                issue += 1
+                magazine = rng.choice(magazines)
+                month = (issue - 1) % 12 + 1
+                issue_title = '%s, %s %d' % (magazine, ['January', 'February', 'March',
+                                                        'April', 'May', 'June', 'July',
+                                                        'August', 'September', 'October',
+                                                        'November', 'December'][month - 1],
+                                             year)
+                editor_title_id = self.add_title(issue_title, year, 'EDITOR',
+                                                 [editors[magazine]])
+                contents, story_ids = story_ids[:8], story_ids[8:]
+                self.add_pub(issue_title, year, 'MAGAZINE',
+                             [editor_title_id] + contents, ptype='digest')
+
+    def add_awards(self):
+        rng = self.rng
+        t = self.tables
+        candidates_by_key = {}
+        for title_id, year, ttype, storylen, author in self.award_candidates:
+            candidates_by_key.setdefault((year, ttype, storylen), []).append(
+                (title_id, author))
+        for award_type_id, _, _, cats in AWARDS:
+            for cat_id, _, ttype, storylen in cats:
+                for year in range(FIRST_AWARD_YEAR, LAST_YEAR + 1):
+                    candidates = candidates_by_key.get((year - 1, ttype, storylen), [])
+                    if not candidates:
+                        continue
+                    finalists = rng.sample(candidates,
+                                           min(len(candidates), FINALISTS_PER_CATEGORY))
+                    for level, (title_id, author) in enumerate(finalists, 1):
+                        title = t['titles'].rows[title_id - 1][1]
+                        award_id = t['awards'].add(title, author, '%d-00-00' % (year),
+                                                   'Ak' if level == 1 else 'An',
+                                                   str(level), award_type_id, cat_id)
+                        t['title_awards'].add(award_id, title_id)
+
+    def add_verifications_tags_and_submissions(self):
+        rng = self.rng
+        t = self.tables
+        num_users = max(10, int(200 * self.scale))
+        for pub_id, _, _, pub_year, *_ in t['pubs'].rows:
+            if rng.random() < 0.4:
+                for user_id in rng.sample(range(1, num_users + 1), rng.randint(1, 3)):
+                    year = max(2006, int(pub_year[:4]))
+                    t['primary_verifications'].add(
+                        pub_id, user_id,
+                        '%d-%02d-%02d 12:00:00' % (rng.randint(year, LAST_YEAR),
+                                                   rng.randint(1, 12), rng.randint(1, 28)),
+                        None)
+        for title_id, _, _, _, _, _, ttype, *_ in t['titles'].rows:
+            if ttype == 'NOVEL' and rng.random() < 0.5:
+                for tag_id in rng.sample(range(1, len(TAGS) + 1), rng.randint(1, 3)):
+                    t['tag_mapping'].add(tag_id, title_id, rng.randint(1, num_users))
+        for _ in range(max(10, len(t['titles'].rows) // 10)):
+            t['submissions'].add('I', rng.randint(1, 40),
+                                 '%d-%02d-01 00:00:00' % (rng.randint(2006, LAST_YEAR),
+                                                          rng.randint(1, 12)),
+                                 rng.randint(1, num_users),
+                                 rng.randint(1, len(t['titles'].rows)))
+
+
+def generate_tables(scale=DEFAULT_SCALE, seed=DEFAULT_SEED):
+    """
+    Return an OrderedDict mapping table names (in the same order as SCHEMA) to
+    (column_names, rows) tuples.  Columns that aren't listed are left as their
+    defaults.
+    """
+    return _Generator(scale, seed).generate()
+
+
+def sql_literal(val):
+    """
+    Return val as a MySQL literal, escaped the same way as mysqldump does
+    """
+    if val is None:
+        return 'NULL'
+    if isinstance(val, (int, float)):
+        return repr(val)
+    escaped = str(val).replace('\\', '\\\\').replace("'", "\\'"). \
+        replace('\n', '\\n').replace('\r', '\\r').replace('\0', '\\0')
+    return "'%s'" % (escaped)
+
+
+def write_sql_dump(tables, outputstream, batch_size=INSERT_BATCH_SIZE):
+    """
+    Write the output of generate_tables() as SQL in the same style as the ISFDB
+    MySQL backups
+    """
+    outputstream.write('-- Synthetic ISFDB data generated by synthetic_data.py\n\n')
+    outputstream.write('/*!40101 SET NAMES latin1 */;\n\n')
+    for table, (columns, rows) in tables.items():
+        outputstream.write('--\n-- Table structure for table `%s`\n--\n\n' % (table))
+        outputstream.write('DROP TABLE IF EXISTS `%s`;\n' % (table))
+        outputstream.write(SCHEMA[table] + '\n\n')
+        outputstream.write('--\n-- Dumping data for table `%s`\n--\n\n' % (table))
+        outputstream.write('LOCK TABLES `%s` WRITE;\n' % (table))
+        column_list = ','.join('`%s`' % (z) for z in columns)
+        for start in range(0, len(rows), batch_size):
+            values = ','.join('(%s)' % (','.join(sql_literal(v) for v in row))
+                              for row in rows[start:start + batch_size])
+            outputstream.write('INSERT INTO `%s` (%s) VALUES %s;\n' %
+                               (table, column_list, values))
+        outputstream.write('UNLOCK TABLES;\n\n')
+
+
+class NotSyntheticDatabaseError(Exception):
+    pass
+
+
+def is_synthetic_database(conn):
+    """
+    Return True if the database is empty or was created by load_tables()
+    """
+    try:
+        marker = conn.execute(text('SELECT metadata_wikiloc FROM metadata;')).scalar()
+    except DBAPIError:
+        conn.rollback()
+        try:
+            conn.execute(text('SELECT 1 FROM titles LIMIT 1;'))
+        except DBAPIError:
+            # No ISFDB tables at all
+            conn.rollback()
+            return True
+        return False
+    return marker == SYNTHETIC_MARKER
+
+
+def load_tables(conn, tables, force=False, batch_size=INSERT_BATCH_SIZE,
+                output_function=print):
+    """
+    (Re)create the tables in the database and insert the output of
+    generate_tables() into them.  Unless force is True, raises
+    NotSyntheticDatabaseError rather than overwriting a real ISFDB database.
+    """
+    if not force and not is_synthetic_database(conn):
+        raise NotSyntheticDatabaseError('Database contains ISFDB tables not created '
+                                        'by synthetic_data.py - refusing to overwrite')
+    start = time.time()
+    for table, (columns, rows) in tables.items():
+        conn.execute(text('DROP TABLE IF EXISTS `%s`;' % (table)))
+        conn.execute(text(SCHEMA[table]))
+        insert = text('INSERT INTO `%s` (%s) VALUES (%s);' %
+                      (table, ','.join(columns), ','.join(':%s' % (z) for z in columns)))
+        for batch_start in range(0, len(rows), batch_size):
+            conn.execute(insert, [dict(zip(columns, row))
+                                  for row in rows[batch_start:batch_start + batch_size]])
+        conn.commit()
+        output_function('Loaded %d rows into %s after %.3f seconds' %
+                        (len(rows), table, time.time() - start))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Generate a synthetic ISFDB database')
+    parser.add_argument('-s', dest='scale', type=float, default=DEFAULT_SCALE,
+                        help='Scale factor - 1 is approximately %d authors (default %s)' %
+                        (AUTHORS_PER_SCALE, DEFAULT_SCALE))
+    parser.add_argument('--seed', dest='seed', type=int, default=DEFAULT_SEED,
+                        help='Random seed (default %d)' % (DEFAULT_SEED))
+    parser.add_argument('-o', dest='output_file',
+                        help='Write the data to this SQL file')
+    parser.add_argument('--load', dest='load', action='store_true',
+                        help='Load the data directly into the database')
+    parser.add_argument('-c', dest='connection_string',
+                        help='Database to load into (default ISFDB_CONNECTION_DETAILS)')
+    parser.add_argument('--force', dest='force', action='store_true',
+                        help='Overwrite the database even if it looks like a real ISFDB one')
+    args = parser.parse_args()
+    if not args.output_file and not args.load:
+        parser.error('Must specify -o and/or --load')
+
+    logging.basicConfig(level=logging.INFO)
+    start = time.time()
+    tables = generate_tables(args.scale, args.seed)
+    print('Generated %d rows in %d tables in %.3f seconds' %
+          (sum(len(z[1]) for z in tables.values()), len(tables), time.time() - start))
+    if args.output_file:
+        with open(args.output_file, 'w', encoding='latin-1') as outputstream:
+            write_sql_dump(tables, outputstream)
+        print('Wrote %s' % (args.output_file))
+    if args.load:
+        conn = get_connection(args.connection_string, query_cache=False)
+        try:
+            load_tables(conn, tables, force=args.force)
+        except NotSyntheticDatabaseError as err:
+            print(err, file=sys.stderr)
+            sys.exit(1)
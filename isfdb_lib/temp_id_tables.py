@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Support for queries that filter on potentially very long lists of IDs e.g. all
+the titles of a prolific author, or of a gestalt pseudonym, or of a whole year.
+
+Binding such lists into "col IN :ids" produces huge statements that are slow
+to send and parse, and which at the extreme exceed max_allowed_packet.  Above
+a threshold (DEFAULT_THRESHOLD, or the ISFDB_TEMP_TABLE_THRESHOLD environment
+variable), id_list_filter() instead loads the IDs into a session temporary
+table, and gives the caller "col IN (SELECT id FROM that_table)" to use in
+their query, which MariaDB/MySQL executes as a semi-join.  Below the threshold
+it just gives the caller the regular IN clause, so the calling code doesn't
+need to care which it got:
+
+    with id_list_filter(conn, 'ca.title_id', 'title_ids', title_ids) as (fltr, params):
+        rows = conn.execute(text('SELECT ... WHERE %s' % (fltr)), params).fetchall()
+
+Note that the results must be fetched before leaving the with block, as the
+temporary table gets dropped at that point.
+
+Creating temporary tables needs the CREATE TEMPORARY TABLES privilege; this
+is checked the first time it's needed on each connection, and if the database
+user doesn't have it, a warning is logged and the IN clause is used regardless.
+
+With a query cache CachingConnection, creating the table is deferred until
+the connection next executes something against the database, so that a cache
+hit doesn't involve loading thousands of IDs into a table that never gets
+used.  (Queries run via its .uncached connection don't trigger this.)
+"""
+
+from contextlib import contextmanager
+from hashlib import sha256
+import logging
+import os
+
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql import text
+
+
+DEFAULT_THRESHOLD = 1000
+
+TABLE_NAME_PREFIX = 'isfdb_tmp_'
+
+INSERT_BATCH_SIZE = 5000
+
+# Keys in Connection.info, which is per database session, as temporary tables are
+ACTIVE_TABLES_INFO_KEY = 'isfdb_temp_id_tables'
+PENDING_TABLES_INFO_KEY = 'isfdb_temp_id_tables_pending'
+AVAILABLE_INFO_KEY = 'isfdb_temp_id_tables_available'
+
+
+def get_threshold():
+    return int(os.environ.get('ISFDB_TEMP_TABLE_THRESHOLD', DEFAULT_THRESHOLD))
+
+
+def _choose_table_name(active_tables, param_name):
+    """
+    Use the same name each time where possible, so that the SQL doesn't vary,
+    which keeps the query cache happy.  MySQL doesn't allow a temporary table
+    to be referenced twice in one query, hence the need to use a different
+    name if (say) a query has two lists of title_ids.
+    """
+    base_name = '%s%s' % (TABLE_NAME_PREFIX, param_name)
+    name = base_name
+    i = 1
+    while name in active_tables:
+        i += 1
+        name = '%s_%d' % (base_name, i)
+    return name
+
+
+def _drop_table(conn, table_name):
+    if conn.dialect.name == 'sqlite':
+        conn.execute(text('DROP TABLE IF EXISTS temp.%s;' % (table_name)))
+    else:
+        conn.execute(text('DROP TEMPORARY TABLE IF EXISTS %s;' % (table_name)))
+
+
+def create_id_table(conn, table_name, ids, index=True):
+    """
+    Create a temporary table containing the (non-None) ids, in a column named
+    id, with a primary key on it unless index is False.
+    """
+    ids = [z for z in ids if z is not None]
+    if index:
+        ids = sorted(set(ids))
+        ddl = 'CREATE TEMPORARY TABLE %s (id INT NOT NULL PRIMARY KEY);'
+    else:
+        ddl = 'CREATE TEMPORARY TABLE %s (id INT NOT NULL);'
+    conn.execute(text(ddl % (table_name)))
+    insert = text('INSERT INTO %s (id) VALUES (:id);' % (table_name))
+    for start in range(0, len(ids), INSERT_BATCH_SIZE):
+        conn.execute(insert, [{'id': z} for z in ids[start:start + INSERT_BATCH_SIZE]])
+
+
+def _temp_tables_available(conn):
+    available = conn.info.get(AVAILABLE_INFO_KEY)
+    if available is None:
+        table_name = '%sprobe' % (TABLE_NAME_PREFIX)
+        try:
+            create_id_table(conn, table_name, [])
+            _drop_table(conn, table_name)
+            available = True
+        except DBAPIError as err:
+            # No rollback, as that would throw away the caller's transaction,
+            # and a failed CREATE doesn't abort it
+            logging.warning('Unable to create temporary tables, so using IN for '
+                            'long lists of IDs instead: %s' % (err))
+            available = False
+        conn.info[AVAILABLE_INFO_KEY] = available
+    return available
+
+
+def create_pending_id_tables(conn):
+    """
+    Create any temporary tables whose creation id_list_filter() deferred, as
+    per the module docstring.  CachingConnection calls this before executing
+    anything against the database.
+    """
+    pending = conn.info.get(PENDING_TABLES_INFO_KEY)
+    while pending:
+        table_name, (ids, index) = pending.popitem()
+        create_id_table(conn, table_name, ids, index)
+
+
+@contextmanager
+def id_list_filter(conn, column, param_name, ids, threshold=None, index=True):
+    """
+    Context manager yielding a (sql_fragment, params) tuple for a filter of
+    column on ids, as per the module docstring.  The params dict should be
+    merged into those for the query.
+    """
+    ids = list(ids)
+    if threshold is None:
+        threshold = get_threshold()
+    if len(ids) <= threshold or not _temp_tables_available(conn):
+        yield '%s IN :%s' % (column, param_name), {param_name: ids}
+        return
+
+    active_tables = conn.info.setdefault(ACTIVE_TABLES_INFO_KEY, set())
+    table_name = _choose_table_name(active_tables, param_name)
+    active_tables.add(table_name)
+    pending = conn.info.setdefault(PENDING_TABLES_INFO_KEY, {})
+    try:
+        # i.e. is this a query_cache.CachingConnection
+        if getattr(conn, 'uncached', None) is not None:
+            pending[table_name] = (ids, index)
+        else:
+            create_id_table(conn, table_name, ids, index)
+        # The digest isn't used in the SQL, but it means that the query cache
+        # key reflects the contents of the table
+        digest = sha256(repr(sorted(set(z for z in ids if z is not None))).encode())
+        yield ('%s IN (SELECT id FROM %s)' % (column, table_name),
+               {'%s_digest' % (param_name): digest.hexdigest()})
+    finally:
+        active_tables.discard(table_name)
+        if table_name not in pending:
+            _drop_table(conn, table_name)
+        pending.pop(table_name, None)
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Base class for the tests that don't need an ISFDB database, just a throwaway
+SQLite one.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ..common import get_connection
+
+
+class SQLiteTestCase(unittest.TestCase):
+    """
+    Each test gets a temporary directory (self.tmp_dir) that is deleted
+    afterwards, containing an empty SQLite database, with self.conn connected
+    to it.  Subclasses that override setUp()/tearDown() need to call the
+    superclass's.
+    """
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.connection_string = 'sqlite:///%s' % os.path.join(self.tmp_dir, 'test.db')
+        self.conn = self.get_connection()
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def get_connection(self, **kwargs):
+        """
+        Return another connection to the test database; kwargs are passed to
+        common.get_connection()
+        """
+        kwargs.setdefault('force_utf8', False)
+        kwargs.setdefault('query_cache', False)
+        return get_connection(self.connection_string, **kwargs)
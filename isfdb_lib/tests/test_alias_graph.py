@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Check that the author_aliases functions give the same results from the alias
+graph as from SQL.  These don't need an ISFDB database, just a throwaway
+SQLite one - although that means names have to match case exactly, as SQLite
+doesn't have the ISFDB tables' case insensitive collation.
+"""
+
+import os
+from unittest.mock import patch
+
+from sqlalchemy.sql import text
+
+from author_aliases import (get_author_aliases, get_author_alias_ids, get_gestalt_ids,
+                            get_real_author_id_and_name,
+                            get_real_author_id_and_name_from_name,
+                            get_real_author_ids_and_names, AuthorIdAndName)
+# Not a relative import, so that this is the same module that author_aliases uses
+from isfdb_lib import alias_graph
+from isfdb_lib.alias_graph import enable_alias_graph, forget_alias_graphs, get_alias_graph
+from .sqlite_test_case import SQLiteTestCase
+
+
+AUTHORS = [
+    # author_id, author_canonical, author_legalname
+    (1, 'Seanan McGuire', 'McGuire, Seanan'),
+    (2, 'Mira Grant', None),
+    (3, 'A. Deborah Baker', None),
+    (10, 'Iain M. Banks', 'Banks, Iain Menzies'),
+    (11, 'Iain Banks', 'Banks, Iain Menzies'),
+    (20, 'Victor Appleton', None),
+    (21, 'Howard R. Garis', 'Garis, Howard Roger'),
+    (22, 'John W. Duffield', None),
+    (23, 'Harriet Stratemeyer Adams', None),
+    (30, 'Lonely Author', None),
+]
+
+PSEUDONYMS = [
+    # pseudonym, author_id
+    (2, 1),
+    (3, 1),
+    (11, 10),
+    (20, 21), (20, 22), (20, 23),
+    (40, 30), # Pseudonym with no authors record
+    (2, 99), # Real author with no authors record
+]
+
+
+class TestAliasGraphEquivalence(SQLiteTestCase):
+    def setUp(self):
+        forget_alias_graphs()
+        super().setUp()
+        self.conn.execute(text('CREATE TABLE authors (author_id INTEGER, '
+                               'author_canonical TEXT, author_legalname TEXT);'))
+        self.conn.execute(text('CREATE TABLE pseudonyms (pseudonym INTEGER, author_id INTEGER);'))
+        self.conn.execute(text('INSERT INTO authors VALUES (:a, :b, :c);'),
+                          [dict(zip('abc', z)) for z in AUTHORS])
+        self.conn.execute(text('INSERT INTO pseudonyms VALUES (:a, :b);'),
+                          [dict(zip('ab', z)) for z in PSEUDONYMS])
+
+    def tearDown(self):
+        enable_alias_graph(None)
+        forget_alias_graphs()
+        super().tearDown()
+
+    def assert_same(self, func, *args, **kwargs):
+        enable_alias_graph(False)
+        from_sql = func(self.conn, *args, **kwargs)
+        enable_alias_graph(True)
+        from_graph = func(self.conn, *args, **kwargs)
+        self.assertEqual(from_sql, from_graph)
+        return from_graph
+
+    def test_graph_loaded_once(self):
+        enable_alias_graph(True)
+        self.assertIs(get_alias_graph(self.conn), get_alias_graph(self.conn))
+        enable_alias_graph(False)
+        self.assertIsNone(get_alias_graph(self.conn))
+
+    def test_graph_reloaded_for_new_dump(self):
+        enable_alias_graph(True)
+        with patch.dict(os.environ, {'ISFDB_DUMP_VERSION': 'dump1'}):
+            graph = get_alias_graph(self.conn)
+            with patch.object(alias_graph, 'DUMP_VERSION_CHECK_INTERVAL', 0):
+                self.assertIs(graph, get_alias_graph(self.conn))
+        with patch.dict(os.environ, {'ISFDB_DUMP_VERSION': 'dump2'}):
+            # Not checked again until the interval has passed
+            self.assertIs(graph, get_alias_graph(self.conn))
+            with patch.object(alias_graph, 'DUMP_VERSION_CHECK_INTERVAL', 0):
+                new_graph = get_alias_graph(self.conn)
+                self.assertIsNot(graph, new_graph)
+                self.assertIs(new_graph, get_alias_graph(self.conn))
+
+    def test_get_author_aliases(self):
+        for author in ('Seanan McGuire', 'Mira Grant', 'Iain Banks', 'Victor Appleton',
+                       'Lonely Author', 'Nobody', 1, 2, 20, 999):
+            self.assert_same(get_author_aliases, author)
+            self.assert_same(get_author_aliases, author,
+                             search_for_additional_pseudonyms=False)
+        self.assertIn('Seanan McGuire', self.assert_same(get_author_aliases, 'Mira Grant'))
+
+    def test_get_author_alias_ids(self):
+        for author in ('Seanan McGuire', 'Mira Grant', 'A. Deborah Baker', 'Iain M. Banks',
+                       'Banks, Iain Menzies', 'Howard R. Garis', 'Nobody'):
+            self.assert_same(get_author_alias_ids, author)
+            self.assert_same(get_author_alias_ids, author,
+                             search_for_additional_pseudonyms=False)
+        self.assertEqual([1, 2, 3], sorted(self.assert_same(get_author_alias_ids,
+                                                            'A. Deborah Baker')))
+
+    # The rest use IN :list or an ORDER BY that MySQL is happy with but SQLite
+    # thinks is ambiguous, so just check the graph results
+
+    def test_get_real_author_id_and_name(self):
+        enable_alias_graph(True)
+        self.assertEqual([AuthorIdAndName(1, 'Seanan McGuire'), AuthorIdAndName(99, None)],
+                         get_real_author_id_and_name(self.conn, 2))
+        self.assertEqual([AuthorIdAndName(30, 'Lonely Author')],
+                         get_real_author_id_and_name(self.conn, 40))
+        self.assertIsNone(get_real_author_id_and_name(self.conn, 1))
+
+    def test_get_real_author_id_and_name_from_name(self):
+        enable_alias_graph(True)
+        self.assertEqual([AuthorIdAndName(None, None), AuthorIdAndName(1, 'Seanan McGuire')],
+                         get_real_author_id_and_name_from_name(self.conn, 'Mira Grant'))
+        self.assertEqual([AuthorIdAndName(1, 'Seanan McGuire')],
+                         get_real_author_id_and_name_from_name(self.conn, 'Seanan McGuire'))
+        self.assertIsNone(get_real_author_id_and_name_from_name(self.conn, 'Nobody'))
+
+    def test_get_gestalt_ids(self):
+        enable_alias_graph(True)
+        self.assertEqual([20], get_gestalt_ids(self.conn, [21, 20, 2, 20, 11]))
+        self.assertEqual([2, 20], get_gestalt_ids(self.conn, [21, 20, 2, 11], more_than=1))
+
+    def test_get_real_author_ids_and_names(self):
+        enable_alias_graph(True)
+        self.assertEqual({11: [AuthorIdAndName(10, 'Iain M. Banks')],
+                          40: [AuthorIdAndName(30, 'Lonely Author')]},
+                         get_real_author_ids_and_names(self.conn, [1, 11, 40, None]))
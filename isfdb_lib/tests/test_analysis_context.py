@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+import threading
+import unittest
+
+from ..analysis_context import (AnalysisContext, CacheStats, LRUCache,
+                                DEFAULT_CACHE_SIZES, get_default_context,
+                                resolve_context)
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_hits_and_misses(self):
+        cache = LRUCache('test', 10)
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 1)
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(CacheStats('test', 1, 1, 1, 10), cache.stats)
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache('test', 2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(1, cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual(2, len(cache))
+
+    def test_get_or_set(self):
+        cache = LRUCache('test', 10)
+        calls = []
+        def func():
+            calls.append(1)
+            return None # Check None values are cached too
+        self.assertIsNone(cache.get_or_set('a', func))
+        self.assertIsNone(cache.get_or_set('a', func))
+        self.assertEqual(1, len(calls))
+
+    def test_threads(self):
+        cache = LRUCache('test', 50)
+        def worker(offset):
+            for i in range(2000):
+                cache.get_or_set((offset + i) % 100, lambda: i)
+        threads = [threading.Thread(target=worker, args=(z,)) for z in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = cache.stats
+        self.assertEqual(8 * 2000, stats.hits + stats.misses)
+        self.assertEqual(50, stats.size)
+
+
+class TestAnalysisContext(unittest.TestCase):
+    def test_sizes(self):
+        context = AnalysisContext({'bibliographies': 3})
+        self.assertEqual(3, context.cache('bibliographies').max_size)
+        self.assertEqual(DEFAULT_CACHE_SIZES['author_gender'],
+                         context.cache('author_gender').max_size)
+        self.assertEqual(sorted(DEFAULT_CACHE_SIZES), [z.name for z in context.stats()])
+
+    def test_contexts_are_separate(self):
+        context1 = AnalysisContext()
+        context2 = AnalysisContext()
+        context1.cache('author_gender').set('x', 'M')
+        self.assertIsNone(context2.cache('author_gender').get('x'))
+
+    def test_resolve_context(self):
+        context = AnalysisContext()
+        self.assertIs(context, resolve_context(context))
+        self.assertIs(get_default_context(), resolve_context(None))
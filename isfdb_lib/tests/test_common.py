@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+from .sqlite_test_case import SQLiteTestCase
+from .. import common
+from ..common import DEFAULT_POOL_SIZE, reset_engines_after_fork
+
+
+class TestSharedEngine(SQLiteTestCase):
+    def test_same_engine(self):
+        conn = self.get_connection()
+        self.assertIs(self.conn.engine, conn.engine)
+        conn.close()
+
+    def test_unclosed_connections_dont_exhaust_pool(self):
+        # Lots of callers never close their connections, which mustn't block
+        # (and then time out) once the pool and its overflow are used up
+        conns = [self.get_connection() for _ in range(DEFAULT_POOL_SIZE + 20)]
+        self.assertEqual(1, conns[-1].exec_driver_sql('SELECT 1;').scalar())
+        for conn in conns:
+            conn.close()
+
+
+class TestResetEnginesAfterFork(SQLiteTestCase):
+    def test_lock_held_at_fork(self):
+        # As if another thread had been holding the lock when the process forked
+        old_lock = common._engines_lock
+        old_lock.acquire()
+        try:
+            reset_engines_after_fork()
+            conn = self.get_connection()
+            self.assertIsNot(self.conn.engine, conn.engine)
+            conn.close()
+        finally:
+            old_lock.release()
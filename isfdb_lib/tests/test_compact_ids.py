@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+
+from isbn_functions import toISBN10, toISBN13
+
+from ..compact_ids import (encode_id, decode_id, CompactIdSet,
+                           FixerIsbnMap, FixerAsinMap,
+                           NUMPY_AVAILABLE, NO_ID, encode_ids_bulk,
+                           save_compact_ids, load_compact_ids, StaleCacheError)
+
+
+class TestEncodeDecodeId(unittest.TestCase):
+    def test_round_trips(self):
+        for val in ('9781473233058', '0575077050', '057507705X', 'B073NXRMWJ',
+                    '0000000000000', '123456789A'):
+            self.assertEqual(val, decode_id(encode_id(val)))
+
+    def test_unpackable(self):
+        for val in ('', 'b073nxrmwj', '978147323305', '97814732330581',
+                    'B073NXRMWJ?ref=foo', None):
+            self.assertIsNone(encode_id(val))
+
+    def test_isbn10_and_asin_keys_differ(self):
+        self.assertNotEqual(encode_id('0575077050') >> 56,
+                            encode_id('B073NXRMWJ') >> 56)
+
+
+class TestCompactIdSet(unittest.TestCase):
+    IDS = {'9781473233058', '0575077050', 'B073NXRMWJ', 'bogus-id'}
+
+    def test_membership_matches_set(self):
+        ids = CompactIdSet(self.IDS)
+        for val in self.IDS:
+            self.assertIn(val, ids)
+        for val in ('9781473233059', '0575077051', '9780575077058', 'B073NXRMWK',
+                    'BOGUS-ID', ''):
+            self.assertNotIn(val, ids)
+
+    def test_len_and_iteration(self):
+        ids = CompactIdSet(self.IDS)
+        self.assertEqual(4, len(ids))
+        self.assertEqual(self.IDS, set(ids))
+
+
+class TestFixerMaps(unittest.TestCase):
+    def test_isbn_map(self):
+        orig = {'9781640637344': (0, 1, 'B07D3JFB9P'),
+                '9781975353636': (0, 'n', None),
+                '9789963536504': (0, None, ''),
+                'not-an-isbn': (4, 2, None)}
+        compact = FixerIsbnMap(orig)
+        self.assertEqual(orig, dict(compact))
+        self.assertNotIn('9781640637345', compact)
+        with self.assertRaises(KeyError):
+            compact['9781640637345']
+
+    def test_asin_map(self):
+        orig = {'B073NXRMWJ': '9781473233058', 'B07D3JFB9P': None,
+                'B0000000XX': 'not-an-isbn'}
+        self.assertEqual(orig, dict(FixerAsinMap(orig)))
+
+
+class TestCacheFile(unittest.TestCase):
+    IDS = {'9781473233058', '0575077050', 'B073NXRMWJ', 'bogus-id'}
+    ISBNS = {'9781640637344': (0, 1, 'B07D3JFB9P'),
+             '9781975353636': (0, 'n', None),
+             '9789963536504': (0, None, ''),
+             'not-an-isbn': (4, 2, None)}
+    ASINS = {'B073NXRMWJ': '9781473233058', 'B07D3JFB9P': None,
+             'B0000000XX': 'not-an-isbn'}
+
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp()
+        os.close(fd)
+        save_compact_ids(self.filename, 'dump-1', CompactIdSet(self.IDS),
+                         FixerIsbnMap(self.ISBNS), FixerAsinMap(self.ASINS))
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_round_trip(self):
+        all_ids, isbns, asins = load_compact_ids(self.filename, 'dump-1')
+        self.assertEqual(self.IDS, set(all_ids))
+        self.assertIn('9781473233058', all_ids)
+        self.assertNotIn('9781473233059', all_ids)
+        self.assertEqual(self.ISBNS, dict(isbns))
+        self.assertEqual(self.ASINS, dict(asins))
+
+    def test_stale_fingerprint(self):
+        with self.assertRaises(StaleCacheError):
+            load_compact_ids(self.filename, 'dump-2')
+
+
+@unittest.skipUnless(NUMPY_AVAILABLE, 'numpy not installed')
+class TestEncodeIdsBulk(unittest.TestCase):
+    VALS = ['9781473233058', '9791473233058', '0575077050', '057507705X',
+            '057507705x', '05750770', '978057507705X', 'B073NXRMWJ', 'b073nxrmwj',
+            '123456789A', '97814732330581', '']
+
+    def test_matches_scalar_versions(self):
+        keys, isbn10_keys, isbn13_keys = encode_ids_bulk(self.VALS)
+        for i, val in enumerate(self.VALS):
+            self.assertEqual(encode_id(val) or NO_ID, keys[i], val)
+            self.assertEqual(encode_id(toISBN10(val)) or NO_ID, isbn10_keys[i], val)
+            self.assertEqual(encode_id(toISBN13(val)) or NO_ID, isbn13_keys[i], val)
+
+    def test_find_keys(self):
+        ids = CompactIdSet(['9781473233058', 'B073NXRMWJ'])
+        keys, _, _ = encode_ids_bulk(['B073NXRMWJ', '9781473233059', '9781473233058'])
+        self.assertEqual([1, -1, 0], ids.find_keys(keys).tolist())
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+These don't need an ISFDB database; the availability checks use a throwaway
+SQLite one.
+"""
+
+import os
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy.sql import text
+
+from .sqlite_test_case import SQLiteTestCase
+from ..common import get_dump_version
+from ..derived_tables import (first_pub_rows, has_derived_tables,
+                              build_derived_tables, forget_availability,
+                              title_ordinal_rows, alias_id_groups, METADATA_TABLE)
+
+
+def _fake_country(price):
+    return {'$': 'US', '\xa3': 'UK'}.get(price[:1] if price else None)
+
+
+class TestFirstPubRows(unittest.TestCase):
+    def test_earliest_per_title(self):
+        rows = [(1, 10, '1950-00-00', '$0.25'),
+                (1, 11, '1951-01-01', '\xa30.50'),
+                (1, 12, '1952-01-01', '$0.35'),
+                (2, 20, '1960-02-00', None)]
+        first_pubs, by_country = first_pub_rows(rows, _fake_country)
+        self.assertEqual([(1, 10, '1950-00-00'), (2, 20, '1960-02-00')], first_pubs)
+        self.assertEqual([(1, 'US', 10, '1950-00-00'), (1, 'UK', 11, '1951-01-01')],
+                         by_country)
+
+    def test_unknown_dates_ignored(self):
+        rows = [(1, 10, '0000-00-00', '$1'),
+                (1, 11, '8888-00-00', '$1'),
+                (1, 12, '1999-00-00', '$1'),
+                (2, 20, None, '$1')]
+        first_pubs, by_country = first_pub_rows(rows, _fake_country)
+        self.assertEqual([(1, 12, '1999-00-00')], first_pubs)
+        self.assertEqual([(1, 'US', 12, '1999-00-00')], by_country)
+
+
+class TestTitleOrdinalRows(unittest.TestCase):
+    def _ordinals(self, rows, pseudonyms=()):
+        return {(z[0], z[1]): z[2] for z in title_ordinal_rows(rows, pseudonyms)}
+
+    def test_ordered_by_earliest_year(self):
+        # Title 2 has a later copyright date, but an earlier pub than title 1
+        rows = [(1, 1, 0, '1980-00-00', '1980-05-00'),
+                (1, 2, 0, '1990-00-00', '1975-01-01'),
+                (1, 3, 0, '0000-00-00', None)]
+        self.assertEqual({(1, 2): 1, (1, 1): 2, (1, 3): 3}, self._ordinals(rows))
+
+    def test_variants_merged_into_root(self):
+        rows = [(1, 1, 0, '1980-00-00', '1980-00-00'),
+                (1, 2, 0, '1985-00-00', '1985-00-00'),
+                (1, 3, 2, '1970-00-00', '1970-00-00')]
+        self.assertEqual({(1, 2): 1, (1, 1): 2}, self._ordinals(rows))
+
+    def test_ties_in_order_of_appearance(self):
+        rows = [(1, 5, 0, '1980-00-00', None),
+                (1, 4, 0, '1980-00-00', None)]
+        self.assertEqual({(1, 5): 1, (1, 4): 2}, self._ordinals(rows))
+
+    def test_pseudonyms(self):
+        # 10 is a pseudonym of 1; 20 is a pseudonym shared by 1 and 2; 30 is a
+        # gestalt used by 1, 2 and 3
+        pseudonyms = [(10, 1), (20, 1), (20, 2), (30, 1), (30, 2), (30, 3)]
+        rows = [(1, 1, 0, '1980-00-00', None),
+                (10, 2, 0, '1970-00-00', None),
+                (20, 3, 0, '1990-00-00', None),
+                (2, 5, 0, '1985-00-00', None),
+                (30, 4, 0, '1960-00-00', None)]
+        self.assertEqual({(1, 2): 1, (1, 1): 2, (1, 3): 3,
+                          # The shared pseudonym gets both its authors' books
+                          (20, 2): 1, (20, 1): 2, (20, 5): 3, (20, 3): 4,
+                          (10, 2): 1, (10, 1): 2, (10, 3): 3,
+                          (2, 5): 1, (2, 3): 2,
+                          # The gestalt gets everyone's books
+                          (30, 4): 1, (30, 2): 2, (30, 1): 3, (30, 5): 4, (30, 3): 5},
+                         self._ordinals(rows, pseudonyms))
+
+
+class TestAliasIdGroups(unittest.TestCase):
+    def test_groups(self):
+        # As per TestTitleOrdinalRows.test_pseudonyms, plus 40, a pseudonym of
+        # 2 only
+        pseudonyms = [(10, 1), (20, 1), (20, 2), (30, 1), (30, 2), (30, 3), (40, 2)]
+        self.assertEqual({1: {1, 10, 20},
+                          2: {2, 20, 40},
+                          3: {3},
+                          10: {1, 10, 20},
+                          # Only the first real author's other pseudonyms
+                          20: {1, 2, 10, 20},
+                          30: {1, 2, 3, 10, 20, 30},
+                          40: {2, 20, 40},
+                          99: {99}},
+                         alias_id_groups([1, 2, 3, 10, 20, 30, 40, 99], pseudonyms))
+
+    def test_year(self):
+        rows = [(1, 1, 0, None, '1980-00-00'),
+                (1, 2, 0, '0000-00-00', None)]
+        self.assertEqual([(1, 1, 1, 1980), (1, 2, 2, 8888)],
+                         title_ordinal_rows(rows, []))
+
+
+class TestHasDerivedTables(SQLiteTestCase):
+    def setUp(self):
+        forget_availability()
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+        forget_availability()
+
+    def _add_metadata(self, dump_version):
+        self.conn.execute(text('CREATE TABLE %s (dump_version VARCHAR(100), '
+                               'built_at DATETIME);' % (METADATA_TABLE)))
+        self.conn.execute(text("INSERT INTO %s VALUES (:v, '2020-01-01');" %
+                               (METADATA_TABLE)), {'v': dump_version})
+
+    def test_missing(self):
+        self.assertFalse(has_derived_tables(self.conn))
+
+    @patch.dict(os.environ, {'ISFDB_DUMP_VERSION': 'dump1'})
+    def test_current(self):
+        self._add_metadata('dump1')
+        self.assertTrue(has_derived_tables(self.conn))
+
+    @patch.dict(os.environ, {'ISFDB_DUMP_VERSION': 'dump2'})
+    def test_stale(self):
+        self._add_metadata('dump1')
+        with self.assertLogs(level='WARNING'):
+            self.assertFalse(has_derived_tables(self.conn))
+
+    def test_unknown_dump_version(self):
+        # The test database has no metadata or submissions tables, so its
+        # dump version is unknown, as is whichever one the tables were built
+        # from
+        self._add_metadata(get_dump_version(self.conn))
+        with self.assertLogs(level='WARNING'):
+            self.assertFalse(has_derived_tables(self.conn))
+
+    def test_build_with_unknown_dump_version(self):
+        with self.assertLogs(level='WARNING'), self.assertRaises(ValueError):
+            build_derived_tables(self.conn, output_function=lambda *args: None)
+
+    @patch.dict(os.environ, {'ISFDB_DUMP_VERSION': 'dump1',
+                             'ISFDB_IGNORE_DERIVED_TABLES': '1'})
+    def test_ignored(self):
+        self._add_metadata('dump1')
+        self.assertFalse(has_derived_tables(self.conn))
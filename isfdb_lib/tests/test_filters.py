@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Check that the (index friendly) SQL from get_filters_and_params_from_args()
+returns the same rows as the YEAR()/LOWER() based SQL it used to generate.
+
+This uses a throwaway SQLite database, with a YEAR() function added.  SQLite
+compares the ISFDB style date strings (including 1968-00-00 and friends) in
+the same order as MySQL does DATEs, and its LIKE is case insensitive, as with
+the ISFDB tables' collations.
+"""
+
+from sqlalchemy.sql import bindparam, text
+
+from .sqlite_test_case import SQLiteTestCase
+from ..common import get_filters_and_params_from_args
+
+
+TITLES = [
+    # title_id, title_title, title_copyright, title_ttype
+    (1, 'The Left Hand of Darkness', '1969-03-00', 'NOVEL'),
+    (2, 'The Lathe of Heaven', '1971-00-00', 'NOVEL'),
+    (3, 'Left Behind', '1995-12-31', 'NOVEL'),
+    (4, 'The Word for World is Forest', '1972-01-01', 'NOVELLA'),
+    (5, 'Lefty', '1969-00-00', 'SHORTFICTION'),
+    (6, 'Unknown date', '0000-00-00', 'NOVEL'),
+    (7, 'Unpublished', '8888-00-00', 'NOVEL'),
+    (8, 'No date at all', None, 'ANTHOLOGY'),
+    (9, 'end of the year', '1968-12-31', 'NOVEL'),
+    (10, 'Far future', '2999-12-31', 'CHAPBOOK'),
+]
+
+
+def _year(dateish):
+    return int(dateish[:4]) if dateish else None
+
+
+def _legacy_filters(args, col='title_copyright'):
+    """
+    The SQL that get_filters_and_params_from_args() used to generate
+    """
+    filters = []
+    params = {}
+    if args.get('title') is not None:
+        val = args['title']
+        if val.startswith('^'):
+            params['title'] = '%s%%' % (val[1:].lower())
+        else:
+            params['title'] = '%%%s%%' % (val.lower())
+        filters.append('LOWER(title_title) LIKE :title')
+    if args.get('work_types'):
+        params['work_types'] = [z.lower() for z in args['work_types']]
+        filters.append('LOWER(title_ttype) IN :work_types')
+    if args.get('year'):
+        val = args['year']
+        if '-' in val:
+            from_year, to_year = val.split('-')
+            params['from_year'] = (int(from_year)  if from_year else -1000)
+            params['to_year'] = (int(to_year) if to_year else 2999)
+            filters.append('YEAR(%s) BETWEEN :from_year AND :to_year' % (col))
+        else:
+            params['year'] = int(val)
+            filters.append('YEAR(%s) = :year' % (col))
+    return ' AND '.join(filters), params
+
+
+class TestFilterEquivalence(SQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.conn.connection.driver_connection.create_function('YEAR', 1, _year)
+        self.conn.execute(text('CREATE TABLE titles (title_id INTEGER, title_title TEXT, '
+                               'title_copyright TEXT, title_ttype TEXT);'))
+        self.conn.execute(text('INSERT INTO titles VALUES (:a, :b, :c, :d);'),
+                          [dict(zip('abcd', z)) for z in TITLES])
+
+    def _title_ids(self, fltr, params):
+        query = text('SELECT title_id FROM titles WHERE %s ORDER BY title_id;' % (fltr))
+        if 'work_types' in params:
+            query = query.bindparams(bindparam('work_types', expanding=True))
+        return [z.title_id for z in self.conn.execute(query, params)]
+
+    def assert_equivalent(self, args, expected_ids):
+        cnm = {'year': 'title_copyright'}
+        fltr, params = get_filters_and_params_from_args(args, column_name_mappings=cnm)
+        self.assertNotIn('YEAR(', fltr)
+        new_ids = self._title_ids(fltr, params)
+        old_ids = self._title_ids(*_legacy_filters(args))
+        self.assertEqual(old_ids, new_ids)
+        self.assertEqual(expected_ids, new_ids)
+
+    def test_single_year(self):
+        self.assert_equivalent({'year': '1969'}, [1, 5])
+        self.assert_equivalent({'year': '1968'}, [9])
+        self.assert_equivalent({'year': '0'}, [6])
+
+    def test_year_range(self):
+        self.assert_equivalent({'year': '1968-1971'}, [1, 2, 5, 9])
+        self.assert_equivalent({'year': '1972-'}, [3, 4, 10])
+        self.assert_equivalent({'year': '-1969'}, [1, 5, 6, 9])
+        self.assert_equivalent({'year': '1980-1970'}, [])
+
+    def test_patterns(self):
+        self.assert_equivalent({'title': 'left'}, [1, 3, 5])
+        self.assert_equivalent({'title': '^LEFT'}, [3, 5])
+        self.assert_equivalent({'title': '^The L'}, [1, 2])
+
+    def test_work_types(self):
+        self.assert_equivalent({'work_types': ['novel']}, [1, 2, 3, 6, 7, 9])
+        self.assert_equivalent({'work_types': ['Novella', 'CHAPBOOK']}, [4, 10])
+
+    def test_combined(self):
+        self.assert_equivalent({'title': 'the', 'year': '1969-1972',
+                                'work_types': ['novel']}, [1, 2])
+
+    def test_prefix_filter_is_sargable(self):
+        fltr, _ = get_filters_and_params_from_args({'author': '^le guin'})
+        self.assertTrue(fltr.startswith('author_canonical LIKE :author'))
@@ -14,7 +14,8 @@ from ..common import (get_connection, parse_args)
 # PublicationDetails)
 from ..identifier_related import (PubTitleAuthorStuff,
                                   get_authors_and_title_for_isbn,
-                                  get_authors_and_title_for_asin)
+                                  get_authors_and_title_for_asin,
+                                  check_asin, check_isbn, check_ids)
 
 
 
@@ -62,3 +63,19 @@ class TestGetAuthorsAndTitleForASIN(unittest.TestCase):
     def test_simple_failure_to_match(self):
         ret = get_authors_and_title_for_asin(self.conn, 'B005LWQZZZ')
         self.assertEqual(None, ret)
+
+
+class TestCheckIds(unittest.TestCase):
+    conn = get_connection()
+
+    def test_matches_individual_checks(self):
+        ids = ['9781473233058', '1473233054', '978-1-4732-3305-8', 'B005LWQCJ0',
+               'b005lwqcj0', 'B005LWQZZZ', '9781473233000']
+        expected = {z: check_asin(self.conn, z) or check_isbn(self.conn, z)
+                    for z in ids}
+        self.assertEqual(expected, check_ids(self.conn, ids))
+        self.assertEqual([True, True, True, True, True, False, False],
+                         [expected[z] for z in ids])
+
+    def test_empty(self):
+        self.assertEqual({}, check_ids(self.conn, []))
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+These use small hand-made ID sets rather than the database.
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from .. import ids_in_memory
+from ..ids_in_memory import (batch_check_in_memory, batch_check_compact,
+                             compact_ids, set_data, current_data,
+                             refresh_from_cache, load_cached_ids, _cache_file_stat)
+from ..compact_ids import load_compact_ids, save_compact_ids
+
+
+ISFDB_IDS = {'9781473233058', '0575077050', 'B073NXRMWJ', 'not-an-isbn'}
+FIXER_ISBNS = {'9781640637344': (0, 1, 'B07D3JFB9P'),
+               '9781975353636': (0, 'n', None)}
+FIXER_ASINS = {'B07D3JFB9P': '9781640637344', 'B000000001': None}
+
+IDS_TO_CHECK = ['9781473233058', '1473233054', '9780575077058', 'B073NXRMWJ',
+                'not-an-isbn', '9781640637344', '9781975353636', 'B07D3JFB9P',
+                'B000000002', '9780000000002']
+
+
+def no_output(*args, **kwargs):
+    pass
+
+
+class TestBatchCheckInMemory(unittest.TestCase):
+    def tearDown(self):
+        ids_in_memory.all_isfdb_ids = {}
+        ids_in_memory.isbn_mappings = {}
+        ids_in_memory.asin_mappings = {}
+
+    def _set_data(self, compact):
+        data = (ISFDB_IDS, FIXER_ISBNS, FIXER_ASINS)
+        if compact:
+            data = compact_ids(*data, output_function=no_output)
+        (ids_in_memory.all_isfdb_ids, ids_in_memory.isbn_mappings,
+         ids_in_memory.asin_mappings) = data
+
+    def test_compact_results_match_original(self):
+        for do_fixer_checks in (True, False):
+            for check_both in (True, False):
+                self._set_data(compact=False)
+                expected = batch_check_in_memory(IDS_TO_CHECK, do_fixer_checks,
+                                                 check_both)
+                self._set_data(compact=True)
+                self.assertEqual(expected,
+                                 batch_check_in_memory(IDS_TO_CHECK, do_fixer_checks,
+                                                       check_both))
+
+    def test_matched_id_for_other_isbn_variant(self):
+        self._set_data(compact=True)
+        self.assertEqual([{'id': '9780575077058', 'supplied_id': '9780575077058',
+                           'known': True, 'matched_id': '0575077050'}],
+                         batch_check_in_memory(['9780575077058']))
+
+    def test_compact_output(self):
+        self._set_data(compact=True)
+        hits, misses = batch_check_compact(IDS_TO_CHECK)
+        self.assertEqual(['B000000002', '9780000000002'], misses)
+        self.assertEqual(len(IDS_TO_CHECK) - 2, len(hits))
+
+
+class TestRefreshFromCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.cache_dir.name, 'ids.cache')
+
+    def tearDown(self):
+        set_data({}, {}, {})
+        self.cache_dir.cleanup()
+
+    def _save(self, ids):
+        save_compact_ids(self.cache_file, 'test',
+                         *compact_ids(ids, FIXER_ISBNS, FIXER_ASINS,
+                                      output_function=no_output))
+
+    def test_picks_up_replaced_cache_file(self):
+        self._save(ISFDB_IDS)
+        set_data(*compact_ids(ISFDB_IDS, FIXER_ISBNS, FIXER_ASINS,
+                              output_function=no_output),
+                 cache_stat=_cache_file_stat(self.cache_file))
+        self.assertFalse(refresh_from_cache(self.cache_file, no_output))
+        self.assertFalse(batch_check_in_memory(['9780000000002'])[0]['known'])
+
+        self._save(ISFDB_IDS | {'9780000000002'})
+        self.assertTrue(refresh_from_cache(self.cache_file, no_output))
+        self.assertTrue(batch_check_in_memory(['9780000000002'])[0]['known'])
+        self.assertEqual(len(ISFDB_IDS) + 1, len(current_data()[0]))
+
+
+class TestLoadCachedIds(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.cache_dir.name, 'ids.cache')
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def test_unknown_dump_version_skips_cache(self):
+        save_compact_ids(self.cache_file, 'schemaNone-subNone',
+                         *compact_ids({'9780000000002'}, {}, {}, output_function=no_output))
+        def unknown_dump_version(conn, allow_unknown=True):
+            return 'schemaNone-subNone' if allow_unknown else None
+        with mock.patch.object(ids_in_memory, 'get_dump_version', unknown_dump_version), \
+             mock.patch.object(ids_in_memory, 'load_ids', return_value=ISFDB_IDS), \
+             mock.patch.object(ids_in_memory, 'load_fixer_ids',
+                               return_value=(FIXER_ISBNS, FIXER_ASINS)), \
+             self.assertLogs(level='WARNING'):
+            all_ids, _, _, cache_stat = load_cached_ids(None, self.cache_file, no_output)
+        self.assertEqual(len(ISFDB_IDS), len(all_ids))
+        self.assertIsNone(cache_stat)
+        # The old file was neither used nor overwritten
+        self.assertEqual(1, len(load_compact_ids(self.cache_file, 'schemaNone-subNone')[0]))
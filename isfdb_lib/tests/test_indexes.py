@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+These don't need a database, as they just check the logic around what
+indexes to add and how to interpret EXPLAIN output.
+"""
+
+import unittest
+
+from ..indexes import (get_alter_statements, find_full_scans, IndexSpec,
+                       INDEX_NAME_PREFIX)
+
+
+SPECS = [IndexSpec('pubs', 'pub_isbn', 'pub_isbn', ''),
+         IndexSpec('webpages', 'author_id', 'author_id', ''),
+         IndexSpec('webpages', 'url', 'url(100)', ''),
+         IndexSpec('canonical_author', 'author_title', 'author_id, title_id', '')]
+
+
+class TestGetAlterStatements(unittest.TestCase):
+    def test_one_statement_per_table(self):
+        existing = {'pubs': {'PRIMARY': ['pub_id']},
+                    'webpages': {'PRIMARY': ['webpage_id']}}
+        self.assertEqual(['ALTER TABLE `pubs` ADD INDEX `%spub_isbn` (pub_isbn);' %
+                          (INDEX_NAME_PREFIX),
+                          'ALTER TABLE `webpages` ADD INDEX `%sauthor_id` (author_id), '
+                          'ADD INDEX `%surl` (url(100));' %
+                          (INDEX_NAME_PREFIX, INDEX_NAME_PREFIX)],
+                         get_alter_statements(SPECS, existing))
+
+    def test_existing_indexes_skipped(self):
+        existing = {'pubs': {INDEX_NAME_PREFIX + 'pub_isbn': ['pub_isbn']},
+                    # Stock index that already covers this
+                    'webpages': {'foo': ['author_id', 'url'], 'bar': ['url']},
+                    # ... but this one doesn't cover both columns
+                    'canonical_author': {'authors': ['author_id']}}
+        self.assertEqual(['ALTER TABLE `canonical_author` ADD INDEX '
+                          '`%sauthor_title` (author_id, title_id);' % (INDEX_NAME_PREFIX)],
+                         get_alter_statements(SPECS, existing))
+
+
+class TestFindFullScans(unittest.TestCase):
+    def test_scans(self):
+        explain_rows = [
+            {'table': 'pubs', 'type': 'ALL', 'rows': 2000000, 'possible_keys': None},
+            {'table': 'languages', 'type': 'ALL', 'rows': 50, 'possible_keys': None},
+            {'table': '<derived2>', 'type': 'ALL', 'rows': 5000, 'possible_keys': None},
+            {'table': 'titles', 'type': 'eq_ref', 'rows': 1, 'possible_keys': 'PRIMARY'}
+        ]
+        scans = find_full_scans('SELECT * FROM pubs WHERE pub_isbn IN (...)', explain_rows)
+        self.assertEqual(['pubs'], [z.table for z in scans])
+        self.assertIsNone(scans[0].known_reason)
+
+    def test_known_scan(self):
+        scans = find_full_scans("SELECT url FROM webpages WHERE url LIKE '%%audible%%'",
+                                [{'table': 'webpages', 'type': 'ALL', 'rows': 100000}])
+        self.assertTrue(scans[0].known_reason)
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+
+import cProfile
+import pstats
+import unittest
+
+from ..common import create_parser
+from ..profiling import top_functions
+
+
+def busy_function():
+    return sum([i * i for i in range(100000)])
+
+
+class TestProfileArgument(unittest.TestCase):
+    def test_argument_forms(self):
+        parser = create_parser('test', supported_args='v')
+        self.assertIsNone(parser.parse_args([]).profile)
+        self.assertIs(True, parser.parse_args(['--profile']).profile)
+        self.assertEqual('/tmp/foo.pstats',
+                         parser.parse_args(['--profile=/tmp/foo.pstats']).profile)
+
+
+class TestTopFunctions(unittest.TestCase):
+    def test_busy_function_is_top(self):
+        profiler = cProfile.Profile()
+        profiler.runcall(busy_function)
+        labels = [z[0] for z in top_functions(pstats.Stats(profiler), 'cumtime')]
+        self.assertTrue(labels[0].endswith('(busy_function)'), labels)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+import os
+import unittest
+from unittest import mock
+
+from sqlalchemy.sql import text
+
+from .sqlite_test_case import SQLiteTestCase
+from ..common import stream_results
+from ..query_cache import QueryCache, CachingConnection
+
+
+class TestCachingConnection(SQLiteTestCase):
+    QUERY = text("""SELECT title_id, title_title FROM titles
+                    WHERE title_id >= :min_id ORDER BY title_id;""")
+
+    def setUp(self):
+        super().setUp()
+        self.raw_conn = self.conn
+        self.raw_conn.execute(text("""CREATE TABLE titles (title_id INTEGER,
+          title_title VARCHAR(255));"""))
+        self.raw_conn.execute(text("""INSERT INTO titles VALUES
+          (1, 'Revenger'), (2, 'Children of Time'), (3, NULL);"""))
+        self.cache = QueryCache(os.path.join(self.tmp_dir, 'cache'))
+        self.env = mock.patch.dict(os.environ, {'ISFDB_DUMP_VERSION': 'dump-1'})
+        self.env.start()
+        self.conn = CachingConnection(self.raw_conn, self.cache)
+
+    def tearDown(self):
+        self.env.stop()
+        super().tearDown()
+
+    def test_cached_results_match(self):
+        expected = self.raw_conn.execute(self.QUERY, {'min_id': 2}).fetchall()
+        first = self.conn.execute(self.QUERY, {'min_id': 2}).fetchall()
+        second = self.conn.execute(self.QUERY, {'min_id': 2}).fetchall()
+        self.assertEqual(expected, first)
+        self.assertEqual(expected, second)
+        self.assertEqual('Children of Time', second[0].title_title)
+        self.assertEqual(3, second[1]._mapping['title_id'])
+        self.assertEqual((1, 1), (self.cache.hits, self.cache.misses))
+
+    def test_cache_ignores_whitespace_but_not_params(self):
+        expected = self.conn.execute(self.QUERY, {'min_id': 2}).fetchall()
+        reformatted = text(' '.join(self.QUERY.text.split()))
+        self.assertEqual(expected, self.conn.execute(reformatted, {'min_id': 2}).fetchall())
+        self.assertEqual(1, self.cache.hits)
+        self.assertEqual(1, self.conn.execute(self.QUERY, {'min_id': 1}).scalar())
+        self.assertEqual(2, self.cache.misses)
+
+    def test_stale_after_new_dump(self):
+        self.conn.execute(self.QUERY, {'min_id': 2}).fetchall()
+        self.raw_conn.execute(text("INSERT INTO titles VALUES (4, 'Revelation Space');"))
+        self.assertEqual(2, len(self.conn.execute(self.QUERY, {'min_id': 2}).fetchall()))
+        with mock.patch.dict(os.environ, {'ISFDB_DUMP_VERSION': 'dump-2'}):
+            conn = CachingConnection(self.raw_conn, self.cache)
+            self.assertEqual(3, len(conn.execute(self.QUERY, {'min_id': 2}).fetchall()))
+
+    def test_non_selects_bypass_cache(self):
+        self.conn.execute(text("UPDATE titles SET title_title = 'x' WHERE title_id = 3;"))
+        self.assertEqual((0, 0), (self.cache.hits, self.cache.misses))
+
+    def test_streamed_queries_bypass_cache(self):
+        rows = list(stream_results(self.conn, self.QUERY, {'min_id': 2}, batch_size=1))
+        self.assertEqual(self.raw_conn.execute(self.QUERY, {'min_id': 2}).fetchall(), rows)
+        self.assertEqual((0, 0), (self.cache.hits, self.cache.misses))
+
+    def test_eviction(self):
+        self.cache.max_bytes = 1
+        self.conn.execute(self.QUERY, {'min_id': 1}).fetchall()
+        self.conn.execute(self.QUERY, {'min_id': 2}).fetchall()
+        self.assertEqual(0, self.cache.size())
+
+    def test_unknown_dump_version_bypasses_cache(self):
+        with mock.patch.dict(os.environ, {'ISFDB_DUMP_VERSION': ''}):
+            conn = CachingConnection(self.raw_conn, self.cache)
+            with self.assertLogs(level='WARNING'):
+                conn.execute(self.QUERY, {'min_id': 2}).fetchall()
+            self.assertIsNone(conn.namespace)
+            self.assertEqual((0, 0), (self.cache.hits, self.cache.misses))
+
+            self.raw_conn.execute(text('CREATE TABLE metadata (metadata_schemaversion INTEGER);'))
+            self.raw_conn.execute(text('CREATE TABLE submissions (sub_id INTEGER);'))
+            self.raw_conn.execute(text('INSERT INTO metadata VALUES (1);'))
+            self.raw_conn.execute(text('INSERT INTO submissions VALUES (1000);'))
+            conn = CachingConnection(self.raw_conn, self.cache)
+            conn.execute(self.QUERY, {'min_id': 2}).fetchall()
+            self.assertIn('schema1-sub1000', conn.namespace)
+            self.assertEqual((0, 1), (self.cache.hits, self.cache.misses))
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+import os
+
+from sqlalchemy.sql import text
+
+from .sqlite_test_case import SQLiteTestCase
+from ..snapshot import export_snapshot, load_snapshot, SnapshotError
+
+
+class TestSnapshotRoundTrip(SQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.conn.execute(text("""CREATE TABLE titles (title_id INTEGER,
+          title_title VARCHAR(255), title_copyright DATE, title_rating FLOAT);"""))
+        self.conn.execute(text("""INSERT INTO titles VALUES
+          (2034339, 'Revenger', '2016-09-07', 1.5),
+          (2, NULL, '2016-00-00', NULL),
+          (3, 'Die Kinder der Zeit', NULL, 2);"""))
+        self.snapshot_dir = os.path.join(self.tmp_dir, 'snapshot')
+        export_snapshot(self.conn, self.snapshot_dir, ['titles'],
+                        output_function=lambda *args: None)
+
+    def test_rows(self):
+        snapshot = load_snapshot(self.snapshot_dir)
+        self.assertEqual([(2034339, 'Revenger', '2016-09-07', 1.5),
+                          (2, None, '2016-00-00', None),
+                          (3, 'Die Kinder der Zeit', None, 2.0)],
+                         list(snapshot['titles'].rows()))
+
+    def test_selected_columns(self):
+        snapshot = load_snapshot(self.snapshot_dir)
+        self.assertEqual([('Revenger',), (None,), ('Die Kinder der Zeit',)],
+                         list(snapshot['titles'].rows(['title_title'])))
+
+    def test_raw_values(self):
+        snapshot = load_snapshot(self.snapshot_dir)
+        self.assertEqual([2034339, 2, 3], list(snapshot['titles']['title_id'].values))
+
+    def test_missing_snapshot(self):
+        with self.assertRaises(SnapshotError):
+            load_snapshot(os.path.join(self.tmp_dir, 'nonexistent'))
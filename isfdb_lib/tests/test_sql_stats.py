@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+import json
+import random
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql import text
+
+from .sqlite_test_case import SQLiteTestCase
+from ..sql_stats import (SqlStats, TemplateStats, normalize_template, percentile,
+                         instrument_engine, uninstrument_engine, N_PLUS_ONE_MIN_CALLS,
+                         MAX_DURATION_SAMPLES)
+
+
+class TestNormalizeTemplate(unittest.TestCase):
+    def test_in_lists_and_numbers(self):
+        self.assertEqual('SELECT * FROM titles WHERE title_id IN (...) LIMIT N',
+                         normalize_template('SELECT *\n  FROM titles WHERE title_id '
+                                            'IN (%s, %s,%s) LIMIT 10'))
+        self.assertEqual(normalize_template('SELECT a FROM b WHERE c IN (?)'),
+                         normalize_template('SELECT a FROM b WHERE c IN (?, ?)'))
+
+    def test_percentile(self):
+        self.assertEqual(95, percentile(list(range(1, 101)), 95))
+        self.assertEqual(7, percentile([7], 95))
+
+
+class TestSqlStats(unittest.TestCase):
+    def test_n_plus_one_flagged(self):
+        stats = SqlStats()
+        for i in range(N_PLUS_ONE_MIN_CALLS):
+            stats.record('SELECT * FROM authors WHERE author_id = %s', (i,),
+                         0.001, 1, 'foo:bar')
+        stats.record('SELECT COUNT(1) FROM titles', (), 0.5, 1, 'foo:baz')
+        top = stats.top_templates()
+        self.assertEqual('SELECT COUNT(N) FROM titles', top[0].template)
+        self.assertFalse(top[0].possible_n_plus_one)
+        self.assertTrue(top[1].possible_n_plus_one)
+        self.assertEqual(N_PLUS_ONE_MIN_CALLS, top[1].rows)
+        data = json.loads(stats.as_json())
+        self.assertEqual(N_PLUS_ONE_MIN_CALLS + 1, data['total_count'])
+
+    def test_sample_recorded(self):
+        stats = SqlStats()
+        stats.record('SELECT * FROM pubs WHERE pub_id IN (%s, %s)', (1, 2), 0.1, 2, 'foo:bar')
+        stats.record('SELECT * FROM pubs WHERE pub_id IN (%s)', (3,), 0.1, 1, 'foo:bar')
+        data = json.loads(stats.as_json())['templates'][0]
+        self.assertEqual('SELECT * FROM pubs WHERE pub_id IN (%s, %s)',
+                         data['sample_statement'])
+        self.assertEqual([1, 2], data['sample_parameters'])
+
+    def test_durations_bounded(self):
+        stats = TemplateStats('SELECT 1')
+        rng = random.Random(42)
+        num_calls = MAX_DURATION_SAMPLES * 10
+        for i in range(num_calls):
+            stats.add_duration(i / num_calls, rng)
+        self.assertEqual(num_calls, stats.count)
+        self.assertAlmostEqual(sum(i / num_calls for i in range(num_calls)),
+                               stats.total_time)
+        self.assertEqual((num_calls - 1) / num_calls, stats.max_time)
+        self.assertEqual(MAX_DURATION_SAMPLES, len(stats.duration_samples))
+        # The sample should be spread across all the calls, not just the first
+        self.assertAlmostEqual(0.95, stats.p95_time, delta=0.02)
+
+    def test_same_params_not_flagged(self):
+        stats = SqlStats()
+        for i in range(N_PLUS_ONE_MIN_CALLS):
+            stats.record('SELECT 1', (), 0.001, 1, 'foo:bar')
+        self.assertFalse(stats.top_templates()[0].possible_n_plus_one)
+
+
+class TestInstrumentedConnection(SQLiteTestCase):
+    # A private engine and SqlStats, so that the process-wide ones - and the
+    # report at exit - aren't touched
+    def setUp(self):
+        super().setUp()
+        self.engine = create_engine(self.connection_string)
+        self.stats = SqlStats()
+        instrument_engine(self.engine, self.stats)
+        self.instrumented_conn = self.engine.connect()
+
+    def tearDown(self):
+        self.instrumented_conn.close()
+        uninstrument_engine(self.engine)
+        self.engine.dispose()
+        super().tearDown()
+
+    def test_records_caller(self):
+        query = text('SELECT :val AS v, 42 AS w;')
+        for i in range(3):
+            self.instrumented_conn.execute(query, {'val': i}).fetchall()
+        stats = self.stats.templates['SELECT ? AS v, N AS w;']
+        self.assertEqual(3, stats.count)
+        self.assertEqual({'test_sql_stats:test_records_caller': 3}, dict(stats.callers))
+
+    def test_instrumented_once(self):
+        instrument_engine(self.engine, self.stats)
+        self.instrumented_conn.execute(text('SELECT 1;'))
+        self.assertEqual(1, self.stats.templates['SELECT N;'].count)
+
+    def test_failed_statement(self):
+        with self.assertRaises(OperationalError):
+            self.instrumented_conn.execute(text('SELECT * FROM nonexistent;'))
+        self.instrumented_conn.rollback()
+        self.assertEqual([], self.instrumented_conn.info['isfdb_query_start_times'])
+        self.instrumented_conn.execute(text('SELECT 1;'))
+        self.assertEqual(['SELECT N;'], list(self.stats.templates))
+
+    def test_uninstrument(self):
+        uninstrument_engine(self.engine)
+        self.instrumented_conn.execute(text('SELECT 1;'))
+        self.assertEqual({}, self.stats.templates)
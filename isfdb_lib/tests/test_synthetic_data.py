@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+These don't need an ISFDB database, just a throwaway SQLite one for the
+checks that stop us overwriting a real database.
+"""
+
+import io
+import unittest
+
+from sqlalchemy.sql import text
+
+from isbn_functions import toISBN10, toISBN13
+from .sqlite_test_case import SQLiteTestCase
+from ..synthetic_data import (generate_tables, write_sql_dump, sql_literal,
+                              is_synthetic_database, load_tables,
+                              NotSyntheticDatabaseError, SCHEMA)
+
+
+def _column(tables, table, column):
+    columns, rows = tables[table]
+    idx = columns.index(column)
+    return [z[idx] for z in rows]
+
+
+class TestGenerateTables(unittest.TestCase):
+    tables = generate_tables(scale=0.05, seed=42)
+
+    def test_deterministic(self):
+        self.assertEqual(self.tables, generate_tables(scale=0.05, seed=42))
+        self.assertNotEqual(self.tables, generate_tables(scale=0.05, seed=43))
+
+    def test_all_tables_in_schema(self):
+        self.assertEqual(list(SCHEMA), list(self.tables))
+        for table in ('authors', 'titles', 'pubs', 'pub_content', 'canonical_author',
+                      'pseudonyms', 'awards', 'identifiers', 'series'):
+            self.assertTrue(self.tables[table][1], table)
+
+    def test_referential_integrity(self):
+        title_ids = set(_column(self.tables, 'titles', 'title_id'))
+        pub_ids = set(_column(self.tables, 'pubs', 'pub_id'))
+        author_ids = set(_column(self.tables, 'authors', 'author_id'))
+        self.assertTrue(set(_column(self.tables, 'pub_content', 'title_id')) <= title_ids)
+        self.assertTrue(set(_column(self.tables, 'pub_content', 'pub_id')) <= pub_ids)
+        self.assertTrue(set(_column(self.tables, 'canonical_author', 'author_id')) <= author_ids)
+        self.assertTrue(set(_column(self.tables, 'pseudonyms', 'pseudonym')) <= author_ids)
+        self.assertTrue(set(_column(self.tables, 'title_awards', 'title_id')) <= title_ids)
+        self.assertTrue(set(_column(self.tables, 'titles', 'title_parent')) <=
+                        title_ids | {0})
+
+    def test_isbns_valid(self):
+        isbns = [z for z in _column(self.tables, 'pubs', 'pub_isbn') if z]
+        self.assertTrue(isbns)
+        for isbn in isbns:
+            if len(isbn) == 10:
+                self.assertEqual(isbn, toISBN10(toISBN13(isbn)))
+            else:
+                self.assertEqual(isbn, toISBN13(toISBN10(isbn)))
+
+
+class TestSqlDump(unittest.TestCase):
+    def test_sql_literal(self):
+        self.assertEqual('NULL', sql_literal(None))
+        self.assertEqual('17', sql_literal(17))
+        self.assertEqual("'Childhood\\'s End'", sql_literal("Childhood's End"))
+        self.assertEqual("'a\\\\b\\n'", sql_literal('a\\b\n'))
+
+    def test_dump_has_all_tables(self):
+        tables = generate_tables(scale=0.01, seed=1)
+        output = io.StringIO()
+        write_sql_dump(tables, output, batch_size=10)
+        txt = output.getvalue()
+        for table, (columns, rows) in tables.items():
+            self.assertIn('CREATE TABLE `%s`' % (table), txt)
+            self.assertEqual((len(rows) + 9) // 10,
+                             txt.count('INSERT INTO `%s` ' % (table)))
+
+
+class TestRefuseToOverwrite(SQLiteTestCase):
+    def test_empty_database_is_fair_game(self):
+        self.assertTrue(is_synthetic_database(self.conn))
+
+    def test_real_database_is_not(self):
+        self.conn.execute(text('CREATE TABLE titles (title_id INTEGER);'))
+        self.assertFalse(is_synthetic_database(self.conn))
+        with self.assertRaises(NotSyntheticDatabaseError):
+            load_tables(self.conn, generate_tables(scale=0.01))
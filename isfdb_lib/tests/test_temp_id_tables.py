@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+import os
+from unittest import mock
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql import text
+
+from .sqlite_test_case import SQLiteTestCase
+from .. import temp_id_tables
+from ..query_cache import CachingConnection, QueryCache
+from ..temp_id_tables import id_list_filter, TABLE_NAME_PREFIX
+
+
+class TestIdListFilter(SQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.conn.execute(text('CREATE TABLE titles (title_id INTEGER, title_title TEXT);'))
+        self.conn.execute(text('INSERT INTO titles VALUES (:title_id, :title_title);'),
+                          [{'title_id': z, 'title_title': 'Title %d' % (z)}
+                           for z in range(1, 101)])
+
+    def _temp_tables(self):
+        return [z.name for z in self.conn.execute(
+            text("SELECT name FROM sqlite_temp_master WHERE type = 'table';"))]
+
+    def test_small_list_uses_in(self):
+        with id_list_filter(self.conn, 'title_id', 'title_ids', [1, 2], threshold=5) \
+             as (fltr, params):
+            self.assertEqual('title_id IN :title_ids', fltr)
+            self.assertEqual({'title_ids': [1, 2]}, params)
+        self.assertEqual([], self._temp_tables())
+
+    def test_large_list_uses_temp_table(self):
+        ids = [z for z in range(0, 200, 3)] + [3, None]
+        with id_list_filter(self.conn, 'title_id', 'title_ids', ids, threshold=5) \
+             as (fltr, params):
+            self.assertIn(TABLE_NAME_PREFIX, fltr)
+            self.assertEqual([TABLE_NAME_PREFIX + 'title_ids'], self._temp_tables())
+            rows = self.conn.execute(text('SELECT title_id FROM titles WHERE %s '
+                                          'ORDER BY title_id;' % (fltr)), params).fetchall()
+        self.assertEqual([z for z in range(3, 101, 3)], [z.title_id for z in rows])
+        self.assertEqual([], self._temp_tables())
+
+    def test_nested_tables_have_different_names(self):
+        with id_list_filter(self.conn, 'title_id', 'title_ids', range(10), threshold=5) \
+             as (fltr1, params1):
+            with id_list_filter(self.conn, 'title_id', 'title_ids', range(20), threshold=5) \
+                 as (fltr2, params2):
+                self.assertNotEqual(fltr1, fltr2)
+                self.assertNotEqual(params1, params2)
+                self.assertEqual(2, len(self._temp_tables()))
+        self.assertEqual([], self._temp_tables())
+
+    def test_same_sql_each_time(self):
+        # So that the query cache can still be used
+        fltrs = []
+        for _ in range(2):
+            with id_list_filter(self.conn, 'title_id', 'title_ids', range(10),
+                                threshold=5) as (fltr, params):
+                fltrs.append((fltr, params))
+        self.assertEqual(fltrs[0], fltrs[1])
+
+    def test_unavailable_keeps_transaction(self):
+        self.conn.execute(text("INSERT INTO titles VALUES (999, 'Uncommitted');"))
+        denied = OperationalError('CREATE TEMPORARY TABLE', {}, Exception('Access denied'))
+        with mock.patch.object(temp_id_tables, 'create_id_table', side_effect=denied), \
+             self.assertLogs(level='WARNING'):
+            with id_list_filter(self.conn, 'title_id', 'title_ids', range(10),
+                                threshold=5) as (fltr, params):
+                self.assertEqual('title_id IN :title_ids', fltr)
+        self.assertTrue(self.conn.in_transaction())
+        self.assertEqual(1, self.conn.execute(text('SELECT COUNT(1) FROM titles '
+                                                   'WHERE title_id = 999;')).scalar())
+
+    def test_not_created_for_cache_hits(self):
+        query = 'SELECT title_id FROM titles WHERE %s ORDER BY title_id;'
+        cache = QueryCache(os.path.join(self.tmp_dir, 'cache'))
+        with mock.patch.dict(os.environ, {'ISFDB_DUMP_VERSION': 'dump-1'}):
+            conn = CachingConnection(self.conn, cache)
+            results = []
+            table_counts = []
+            for _ in range(2):
+                with id_list_filter(conn, 'title_id', 'title_ids', range(10),
+                                    threshold=5) as (fltr, params):
+                    results.append(conn.execute(text(query % (fltr)), params).fetchall())
+                    table_counts.append(len(self._temp_tables()))
+                self.assertEqual([], self._temp_tables())
+        # i.e. created for the cache miss, but not for the hit
+        self.assertEqual([1, 0], table_counts)
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(list(range(1, 10)), [z.title_id for z in results[1]])
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+from argparse import Namespace
+from collections import Counter
+import os
+import unittest
+from unittest import mock
+
+from sqlalchemy.sql import text
+
+from .sqlite_test_case import SQLiteTestCase
+from ..common import get_connection
+from ..query_cache import CachingConnection
+from ..year_slicing import (args_for_year_chunks, merge_counters, parse_year_range,
+                            run_in_workers, split_year_range, split_years,
+                            worker_connection_kwargs)
+
+
+def _count_titles(conn, from_year, to_year):
+    rows = conn.execute(text('SELECT title_year, COUNT(1) c FROM titles '
+                             'WHERE title_year >= :from_year AND title_year <= :to_year '
+                             'GROUP BY title_year;'),
+                        {'from_year': from_year, 'to_year': to_year})
+    return Counter({z.title_year: z.c for z in rows})
+
+
+class TestSplitting(unittest.TestCase):
+    def test_parse_year_range(self):
+        self.assertEqual((1950, 2020), parse_year_range('1950-2020'))
+        self.assertEqual((2001, 2001), parse_year_range('2001'))
+        self.assertIsNone(parse_year_range('1950-'))
+        self.assertIsNone(parse_year_range('-2020'))
+        self.assertIsNone(parse_year_range(None))
+
+    def test_split_years(self):
+        self.assertEqual([(1950, 1959), (1960, 1969), (1970, 1975)],
+                         split_years(1950, 1975, chunk_years=10))
+        self.assertEqual([(2000, 2000)], split_years(2000, 2000, chunk_years=10))
+        self.assertEqual([], split_years(2001, 2000, chunk_years=10))
+
+    def test_split_years_by_workers(self):
+        # Two chunks per worker
+        self.assertEqual([(1951, 1968), (1969, 1986), (1987, 2004), (2005, 2020)],
+                         split_years(1951, 2020, workers=2))
+
+    def test_split_year_range(self):
+        self.assertEqual(['2000-2004', '2005-2009'],
+                         split_year_range('2000-2009', chunk_years=5))
+        self.assertEqual(['1950-'], split_year_range('1950-', chunk_years=5))
+
+    def test_args_for_year_chunks(self):
+        args = Namespace(year='2000-2009', verbose=True)
+        chunks = args_for_year_chunks(args, chunk_years=5)
+        self.assertEqual(['2000-2004', '2005-2009'], [z.year for z in chunks])
+        self.assertTrue(all(z.verbose for z in chunks))
+        self.assertEqual('2000-2009', args.year)
+
+    def test_merge_counters(self):
+        self.assertEqual(Counter({'M': 3, 'F': 2}),
+                         merge_counters([Counter({'M': 1}), Counter({'M': 2, 'F': 2})]))
+
+
+class TestRunInWorkers(SQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.conn.execute(text('CREATE TABLE titles (title_id INTEGER, title_year INTEGER);'))
+        self.conn.execute(text('INSERT INTO titles VALUES (:title_id, :title_year);'),
+                          [{'title_id': z, 'title_year': 1950 + (z % 30)}
+                           for z in range(1, 301)])
+        self.conn.commit()
+        self.chunks = split_years(1950, 1979, chunk_years=4)
+
+    def test_same_as_serial(self):
+        serial = run_in_workers(_count_titles, self.chunks, conn=self.conn, workers=1)
+        parallel = run_in_workers(_count_titles, self.chunks, workers=2,
+                                  connection_string=self.connection_string,
+                                  force_utf8=False, query_cache=False)
+        self.assertEqual(serial, parallel)
+        self.assertEqual(8, len(parallel))
+        self.assertEqual(Counter({z: 10 for z in range(1950, 1980)}),
+                         merge_counters(parallel))
+
+    def test_workers_use_conns_database(self):
+        other_connection_string = 'sqlite:///%s' % os.path.join(self.tmp_dir, 'other.db')
+        other_conn = get_connection(other_connection_string, force_utf8=False,
+                                    query_cache=False)
+        other_conn.execute(text('CREATE TABLE titles (title_id INTEGER, title_year INTEGER);'))
+        other_conn.commit()
+        other_conn.close()
+        with mock.patch.dict(os.environ, {'ISFDB_CONNECTION_DETAILS': other_connection_string}):
+            parallel = run_in_workers(_count_titles, self.chunks, conn=self.conn, workers=2)
+        self.assertEqual(Counter({z: 10 for z in range(1950, 1980)}),
+                         merge_counters(parallel))
+
+    def test_worker_connection_kwargs(self):
+        kwargs = worker_connection_kwargs(self.conn)
+        self.assertEqual(self.connection_string, kwargs['connection_string'])
+        self.assertFalse(kwargs['query_cache'])
+        self.assertTrue(worker_connection_kwargs(CachingConnection(self.conn))['query_cache'])
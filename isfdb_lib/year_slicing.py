@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Run reports that cover a range of years (e.g. -y 1950-2020) in parallel, by
+splitting the range into chunks of years, and running each chunk in a pool
+of worker processes, so that a 70 year report can use all the cores - and
+database connections - rather than one.
+
+Each worker process gets its own database connection (after throwing away
+any pooled connections inherited from the parent) to the same database as the
+conn passed to run_in_workers(), with the same query cache and SQL stats
+settings, which is passed as the first argument to the function being run:
+
+    def count_stuff(conn, from_year, to_year):
+        ...
+        return some_counter
+
+    chunks = split_years(1950, 2020, chunk_years=5) # [(1950, 1954), ...]
+    results = run_in_workers(count_stuff, chunks)
+    totals = merge_counters(results)
+
+The results come back in the same order as the chunks, regardless of which
+finished first.  The function, its arguments and its results must all be
+picklable, which means top-level functions, and no connections, contexts or
+open results in what's returned.
+
+Each worker also has its own analysis_context default context, so caches
+aren't shared between workers.  Similarly, any SQL stats are recorded per
+worker, and aren't included in the parent process's report.
+
+The number of workers defaults to the ISFDB_WORKERS environment variable, or
+the number of CPUs.  With one worker or one chunk, the function is just run
+in this process, using the conn passed to run_in_workers(), if any.
+"""
+
+from argparse import Namespace
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import os
+
+from isfdb_lib.common import get_connection, reset_engines_after_fork
+from isfdb_lib import sql_stats
+
+
+_worker_conn = None
+
+
+def default_workers():
+    return int(os.environ.get('ISFDB_WORKERS') or os.cpu_count() or 1)
+
+
+def parse_year_range(year_arg):
+    """
+    Return a (from_year, to_year) tuple for a -y argument such as '2001' or
+    '1950-2020', or None if it's missing or open-ended (e.g. '1950-'), in
+    which case it can't be split up.
+    """
+    if not year_arg:
+        return None
+    if '-' in str(year_arg):
+        from_year, to_year = str(year_arg).split('-')
+        if not from_year or not to_year:
+            return None
+        return int(from_year), int(to_year)
+    return int(year_arg), int(year_arg)
+
+
+def split_years(from_year, to_year, chunk_years=None, workers=None):
+    """
+    Return a list of (from_year, to_year) tuples covering from_year to to_year
+    inclusive.  If chunk_years isn't specified, the chunks are sized to give
+    each worker a couple of them, so that a slow chunk doesn't leave the
+    other workers idle at the end.
+    """
+    num_years = to_year - from_year + 1
+    if num_years <= 0:
+        return []
+    if not chunk_years:
+        chunk_years = max(1, -(-num_years // ((workers or default_workers()) * 2)))
+    return [(z, min(z + chunk_years - 1, to_year))
+            for z in range(from_year, to_year + 1, chunk_years)]
+
+
+def split_year_range(year_arg, chunk_years=None, workers=None):
+    """
+    Return a list of -y style year range strings that the year_arg range has
+    been split into, or [year_arg] if it can't be split
+    """
+    year_range = parse_year_range(year_arg)
+    if not year_range:
+        return [year_arg]
+    return ['%d-%d' % z for z in split_years(*year_range, chunk_years=chunk_years,
+                                             workers=workers)]
+
+
+def args_for_year_chunks(args, chunk_years=None, workers=None):
+    """
+    Return a list of copies of the argparse Namespace args, one for each chunk
+    of args.year
+    """
+    ret = []
+    for year_arg in split_year_range(getattr(args, 'year', None), chunk_years, workers):
+        chunk_args = Namespace(**vars(args))
+        chunk_args.year = year_arg
+        ret.append(chunk_args)
+    return ret
+
+
+def worker_connection_kwargs(conn):
+    """
+    Return a dict of get_connection() arguments for a connection to the same
+    database as conn, with the same settings
+    """
+    return {
+        'connection_string': conn.engine.url.render_as_string(hide_password=False),
+        # Any charset that get_connection() added is already in the URL
+        'force_utf8': False,
+        # i.e. is this a query_cache.CachingConnection
+        'query_cache': getattr(conn, 'uncached', None) is not None,
+        'sql_stats': sql_stats.is_instrumented(conn.engine)
+    }
+
+
+def _init_worker(connection_string, connection_kwargs):
+    global _worker_conn
+    # Any connections in the pool came from the parent, and mustn't be used
+    # (or closed) here
+    reset_engines_after_fork()
+    _worker_conn = get_connection(connection_string, **connection_kwargs)
+
+
+def _run_in_worker(function, args):
+    return function(_worker_conn, *args)
+
+
+def run_in_workers(function, chunk_args, conn=None, workers=None,
+                   connection_string=None, **connection_kwargs):
+    """
+    Return a list of function(conn, *args) for each args tuple in chunk_args,
+    run in a pool of worker processes as per the module docstring.
+    connection_string and connection_kwargs are passed to
+    common.get_connection() in each worker; if connection_string isn't
+    specified, they default to those for conn (see worker_connection_kwargs())
+    or failing that, get_connection()'s defaults.
+    """
+    chunk_args = list(chunk_args)
+    if workers is None:
+        workers = default_workers()
+    workers = min(workers, len(chunk_args))
+    if workers <= 1:
+        if conn is None:
+            conn = get_connection(connection_string, **connection_kwargs)
+        return [function(conn, *z) for z in chunk_args]
+
+    if conn is not None and connection_string is None:
+        derived_kwargs = worker_connection_kwargs(conn)
+        derived_kwargs.update(connection_kwargs)
+        connection_string = derived_kwargs.pop('connection_string')
+        connection_kwargs = derived_kwargs
+
+    logging.info('Running %d chunks in %d worker processes' % (len(chunk_args), workers))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(connection_string, connection_kwargs)) as executor:
+        futures = [executor.submit(_run_in_worker, function, z) for z in chunk_args]
+        return [z.result() for z in futures]
+
+
+def merge_counters(counters):
+    """
+    Return a Counter that is the sum of the counters, added in order
+    """
+    ret = Counter()
+    for counter in counters:
+        ret.update(counter)
+    return ret
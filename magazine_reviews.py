@@ -20,7 +20,6 @@ Magazines which are somewhat compromised:
 from collections import defaultdict
 from datetime import date
 from enum import Enum
-from functools import reduce
 import logging
 import pdb
 import sys
@@ -28,7 +27,7 @@ import sys
 from sqlalchemy.sql import text
 
 from common import (get_connection, create_parser, parse_args,
-                    get_filters_and_params_from_args)
+                    get_filters_and_params_from_args, stream_results)
 from isfdb_utils import convert_dateish_to_date
 
 
@@ -70,7 +69,7 @@ class ReviewedWork(object):
         self.review_month = normalize_month(convert_dateish_to_date(row.review_month))
         if self.review_month is None:
             # Maybe another review in this issue has the date?
-            fallback = pub_months.get(row['pub_id'], None)
+            fallback = pub_months.get(row.pub_id, None)
             logging.warning('Undefined review month for %s (review.title_id=%d,'
                             'work.title_id=%d), using fallback %s' %
                             (self.title, row.title_id, self.title_id,
@@ -152,19 +151,15 @@ WHERE pub_id IN (
     params['review_ttypes'] = REVIEW_TTYPES_OF_INTEREST
     params['work_ttypes'] = WORK_TTYPES_OF_INTEREST
     params['magazine'] = magazine
-    results = conn.execute(query, params).fetchall()
-
-    def make_list_excluding_duplicates(accumulator, new_value):
-        if not accumulator:
-            accumulator = []
+    # Stream the rows straight into the deduplication, as there can be a lot
+    # of them for a long-running magazine, many of which are just repeats
+    # due to multiple authors
+    reviews = []
+    for row in stream_results(conn, query, params):
         try:
-            accumulator.append(ReviewedWork(new_value,
-                                            allow_duplicates=repeats))
+            reviews.append(ReviewedWork(row, allow_duplicates=repeats))
         except DuplicateReviewError:
             pass
-        return accumulator
-
-    reviews = reduce(make_list_excluding_duplicates, results, None)
     return sorted(reviews, key=lambda z: (z.review_month, z.title))
 
 def get_reviews(conn, args, repeats=RepeatReviewBehaviour.DIFFERENT_MONTHS_ONLY):
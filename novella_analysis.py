@@ -20,7 +20,7 @@ import sys
 from sqlalchemy.sql import text
 
 from common import (get_connection, parse_args, AmbiguousArgumentsError,
-                    get_filters_and_params_from_args)
+                    get_filters_and_params_from_args, stream_results)
 from isfdb_utils import (convert_dateish_to_date, merge_similar_titles)
 from author_aliases import get_author_alias_ids
 from deduplicate import (DuplicatedOrMergedRecordError,
@@ -36,12 +36,32 @@ PUB_FORMATS = ['ebook', 'hc', 'tp', 'pb']
 
 
 def get_novellas(conn, args):
+    query, params = _novellas_query(args)
+    return conn.execute(query, params).fetchall()
+
+
+def iter_novellas(conn, args):
+    """
+    Generator version of get_novellas(), which streams the rows (one per
+    novella pub) from the database, sorted by title_id, as
+    postprocess_novellas() expects.  As per common.stream_results(), the
+    connection can't be used for anything else until this is exhausted.
+    """
+    query, params = _novellas_query(args)
+    yield from stream_results(conn, query, params)
+
+
+def _novellas_query(args):
     fltr, params = get_filters_and_params_from_args(
         args, column_name_mappings={'year': 'title_copyright'})
 
     # TODO: handling of 'vague' dates that Python date object doesn't like
+    # This used to be SELECT *, which meant dragging back every column of four
+    # tables, when postprocess_novellas() only wants these
     query = text('''
-SELECT *
+SELECT t.title_id, t.title_title, t.title_copyright,
+  p.pub_id, p.pub_ptype, p.pub_year, p.pub_ctype, p.pub_isbn,
+  pb.publisher_name
 FROM titles t
 LEFT OUTER JOIN pub_content pc ON pc.title_id = t.title_id
 LEFT OUTER JOIN pubs p ON pc.pub_id = p.pub_id
@@ -61,18 +81,21 @@ ORDER BY t.title_id, t.title_copyright;
     params['languages'] = VALID_LANGUAGE_IDS
 
 
-    results = conn.execute(query, **params).fetchall()
-    return results
+    return query, params
 
 def postprocess_novellas(novellas):
     """
-    Return a list of novellas that:
+    Generator yielding novellas that:
     * Collapses all the different pubs into a {publisher>list-of-formats} dict
     * Maybe does something with multiple authors?
-    Presumes the novellas are sorted by title_id
+    Presumes the novellas are sorted by title_id, so that each one can be
+    yielded as soon as its last pub has been seen, rather than having to hold
+    all of them in memory.
     """
-    title_id_to_details = {}
+    val = None
     for novella in novellas:
+        # SQLAlchemy 2 rows need ._mapping for access by column name
+        novella = getattr(novella, '_mapping', novella)
         title_id = novella['title_id']
         publisher = novella['publisher_name']
         fmt = novella['pub_ptype']
@@ -83,10 +106,9 @@ def postprocess_novellas(novellas):
         pub_isbn = novella['pub_isbn']
         pub_id = novella['pub_id']
         pub_details = (fmt, pub_date, pub_type, pub_id, pub_isbn)
-        try:
-            val = title_id_to_details[title_id]
-
-        except KeyError:
+        if val is None or val['title_id'] != title_id:
+            if val is not None:
+                yield val
             # val = dict(novella)
             # val['pubs'] = defaultdict(list)
             val = {
@@ -95,10 +117,10 @@ def postprocess_novellas(novellas):
                 'copyright_date': novella['title_copyright'],
                 'pubs': defaultdict(list)
             }
-            title_id_to_details[title_id] = val
         val['pubs'][publisher].append(pub_details)
 
-    return title_id_to_details.values()
+    if val is not None:
+        yield val
 
 if __name__ == '__main__':
     args = parse_args(sys.argv[1:],
@@ -107,7 +129,7 @@ if __name__ == '__main__':
 
     conn = get_connection()
 
-    novella_pubs = get_novellas(conn, args)
+    novella_pubs = iter_novellas(conn, args)
     novellas = postprocess_novellas(novella_pubs)
     for i, novella in enumerate(novellas, 1):
         print(f'{i}. {novella}')
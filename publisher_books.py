@@ -26,6 +26,7 @@ from sqlalchemy.sql import text
 from common import (get_connection,
                     parse_args, create_parser, get_filters_and_params_from_args)
 from country_related import derive_country_from_price
+from isfdb_lib.derived_tables import has_derived_tables
 from isfdb_utils import convert_dateish_to_date, pretty_list
 from magazine_reviews import normalize_month
 
@@ -106,7 +107,10 @@ class CountrySpecificBook(object):
         self.title_parent = value_obj.title_parent
         self.title_language = value_obj.title_language
         self.copyright_date = convert_dateish_to_date(value_obj.copyright_dateish)
-        if self.title_parent and conn:
+        if self.title_parent and hasattr(value_obj, 'root_copyright_dateish'):
+            # The query already picked up the parent details via title_root
+            self.best_copyright_date = self._best_copyright_date_from_root(value_obj)
+        elif self.title_parent and conn:
             self.best_copyright_date = self._get_best_copyright_date(conn)
         else:
             self.best_copyright_date = self.copyright_date
@@ -129,6 +133,18 @@ class CountrySpecificBook(object):
         self.publications.append(publication)
 
 
+    def _best_copyright_date_from_root(self, value_obj):
+        """
+        Equivalent of _get_best_copyright_date(), for when the parent's details
+        came from the title_root derived table.
+        """
+        # The original query's "title_language = :language" never matches NULL
+        if value_obj.root_language is None or \
+           value_obj.root_language != self.title_language:
+            return self.copyright_date
+        return convert_dateish_to_date(value_obj.root_copyright_dateish) or \
+            self.copyright_date
+
     @lru_cache()
     def _get_best_copyright_date(self, conn):
         """
@@ -242,6 +258,14 @@ def get_publisher_books(conn, args, countries=None, original_adult_genre_only=Tr
     # A: Yes, but not for that reason - we need it to exclude INTERIORART,
     #    COVERART etc.  Not quite sure how yet though
 
+    # If we have the title_root table, we can get the parent details that
+    # CountrySpecificBook needs in the same query, rather than one per variant
+    if has_derived_tables(conn):
+        root_columns = ', tr.root_language, tr.root_copyright_dateish'
+        root_join = 'LEFT OUTER JOIN title_root tr ON tr.title_id = t.title_id'
+    else:
+        root_columns = root_join = ''
+
     # We include pubs.pub_id as that's (maybe) the easiest way to track
     # publications with multiple authors
     query = text("""SELECT publisher_name,
@@ -252,17 +276,18 @@ def get_publisher_books(conn, args, countries=None, original_adult_genre_only=Tr
                            CAST(pub_year AS CHAR) pub_dateish,
                            CAST(title_copyright AS CHAR) copyright_dateish,
                            pub_ptype, pub_price, pub_isbn,
-                           title_ttype, pub_ctype
+                           title_ttype, pub_ctype %s
       FROM publishers p
         LEFT OUTER JOIN pubs ON pubs.publisher_id = p.publisher_id
         LEFT OUTER JOIN pub_content pc ON pubs.pub_id = pc.pub_id
         LEFT OUTER JOIN canonical_author ca ON ca.title_id = pc.title_id
         LEFT OUTER JOIN authors a ON ca.author_id = a.author_id
         LEFT OUTER JOIN titles t on t.title_id = pc.title_id
+        %s
       WHERE title_ttype in :book_types
         AND title_ttype = pub_ctype
         AND %s
-      ORDER BY t.title_id, pub_dateish, pubs.pub_id""" % (fltr))
+      ORDER BY t.title_id, pub_dateish, pubs.pub_id""" % (root_columns, root_join, fltr))
 
     #print(fltr)
     #print(params)
@@ -346,6 +371,13 @@ class PublisherBooks(object):
             self.books = books
 
 
+    def __getstate__(self):
+        # Connections can't be pickled e.g. to return the object from a worker
+        # process
+        state = self.__dict__.copy()
+        state['conn'] = None
+        return state
+
     def output_pub_detail(self, output_function=print):
         """
         Output details pertinent the titles and their individual publications
@@ -11,7 +11,8 @@ import sys
 
 from sqlalchemy.sql import text
 
-from common import get_connection, parse_args, get_filters_and_params_from_args
+from common import (get_connection, parse_args, get_filters_and_params_from_args,
+                    stream_results)
 from isfdb_utils import convert_dateish_to_date
 
 class ArgumentError(Exception): # I thought there was a built-in for this?
@@ -85,8 +86,9 @@ WHERE %s
 
     # print(query)
 
-    results = conn.execute(query, params)
-    return results
+    # The query for the "other" country covers every year, so stream it rather
+    # than having the whole thing in memory before it gets dictified
+    return stream_results(conn, query, params)
 
 
 def get_titles_published_in_one_country_only(conn, country, other_country, year,
@@ -11,13 +11,16 @@ fairly closely, albeit showing slightly different metrics.
 
 from collections import defaultdict
 from datetime import datetime
+from itertools import chain
 # from functools import reduce, lru_cache
 import pdb
 import sys
 
 from sqlalchemy.sql import text
 
-from common import (get_connection, parse_args, AmbiguousArgumentsError)
+from common import (get_connection, parse_args, create_parser,
+                    AmbiguousArgumentsError)
+from isfdb_lib.year_slicing import run_in_workers, split_years
 
 def get_stats(conn, min_year=0, max_year=2999, language_filter=17):
     """
@@ -61,6 +64,24 @@ def get_stats(conn, min_year=0, max_year=2999, language_filter=17):
     rows = conn.execute(query, {'min_year': min_year, 'max_year': max_year})
     return rows
 
+def _stats_for_years(conn, min_year, max_year, language_filter):
+    # Tuples rather than rows, so that they can be returned from a worker process
+    return [tuple(z) for z in get_stats(conn, min_year, max_year, language_filter)]
+
+
+def get_stats_by_year_chunks(min_year, max_year, language_filter=17, conn=None,
+                             workers=None, chunk_years=None):
+    """
+    Equivalent of get_stats() (but returning a list of tuples), with the years
+    split into chunks that are run in worker processes, as per
+    isfdb_lib/year_slicing.py
+    """
+    chunk_args = [(from_year, to_year, language_filter) for from_year, to_year in
+                  split_years(min_year, max_year, chunk_years, workers)]
+    results = run_in_workers(_stats_for_years, chunk_args, conn=conn, workers=workers)
+    return list(chain.from_iterable(results))
+
+
 def turn_raw_stats_into_cells(rows):
     """
     Turn the output from get_stats() into a form more suitable for Excel/Google
@@ -94,8 +115,21 @@ def turn_raw_stats_into_cells(rows):
 
 
 if __name__ == '__main__':
+    # None of the filters apply, as this always reports on every year, but
+    # this gets us -v and --profile
+    parser = create_parser(description='Report on the proportion of novels that '
+                           'are serialized vs standalone', supported_args='v')
+    parser.add_argument('-j', dest='workers', type=int, default=1,
+                        help='Number of worker processes to split the years '
+                        'between (0 = one per CPU)')
+    args = parse_args(sys.argv[1:], parser=parser)
+
     conn = get_connection()
-    rows = get_stats(conn, min_year=1900, max_year=datetime.today().year)
+    if args.workers == 1:
+        rows = get_stats(conn, min_year=1900, max_year=datetime.today().year)
+    else:
+        rows = get_stats_by_year_chunks(1900, datetime.today().year, conn=conn,
+                                        workers=args.workers or None)
 
     for cell_row in turn_raw_stats_into_cells(rows):
         print(cell_row)
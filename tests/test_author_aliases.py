@@ -18,6 +18,7 @@ from ..common import get_connection
 from ..author_aliases import (unlegalize, get_author_aliases,
                               get_author_alias_ids, get_real_author_id,
                               get_real_author_id_and_name,
+                              get_real_author_ids_and_names,
                               get_real_author_id_and_name_from_name,
                               get_gestalt_ids,
                               get_author_name)
@@ -257,6 +258,19 @@ class TestGetRealAuthorIdAndName(unittest.TestCase):
                          get_real_author_id_and_name(self.conn, 155601)) # JSAC
 
 
+class TestGetRealAuthorIdsAndNames(unittest.TestCase):
+    conn = get_connection()
+
+    def test_mixture(self):
+        self.assertEqual({133814: [(129348, 'Seanan McGuire')],
+                          155601: [(10297, 'Daniel Abraham'), (123977, 'Ty Franck')]},
+                         get_real_author_ids_and_names(self.conn,
+                                                       [133814, 129348, 155601]))
+
+    def test_empty(self):
+        self.assertEqual({}, get_real_author_ids_and_names(self.conn, []))
+
+
 class TestGetRealAuthorIdAndNameFromName(unittest.TestCase):
     conn = get_connection()
 
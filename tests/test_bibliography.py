@@ -16,7 +16,10 @@ from ..publication_history import (get_publications_by_country,
                                    PublicationDetails)
 
 # TODO: there are other functions (probably more easily testable) in that module
-from ..bibliography import (get_author_bibliography, PubStuff)
+from ..author_aliases import get_author_alias_ids
+from ..bibliography import (get_author_bibliography, get_bibliography,
+                             get_bibliographies, group_bibliography_rows,
+                             PubStuff, Repackaging)
 
 
 CoreBookInfo = namedtuple('CoreBookInfo', 'id, title, year')
@@ -40,6 +43,42 @@ def make_title_id_to_details_map(books):
     """
     return {z.title_id: z for z in books}
 
+BibliographyRow = namedtuple('BibliographyRow', 'title_id, title_parent, title_title, '
+                             't_copyright, title_ttype, pub_id, pub_title, '
+                             'p_publication_date, pub_isbn, pub_price, pub_ptype, '
+                             'pub_ctype, publisher_name')
+
+
+class TestGroupBibliographyRows(unittest.TestCase):
+    # Doesn't need the database, but the imports above do
+
+    def test_variants_grouped_under_root(self):
+        rows = [BibliographyRow(1, 0, 'Book', '1990-00-00', 'NOVEL', 10, 'Book',
+                                '1990-05-00', 'isbn1', '$1', 'hc', 'NOVEL', 'Pub A'),
+                BibliographyRow(2, 0, 'Other', '1995-00-00', 'NOVEL', 20, 'Other',
+                                '1995-01-01', 'isbn2', '$1', 'pb', 'NOVEL', 'Pub B'),
+                BibliographyRow(3, 1, 'Book Variant', '1990-00-00', 'NOVEL', 30,
+                                'Omnibus', '2000-01-01', 'isbn3', '$2', 'tp',
+                                'OMNIBUS', 'Pub B')]
+        books = group_bibliography_rows(rows)
+        self.assertEqual([1, 2], [z.title_id for z in books])
+        book = books[0]
+        self.assertEqual(1990, book.year)
+        self.assertEqual(['isbn1', 'isbn3'], book.isbns)
+        self.assertEqual({'Pub A', 'Pub B'}, book.publishers)
+        self.assertEqual([10, 30], [z.pub_id for z in book.all_pub_stuff])
+        self.assertEqual({Repackaging('Omnibus', 'OMNIBUS', datetime.date(2000, 1, 1))},
+                         book._repackagings)
+        self.assertEqual(['Book', 'Book Variant'], book.prioritized_titles)
+        self.assertFalse(hasattr(book, '__dict__'))
+
+    def test_no_state_between_calls(self):
+        row = BibliographyRow(1, 0, 'Book', '1990-00-00', 'NOVEL', 10, 'Book',
+                              '1990-05-00', 'isbn1', '$1', 'hc', 'NOVEL', 'Pub A')
+        self.assertEqual(1, len(group_bibliography_rows([row])))
+        self.assertEqual(1, len(group_bibliography_rows([row])))
+
+
 
 class TestBibliography(unittest.TestCase):
     # There's a *lot* more should be tested...
@@ -127,3 +166,18 @@ class TestBibliography(unittest.TestCase):
                                    price='$7.99',
                                    publisher='Neal Asher')], mindgames.all_pub_stuff)
 
+    def test_get_bibliographies_matches_get_bibliography(self):
+        # Bradbury's aliases include "Brett Sterling", a house name also used
+        # by Edmond Hamilton, so some rows belong to more than one group
+        author_id_groups = {name: get_author_alias_ids(self.conn, name)
+                            for name in ['Daniel Keyes', 'Ray Bradbury',
+                                         'Edmond Hamilton']}
+        bulk = get_bibliographies(self.conn, author_id_groups,
+                                  MAIN_TYPES_OF_INTEREST)
+        self.assertEqual(set(author_id_groups), set(bulk))
+        for name, author_ids in author_id_groups.items():
+            single = get_bibliography(self.conn, {'author_ids': author_ids},
+                                      MAIN_TYPES_OF_INTEREST)
+            self.assertEqual(extract_core_bits(single), extract_core_bits(bulk[name]))
+            self.assertEqual([z.all_pub_stuff for z in single],
+                             [z.all_pub_stuff for z in bulk[name]])
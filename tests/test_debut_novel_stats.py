@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+These don't need an ISFDB database, just a throwaway SQLite one with a
+handful of authors, and the derived tables built from them by hand (as the
+SQL that tools/build_derived_tables.py uses is MariaDB specific).  As SQLite
+can't take a list for "IN ?" in the way that MySQLdb can, such parameters
+are expanded by _expand_list_params().
+"""
+
+from collections import namedtuple
+import os
+from unittest.mock import patch
+
+from sqlalchemy import event
+from sqlalchemy.sql import text
+
+from isfdb_lib.alias_graph import enable_alias_graph
+from isfdb_lib.analysis_context import AnalysisContext
+# Not relative imports, so that these are the same modules that
+# debut_novel_stats uses
+from isfdb_lib.derived_tables import (forget_availability, title_ordinal_rows,
+                                      ORDINAL_ROWS_QUERY, ORDINAL_TITLE_TYPES,
+                                      ORDINAL_LANGUAGE_IDS, METADATA_TABLE)
+from ..isfdb_lib.tests.sqlite_test_case import SQLiteTestCase
+from ..debut_novel_stats import DebutStats
+
+
+TABLES = [
+    'CREATE TABLE authors (author_id INTEGER, author_canonical TEXT, author_legalname TEXT);',
+    'CREATE TABLE pseudonyms (pseudonym INTEGER, author_id INTEGER);',
+    'CREATE TABLE titles (title_id INTEGER, title_title TEXT, title_copyright TEXT, '
+    'series_id INTEGER, title_seriesnum INTEGER, title_seriesnum_2 TEXT, '
+    'title_ttype TEXT, title_parent INTEGER, title_language INTEGER);',
+    'CREATE TABLE canonical_author (title_id INTEGER, author_id INTEGER);',
+    'CREATE TABLE pubs (pub_id INTEGER, pub_title TEXT, pub_year TEXT, pub_isbn TEXT, '
+    'pub_price TEXT, pub_ptype TEXT, pub_ctype TEXT, publisher_id INTEGER);',
+    'CREATE TABLE pub_content (title_id INTEGER, pub_id INTEGER);',
+    'CREATE TABLE publishers (publisher_id INTEGER, publisher_name TEXT);',
+    # Cut down versions of the derived tables that get_nth_novels_from_derived_tables()
+    # uses
+    'CREATE TABLE title_root (title_id INTEGER, root_title_id INTEGER);',
+    'CREATE TABLE title_real_authors (title_id INTEGER, author_id INTEGER, '
+    'real_author_id INTEGER);',
+    'CREATE TABLE author_title_ordinals (author_id INTEGER, root_title_id INTEGER, '
+    'ordinal INTEGER, title_year INTEGER);',
+    'CREATE TABLE %s (dump_version TEXT, built_at TEXT);' % (METADATA_TABLE)
+]
+
+ALICE, BOB, CAROL, DEE, SHARED, HOUSE = 1, 2, 3, 4, 10, 20
+
+AUTHORS = [(ALICE, 'Alice Real'), (BOB, 'Bob Real'), (CAROL, 'Carol Real'),
+           (DEE, 'Dee Real'),
+           # A pseudonym used by two authors
+           (SHARED, 'Shared Name'),
+           # A gestalt/house name used by three
+           (HOUSE, 'House Name')]
+
+PSEUDONYMS = [(SHARED, ALICE), (SHARED, BOB),
+              (HOUSE, ALICE), (HOUSE, CAROL), (HOUSE, DEE)]
+
+# title_id => (title, year, author_id)
+NOVELS = {
+    101: ('Alice One', 1990, ALICE),
+    102: ('Alice Two', 2000, ALICE),
+    201: ('Bob One', 1995, BOB),
+    301: ('Carol One', 1985, CAROL),
+    401: ('Dee One', 1980, DEE),
+    1001: ('Shared One', 1992, SHARED),
+    2001: ('House One', 1970, HOUSE),
+    2002: ('House Two', 1998, HOUSE)
+}
+
+Book = namedtuple('Book', 'title_id, title, parent_id, author_id_to_name')
+
+
+def _expand_list_params(conn, cursor, statement, parameters, context, executemany):
+    if executemany or not any(isinstance(z, (list, tuple)) for z in parameters):
+        return statement, parameters
+    bits = statement.split('?')
+    new_statement = bits[0]
+    new_parameters = []
+    for param, bit in zip(parameters, bits[1:]):
+        if isinstance(param, (list, tuple)):
+            new_statement += '(%s)' % (', '.join(['?'] * len(param)))
+            new_parameters.extend(param)
+        else:
+            new_statement += '?'
+            new_parameters.append(param)
+        new_statement += bit
+    return new_statement, tuple(new_parameters)
+
+
+class TestDebutStatsDerivedTables(SQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+        event.listen(self.conn.engine, 'before_cursor_execute', _expand_list_params,
+                     retval=True)
+        forget_availability()
+        enable_alias_graph(False)
+        for ddl in TABLES:
+            self.conn.execute(text(ddl))
+        self._insert('authors', [(a, name, None) for a, name in AUTHORS])
+        self._insert('pseudonyms', PSEUDONYMS)
+        for title_id, (title, year, author_id) in NOVELS.items():
+            self._insert('titles', [(title_id, title, '%d-00-00' % (year), None, None,
+                                     None, 'NOVEL', 0, ORDINAL_LANGUAGE_IDS[0])])
+            self._insert('canonical_author', [(title_id, author_id)])
+            self._insert('pubs', [(title_id, title, '%d-01-01' % (year), None, None,
+                                   'hc', 'NOVEL', 1)])
+            self._insert('pub_content', [(title_id, title_id)])
+        self._insert('publishers', [(1, 'Some Publisher')])
+        self._build_derived_tables()
+        self.conn.commit()
+
+    def tearDown(self):
+        enable_alias_graph(None)
+        forget_availability()
+        event.remove(self.conn.engine, 'before_cursor_execute', _expand_list_params)
+        super().tearDown()
+
+    def _insert(self, table, rows):
+        placeholders = ', '.join(':%d' % (z) for z in range(len(rows[0])))
+        self.conn.execute(text('INSERT INTO %s VALUES (%s);' % (table, placeholders)),
+                          [{str(i): v for i, v in enumerate(row)} for row in rows])
+
+    def _build_derived_tables(self):
+        self._insert('title_root', [(z, z) for z in NOVELS])
+        real_authors = {}
+        for pseudonym, author_id in PSEUDONYMS:
+            real_authors.setdefault(pseudonym, []).append(author_id)
+        self._insert('title_real_authors',
+                     [(title_id, author_id, real_id)
+                      for title_id, (_, _, author_id) in NOVELS.items()
+                      for real_id in real_authors.get(author_id, [author_id])])
+        rows = self.conn.execute(text(ORDINAL_ROWS_QUERY),
+                                 {'title_types': ORDINAL_TITLE_TYPES,
+                                  'title_languages': ORDINAL_LANGUAGE_IDS}).fetchall()
+        self._insert('author_title_ordinals',
+                     title_ordinal_rows([tuple(z) for z in rows], PSEUDONYMS))
+        self._insert(METADATA_TABLE, [('test-dump', '2020-01-01')])
+
+    def _debut_stats(self, use_derived_tables):
+        # The order matters for the bibliographies route, as an author can
+        # get the bibliography of an earlier one whose alias they are; this
+        # order is one where that gives the same bibliographies as each author
+        # getting their own
+        names = dict(AUTHORS)
+        books = [Book(z, NOVELS[z][0], 0, {NOVELS[z][2]: names[NOVELS[z][2]]})
+                 for z in (101, 102, 1001, 301, 401, 201, 2001, 2002)]
+        env = {'ISFDB_DUMP_VERSION': 'test-dump'}
+        if not use_derived_tables:
+            env['ISFDB_IGNORE_DERIVED_TABLES'] = '1'
+        with patch.dict(os.environ, env):
+            forget_availability()
+            stats = DebutStats(books, self.conn, original_books_only=False,
+                               context=AnalysisContext())
+        self.assertEqual(use_derived_tables, stats.nth_novels is not None)
+        return (sorted(stats.debut_authors),
+                sorted((bk.title_id, nth) for nth, bk in stats.nth_book_details))
+
+    def test_same_with_and_without_derived_tables(self):
+        expected = (['Alice Real', 'Carol Real', 'Dee Real', 'House Name'],
+                    [(101, 1), (102, 3),
+                     # Bob's bibliography includes the shared pseudonym's book
+                     (201, 2),
+                     (301, 1), (401, 1),
+                     # The shared pseudonym's bibliography includes Alice's
+                     # and Bob's books
+                     (1001, 2),
+                     # The gestalt's bibliography includes all its members' books
+                     (2001, 1), (2002, 6)])
+        self.assertEqual(expected, self._debut_stats(use_derived_tables=False))
+        self.assertEqual(expected, self._debut_stats(use_derived_tables=True))
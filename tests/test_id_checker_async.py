@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+These use small hand-made ID sets (or a stubbed-out database check) rather
+than the database.
+"""
+
+from unittest import mock
+
+from aiohttp.test_utils import AioHTTPTestCase
+
+# The same module object that id_checker_async uses, rather than the
+# package-relative copy
+from isfdb_lib import ids_in_memory
+
+from ..tools import id_checker_async
+
+
+ISFDB_IDS = {'9781473233058', 'B073NXRMWJ'}
+FIXER_ISBNS = {'9781975353636': (0, 'n', None)}
+FIXER_ASINS = {}
+
+
+def no_output(*args, **kwargs):
+    pass
+
+
+class IdCheckerTestCase(AioHTTPTestCase):
+    in_memory = True
+
+    async def get_application(self):
+        return id_checker_async.create_app(in_memory=self.in_memory)
+
+    async def asyncSetUp(self):
+        # Don't go anywhere near the database or the cache file on startup
+        patcher = mock.patch.object(id_checker_async, '_load_data')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        await super().asyncSetUp()
+
+    async def _batch_check(self, data):
+        return await self.client.request('POST', '/batch_check/', data=data,
+                                         headers={'Content-Type': 'application/json'})
+
+
+class TestBatchCheckInMemory(IdCheckerTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        ids_in_memory.set_data(*ids_in_memory.compact_ids(ISFDB_IDS, FIXER_ISBNS,
+                                                          FIXER_ASINS,
+                                                          output_function=no_output))
+
+    async def asyncTearDown(self):
+        ids_in_memory.set_data({}, {}, {})
+        await super().asyncTearDown()
+
+    async def test_batch_check(self):
+        resp = await self._batch_check('["9781473233058", "1473233054", '
+                                       '"9781975353636", "B000000002"]')
+        self.assertEqual(200, resp.status)
+        self.assertEqual(id_checker_async.API_VERSION,
+                         resp.headers['X-ID-Checker-API-Version'])
+        self.assertEqual('*', resp.headers['Access-Control-Allow-Origin'])
+        results = await resp.json()
+        self.assertEqual(['9781473233058', '1473233054', '9781975353636', 'B000000002'],
+                         [z['id'] for z in results])
+        self.assertEqual([True, True, False, False], [z['known'] for z in results])
+        self.assertEqual('9781473233058', results[1]['matched_id'])
+        self.assertEqual(0, results[2]['status'])
+
+    async def test_big_batch_matches_inline(self):
+        vals = ['9781473233058', 'B000000002'] * id_checker_async.MAX_INLINE_BATCH_SIZE
+        resp = await self._batch_check('[%s]' % (', '.join('"%s"' % z for z in vals)))
+        self.assertEqual(200, resp.status)
+        self.assertEqual(ids_in_memory.batch_check_in_memory(vals), await resp.json())
+
+    async def test_bad_json(self):
+        for data in ('not json', '{"id": "9781473233058"}', '[1, 2]'):
+            resp = await self._batch_check(data)
+            self.assertEqual(400, resp.status)
+            # Errors need the CORS headers too, or browsers hide them from scripts
+            self.assertEqual('*', resp.headers['Access-Control-Allow-Origin'])
+
+    async def test_options(self):
+        resp = await self.client.request('OPTIONS', '/batch_check/')
+        self.assertEqual(200, resp.status)
+        self.assertEqual('*', resp.headers['Access-Control-Allow-Origin'])
+
+    async def test_reload_forbidden(self):
+        with mock.patch.object(id_checker_async, 'RELOAD_TOKEN', 'sekrit'), \
+             mock.patch.object(id_checker_async, '_reload_data') as reload_data:
+            resp = await self.client.request('POST', '/reload/',
+                                             headers={'X-Reload-Token': 'wrong'})
+            self.assertEqual(403, resp.status)
+            self.assertEqual('*', resp.headers['Access-Control-Allow-Origin'])
+            reload_data.assert_not_called()
+
+            resp = await self.client.request('POST', '/reload/',
+                                             headers={'X-Reload-Token': 'sekrit'})
+            self.assertEqual(200, resp.status)
+            reload_data.assert_called_once_with()
+
+
+class TestBatchCheckDbOnly(IdCheckerTestCase):
+    in_memory = False
+
+    async def test_batch_check(self):
+        known = {'9781473233058': True, 'B000000002': False}
+        with mock.patch.object(id_checker_async, 'check_ids',
+                               return_value=known) as check_ids, \
+             mock.patch.object(id_checker_async, 'connection'):
+            resp = await self._batch_check('["9781473233058", "B000000002"]')
+        self.assertEqual(200, resp.status)
+        self.assertEqual([{'id': '9781473233058', 'known': True},
+                          {'id': 'B000000002', 'known': False}],
+                         await resp.json())
+        self.assertEqual(['9781473233058', 'B000000002'], check_ids.call_args[0][1])
+
+    async def test_reload_not_in_memory(self):
+        with mock.patch.object(id_checker_async, 'RELOAD_TOKEN', 'sekrit'):
+            resp = await self.client.request('POST', '/reload/',
+                                             headers={'X-Reload-Token': 'sekrit'})
+        self.assertEqual(400, resp.status)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+These don't need the database: they feed hand-made rows into the functions
+that post-process the rows of the big report queries, which are given them
+one at a time as they are streamed from the database.
+"""
+
+from collections import namedtuple
+from datetime import date
+import unittest
+from unittest import mock
+
+from .. import magazine_reviews
+from ..magazine_reviews import (_get_reviews, RepeatReviewBehaviour,
+                                ReviewedWork)
+from ..novella_analysis import postprocess_novellas
+from ..title_related import postprocess_titles
+
+
+def _novella_pub(title_id, title, pub_id, publisher, fmt):
+    return {'title_id': title_id, 'title_title': title,
+            'title_copyright': date(2020, 1, 1), 'pub_id': pub_id,
+            'pub_ptype': fmt, 'pub_year': date(2020, 2, 1), 'pub_ctype': 'CHAPBOOK',
+            'pub_isbn': None, 'publisher_name': publisher}
+
+
+class TestPostprocessNovellas(unittest.TestCase):
+    def test_grouping(self):
+        rows = [_novella_pub(1, 'One', 10, 'Tor.com', 'ebook'),
+                _novella_pub(1, 'One', 11, 'Tor.com', 'tp'),
+                _novella_pub(1, 'One', 12, 'Subterranean', 'hc'),
+                _novella_pub(2, 'Two', 20, 'Tor.com', 'ebook'),
+                _novella_pub(3, 'Three', 30, 'PS', 'hc')]
+        ret = list(postprocess_novellas(iter(rows)))
+        self.assertEqual([1, 2, 3], [z['title_id'] for z in ret])
+        self.assertEqual(['One', 'Two', 'Three'], [z['title'] for z in ret])
+        self.assertEqual({'Tor.com': [10, 11], 'Subterranean': [12]},
+                         {k: [z[3] for z in v] for k, v in ret[0]['pubs'].items()})
+        # The last novella isn't lost just because no row follows it
+        self.assertEqual({'PS': [('hc', date(2020, 2, 1), 'CHAPBOOK', 30, None)]},
+                         dict(ret[2]['pubs']))
+
+    def test_yields_before_the_end(self):
+        # Each novella should be available as soon as the next one starts,
+        # rather than after all the rows have been read
+        def rows():
+            yield _novella_pub(1, 'One', 10, 'Tor.com', 'ebook')
+            yield _novella_pub(2, 'Two', 20, 'Tor.com', 'ebook')
+            raise AssertionError('Read too far')
+        self.assertEqual(1, next(postprocess_novellas(rows()))['title_id'])
+
+    def test_empty(self):
+        self.assertEqual([], list(postprocess_novellas([])))
+
+
+TitleRow = namedtuple('TitleRow', 'title_id, author, title, title_parent')
+
+
+class TestPostprocessTitles(unittest.TestCase):
+    def test_children_excluded(self):
+        rows = [TitleRow(1866037, 'J. P. Smythe', 'Way Down Dark', 1866038),
+                TitleRow(1866038, 'James Smythe', 'Way Down Dark', 0),
+                TitleRow(2034339, 'Alastair Reynolds', 'Revenger', None)]
+        self.assertEqual(rows[1:], postprocess_titles(iter(rows)))
+
+    def test_multiple_authors_kept(self):
+        rows = [TitleRow(1, 'Author A', 'Joint Effort', 0),
+                TitleRow(1, 'Author B', 'Joint Effort', 0)]
+        self.assertEqual(rows, postprocess_titles(rows))
+
+
+ReviewRow = namedtuple('ReviewRow', 'pub_id, pubc_page, title_id, title_title, '
+                       'title_ttype, review_month, work_id, work_title, work_ttype, '
+                       'work_author')
+
+
+def _review(pub_id, review_id, review_month, work_id, work_title, work_author):
+    return ReviewRow(pub_id, '1', review_id, work_title, 'REVIEW', review_month,
+                     work_id, work_title, 'NOVEL', work_author)
+
+
+class TestGetReviews(unittest.TestCase):
+    def setUp(self):
+        # Both of these are module/class level, so would otherwise leak
+        # between tests
+        for patcher in (mock.patch.dict(ReviewedWork._known_keys, clear=True),
+                        mock.patch.dict(magazine_reviews.pub_months, clear=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _get_reviews(self, rows, repeats):
+        with mock.patch.object(magazine_reviews, 'stream_results',
+                               return_value=iter(rows)):
+            return _get_reviews(None, 'Interzone', '1 = 1', {}, repeats)
+
+    def test_duplicates_merged(self):
+        rows = [_review(1, 100, '2010-05-00', 10, 'Zebra', 'Author A'),
+                _review(1, 100, '2010-05-00', 10, 'Zebra', 'Author B'),
+                _review(1, 101, '2010-05-00', 11, 'Aardvark', 'Author C'),
+                _review(2, 102, '2010-03-00', 10, 'Zebra', 'Author A')]
+        ret = self._get_reviews(rows, RepeatReviewBehaviour.DIFFERENT_MONTHS_ONLY)
+        self.assertEqual([('Zebra', date(2010, 3, 1), 'Author A'),
+                          ('Aardvark', date(2010, 5, 1), 'Author C'),
+                          ('Zebra', date(2010, 5, 1), 'Author A+Author B')],
+                         [(z.title, z.review_month, z.author) for z in ret])
+
+    def test_different_years_only(self):
+        rows = [_review(1, 100, '2010-05-00', 10, 'Zebra', 'Author A'),
+                _review(2, 102, '2010-03-00', 10, 'Zebra', 'Author A')]
+        ret = self._get_reviews(rows, RepeatReviewBehaviour.DIFFERENT_YEARS_ONLY)
+        self.assertEqual([date(2010, 5, 1)], [z.review_month for z in ret])
+
+    def test_empty(self):
+        self.assertEqual([], self._get_reviews([], RepeatReviewBehaviour.ALLOW))
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from ..tools.run_benchmarks import compare_results, MIN_COMPARABLE_TIME
+
+
+def _results(**medians):
+    return {'benchmarks': {name: {'error': 'Boom'} if median is None else
+                           {'median': median}
+                           for name, median in medians.items()}}
+
+
+class TestCompareResults(unittest.TestCase):
+    def test_statuses(self):
+        old = _results(same=1.0, slower=1.0, faster=1.0, broken=1.0, gone=1.0,
+                       was_broken=None)
+        new = _results(same=1.1, slower=1.3, faster=0.7, broken=None, added=2.0,
+                       was_broken=1.0)
+        self.assertEqual([('same', 1.0, 1.1, 'ok'),
+                          ('slower', 1.0, 1.3, 'regression'),
+                          ('faster', 1.0, 0.7, 'improvement'),
+                          ('broken', 1.0, None, 'error'),
+                          ('added', None, 2.0, 'new'),
+                          ('was_broken', None, 1.0, 'new'),
+                          ('gone', 1.0, None, 'missing')],
+                         compare_results(old, new))
+
+    def test_threshold(self):
+        old = _results(foo=1.0)
+        new = _results(foo=1.3)
+        self.assertEqual('regression', compare_results(old, new)[0][3])
+        self.assertEqual('ok', compare_results(old, new, threshold=1.5)[0][3])
+
+    def test_tiny_times_ignored(self):
+        old = _results(foo=MIN_COMPARABLE_TIME / 10)
+        new = _results(foo=MIN_COMPARABLE_TIME / 2)
+        self.assertEqual('ok', compare_results(old, new)[0][3])
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+import mmap
+import os
+import shutil
+import tempfile
+import unittest
+
+from ..tools.search_in_dump import count_newlines, load_index, search_for
+
+
+DUMP = b"""-- MySQL dump
+--
+-- Table structure for table `authors`
+--
+CREATE TABLE `authors` (`author_id` int);
+--
+-- Dumping data for table `authors`
+--
+INSERT INTO `authors` VALUES (1,'John Smith'),(2,'Jane Doe');
+INSERT INTO `authors` VALUES (3,'Cordwainer Smith');
+--
+-- Table structure for table `titles`
+--
+CREATE TABLE `titles` (`title_id` int);
+--
+-- Dumping data for table `titles`
+--
+INSERT INTO `titles` VALUES (10,'Smith and Smith, by John Smith');
+INSERT INTO `titles` VALUES (11,'Nothing to see here');
+"""
+
+
+class TestSearchInDump(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dump_file = os.path.join(self.tmp_dir, 'dump.sql')
+        with open(self.dump_file, 'wb') as outputstream:
+            outputstream.write(DUMP)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _search(self, terms, tables=None):
+        return search_for(terms, self.dump_file, tables, output_function=lambda *args: None)
+
+    def test_index(self):
+        index = load_index(self.dump_file, output_function=lambda *args: None)
+        self.assertEqual(['authors', 'titles'], sorted(index['tables']))
+        self.assertEqual([3, 7, 12, 16], [z[1] for z in index['sections']])
+        self.assertTrue(os.path.exists(self.dump_file + '.index.json'))
+
+    def test_all_tables(self):
+        self.assertEqual([('Doe', 9, 'authors'),
+                          ('Nothing', 19, 'titles')],
+                         self._search(['Doe', 'Nothing', 'Missing']))
+
+    def test_term_within_another_terms_match(self):
+        # Line 9 only contains "Smith" as part of "John Smith", but should still
+        # be reported for it
+        self.assertEqual([('John Smith', 9, 'authors'),
+                          ('Smith', 9, 'authors'),
+                          ('Smith', 10, 'authors'),
+                          ('John Smith', 18, 'titles'),
+                          ('Smith', 18, 'titles')],
+                         self._search(['John Smith', 'Smith', 'John Smith']))
+
+    def test_empty_terms_ignored(self):
+        self.assertEqual([('Doe', 9, 'authors')], self._search(['', 'Doe']))
+        self.assertEqual([], self._search(['']))
+
+    def test_only_some_tables(self):
+        self.assertEqual([('Smith', 18, 'titles')], self._search(['Smith'], ['titles']))
+        with self.assertRaises(KeyError):
+            self._search(['Smith'], ['pubs'])
+
+    def test_count_newlines(self):
+        with open(self.dump_file, 'rb') as inputstream:
+            mm = mmap.mmap(inputstream.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                self.assertEqual(DUMP.count(b'\n'), count_newlines(mm, 0, len(DUMP)))
+                self.assertEqual(DUMP[5:200].count(b'\n'), count_newlines(mm, 5, 200))
+                self.assertEqual(0, count_newlines(mm, 1, 5))
+            finally:
+                mm.close()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+import csv
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from ..tools.split_sql_dump import parse_insert_values, split_dump, DumpParseError
+
+
+DUMP = r"""-- MySQL dump
+LOCK TABLES `titles` WRITE;
+INSERT INTO `titles` VALUES (1,'Childhood\'s End',NULL,'1953-00-00'),(2,'C:\\Temp','','1990-01-01');
+INSERT INTO `titles` VALUES (3,'Tab\there\nand a \'),(\' in the middle',NULL,'2001-02-03');
+UNLOCK TABLES;
+LOCK TABLES `authors` WRITE;
+INSERT INTO `authors` VALUES (10,'\\N',-1.5),(11,'Say \"hi\"',0);
+UNLOCK TABLES;
+"""
+
+
+def _rows(line):
+    return list(parse_insert_values(line, line.index('(')))
+
+
+class TestParseInsertValues(unittest.TestCase):
+    def test_numbers_strings_and_nulls(self):
+        self.assertEqual([('1', 'Revenger', None, '2.5'), ('-2', '', None, '0')],
+                         _rows("INSERT INTO `t` VALUES (1,'Revenger',NULL,2.5),"
+                               "(-2,'',NULL , 0);"))
+
+    def test_escapes(self):
+        self.assertEqual([("Childhood's End", 'a\\b', 'x\ny\tz', '\\N')],
+                         _rows(r"INSERT INTO `t` VALUES ('Childhood\'s End','a\\b',"
+                               r"'x\ny\tz','\\N');"))
+
+    def test_string_ending_in_backslash(self):
+        self.assertEqual([('1', 'C:\\', '2')],
+                         _rows(r"INSERT INTO `t` VALUES (1,'C:\\',2);"))
+
+    def test_row_separator_inside_string(self):
+        self.assertEqual([('1', "'),('", '2'), ('3', 'NULL', '4')],
+                         _rows(r"INSERT INTO `t` VALUES (1,'\'),(\'',2),(3,'NULL',4);"))
+        self.assertEqual([('1', '),(')], _rows("INSERT INTO `t` VALUES (1,'),(');"))
+
+    def test_bad_lines(self):
+        with self.assertRaises(DumpParseError):
+            _rows("INSERT INTO `t` VALUES (1,'unterminated);")
+        with self.assertRaises(DumpParseError):
+            _rows("INSERT INTO `t` VALUES (1,2) garbage;")
+
+
+class TestSplitDump(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _split(self, fmt):
+        split_dump(io.StringIO(DUMP), self.tmp_dir, fmt, output_function=lambda *args: None)
+
+    def _read(self, filename):
+        with open(os.path.join(self.tmp_dir, filename), encoding='latin-1',
+                  newline='') as inputstream:
+            return inputstream.read()
+
+    def test_sql(self):
+        self._split('sql')
+        self.assertEqual(['_prologue.sql', 'authors.sql', 'titles.sql'],
+                         sorted(os.listdir(self.tmp_dir)))
+        self.assertEqual(DUMP, ''.join([self._read(z) for z in
+                                        ('_prologue.sql', 'titles.sql', 'authors.sql')]))
+
+    def test_tsv(self):
+        self._split('tsv')
+        self.assertEqual("1\tChildhood's End\t\\N\t1953-00-00\n"
+                         "2\tC:\\\\Temp\t\t1990-01-01\n"
+                         "3\tTab\\there\\nand a '),(' in the middle\t\\N\t2001-02-03\n",
+                         self._read('titles.tsv'))
+        self.assertEqual('10\t\\\\N\t-1.5\n11\tSay "hi"\t0\n', self._read('authors.tsv'))
+
+    def test_csv(self):
+        self._split('csv')
+        # NULLs are left empty, and everything else is quoted, so that they
+        # can be told apart from empty strings (and from the string \N)
+        self.assertEqual('"1","Childhood\'s End",,"1953-00-00"\r\n'
+                         '"2","C:\\Temp","","1990-01-01"\r\n'
+                         '"3","Tab\there\nand a \'),(\' in the middle",,"2001-02-03"\r\n',
+                         self._read('titles.csv'))
+        self.assertEqual('"10","\\N","-1.5"\r\n"11","Say ""hi""","0"\r\n',
+                         self._read('authors.csv'))
+        with open(os.path.join(self.tmp_dir, 'titles.csv'), encoding='latin-1',
+                  newline='') as inputstream:
+            rows = list(csv.reader(inputstream))
+        self.assertEqual(['3', "Tab\there\nand a '),(' in the middle", '', '2001-02-03'],
+                         rows[2])
@@ -15,7 +15,9 @@ from ..title_related import (get_title_details_from_id,
                              get_all_related_title_ids,
                              fetch_title_details,
                              get_authors_for_title,
-                             get_definitive_authors)
+                             get_authors_for_titles,
+                             get_definitive_authors,
+                             get_definitive_authors_for_books)
 from ..author_aliases import AuthorIdAndName
 
 
@@ -181,6 +183,31 @@ class TestGetDefinitiveAuthors(unittest.TestCase):
                           sorted(get_definitive_authors(self.conn, book)))
 
 
+class TestGetDefinitiveAuthorsForBooks(unittest.TestCase):
+    conn = get_connection()
+
+    def test_matches_single_book_version(self):
+        books = [MockBook(2515634, 'Mira Grant'),
+                 MockBook(21043, 'Gabriel King'),
+                 MockBook(2515635, 'Seanan McGuire')]
+        self.assertEqual([sorted(get_definitive_authors(self.conn, z)) for z in books],
+                         [sorted(z) for z in
+                          get_definitive_authors_for_books(self.conn, books)])
+
+    def test_bare_title_ids(self):
+        self.assertEqual([[AuthorIdAndName(129348, 'Seanan McGuire')]],
+                         get_definitive_authors_for_books(self.conn, [2515634]))
+
+    def test_no_title_id_falls_back_to_name(self):
+        book = MockBook(0, 'Henry Kuttner+C. L. Moore')
+        self.assertEqual([[AuthorIdAndName(None, 'Henry Kuttner'),
+                           AuthorIdAndName(None, 'C. L. Moore')]],
+                         get_definitive_authors_for_books(self.conn, [book]))
+
+    def test_empty(self):
+        self.assertEqual([], get_definitive_authors_for_books(self.conn, []))
+
+
 class TestGetAuthorsForTitle(unittest.TestCase):
     conn = get_connection()
 
@@ -208,3 +235,14 @@ class TestGetAuthorsForTitle(unittest.TestCase):
         self.assertEqual([AuthorIdAndName(3161, 'Paul Witcover')],
                           get_authors_for_title(self.conn, 8616))
 
+
+class TestGetAuthorsForTitles(unittest.TestCase):
+    conn = get_connection()
+
+    def test_multiple_titles(self):
+        self.assertEqual({2515634: [AuthorIdAndName(133814, 'Mira Grant')],
+                          2515635: [AuthorIdAndName(129348, 'Seanan McGuire')]},
+                         get_authors_for_titles(self.conn, [2515634, 2515635]))
+
+    def test_empty(self):
+        self.assertEqual({}, get_authors_for_titles(self.conn, []))
@@ -16,6 +16,7 @@ import sys
 from sqlalchemy.sql import text
 
 from common import get_connection
+from isfdb_lib.temp_id_tables import id_list_filter
 from title_publications import get_publications_for_title_ids
 from author_aliases import AuthorIdAndName
 
@@ -35,16 +36,16 @@ def get_pub_contents(conn, pub_ids, exclude_container_types=True):
     # Note that this will sort the page numbers alphabetically, so you'll get
     # 1, 10, 100, 2, 3 etc, which is of minimal use.
 
-    query = text("""SELECT pc.pub_id, pc.pubc_page,
-           t.title_id, t.title_title, CAST(t.title_copyright AS CHAR) title_date,
-           t.title_ttype, t.title_storylen, t.title_parent, n.note_note
-    FROM pub_content pc
-    LEFT OUTER JOIN titles t ON pc.title_id = t.title_id
-    NATURAL LEFT OUTER JOIN notes n
-    WHERE pc.pub_id in :pub_ids
-    ORDER BY pc.pub_id, pc.pubc_page, t.title_title;""")
-
-    results = conn.execute(query, {'pub_ids': pub_ids})
+    with id_list_filter(conn, 'pc.pub_id', 'pub_ids', pub_ids) as (fltr, params):
+        query = text("""SELECT pc.pub_id, pc.pubc_page,
+               t.title_id, t.title_title, CAST(t.title_copyright AS CHAR) title_date,
+               t.title_ttype, t.title_storylen, t.title_parent, n.note_note
+        FROM pub_content pc
+        LEFT OUTER JOIN titles t ON pc.title_id = t.title_id
+        NATURAL LEFT OUTER JOIN notes n
+        WHERE %s
+        ORDER BY pc.pub_id, pc.pubc_page, t.title_title;""" % (fltr))
+        results = conn.execute(query, params).fetchall()
     ret = defaultdict(list)
     for row in results:
         t_type = row.title_ttype
@@ -82,14 +83,15 @@ def get_title_authors(conn, title_ids):
     This similar to title_related.get_authors_for_title(), but handles multiple
     titles in a single query.  TODO: make those use common code?
     """
-    query = text("""SELECT ca.title_id, ca.author_id, author_canonical
-    FROM canonical_author ca
-    LEFT OUTER JOIN authors a ON a.author_id = ca.author_id
-    WHERE ca.title_id in :title_ids
-    ORDER BY ca.title_id, a.author_id;""")
-
-    # Cast title_ids to a list because SQLAlchemy/MySQL doesn't like sets
-    results = conn.execute(query, {'title_ids': list(title_ids)})
+    # (id_list_filter() turns title_ids into a list, as SQLAlchemy/MySQL
+    # doesn't like sets)
+    with id_list_filter(conn, 'ca.title_id', 'title_ids', title_ids) as (fltr, params):
+        query = text("""SELECT ca.title_id, ca.author_id, author_canonical
+        FROM canonical_author ca
+        LEFT OUTER JOIN authors a ON a.author_id = ca.author_id
+        WHERE %s
+        ORDER BY ca.title_id, a.author_id;""" % (fltr))
+        results = conn.execute(query, params).fetchall()
     ret = defaultdict(list)
     for row in results:
         author_stuff = AuthorIdAndName( row.author_id, row.author_canonical)
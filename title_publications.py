@@ -14,6 +14,7 @@ from sqlalchemy.sql import text
 
 from common import get_connection
 from country_related import derive_country_from_price
+from isfdb_lib.derived_tables import has_derived_tables
 
 
 class UnexpectedDataError(Exception):
@@ -21,11 +22,18 @@ class UnexpectedDataError(Exception):
 class NoPublicationsFoundError(Exception):
     pass
 
-def get_raw_publications_for_title_ids(conn, title_ids):
+def get_raw_publications_for_title_ids(conn, title_ids, pub_ids=None):
     """
     Base function that doesn't do anything clever with magazines (in terms of turning a
     particular issue into the overall EDITOR/series.
+
+    Specify pub_ids if you're only interested in some of the publications.
     """
+    params = {'title_ids': title_ids}
+    pub_filter = ''
+    if pub_ids:
+        pub_filter = 'AND p.pub_id IN :pub_ids'
+        params['pub_ids'] = pub_ids
     query = text("""SELECT p.pub_id, pub_title, CAST(pub_year AS CHAR) pub_date,
     pub_ptype, pub_ctype, pub_price, pubc_page,
     p.publisher_id, pb.publisher_name,
@@ -34,10 +42,10 @@ def get_raw_publications_for_title_ids(conn, title_ids):
     LEFT OUTER JOIN publishers pb ON p.publisher_id = pb.publisher_id
     LEFT OUTER JOIN pub_content pc ON pc.pub_id = p.pub_id
     LEFT OUTER JOIN pub_series ps ON ps.pub_series_id = p.pub_series_id
-    WHERE pc.title_id IN :title_ids
-    ORDER by pub_year, p.pub_id, pubc_page, pub_title;""")
+    WHERE pc.title_id IN :title_ids %s
+    ORDER by pub_year, p.pub_id, pubc_page, pub_title;""" % (pub_filter))
 
-    results = conn.execute(query, {'title_ids': title_ids}).fetchall()
+    results = conn.execute(query, params).fetchall()
     return results
 
 
@@ -72,7 +80,7 @@ WHERE pc.pub_id = :pub_id AND t.title_ttype = 'EDITOR';""")
     return results[0]
 
 
-def get_publications_for_title_ids(conn, title_ids):
+def get_publications_for_title_ids(conn, title_ids, pub_ids=None):
     """
     Given a list/iterable of title_ids, return a list of PubDetails
     ... What are "PubDetails", they aren't referenced anywhere in the code except here ...
@@ -83,7 +91,7 @@ def get_publications_for_title_ids(conn, title_ids):
     fundamental story (or in theory non-fiction, art etc), but probably you
     could feed in any arbitrary IDs.
     """
-    raw_results = get_raw_publications_for_title_ids(conn, title_ids)
+    raw_results = get_raw_publications_for_title_ids(conn, title_ids, pub_ids)
 
     results = []
     for r in raw_results:
@@ -134,13 +142,45 @@ def get_earliest_pub(conn, title_ids, only_from_country=None):
     Return a dict with various pub properties for the earliest publication of any of the given
     title_ids.  (It is assumed that the caller has done any lookups on the title_id to find
     all the relevant variants it might have been published as)
+
+    If the derived tables are available, they are used to find the pub, so that
+    only that one has to be fetched, rather than every pub of every title.
     """
+    if has_derived_tables(conn):
+        pub_id = get_earliest_pub_id_from_derived_tables(conn, title_ids,
+                                                         only_from_country)
+        if pub_id:
+            return extract_earliest_pub(get_publications_for_title_ids(conn, title_ids,
+                                                                       [pub_id]))
+        # Otherwise there are no pubs with known dates, so do it the slow way
+
     raw_results = get_publications_for_title_ids(conn, title_ids)
     if not raw_results:
         raise NoPublicationsFoundError('No publications for for title_ids %s' %
                                        (title_ids))
     return extract_earliest_pub(raw_results, only_from_country)
 
+
+def get_earliest_pub_id_from_derived_tables(conn, title_ids, only_from_country=None):
+    """
+    Return the pub_id that get_earliest_pub() would pick, or None if none of the
+    titles have any pubs with known dates.
+    """
+    if only_from_country:
+        query = text("""SELECT pub_id FROM title_first_pub_by_country
+          WHERE title_id IN :title_ids AND country = :country
+          ORDER BY pub_date, pub_id LIMIT 1;""")
+        pub_id = conn.execute(query, {'title_ids': title_ids,
+                                      'country': only_from_country}).scalar()
+        if pub_id:
+            return pub_id
+        # As per extract_earliest_pub(), fall back to any country
+    query = text("""SELECT pub_id FROM title_first_pub
+      WHERE title_id IN :title_ids
+      ORDER BY pub_date, pub_id LIMIT 1;""")
+    return conn.execute(query, {'title_ids': title_ids}).scalar()
+
+
 if __name__ == '__main__':
     # This is just for quick hacks/tests, not intended for "real" use
     conn = get_connection()
@@ -20,10 +20,12 @@ from sqlalchemy.sql import text
 
 from common import (get_connection, parse_args,
                     get_filters_and_params_from_args,
-                    AmbiguousArgumentsError)
+                    AmbiguousArgumentsError, stream_results)
 from isfdb_utils import convert_dateish_to_date
 from author_aliases import (get_author_aliases, AuthorIdAndName,
-                            get_real_author_id_and_name)
+                            get_real_author_id_and_name,
+                            get_real_author_ids_and_names,
+                            get_real_author_ids_and_names_for_titles)
 from award_related import extract_authors_from_author_field
 from custom_exceptions import BookNotFoundError
 
@@ -78,10 +80,14 @@ def get_all_title_details(conn, filter_args, extra_columns=None, title_types=Non
                              postprocess=False)
 
 def get_title_details(conn, filter_args, extra_columns=None, title_types=None,
-                      postprocess=True):
+                      postprocess=True, stream=False):
     """
     Return a dictionary mapping title_id to dict of matching book(s),
     with (some) duplicate/irrelevant entries removed
+
+    If stream is True, the rows are streamed from the database into the
+    postprocessing, rather than all being fetched first, which is worth doing
+    for broad filters e.g. just a range of years.
     """
 
     if extra_columns:
@@ -91,11 +97,14 @@ def get_title_details(conn, filter_args, extra_columns=None, title_types=None,
     fltr, params = get_filters_and_params_from_args(filter_args)
     params['title_types'] = title_types or DEFAULT_TITLE_TYPES
 
-    details = fetch_title_details(conn, fltr, params, extra_col_str)
+    if stream:
+        details = iter_title_details(conn, fltr, params, extra_col_str)
+    else:
+        details = fetch_title_details(conn, fltr, params, extra_col_str)
     if postprocess:
         return postprocess_titles(details)
     else:
-        return details
+        return list(details)
 
 
 def fetch_title_details(conn, fltr, params, extra_col_str):
@@ -105,9 +114,20 @@ def fetch_title_details(conn, fltr, params, extra_col_str):
 
     TODO(maybe): prefix this with an underscore?
     """
+    return conn.execute(_title_details_query(fltr, extra_col_str), params).fetchall()
+
 
-    # print(params)
+def iter_title_details(conn, fltr, params, extra_col_str):
+    """
+    Generator version of fetch_title_details(), which streams the rows from the
+    database, for when there are a lot of them e.g. a year or more's worth.
+    As per common.stream_results(), the connection can't be used for anything
+    else until this is exhausted.
+    """
+    yield from stream_results(conn, _title_details_query(fltr, extra_col_str), params)
 
+
+def _title_details_query(fltr, extra_col_str):
     # This query isn't right - it fails to pick up "Die Kinder der Zeit"
     # The relevant ID is 1856439, not sure what column name that's for
     # Hmm, that's the correct title_id, perhaps there's more to it...
@@ -124,11 +144,9 @@ def fetch_title_details(conn, fltr, params, extra_col_str):
         title_ttype in :title_types
       ORDER BY title_id""" % (extra_col_str, fltr))
 
-
     #print(query)
-    #print(params)
 
-    return conn.execute(query, params).fetchall()
+    return query
 
 
 
@@ -150,6 +168,30 @@ def get_authors_for_title(conn, title_id):
     return [AuthorIdAndName(z.author_id, z.author) for z in results]
 
 
+def get_authors_for_titles(conn, title_ids):
+    """
+    Bulk version of get_authors_for_title(): given an iterable of title_ids,
+    return a dict mapping each title_id to a list of AuthorIdAndName tuples,
+    using a single query.  title_ids that don't exist are not present in the
+    returned dict.
+    """
+    ids = list({z for z in title_ids if z})
+    if not ids:
+        return {}
+    query = text("""SELECT t.title_id, a.author_id, author_canonical author
+      FROM titles t
+      LEFT OUTER JOIN canonical_author ca ON ca.title_id = t.title_id
+      LEFT OUTER JOIN authors a ON a.author_id = ca.author_id
+      WHERE t.title_id IN :title_ids
+      ORDER BY t.title_id;""")
+
+    results = conn.execute(query, {'title_ids': ids})
+    ret = defaultdict(list)
+    for row in results:
+        ret[row.title_id].append(AuthorIdAndName(row.author_id, row.author))
+    return dict(ret)
+
+
 def get_title_details_from_id(conn, title_id, extra_columns=None,
                               parent_search_depth=0):
     """
@@ -190,12 +232,12 @@ def postprocess_titles(title_rows):
     This is for cases like books with multiple authors causing the SQL joins
     to return multiple rows.
     """
-    results = list(title_rows)
-    # print(results)
-    #title_ids = set([z[0] for z in results])
-    title_ids = set([z.title_id for z in results])
+    # This used to build a set of all the title_ids first, for the check at
+    # the end of the loop, but as that only looks at falsy title_parents -
+    # which can never be title_ids - the rows can be checked as they come in,
+    # without holding them all in memory
     ret = []
-    for bits in results:
+    for bits in title_rows:
         # Exclude rows that have a parent that is in the results (I think these
         # are typically translations).
         # No, An example is Girl with all the Gifts (title_id=166651) which
@@ -212,7 +254,7 @@ def postprocess_titles(title_rows):
         # http://www.isfdb.org/wiki/index.php/Schema:titles isn't much help
 
         # TODO: merge these into the returned results
-        if not bits.title_parent and bits.title_parent not in title_ids:
+        if not bits.title_parent:
             ret.append(bits)
     # print(ret)
     return ret
@@ -367,40 +409,76 @@ def get_definitive_authors(conn, book):
       may not be the same as the credited author e.g. "Mira Grant"=>"Seanan McGuire"
 
     See get_authors_for_title() for a simpler function that doesn't do
-    any depseudonymization.
-    """
-    try:
-        if not book.title_id:
-            raise AttributeError('title_id==0 is essentially no title_id')
-        credited_author_stuff = get_authors_for_title(conn, book.title_id)
-        real_author_stuff = []
-        for credited_author in credited_author_stuff:
-            author_stuff = get_real_author_id_and_name(conn, credited_author.id)
-            if author_stuff:
-                # Replace this apparent pseudonym with these real author(s)
-                real_author_stuff.extend(author_stuff)
-            else:
-                # Credited author was real, so keep it
-                real_author_stuff.append(credited_author)
-
-        # Report discrepancies between the newer title_id->author_ids method
-        # versus the original author_names method
-        if not credited_author_stuff and not book.author:
-            pass # Don't worry about set() != set('') e.g. AO3 on Best Related
+    any depseudonymization, and get_definitive_authors_for_books() if you
+    have more than a handful of books to process.
+    """
+    title_id = getattr(book, 'title_id', None)
+    if not title_id:
+        return _resolve_definitive_authors(book, None, {})
+    credited_author_stuff = get_authors_for_title(conn, title_id)
+    real_mappings = get_real_author_ids_and_names_for_titles(conn, [title_id])
+    if real_mappings is not None:
+        return _resolve_definitive_authors(book, credited_author_stuff, real_mappings)
+    real_mappings = {}
+    for credited_author in credited_author_stuff:
+        author_stuff = get_real_author_id_and_name(conn, credited_author.id)
+        if author_stuff:
+            real_mappings[credited_author.id] = author_stuff
+    return _resolve_definitive_authors(book, credited_author_stuff, real_mappings)
+
+
+def get_definitive_authors_for_books(conn, books):
+    """
+    Bulk version of get_definitive_authors(): given an iterable of book
+    objects (or bare title_ids), return a list - in the same order as books -
+    of the lists that get_definitive_authors() would have returned for each
+    one.
+
+    Rather than doing 1+N queries per book, this does one query for all the
+    credited authors, and one more for all the pseudonym lookups (which uses
+    the title_real_authors derived table if it's available).
+    """
+    books = [_BareTitleId(z) if isinstance(z, int) else z for z in books]
+    title_ids = [getattr(z, 'title_id', None) for z in books]
+    title_to_authors = get_authors_for_titles(conn, title_ids)
+    real_mappings = get_real_author_ids_and_names_for_titles(conn, title_ids)
+    if real_mappings is None:
+        credited_ids = set()
+        for author_stuff in title_to_authors.values():
+            credited_ids.update(z.id for z in author_stuff)
+        real_mappings = get_real_author_ids_and_names(conn, credited_ids)
+
+    ret = []
+    for book, title_id in zip(books, title_ids):
+        if title_id:
+            credited_author_stuff = title_to_authors.get(title_id, [])
         else:
-            # author_names_1 = set([z.name for z in credited_author_stuff])
-            author_names_1 = set([z.name for z in real_author_stuff])
-            author_names_2 = set(extract_authors_from_author_field(book.author))
-            author_diffs = author_names_1.symmetric_difference(author_names_2)
-            # Don't bother logging this warning if a dummy empty author attribute
-            # was in the book object
-            if book.author and author_diffs:
-                logging.warning('title_id (%d) authors != author_names (%s != %s)' %
-                            (book.title_id, author_names_1, author_names_2))
-        # Regardless of any differences, use the author_id way if possible -
-        # as these are a tuple with author names, we can still fall back to those
-        author_bits = real_author_stuff
-    except AttributeError:
+            credited_author_stuff = None
+        ret.append(_resolve_definitive_authors(book, credited_author_stuff,
+                                               real_mappings))
+    return ret
+
+
+class _BareTitleId(object):
+    """
+    Minimal book-like wrapper for when get_definitive_authors_for_books() is
+    passed plain title_ids
+    """
+    def __init__(self, title_id):
+        self.title_id = title_id
+        self.author = ''
+
+
+def _resolve_definitive_authors(book, credited_author_stuff, real_mappings):
+    """
+    Common code for get_definitive_authors() and
+    get_definitive_authors_for_books().
+
+    credited_author_stuff is the output of get_authors_for_title() for the book,
+    or None if the book has no (usable) title_id.  real_mappings is a dict
+    mapping pseudonym author_ids to lists of the real AuthorIdAndName tuples.
+    """
+    if credited_author_stuff is None:
         # No title_id attribute
 
         # Thought: perhaps it might be more elegant to fake the id/name tuple
@@ -411,9 +489,35 @@ def get_definitive_authors(conn, book):
         # Get a list of author names
         author_names = extract_authors_from_author_field(book.author)
         # Turn it into fake AuthorIdAndName namedtuple
-        author_bits = [AuthorIdAndName(None, z) for z in author_names]
+        return [AuthorIdAndName(None, z) for z in author_names]
+
+    real_author_stuff = []
+    for credited_author in credited_author_stuff:
+        author_stuff = real_mappings.get(credited_author.id)
+        if author_stuff:
+            # Replace this apparent pseudonym with these real author(s)
+            real_author_stuff.extend(author_stuff)
+        else:
+            # Credited author was real, so keep it
+            real_author_stuff.append(credited_author)
 
-    return author_bits
+    # Report discrepancies between the newer title_id->author_ids method
+    # versus the original author_names method
+    if not credited_author_stuff and not book.author:
+        pass # Don't worry about set() != set('') e.g. AO3 on Best Related
+    else:
+        # author_names_1 = set([z.name for z in credited_author_stuff])
+        author_names_1 = set([z.name for z in real_author_stuff])
+        author_names_2 = set(extract_authors_from_author_field(book.author))
+        author_diffs = author_names_1.symmetric_difference(author_names_2)
+        # Don't bother logging this warning if a dummy empty author attribute
+        # was in the book object
+        if book.author and author_diffs:
+            logging.warning('title_id (%d) authors != author_names (%s != %s)' %
+                        (book.title_id, author_names_1, author_names_2))
+    # Regardless of any differences, use the author_id way if possible -
+    # as these are a tuple with author names, we can still fall back to those
+    return real_author_stuff
 
 
 def get_exact_matching_title(conn, author, title, title_types=None):
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Add the secondary indexes defined in isfdb_lib/indexes.py to a freshly
+imported ISFDB database.  This is called by setup_testing_database.sh, but can
+be run by hand against an existing database; indexes that already exist are
+skipped, so it's safe to run repeatedly.
+
+The connection must be to a user that can ALTER the tables e.g. the readwrite
+user that setup_testing_database.sh creates.
+
+Usage:
+
+  tools/add_indexes.py [-c CONNECTION_STRING] [--dry-run] [--drop]
+"""
+
+from argparse import ArgumentParser
+
+from isfdb_lib.common import get_connection
+from isfdb_lib.indexes import create_indexes, drop_indexes, SECONDARY_INDEXES
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Add secondary indexes to an ISFDB database')
+    parser.add_argument('-c', dest='connection_string',
+                        help='Database to use (default ISFDB_CONNECTION_DETAILS)')
+    parser.add_argument('--dry-run', dest='dry_run', action='store_true',
+                        help='Just output the ALTER statements that would be run')
+    parser.add_argument('--drop', dest='drop', action='store_true',
+                        help='Remove the indexes that this previously added')
+    parser.add_argument('--list', dest='list_indexes', action='store_true',
+                        help='List the indexes and why they are wanted')
+    args = parser.parse_args()
+
+    if args.list_indexes:
+        for spec in SECONDARY_INDEXES:
+            print('%s(%s): %s' % (spec.table, spec.columns, spec.reason))
+    else:
+        conn = get_connection(args.connection_string, query_cache=False)
+        if args.drop:
+            drop_indexes(conn)
+        else:
+            create_indexes(conn, dry_run=args.dry_run)
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+(Re)build the derived tables defined in isfdb_lib/derived_tables.py.  This is
+called by setup_testing_database.sh, but needs to be run by hand if you've
+loaded a new dump some other way - until then, the library will ignore the
+tables as they're for a different dump.
+
+The connection must be to a user that can CREATE tables e.g. the readwrite
+user that setup_testing_database.sh creates.
+
+Usage:
+
+  tools/build_derived_tables.py [-c CONNECTION_STRING] [--drop]
+"""
+
+from argparse import ArgumentParser
+
+from isfdb_lib.common import get_connection
+from isfdb_lib.derived_tables import build_derived_tables, drop_derived_tables
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Build derived tables in an ISFDB database')
+    parser.add_argument('-c', dest='connection_string',
+                        help='Database to use (default ISFDB_CONNECTION_DETAILS)')
+    parser.add_argument('--drop', dest='drop', action='store_true',
+                        help='Remove the derived tables')
+    args = parser.parse_args()
+
+    conn = get_connection(args.connection_string, query_cache=False)
+    if args.drop:
+        drop_derived_tables(conn)
+    else:
+        build_derived_tables(conn)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Run EXPLAIN on the SQL that the library actually runs, and report any queries
+that do full table scans, so that missing indexes - or queries written in a
+way that stops an index being used - get noticed.
+
+The SQL comes from sql_stats.py, which records a sample statement (and its
+parameters) for every distinct query template.  Either:
+* Pass one or more JSON files written via ISFDB_SQL_STATS_JSON, e.g.
+    ISFDB_SQL_STATS=1 ISFDB_SQL_STATS_JSON=/tmp/debut.json ./debut_novel_stats.py ...
+    tools/explain_queries.py /tmp/debut.json
+* Or use --run-benchmarks to run the workload in tools/run_benchmarks.py
+  (once each) and check everything that ran.
+
+Scans that are expected (see KNOWN_FULL_SCANS in isfdb_lib/indexes.py) are
+only shown with -v.  The exit status is 1 if there are any unexpected scans.
+
+Usage:
+
+  tools/explain_queries.py [-c CONNECTION_STRING] [-v] [--min-rows N]
+                           [--run-benchmarks] [stats.json ...]
+"""
+
+from argparse import ArgumentParser
+import json
+import logging
+import sys
+
+from sqlalchemy.exc import DBAPIError
+
+from isfdb_lib.common import get_connection
+from isfdb_lib.indexes import (explain_statement, find_full_scans, is_explainable,
+                               MIN_SCAN_ROWS)
+from isfdb_lib import sql_stats
+
+
+MAX_TEMPLATE_DISPLAY_LENGTH = 150
+
+
+def load_templates(filenames):
+    """
+    Return a list of template dicts from sql_stats JSON files, with any
+    duplicates (from different files) removed
+    """
+    ret = {}
+    for filename in filenames:
+        with open(filename) as inputstream:
+            for template in json.load(inputstream)['templates']:
+                ret.setdefault(template['template'], template)
+    return list(ret.values())
+
+
+def collect_templates_from_benchmarks(conn, year_range=None):
+    # Imported here as it pulls in pretty much the whole repo
+    from run_benchmarks import run_benchmarks, DEFAULT_YEAR_RANGE
+    run_benchmarks(conn, year_range=year_range or DEFAULT_YEAR_RANGE, repeat=1)
+    return [z.as_dict() for z in sql_stats.get_stats().top_templates()]
+
+
+def check_templates(conn, templates, min_rows=MIN_SCAN_ROWS, output_function=print):
+    """
+    Return a list of (template_dict, [FullScan, ...]) tuples for the templates
+    that had any full scans
+    """
+    ret = []
+    for template in templates:
+        statement = template.get('sample_statement')
+        if not statement or not is_explainable(statement):
+            continue
+        try:
+            explain_rows = explain_statement(conn, statement,
+                                             template.get('sample_parameters'))
+        except DBAPIError as err:
+            conn.rollback()
+            output_function('Unable to EXPLAIN %s: %s' %
+                            (template['template'][:MAX_TEMPLATE_DISPLAY_LENGTH], err))
+            continue
+        scans = find_full_scans(template['template'], explain_rows, min_rows)
+        if scans:
+            ret.append((template, scans))
+    return ret
+
+
+def output_scans(results, verbose=False, output_function=print):
+    for template, scans in results:
+        unexpected = [z for z in scans if not z.known_reason]
+        if not unexpected and not verbose:
+            continue
+        output_function(template['template'][:MAX_TEMPLATE_DISPLAY_LENGTH])
+        output_function('  called from: %s' % (', '.join(template.get('callers', {}))))
+        for scan in scans:
+            output_function('  full scan of %s (~%d rows, possible keys: %s)%s' %
+                            (scan.table, scan.rows, scan.possible_keys or 'none',
+                             ' - expected: %s' % (scan.known_reason)
+                             if scan.known_reason else ''))
+        output_function('')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Report full table scans in the SQL that gets run')
+    parser.add_argument('-c', dest='connection_string',
+                        help='Database to use (default ISFDB_CONNECTION_DETAILS)')
+    parser.add_argument('--run-benchmarks', dest='run_benchmarks', action='store_true',
+                        help='Collect the SQL by running the benchmark workload')
+    parser.add_argument('-y', dest='year_range',
+                        help='Years to use for --run-benchmarks')
+    parser.add_argument('--min-rows', dest='min_rows', type=int, default=MIN_SCAN_ROWS,
+                        help='Ignore scans of tables with fewer rows than this '
+                        '(default %d)' % (MIN_SCAN_ROWS))
+    parser.add_argument('-v', dest='verbose', action='store_true',
+                        help='Also show scans that are expected')
+    parser.add_argument('stats_files', nargs='*',
+                        help='JSON file(s) written via ISFDB_SQL_STATS_JSON')
+    args = parser.parse_args()
+    if not args.stats_files and not args.run_benchmarks:
+        parser.error('Must specify stats file(s) and/or --run-benchmarks')
+
+    logging.basicConfig(level=logging.WARNING)
+    conn = get_connection(args.connection_string, query_cache=False)
+    templates = load_templates(args.stats_files)
+    if args.run_benchmarks:
+        templates.extend(collect_templates_from_benchmarks(conn, args.year_range))
+
+    results = check_templates(conn, templates, args.min_rows)
+    output_scans(results, args.verbose)
+    num_unexpected = len([z for z in results if any(not s.known_reason for s in z[1])])
+    print('Checked %d query templates: %d with unexpected full scans, %d with expected ones' %
+          (len(templates), num_unexpected, len(results) - num_unexpected))
+    if num_unexpected:
+        sys.exit(1)
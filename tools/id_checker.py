@@ -17,6 +17,28 @@ Usage:
 or
   gunicorn -w 4 --access-logfile=- --certfile cert.pem --keyfile key.pem -b 0.0.0.0:5000 tools.id_checker:app
 
+The in-memory data is cached in ISFDB_ID_CACHE_FILE (default: ids_in_memory.cache
+in the Fixer dump directory), so after the first startup each worker just
+memory-maps that file.  Set ISFDB_ID_CACHE_FILE to an empty string to disable
+the cache.
+
+Better still, run gunicorn with --preload, in which case the data is loaded
+once in the master process, and the workers inherit it when they are forked.
+As the data is all in flat arrays (either mmap-ed from the cache or
+array.array), the workers share the same physical memory rather than each
+getting a copy-on-write copy.
+
+After loading a new dump, either:
+* POST to /reload/ (from localhost, or with an X-Reload-Token header matching
+  the ISFDB_ID_CHECKER_RELOAD_TOKEN environment variable), which rebuilds the
+  data in the worker that handles the request, and the cache file.  The other
+  workers notice the new cache file within RELOAD_CHECK_INTERVAL seconds and
+  swap it in.
+* Rebuild the cache file some other way, e.g. by running
+  isfdb_lib/ids_in_memory.py, and the workers will similarly pick it up.
+
+
+See also tools/id_checker_async.py for an asyncio-based alternative.
 
 References:
 * https://medium.com/@onejohi/building-a-simple-rest-api-with-python-and-flask-b404371dc699
@@ -31,14 +53,25 @@ import time
 # import json # flask.jsonify might be enough?
 
 # isfdb_tools
-from isfdb_lib.common import get_connection
-from isfdb_lib.identifier_related import check_asin, check_isbn
+from isfdb_lib.common import connection, dispose_engines, reset_engines_after_fork
+from isfdb_lib.identifier_related import check_asin, check_isbn, check_ids
 from isfdb_lib.ids_in_memory import (initialise, # load_ids, load_fixer_ids,
-                                     batch_check_in_memory, batch_check_with_stats)
+                                     batch_check_in_memory, batch_check_with_stats,
+                                     reload_data, refresh_from_cache,
+                                     CACHE_FILE)
 
 IN_MEMORY_DATA = True
 
-conn = get_connection()
+# How often (in seconds) each worker checks whether the cache file has been
+# rebuilt by someone else
+RELOAD_CHECK_INTERVAL = 30
+
+RELOAD_TOKEN = os.environ.get('ISFDB_ID_CHECKER_RELOAD_TOKEN')
+
+# With gunicorn --preload, this module is imported in the master process, so
+# any pooled DB connections it made would otherwise be shared by all the
+# forked workers.
+os.register_at_fork(after_in_child=reset_engines_after_fork)
 
 
 from flask import Flask, jsonify, request, make_response
@@ -74,7 +107,9 @@ def check_id_response(id_to_check):
     For simple tests only - use /batch_check/ for real production code.
     """
 
-    if check_asin(conn, id_to_check) or check_isbn(conn, id_to_check):
+    with connection() as conn:
+        is_known = check_asin(conn, id_to_check) or check_isbn(conn, id_to_check)
+    if is_known:
         # return jsonify(True)
         return jsonify([{
             "id": id_to_check,
@@ -91,9 +126,10 @@ def batch_check_via_database(vals, output_function=print):
     known_count = 0
     start = time.time()
 
-    for i, id_to_check in enumerate(vals):
-        # print('%d. Checking %s ...' % (i, id_to_check))
-        is_known = check_asin(conn, id_to_check) or check_isbn(conn, id_to_check)
+    with connection() as conn:
+        known_ids = check_ids(conn, vals)
+    for id_to_check in vals:
+        is_known = known_ids.get(id_to_check, False)
         if is_known:
             known_count += 1
         ret.append({
@@ -114,8 +150,10 @@ if IN_MEMORY_DATA:
     # Not sure if/how that can be done in gunicorn, hence the nasty hack that causes multiple
     # (re)loads
 
+    # NB: with gunicorn --preload, this is true in the master process, so the
+    # load only happens once
     need_to_load = (os.environ.get('WERKZEUG_RUN_MAIN') == 'true') or \
-        ('gunicorn' in os.environ.get('SERVER_SOFTWARE'))
+        ('gunicorn' in os.environ.get('SERVER_SOFTWARE', ''))
 
     if need_to_load:
         checker_function = batch_check_in_memory
@@ -125,14 +163,46 @@ if IN_MEMORY_DATA:
 
         checker_function = batch_check_with_stats
         print('About to call initialise()...')
-        initialise(conn)
+        with connection() as conn:
+            initialise(conn, cache_file=CACHE_FILE)
         print('Returned from initialise().')
-        conn.close()
+        # Don't leave the connection used for the load lying around in the
+        # pool, as with --preload it would be inherited by the workers
+        dispose_engines()
 else:
     print(f'Have not initialized - IN_MEMORY_DATA={IN_MEMORY_DATA}')
     checker_function = batch_check_via_database
 
 
+last_reload_check = time.time()
+
+@app.before_request
+def check_for_new_data():
+    global last_reload_check
+    if IN_MEMORY_DATA and time.time() - last_reload_check > RELOAD_CHECK_INTERVAL:
+        last_reload_check = time.time()
+        refresh_from_cache(CACHE_FILE)
+
+
+@app.route('/reload/', methods=['POST'])
+def reload_response():
+    """
+    Rebuild the in-memory data from the database and Fixer files.
+    """
+    if RELOAD_TOKEN:
+        allowed = request.headers.get('X-Reload-Token') == RELOAD_TOKEN
+    else:
+        allowed = request.remote_addr in ('127.0.0.1', '::1')
+    if not allowed:
+        return make_response('Reload not permitted', 403)
+    if not IN_MEMORY_DATA:
+        return make_response('Not using in-memory data, nothing to reload', 400)
+    start = time.time()
+    with connection() as conn:
+        reload_data(conn, CACHE_FILE)
+    return 'Reloaded data in %.3f seconds' % (time.time() - start)
+
+
 @app.route('/batch_check/', methods=['POST'])
 @cross_origin()
 def batch_check_response():
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+An asyncio-based alternative to id_checker.py, with the same endpoints and
+JSON responses, for when lots of clients (e.g. many browser tabs) are hitting
+the checker at once.
+
+With the in-memory data (the default), lookups are done directly in the event
+loop - they take microseconds per ID - apart from big batches, which are
+handed off to a thread so that they don't hold up other requests.  Anything
+that needs the database (--db-only mode, /check/<id>, reloads) is done in a
+thread, with at most MAX_CONCURRENT_DB_CHECKS of them running at once, so a
+flurry of requests queues up here rather than each opening its own database
+connection.
+In --db-only mode each batch is checked with one query for ASINs and one for
+ISBNs, rather than two queries per ID.
+
+Dependencies:
+
+  aiohttp (installed from PyPI, or your distro's package manager, etc)
+
+Usage:
+
+  tools/id_checker_async.py [-p 5000] [--certfile cert.pem --keyfile key.pem] [--db-only]
+
+See id_checker.py for details of the cache file and /reload/.
+"""
+
+from argparse import ArgumentParser
+import asyncio
+import logging
+import os
+import ssl
+import time
+
+from aiohttp import web
+
+from isfdb_lib.common import connection
+from isfdb_lib.identifier_related import check_asin, check_isbn, check_ids
+from isfdb_lib.ids_in_memory import (initialise, batch_check_in_memory,
+                                     reload_data, refresh_from_cache,
+                                     CACHE_FILE)
+
+
+DEFAULT_HOST = '0.0.0.0'
+DEFAULT_PORT = 5000
+
+API_VERSION = '0.2'
+
+# The connection pool in common.py doesn't limit how many connections get
+# opened (see DEFAULT_MAX_OVERFLOW), so this is what stops a burst of requests
+# opening a connection each.  Keeping it no bigger than DEFAULT_POOL_SIZE means
+# the connections get reused rather than opened and closed for each request.
+MAX_CONCURRENT_DB_CHECKS = 4
+
+# Batches bigger than this are checked in a thread rather than in the event loop
+MAX_INLINE_BATCH_SIZE = 1000
+
+# See the same constant in id_checker.py
+RELOAD_CHECK_INTERVAL = 30
+
+RELOAD_TOKEN = os.environ.get('ISFDB_ID_CHECKER_RELOAD_TOKEN')
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, X-Reload-Token',
+    'Access-Control-Expose-Headers': 'X-ID-Checker-API-Version'
+}
+
+
+def json_response(data):
+    # As per id_checker.json_response()
+    return web.json_response(data, headers={'X-ID-Checker-API-Version': API_VERSION})
+
+
+def _load_data():
+    with connection() as conn:
+        initialise(conn, cache_file=CACHE_FILE)
+
+
+def _reload_data():
+    with connection() as conn:
+        reload_data(conn, CACHE_FILE)
+
+
+def _check_one_via_database(id_to_check):
+    with connection() as conn:
+        return check_asin(conn, id_to_check) or check_isbn(conn, id_to_check)
+
+
+def _check_via_database(vals):
+    with connection() as conn:
+        return check_ids(conn, vals)
+
+
+class IdCheckerServer(object):
+    def __init__(self, in_memory=True,
+                 max_concurrent_db_checks=MAX_CONCURRENT_DB_CHECKS):
+        self.in_memory = in_memory
+        self.max_concurrent_db_checks = max_concurrent_db_checks
+        self.db_semaphore = None
+        self.refresh_task = None
+
+    async def run_db_function(self, func, *args):
+        """
+        Run a (blocking) function that uses the database in a thread, waiting
+        if there are already too many such functions running.
+        """
+        async with self.db_semaphore:
+            return await asyncio.to_thread(func, *args)
+
+    async def on_startup(self, app):
+        self.db_semaphore = asyncio.Semaphore(self.max_concurrent_db_checks)
+        if self.in_memory:
+            logging.info('About to load in-memory data...')
+            await self.run_db_function(_load_data)
+            logging.info('Loaded in-memory data.')
+            self.refresh_task = asyncio.create_task(self.refresh_periodically())
+        else:
+            logging.info('Not loading in-memory data, will use the database')
+
+    async def on_cleanup(self, app):
+        if self.refresh_task:
+            self.refresh_task.cancel()
+
+    async def refresh_periodically(self):
+        while True:
+            await asyncio.sleep(RELOAD_CHECK_INTERVAL)
+            await asyncio.to_thread(refresh_from_cache, CACHE_FILE)
+
+    async def index(self, request):
+        return web.Response(text='ID Checker (async) server running at %s' %
+                            (time.strftime('%Y-%m-%d %H:%M:%S')))
+
+    async def check_id(self, request):
+        """
+        For simple tests only - use /batch_check/ for real production code.
+        """
+        id_to_check = request.match_info['id_to_check']
+        is_known = await self.run_db_function(_check_one_via_database, id_to_check)
+        return json_response([{'id': id_to_check, 'known': is_known}])
+
+    async def batch_check(self, request):
+        try:
+            vals = await request.json()
+        except ValueError:
+            raise web.HTTPBadRequest(text='Expected a JSON list of IDs')
+        if not isinstance(vals, list) or \
+           not all(isinstance(z, str) for z in vals):
+            raise web.HTTPBadRequest(text='Expected a JSON list of IDs')
+
+        start = time.time()
+        if self.in_memory:
+            if len(vals) <= MAX_INLINE_BATCH_SIZE:
+                ret = batch_check_in_memory(vals)
+            else:
+                ret = await asyncio.to_thread(batch_check_in_memory, vals)
+        else:
+            known_ids = await self.run_db_function(_check_via_database, vals)
+            ret = [{'id': z, 'known': known_ids.get(z, False)} for z in vals]
+        logging.info('Checked %d IDs, of which %d were known, in %.3f seconds' %
+                     (len(ret), len([z for z in ret if z['known']]),
+                      time.time() - start))
+        return json_response(ret)
+
+    async def reload(self, request):
+        if RELOAD_TOKEN:
+            allowed = request.headers.get('X-Reload-Token') == RELOAD_TOKEN
+        else:
+            allowed = request.remote in ('127.0.0.1', '::1')
+        if not allowed:
+            raise web.HTTPForbidden(text='Reload not permitted')
+        if not self.in_memory:
+            raise web.HTTPBadRequest(text='Not using in-memory data, nothing to reload')
+        start = time.time()
+        await self.run_db_function(_reload_data)
+        return web.Response(text='Reloaded data in %.3f seconds' % (time.time() - start))
+
+
+@web.middleware
+async def cors_middleware(request, handler):
+    # The equivalent of flask_cors in id_checker.py
+    if request.method == 'OPTIONS':
+        resp = web.Response()
+    else:
+        try:
+            resp = await handler(request)
+        except web.HTTPException as err:
+            err.headers.update(CORS_HEADERS)
+            raise
+    resp.headers.update(CORS_HEADERS)
+    return resp
+
+
+def create_app(in_memory=True):
+    server = IdCheckerServer(in_memory=in_memory)
+    app = web.Application(middlewares=[cors_middleware])
+    app.on_startup.append(server.on_startup)
+    app.on_cleanup.append(server.on_cleanup)
+    app.router.add_get('/', server.index)
+    app.router.add_get('/check/{id_to_check}', server.check_id)
+    app.router.add_post('/batch_check/', server.batch_check)
+    app.router.add_post('/reload/', server.reload)
+    return app
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='asyncio server to check IDs against ISFDB')
+    parser.add_argument('--host', dest='host', default=DEFAULT_HOST,
+                        help='Address to listen on (default %s)' % (DEFAULT_HOST))
+    parser.add_argument('-p', dest='port', type=int, default=DEFAULT_PORT,
+                        help='Port to listen on (default %d)' % (DEFAULT_PORT))
+    parser.add_argument('--certfile', dest='certfile',
+                        help='Certificate file, to serve HTTPS')
+    parser.add_argument('--keyfile', dest='keyfile',
+                        help='Private key file, to serve HTTPS')
+    parser.add_argument('--db-only', dest='in_memory', action='store_false',
+                        help='Check IDs against the database rather than in memory')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    ssl_context = None
+    if args.certfile:
+        ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        ssl_context.load_cert_chain(args.certfile, args.keyfile)
+    web.run_app(create_app(args.in_memory), host=args.host, port=args.port,
+                ssl_context=ssl_context)
@@ -1,10 +1,18 @@
 #!/bin/bash -x
 
 FILE=$1
+# Optional: directory to also split the dump into per-table files, which is
+# done straight from the zip in parallel with the unzip/import
+SPLIT_DIR=$2
 echo $FILE
 DT=`echo $FILE | sed 's/backup.MySQL.[0-9][0-9].//g' | sed 's/\.zip//g' | sed 's/\-//g'`
 echo $DT
 
+if [ "$SPLIT_DIR" != "" ]
+then
+    unzip -p $FILE | `dirname $0`/split_sql_dump.py -o $SPLIT_DIR - &
+fi
+
 unzip $FILE
 mv cygdrive cygdrive.${DT}
 (
@@ -12,3 +20,4 @@ mv cygdrive cygdrive.${DT}
     mysql --user=root --password=isfdbtest isfdb < backup-MySQL*
 )
 
+wait
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Time the main analysis entry points against a database, and save the results
+as JSON so that later runs can be compared against them to spot regressions.
+
+This is intended to be run against a synthetic database created by
+isfdb_lib/synthetic_data.py - so that the numbers are reproducible, and it
+can be run without a real dump - but it works against a real ISFDB database
+too.  The authors/publishers/awards to use are picked by querying the database
+for the most prolific ones, rather than being hardcoded.
+
+Each benchmark has an untimed setup step (picking its arguments), followed by
+N timed runs.  The caches in the default AnalysisContext and the alias graph
+are cleared before each run, so that every run does the same work and the
+median is of like-for-like runs, rather than of one cold run and N-1 warm
+ones.  Any difference between "first" and "median" is then down to warming
+up the database's own caches etc.  The SQL run during the first run is
+counted via sql_stats.py, so that N+1-style regressions show up even if the
+database is fast.
+
+The code under test is imported lazily, so that a missing optional dependency
+(e.g. the human-names repo used by the gender analysis) only fails the
+benchmarks that need it, which are recorded as errors.
+
+Usage:
+
+  ./isfdb_lib/synthetic_data.py -s 1 --load
+  ./tools/run_benchmarks.py -o baseline.json
+  ... make some changes ...
+  ./tools/run_benchmarks.py -o new.json --compare baseline.json
+
+The exit status is 1 if any benchmark's median time got worse by more than
+the threshold (default DEFAULT_REGRESSION_THRESHOLD).
+"""
+
+from argparse import ArgumentParser
+from collections import OrderedDict
+from datetime import datetime
+import json
+import logging
+import random
+import statistics
+import sys
+import time
+
+from sqlalchemy.sql import text
+
+from isfdb_lib.common import get_connection, get_dump_version, parse_args
+from isfdb_lib.alias_graph import forget_alias_graphs
+from isfdb_lib.analysis_context import get_default_context
+from isfdb_lib import sql_stats
+
+
+DEFAULT_REPEAT = 3
+DEFAULT_YEAR_RANGE = '2000-2009'
+# Ratio of new to old median time that counts as a regression
+DEFAULT_REGRESSION_THRESHOLD = 1.25
+# Don't flag regressions in anything that runs quicker than this (seconds), as
+# the timings are too noisy
+MIN_COMPARABLE_TIME = 0.01
+
+BATCH_CHECK_SIZE = 10000
+
+RESULTS_FORMAT_VERSION = 1
+
+
+def _no_output(*args, **kwargs):
+    pass
+
+
+def _most_prolific_author(conn):
+    return conn.execute(text("""SELECT a.author_canonical
+      FROM canonical_author ca
+      INNER JOIN titles t ON t.title_id = ca.title_id
+      INNER JOIN authors a ON a.author_id = ca.author_id
+      WHERE t.title_ttype = 'NOVEL' AND t.title_parent = 0
+      GROUP BY ca.author_id, a.author_canonical
+      ORDER BY COUNT(1) DESC, ca.author_id
+      LIMIT 1;""")).scalar()
+
+
+def _busiest_publisher(conn):
+    return conn.execute(text("""SELECT p.publisher_name
+      FROM pubs
+      INNER JOIN publishers p ON p.publisher_id = pubs.publisher_id
+      GROUP BY p.publisher_id, p.publisher_name
+      ORDER BY COUNT(1) DESC, p.publisher_id
+      LIMIT 1;""")).scalar()
+
+
+def _busiest_award(conn):
+    return conn.execute(text("""SELECT at.award_type_name
+      FROM awards a
+      INNER JOIN award_types at ON at.award_type_id = a.award_type_id
+      GROUP BY at.award_type_id, at.award_type_name
+      ORDER BY COUNT(1) DESC, at.award_type_id
+      LIMIT 1;""")).scalar()
+
+
+# Each of these does any setup, and returns a function with no arguments that
+# runs the thing to be timed.
+
+def setup_author_bibliography(conn, year_range):
+    from bibliography import get_author_bibliography
+    author = _most_prolific_author(conn)
+    return lambda: get_author_bibliography(conn, [author])
+
+
+def setup_publisher_books(conn, year_range):
+    from publisher_books import get_publisher_books
+    args = parse_args(['-P', _busiest_publisher(conn), '-y', year_range],
+                      supported_args='knpy')
+    return lambda: get_publisher_books(conn, args)
+
+
+def setup_debut_report(conn, year_range):
+    from debut_novel_stats import debut_report
+    args = parse_args(['-P', _busiest_publisher(conn), '-y', year_range, '-k', 'uk'],
+                      supported_args='knpy')
+    args.show_nth_detail = args.show_pub_detail = False
+    return lambda: debut_report(conn, args, output_function=_no_output)
+
+
+def _finalists_args(conn, year_range):
+    return parse_args(['-W', _busiest_award(conn), '-y', year_range],
+                      supported_args='cwy')
+
+
+def setup_finalists(conn, year_range):
+    from finalists import get_finalists, get_type_and_filter
+    args = _finalists_args(conn, year_range)
+    _, level_filter = get_type_and_filter('finalists')
+    return lambda: get_finalists(conn, args, level_filter)
+
+
+def setup_gender_analysis(conn, year_range):
+    from finalists import get_finalists, get_type_and_filter
+    from gender_analysis import analyse_authors_by_gender
+    _, level_filter = get_type_and_filter('finalists')
+    books = get_finalists(conn, _finalists_args(conn, year_range), level_filter)
+    return lambda: analyse_authors_by_gender(conn, books, output_function=_no_output)
+
+
+def setup_batch_check_in_memory(conn, year_range):
+    from isfdb_lib.ids_in_memory import (load_ids, compact_ids, set_data,
+                                         batch_check_in_memory)
+    ids = load_ids(conn, output_function=_no_output)
+    set_data(*compact_ids(ids, {}, {}, output_function=_no_output))
+    # Roughly half known IDs, half made-up ISBNs
+    rng = random.Random(len(ids))
+    known = sorted(ids)
+    vals = [rng.choice(known) if rng.random() < 0.5 else
+            '978%010d' % (rng.randrange(10 ** 10))
+            for _ in range(BATCH_CHECK_SIZE)]
+    return lambda: batch_check_in_memory(vals)
+
+
+def setup_verification_stats(conn, year_range):
+    from verification_stats import get_verification_stats
+    args = parse_args(['-y', year_range], supported_args='ly')
+    return lambda: get_verification_stats(conn, args)
+
+
+BENCHMARKS = OrderedDict([
+    ('author_bibliography', setup_author_bibliography),
+    ('publisher_books', setup_publisher_books),
+    ('debut_report', setup_debut_report),
+    ('finalists', setup_finalists),
+    ('gender_analysis', setup_gender_analysis),
+    ('batch_check_in_memory', setup_batch_check_in_memory),
+    ('verification_stats', setup_verification_stats)
+])
+
+
+def _sql_totals():
+    templates = sql_stats.get_stats().templates.values()
+    return sum([z.count for z in templates]), sum([z.total_time for z in templates])
+
+
+def _clear_caches():
+    get_default_context().clear()
+    forget_alias_graphs()
+
+
+def run_benchmark(conn, setup_function, year_range, repeat=DEFAULT_REPEAT):
+    """
+    Return a dict of the timings for one benchmark, or of the error if it
+    blew up
+    """
+    try:
+        func = setup_function(conn, year_range)
+        times = []
+        before_count, before_time = _sql_totals()
+        for i in range(max(1, repeat)):
+            _clear_caches()
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+            if i == 0:
+                after_count, after_time = _sql_totals()
+                sql_count = after_count - before_count
+                sql_time = after_time - before_time
+    except Exception as err:
+        logging.exception('Benchmark failed')
+        conn.rollback()
+        return {'error': '%s: %s' % (type(err).__name__, err)}
+    return {
+        'times': times,
+        'first': times[0],
+        'min': min(times),
+        'median': statistics.median(times),
+        'sql_count': sql_count,
+        'sql_time': sql_time
+    }
+
+
+def run_benchmarks(conn, names=None, year_range=DEFAULT_YEAR_RANGE,
+                   repeat=DEFAULT_REPEAT, output_function=print):
+    sql_stats.enable([conn.engine], report_at_exit=False)
+    ret = {
+        'format_version': RESULTS_FORMAT_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'database': conn.engine.url.render_as_string(hide_password=True),
+        'dump_version': get_dump_version(conn),
+        'python': sys.version.split()[0],
+        'year_range': year_range,
+        'repeat': repeat,
+        'benchmarks': OrderedDict()
+    }
+    for name, setup_function in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        result = run_benchmark(conn, setup_function, year_range, repeat)
+        ret['benchmarks'][name] = result
+        if 'error' in result:
+            output_function('%-25s ERROR %s' % (name, result['error']))
+        else:
+            output_function('%-25s first %8.3fs  median %8.3fs  %6d SQL statements (%.3fs)' %
+                            (name, result['first'], result['median'],
+                             result['sql_count'], result['sql_time']))
+    return ret
+
+
+def compare_results(old, new, threshold=DEFAULT_REGRESSION_THRESHOLD):
+    """
+    Return a list of (name, old_median, new_median, status) tuples, where
+    status is one of 'regression', 'improvement', 'ok', 'new', 'missing' or
+    'error'.  The medians are None where not available.
+    """
+    ret = []
+    old_benchmarks = old['benchmarks']
+    new_benchmarks = new['benchmarks']
+    for name in list(new_benchmarks) + [z for z in old_benchmarks
+                                        if z not in new_benchmarks]:
+        old_median = old_benchmarks.get(name, {}).get('median')
+        new_median = new_benchmarks.get(name, {}).get('median')
+        if name not in new_benchmarks:
+            status = 'missing'
+        elif new_median is None:
+            status = 'error'
+        elif old_median is None:
+            status = 'new'
+        elif max(old_median, new_median) < MIN_COMPARABLE_TIME:
+            status = 'ok'
+        elif new_median > old_median * threshold:
+            status = 'regression'
+        elif new_median * threshold < old_median:
+            status = 'improvement'
+        else:
+            status = 'ok'
+        ret.append((name, old_median, new_median, status))
+    return ret
+
+
+def output_comparison(old, new, comparison, output_function=print):
+    if old.get('dump_version') != new.get('dump_version'):
+        output_function('WARNING: comparing results from different databases (%s vs %s)' %
+                        (old.get('dump_version'), new.get('dump_version')))
+    output_function('%-25s %10s %10s %7s  %s' % ('Benchmark', 'Old(s)', 'New(s)',
+                                                 'Change', 'Status'))
+    for name, old_median, new_median, status in comparison:
+        if old_median and new_median:
+            change = '%+6.0f%%' % (100 * (new_median - old_median) / old_median)
+        else:
+            change = ''
+        output_function('%-25s %10s %10s %7s  %s' %
+                        (name,
+                         '%.3f' % old_median if old_median is not None else '-',
+                         '%.3f' % new_median if new_median is not None else '-',
+                         change, status.upper() if status == 'regression' else status))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark the main analysis functions')
+    parser.add_argument('-c', dest='connection_string',
+                        help='Database to use (default ISFDB_CONNECTION_DETAILS)')
+    parser.add_argument('-o', dest='output_file',
+                        help='Write the results as JSON to this file')
+    parser.add_argument('--compare', dest='baseline_file',
+                        help='Compare the results against this earlier JSON file')
+    parser.add_argument('--threshold', dest='threshold', type=float,
+                        default=DEFAULT_REGRESSION_THRESHOLD,
+                        help='Slowdown ratio that counts as a regression (default %s)' %
+                        (DEFAULT_REGRESSION_THRESHOLD))
+    parser.add_argument('-r', dest='repeat', type=int, default=DEFAULT_REPEAT,
+                        help='Number of timed runs of each benchmark (default %d)' %
+                        (DEFAULT_REPEAT))
+    parser.add_argument('-y', dest='year_range', default=DEFAULT_YEAR_RANGE,
+                        help='Years for the benchmarks that take them (default %s)' %
+                        (DEFAULT_YEAR_RANGE))
+    parser.add_argument('-b', dest='benchmarks', action='append', default=[],
+                        choices=list(BENCHMARKS),
+                        help='Benchmark(s) to run (default all)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    conn = get_connection(args.connection_string, query_cache=False)
+    results = run_benchmarks(conn, args.benchmarks, args.year_range, args.repeat)
+
+    if args.output_file:
+        with open(args.output_file, 'w') as outputstream:
+            json.dump(results, outputstream, indent=2)
+        print('Wrote results to %s' % (args.output_file))
+
+    if args.baseline_file:
+        with open(args.baseline_file) as inputstream:
+            baseline = json.load(inputstream)
+        comparison = compare_results(baseline, results, args.threshold)
+        print()
+        output_comparison(baseline, results, comparison)
+        if any(z[3] == 'regression' for z in comparison):
+            sys.exit(1)
@@ -1,26 +1,193 @@
 #!/usr/bin/env python3
+"""
+Find which table(s) and line(s) of a dump contain one or more values.
 
+The first time a dump is searched, an index of the byte offsets of each
+table's structure and data sections is built and saved alongside it (as
+<dump>.index.json), which takes one pass over the file.  After that, all the
+search terms are matched in a single pass over the memory-mapped dump - or just
+over the data sections of the tables specified with -t - rather than one pass
+per term.
+
+Usage:
+
+    tools/search_in_dump.py [-d dump-file] [-t table ...] term [term ...]
+"""
+
+from argparse import ArgumentParser
+from bisect import bisect_right
+import json
+import mmap
+import os
 import re
 import sys
 
 
 DUMP_FILE = '/mnt/sdb10/data_downloads/isfdb/cygdrive/c/ISFDB/Backups/backup-MySQL-55-2019-02-09'
 
+# See the same constant in split_sql_dump.py
+DUMP_ENCODING = 'latin-1'
+
+INDEX_FORMAT_VERSION = 1
+
+TABLE_SECTION_REGEX = re.compile(rb'-- (Table structure for table |Dumping data for table )`(.*)`')
+
+
+def index_filename(dump_file):
+    return dump_file + '.index.json'
+
+
+def build_index(dump_file, output_function=print):
+    """
+    Return (and save) a dict describing where each table's sections are in the
+    dump.  'sections' is a list of [offset, line_number, table_name] for the
+    start of each table structure or data section, in file order.  'tables'
+    maps each table name to the [start, end] byte offsets of its data section.
+    """
+    sections = []
+    tables = {}
+    current_data_table = None
+    offset = 0
+    with open(dump_file, 'rb') as inputstream:
+        for line_number, line in enumerate(inputstream, 1):
+            if line.startswith(b'-- '):
+                section_check = TABLE_SECTION_REGEX.match(line)
+                if section_check:
+                    table = section_check.group(2).decode(DUMP_ENCODING)
+                    sections.append([offset, line_number, table])
+                    if current_data_table:
+                        tables[current_data_table][1] = offset
+                        current_data_table = None
+                    if section_check.group(1).startswith(b'Dumping'):
+                        current_data_table = table
+                        tables[table] = [offset, None]
+            offset += len(line)
+    if current_data_table:
+        tables[current_data_table][1] = offset
+
+    stat = os.stat(dump_file)
+    index = {
+        'format_version': INDEX_FORMAT_VERSION,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'sections': sections,
+        'tables': tables
+    }
+    with open(index_filename(dump_file), 'w') as outputstream:
+        json.dump(index, outputstream)
+    output_function('Indexed %d tables in %s' % (len(tables), dump_file))
+    return index
+
+
+def load_index(dump_file, output_function=print):
+    """
+    Return the index for the dump, (re)building it if it doesn't exist or is
+    out of date.
+    """
+    try:
+        with open(index_filename(dump_file)) as inputstream:
+            index = json.load(inputstream)
+        stat = os.stat(dump_file)
+        if index.get('format_version') == INDEX_FORMAT_VERSION and \
+           index['size'] == stat.st_size and index['mtime'] == stat.st_mtime:
+            return index
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+    return build_index(dump_file, output_function)
+
+
+def make_matcher(terms):
+    """
+    Return a compiled (bytes) regex which matches any of the terms, for
+    finding the lines that contain at least one of them.
+    """
+    ordered_terms = sorted(set(terms), key=len, reverse=True)
+    return re.compile(b'|'.join([re.escape(z.encode(DUMP_ENCODING))
+                                 for z in ordered_terms]))
+
+
+def count_newlines(mm, start, end):
+    """
+    Return the number of newlines in mm[start:end], without copying that
+    (potentially huge) slice out of the mmap.
+    """
+    count = 0
+    pos = mm.find(b'\n', start, end)
+    while pos >= 0:
+        count += 1
+        pos = mm.find(b'\n', pos + 1, end)
+    return count
+
+
+def search_for(terms, dump_file=DUMP_FILE, tables=None, output_function=print):
+    """
+    Search for all the terms in one pass, returning a list of
+    (term, line_number, table) tuples for each line a term appears in.  If
+    tables are specified, only the data sections for those tables are searched.
+
+    The regex from make_matcher() is used to find each line containing any of
+    the terms, which is then checked for each term individually, as a term
+    can appear only within another term's match (e.g. "Smith" in "John Smith").
+    """
+    index = load_index(dump_file, output_function)
+    section_offsets = [z[0] for z in index['sections']]
+    if tables:
+        missing = [z for z in tables if z not in index['tables']]
+        if missing:
+            raise KeyError('No data for table(s) %s in %s' % (', '.join(missing), dump_file))
+        ranges = sorted([tuple(index['tables'][z]) for z in tables])
+    else:
+        ranges = [(0, index['size'])]
+
+    # An empty term would match (zero-width) everywhere, without ever moving on
+    unique_terms = list(dict.fromkeys([z for z in terms if z]))
+    if not unique_terms:
+        return []
+    encoded_terms = [(z, z.encode(DUMP_ENCODING)) for z in unique_terms]
+    matcher = make_matcher(unique_terms)
+    ret = []
+    with open(dump_file, 'rb') as inputstream:
+        mm = mmap.mmap(inputstream.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for start, end in ranges:
+                # Work out line numbers relative to the nearest preceding section
+                section_idx = bisect_right(section_offsets, start) - 1
+                if section_idx >= 0:
+                    line_offset, line_number, _ = index['sections'][section_idx]
+                else:
+                    line_offset, line_number = 0, 1
+                match = matcher.search(mm, start, end)
+                while match:
+                    line_start = max(mm.rfind(b'\n', start, match.start()) + 1, start)
+                    line_end = mm.find(b'\n', match.end(), end)
+                    if line_end < 0:
+                        line_end = end
+                    line_number += count_newlines(mm, line_offset, line_start)
+                    line_offset = line_start
+                    section_idx = bisect_right(section_offsets, line_start) - 1
+                    table = index['sections'][section_idx][2] if section_idx >= 0 else None
+                    for term, encoded_term in encoded_terms:
+                        if mm.find(encoded_term, line_start, line_end) >= 0:
+                            ret.append((term, line_number, table))
+                            output_function('Found "%s" at line %d (current table %s)' %
+                                            (term, line_number, table))
+                    match = matcher.search(mm, line_end, end)
+        finally:
+            mm.close()
+    return ret
 
-def search_for(word):
-    current_table = None
-    for i, line in enumerate(open(DUMP_FILE), 1):
-        # print(line[:100])
-        table_check = re.match('\-\- (Table structure for table |Dumping data for table )`(.*)`',
-                               line)
-        if table_check:
-            current_table = table_check.group(2)
-            # print('Reference to table %s found at line %d' % (table_check.group(2),
-            #                                                  i))
-        if word in line:
-            print('Found reference at line %d (current table %s)' %
-                  (i, current_table))
 
 if __name__ == '__main__':
-    for word in sys.argv[1:]:
-        search_for(word)
+    parser = ArgumentParser(description='Search an ISFDB MySQL dump for values')
+    parser.add_argument('-d', dest='dump_file', nargs='?', default=DUMP_FILE,
+                        help='Dump file to search (default %s)' % (DUMP_FILE))
+    parser.add_argument('-t', dest='tables', action='append', default=[],
+                        help='Only search the data for this table (can be used multiple times)')
+    parser.add_argument('-r', dest='reindex', action='store_true',
+                        help='Force the dump to be reindexed')
+    parser.add_argument('terms', nargs='+', help='Values to search for')
+    args = parser.parse_args()
+
+    if args.reindex:
+        build_index(args.dump_file)
+    search_for(args.terms, args.dump_file, args.tables)
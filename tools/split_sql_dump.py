@@ -4,8 +4,23 @@ Hacky script to split up the dump into separate files per table.
 
 This is to make it easier to find where a value comes from, which is a PITA
 doing with grep/less/etc due to the long lines.
+
+Each table is written out as the dump is read, so memory usage is bounded
+by the longest line (i.e. a single extended INSERT statement), not the size of
+the biggest table.  As such, the dump can be piped in straight from the zip file
+e.g.
+
+    unzip -p backup-MySQL-55-2019-06-22.zip | tools/split_sql_dump.py -o /tmp/split -
+
+By default the per-table files are the raw SQL, but -f tsv or -f csv will
+instead output one line per row.  TSV output represents NULLs as \\N, and
+escapes tabs, newlines and backslashes, per MySQL's LOAD DATA/SELECT INTO
+OUTFILE convention.  CSV output leaves NULL fields empty, and quotes all the
+other values, so that NULLs can be told apart from empty strings (as per
+PostgreSQL's COPY ... CSV).
 """
 
+from argparse import ArgumentParser
 import os
 import re
 import sys
@@ -14,43 +29,193 @@ DEFAULT_DUMP_FILE = "/mnt/sdb10/data_downloads/isfdb/cygdrive.20190622/c/ISFDB/B
 
 OUTPUT_DIR = "/tmp"
 
+# latin-1 maps every byte to a character and back again, so using it for both
+# reading and writing means the output is byte-identical to the input, regardless
+# of whatever encoding the dump actually uses.
+DUMP_ENCODING = 'latin-1'
 
-def write_buffer(tbl, buf):
-    output_filename = os.path.join(OUTPUT_DIR, '%s.sql' % (tbl))
-    print('Writing %d lines to %s' % (len(buf), output_filename))
-    with open(output_filename, 'w') as outputstream:
-        for l in buf:
-            outputstream.write(l)
-            outputstream.write('\n')
+NULL_REPRESENTATION = '\\N'
 
+INSERT_REGEX = re.compile(r'INSERT INTO `(\w+)` VALUES ')
 
-def split_dump(dump_file, output_dir):
+# One value within a VALUES (...) tuple: a quoted string, NULL, or a bare literal
+# (in practice a number)
+VALUE_REGEX = re.compile(r"""\s*(?:'((?:[^'\\]|\\.)*)'   # quoted string
+                                 |(NULL)(?=\s*[,)])
+                                 |([^,()']+))             # number etc
+                         \s*""", re.VERBOSE | re.DOTALL)
 
-    current_table = '_prologue'
-    buf = []
-    for line in open(dump_file):
-        if line.startswith('LOCK TABLES'):
-            if buf:
-                write_buffer(current_table, buf)
-            buf = [line]
-            tablename_regex = re.search('LOCK TABLES `(\w+)`', line)
-            if not tablename_regex:
-                raise Exception('Unable to parse %s for table name' % (line))
-            current_table = tablename_regex.group(1)
-        elif line.startswith('UNLOCK TABLES'):
-            # Do we need to do anything?  Only if we care about the epilogue
-            # being table independent I think
-            buf.append(line)
+UNESCAPE_REGEX = re.compile(r'\\(.)', re.DOTALL)
+UNESCAPE_MAPPINGS = {'0': '\0', 'b': '\b', 'n': '\n', 'r': '\r', 't': '\t',
+                     'Z': '\x1a'}
+
+TSV_ESCAPE_MAPPINGS = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n',
+                                     '\r': '\\r', '\0': '\\0'})
+
+
+class DumpParseError(Exception):
+    pass
+
+
+def _unescape(txt):
+    if '\\' not in txt:
+        return txt
+    return UNESCAPE_REGEX.sub(lambda m: UNESCAPE_MAPPINGS.get(m.group(1), m.group(1)),
+                              txt)
+
+
+def parse_insert_values(line, pos=0):
+    """
+    Return a generator of tuples for each row in the VALUES (...),(...) part
+    of an INSERT statement, starting from pos.  String values are unescaped,
+    NULLs are returned as None, and all other values are returned as the
+    (stripped) text of the literal.
+    """
+    line_length = len(line)
+    while pos < line_length:
+        ch = line[pos]
+        if ch == '(':
+            pos += 1
+            row = []
+            while True:
+                match = VALUE_REGEX.match(line, pos)
+                if not match:
+                    raise DumpParseError('Unable to parse value at offset %d: %s...' %
+                                         (pos, line[pos:pos+50]))
+                quoted, null, bare = match.groups()
+                if quoted is not None:
+                    row.append(_unescape(quoted))
+                elif null:
+                    row.append(None)
+                else:
+                    row.append(bare.strip())
+                pos = match.end()
+                if pos >= line_length:
+                    raise DumpParseError('Unterminated row: %s...' % (line[:50]))
+                ch = line[pos]
+                pos += 1
+                if ch == ')':
+                    break
+                elif ch != ',':
+                    raise DumpParseError('Unexpected %r at offset %d' % (ch, pos - 1))
+            yield tuple(row)
+        elif ch in ',; \t\r\n':
+            pos += 1
         else:
-            buf.append(line)
-    if buf:
-        write_buffer(current_table, buf)
+            raise DumpParseError('Unexpected %r at offset %d' % (ch, pos))
 
 
+def _csv_field(val):
+    # The csv module can't leave None unquoted whilst quoting empty strings
+    # (at least before Python 3.12's QUOTE_NOTNULL), so this does it by hand
+    if val is None:
+        return ''
+    return '"%s"' % (val.replace('"', '""'))
 
-if __name__ == '__main__':
-    if len(sys.argv) > 1:
-        dump_file = sys.argv[1]
+
+class TableWriters(object):
+    """
+    Manage the (possibly many) per-table output files.  Files are opened on
+    first use, and only one is kept open at a time, as dumps have all of a
+    table's data in one contiguous block.
+    """
+    def __init__(self, output_dir, fmt, output_function=print):
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.output_function = output_function
+        self.current_table = None
+        self.stream = None
+        self.count = 0
+        self.seen_tables = set()
+
+    def _switch_to(self, tbl):
+        if tbl == self.current_table:
+            return
+        self.close()
+        self.current_table = tbl
+        output_filename = os.path.join(self.output_dir, '%s.%s' % (tbl, self.fmt))
+        # Append if we've seen this table before, rather than clobbering it
+        mode = 'a' if tbl in self.seen_tables else 'w'
+        self.seen_tables.add(tbl)
+        self.stream = open(output_filename, mode, encoding=DUMP_ENCODING, newline='')
+        self.output_function('Writing to %s' % (output_filename))
+
+    def write_line(self, tbl, line):
+        self._switch_to(tbl)
+        self.stream.write(line)
+        self.count += 1
+
+    def write_row(self, tbl, row):
+        self._switch_to(tbl)
+        if self.fmt == 'csv':
+            self.stream.write(','.join([_csv_field(z) for z in row]))
+            self.stream.write('\r\n')
+        else:
+            self.stream.write('\t'.join([NULL_REPRESENTATION if z is None else
+                                         z.translate(TSV_ESCAPE_MAPPINGS)
+                                         for z in row]))
+            self.stream.write('\n')
+        self.count += 1
+
+    def close(self):
+        if self.stream:
+            self.output_function('Wrote %d %s to %s' %
+                                 (self.count, 'lines' if self.fmt == 'sql' else 'rows',
+                                  self.current_table))
+            self.stream.close()
+        self.stream = None
+        self.current_table = None
+        self.count = 0
+
+
+def split_dump(dump_file, output_dir, fmt='sql', output_function=print):
+    """
+    Split dump_file - which can be a filename, '-' for stdin, or an already open
+    (text) stream - into per-table files in output_dir.  fmt is one of 'sql'
+    (the original statements), 'tsv' or 'csv' (one line per row).
+    """
+    if fmt not in ('sql', 'tsv', 'csv'):
+        raise ValueError('Unknown output format "%s"' % (fmt))
+    os.makedirs(output_dir, exist_ok=True)
+
+    if dump_file == '-':
+        inputstream = open(sys.stdin.fileno(), encoding=DUMP_ENCODING, closefd=False)
+    elif isinstance(dump_file, str):
+        inputstream = open(dump_file, encoding=DUMP_ENCODING)
     else:
-        dump_file = DEFAULT_DUMP_FILE
-    split_dump(dump_file, OUTPUT_DIR)
+        inputstream = dump_file
+
+    writers = TableWriters(output_dir, fmt, output_function)
+    current_table = '_prologue'
+    try:
+        for line in inputstream:
+            if line.startswith('LOCK TABLES'):
+                tablename_regex = re.search(r'LOCK TABLES `(\w+)`', line)
+                if not tablename_regex:
+                    raise DumpParseError('Unable to parse %s for table name' % (line))
+                current_table = tablename_regex.group(1)
+
+            if fmt == 'sql':
+                writers.write_line(current_table, line)
+            else:
+                insert_regex = INSERT_REGEX.match(line)
+                if insert_regex:
+                    for row in parse_insert_values(line, insert_regex.end()):
+                        writers.write_row(insert_regex.group(1), row)
+    finally:
+        writers.close()
+        if inputstream is not dump_file:
+            inputstream.close()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Split an ISFDB MySQL dump into per-table files')
+    parser.add_argument('-o', dest='output_dir', nargs='?', default=OUTPUT_DIR,
+                        help='Directory to write the per-table files to (default %s)' %
+                        (OUTPUT_DIR))
+    parser.add_argument('-f', dest='fmt', choices=['sql', 'tsv', 'csv'], default='sql',
+                        help='Output format (default sql)')
+    parser.add_argument('dump_file', nargs='?', default=DEFAULT_DUMP_FILE,
+                        help='Dump file to split, or - to read from stdin')
+    args = parser.parse_args()
+    split_dump(args.dump_file, args.output_dir, args.fmt)
@@ -13,13 +13,30 @@ from sqlalchemy.sql import text
 
 
 from common import (get_connection, create_parser, parse_args,
-                    get_filters_and_params_from_args)
+                    get_filters_and_params_from_args, stream_results)
+from isfdb_lib.derived_tables import has_derived_tables
 
 
 def get_verification_stats(conn, args, limit=100, author_separator=' and '):
     """
-    Return a list/iterable of the most verified titles
+    Return a list of the most verified titles
     """
+    query, params = _verification_stats_query(conn, args, limit, author_separator)
+    return conn.execute(query, params).fetchall()
+
+
+def iter_verification_stats(conn, args, limit=100, author_separator=' and '):
+    """
+    Generator version of get_verification_stats(), which streams the rows
+    from the database rather than fetching them all up front - useful with
+    a large -l limit.  As per common.stream_results(), the connection
+    can't be used for anything else until this is exhausted.
+    """
+    query, params = _verification_stats_query(conn, args, limit, author_separator)
+    yield from stream_results(conn, query, params)
+
+
+def _verification_stats_query(conn, args, limit, author_separator):
 
     cnm = {'year': 'title_copyright'}
 
@@ -33,9 +50,18 @@ def get_verification_stats(conn, args, limit=100, author_separator=' and '):
 
     params['author_separator'] = author_separator
 
+    # Grouping on the precomputed root can use the title_root index, whereas
+    # grouping on the CASE needs a temporary table
+    if has_derived_tables(conn):
+        root_column = 'tr.root_title_id'
+        root_join = 'INNER JOIN title_root tr ON tr.title_id = pc.title_id'
+    else:
+        root_column = 'CASE WHEN t.title_parent !=0 THEN t.title_parent ELSE t.title_id END'
+        root_join = ''
+
     query = text("""
     WITH root_query AS (
-      SELECT CASE WHEN t.title_parent !=0 THEN t.title_parent ELSE t.title_id END root_title_id,
+      SELECT %s root_title_id,
         COUNT(1) num_verifications,
         COUNT(DISTINCT p.pub_id) num_verified_pubs,
         COUNT(DISTINCT pv.user_id) num_verifiers
@@ -43,6 +69,7 @@ def get_verification_stats(conn, args, limit=100, author_separator=' and '):
       NATURAL JOIN pubs p
       NATURAL JOIN pub_content pc
       LEFT OUTER JOIN titles t ON t.title_id = pc.title_id
+      %s
       WHERE p.pub_ctype = t.title_ttype
       GROUP BY root_title_id
     )
@@ -58,10 +85,9 @@ def get_verification_stats(conn, args, limit=100, author_separator=' and '):
     %s
     GROUP BY t.title_id
     ORDER BY num_verifiers DESC, num_verifications DESC, num_verified_pubs DESC
-    LIMIT :limit;"""  % (fltr))
+    LIMIT :limit;"""  % (root_column, root_join, fltr))
     # pdb.set_trace()
-    results = conn.execute(query, **params).fetchall()
-    return results
+    return query, params
 
 def output_report(data, output_function=print):
     for i, row in enumerate(data, 1):
@@ -99,7 +125,10 @@ if __name__ == '__main__':
                         help='Show extra stats derived from the basic data')
     margs = parse_args(sys.argv[1:], parser=parser)
 
-    mdata = get_verification_stats(mconn, margs)
+    mdata = iter_verification_stats(mconn, margs)
+    if margs.extra_stats:
+        # extra_stats() needs to go over the data again
+        mdata = list(mdata)
     output_report(mdata)
 
     if margs.extra_stats: